@@ -1,26 +1,103 @@
+"""
+WSGI entry point for the AI Assistant. create_app() builds the Flask application from the settings
+in config.py; the module-level `app` is built from the environment on first use, so
+`gunicorn app:app` (see gunicorn.conf.py) and `python app.py` both work.
+"""
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import os
-from flask import Flask, request, render_template, redirect, url_for
+import math
+from flask import Flask, Blueprint, request, render_template, redirect, url_for, jsonify, Response, stream_with_context, send_file
 from datetime import datetime
 from utils import log_event, ensure_directory_exists
-from prompts import get_question_answering_prompt, get_summarization_prompt, get_creative_content_prompt
-from gemini_api import get_gemini_response
-import markdown
+from config import load_config, DATA_DIR
+from feedback import save_feedback_for_response, feedback_stats
+from response_store import response_store
+from prompts import PROMPT_OPTIONS
+from gemini_api import stream_gemini_response, client_manager, upstream_stats, GeminiError
+from budget import output_budget
+from assistant import (response_cache, semantic_cache, single_flight, model_router, conversations, generate_response,
+                       build_request_prompt, resume_conversation, continue_conversation, CACHE_MODEL_NAME)
+from batch import submit_batch, resume_batch, get_batch_progress, batch_output_path, batch_options
+from streaming import IncrementalMarkdownRenderer, sse_event
+from jobqueue import job_queue, enqueue_job, runs_in_background, status_report, stored_response_id
+from metrics import (registry, phase, start_request_timer, finish_request_timer, detach_request_timer, streamed_request,
+                     STARTUP_SECONDS)
+from rendering import render_markdown, render_cache
+
+STARTUP_SECONDS.set(time.perf_counter() - _IMPORT_STARTED, phase="import")
+
+views = Blueprint('views', __name__)
+
+def create_app(config=None):
+    """
+    Builds the Flask application and prepares the data directory. Startup phases are recorded
+    in the assistant_startup_seconds gauge.
+    :param config: Optional dict of settings overriding those read from the environment (see config.py).
+    """
+    started = time.perf_counter()
+    settings = load_config(config)
+    flask_app = Flask(__name__)
+    flask_app.config.update(settings)
+    flask_app.register_blueprint(views)
+    ensure_directory_exists(DATA_DIR)
+    STARTUP_SECONDS.set(time.perf_counter() - started, phase="create_app")
+
+    # Build the shared Gemini client up front so the first request doesn't pay the cold start
+    if settings["GEMINI_PREWARM"]:
+        prewarm_started = time.perf_counter()
+        client_manager.prewarm()
+        STARTUP_SECONDS.set(time.perf_counter() - prewarm_started, phase="prewarm")
+    log_event(f"Application started in {time.perf_counter() - started:.3f}s "
+              f"({STARTUP_SECONDS.value(phase='import'):.3f}s importing) and data directory ensured.")
+    return flask_app
+
+def __getattr__(name):
+    # The default application is only built when first asked for, so importing this module
+    # (e.g. for create_app) has no side effects
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-app = Flask(__name__)
+def _route_name():
+    return (request.endpoint or 'unknown').rpartition('.')[2]
 
-# Ensure the data directory exists on startup
-DATA_DIR = 'data'
-ensure_directory_exists(DATA_DIR)
-log_event("Application started and data directory ensured.")
+@views.before_app_request
+def start_timing():
+    """
+    Starts timing the request and its phases for /metrics.
+    """
+    if _route_name() not in ('metrics', 'static'):
+        start_request_timer(_route_name())
 
-@app.route('/')
+@views.teardown_app_request
+def finish_timing(_error=None):
+    """
+    Records the request's latency histograms; streamed responses detach their timer and record them once the stream ends.
+    """
+    finish_request_timer()
+
+def error_page(query, error):
+    """
+    Renders the result page for a failed model call with the error's HTTP status.
+    No feedback form is shown, so error text never ends up in the feedback log.
+    """
+    headers = {}
+    if error.retry_after:
+        headers['Retry-After'] = str(math.ceil(error.retry_after))
+    with phase("render_template"):
+        return render_template('result.html', query=query, error_message=error.user_message), error.status_code, headers
+
+@views.route('/')
 def index():
     """
     Renders the main input page for the AI Assistant.
     """
-    return render_template('index.html')
+    return render_template('index.html', prompt_options=PROMPT_OPTIONS)
 
-@app.route('/generate', methods=['POST'])
+@views.route('/generate', methods=['POST'])
 def generate():
     """
     Handles the user's request, generates a response using the AI model,
@@ -30,54 +107,294 @@ def generate():
     prompt_style = request.form['prompt_style']
     user_input = request.form['user_input']
 
-    prompt = ""
-    ai_response = "Error: Could not generate a response."
+    if request.form.get('stream') == 'on':
+        # Render the page right away; it fetches the response from /generate/stream
+        return render_template('stream.html', query=user_input, function_choice=function_choice, prompt_style=prompt_style)
+
+    if runs_in_background(request.form, prompt_style):
+        # Answer at once; a worker process generates the response and the job page waits for it
+        job_id = enqueue_job(job_queue, function_choice, prompt_style, user_input)
+        return redirect(url_for('.job_page', job_id=job_id), code=303)
+
     original_ai_response = "" # Store the original, raw AI response
     ai_response_html = "" # Store the HTML converted response
+    response_id = None # Id of the stored response, posted back by the feedback form
+
+    # Get the raw response, reusing a cached answer for a repeated prompt
+    try:
+        response = generate_response(function_choice, prompt_style, user_input)
+    except GeminiError as e:
+        return error_page(user_input, e)
+    if response is not None:
+        original_ai_response = response
+
+        # Convert the Markdown response to sanitized HTML, once per distinct response
+        with phase("render_markdown"):
+            ai_response_html = render_markdown(original_ai_response)
+        # Keep the raw text on the server; the feedback form only posts its id back
+        with phase("store_response"):
+            response_id = response_store.save(user_input, original_ai_response, function_choice, prompt_style)
+
+    # Pass the HTML for display and the stored response's id for feedback logging
+    with phase("render_template"):
+        return render_template('result.html', query=user_input, response=ai_response_html, response_id=response_id)
+
+@views.route('/follow_up', methods=['POST'])
+def follow_up():
+    """
+    Answers a follow-up question about an earlier response, sending the conversation so far as chat
+    history. The form posts the session id once a conversation has started, and the id of the
+    response being followed up either way.
+    """
+    user_input = request.form['user_input']
+    session = resume_conversation(request.form.get('session_id', ''), request.form.get('response_id', ''))
+    if session is None:
+        return "This conversation has expired, so the follow-up could not be answered.", 404
+
+    try:
+        with phase("upstream"):
+            original_ai_response = continue_conversation(session, user_input)
+    except GeminiError as e:
+        return error_page(user_input, e)
+    with phase("render_markdown"):
+        ai_response_html = render_markdown(original_ai_response)
+    with phase("store_response"):
+        response_id = response_store.save(user_input, original_ai_response, 'follow_up', None)
+    with phase("render_template"):
+        return render_template('result.html', query=user_input, response=ai_response_html,
+                               response_id=response_id, session_id=session['id'])
+
+@views.route('/jobs/<job_id>')
+def job_page(job_id):
+    """
+    Shows a background job: a page that polls its status while it is queued or running,
+    then the result page (or the error) once it has finished.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return "This job has expired or does not exist.", 404
+    if job['status'] == 'failed':
+        with phase("render_template"):
+            return render_template('result.html', query=job['user_input'], error_message=job['error_message']), job['error_status']
+    if job['status'] != 'done':
+        with phase("render_template"):
+            return render_template('job.html', query=job['user_input'], job=status_report(job),
+                                   status_url=url_for('.job_status', job_id=job_id))
+    with phase("render_markdown"):
+        response_html = render_markdown(job['response'])
+    with phase("store_response"):
+        response_id = stored_response_id(job_queue, job)
+    with phase("render_template"):
+        return render_template('result.html', query=job['user_input'], response=response_html, response_id=response_id)
+
+@views.route('/jobs/<job_id>/status')
+def job_status(job_id):
+    """
+    Reports a background job's status (and its place in the queue while queued) as JSON.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job: {job_id}"}), 404
+    return jsonify(status_report(job))
+
+@views.route('/generate/stream', methods=['POST'])
+def generate_stream():
+    """
+    Streams the AI response as Server-Sent Events while it is being generated.
+    Markdown is rendered incrementally: 'block' events carry HTML for completed blocks,
+    'tail' events carry provisional HTML for the unfinished block, and a final 'done'
+    event carries the id under which the full raw text was stored for the feedback form.
+    """
+    function_choice = request.form['function_choice']
+    prompt_style = request.form['prompt_style']
+    user_input = request.form['user_input']
 
-    if function_choice == 'answer_question':
-        prompt = get_question_answering_prompt(user_input, prompt_type=prompt_style)
-    elif function_choice == 'summarize_text':
-        prompt = get_summarization_prompt(user_input, prompt_type=prompt_style)
-    elif function_choice == 'generate_creative_content':
-        if '_' in prompt_style:
-            parts = prompt_style.split('_', 1)
-            content_type = parts[0]
-            creative_prompt_type = parts[1]
+    try:
+        # Long documents to summarize are reduced chunk by chunk before the final call streams
+        prompt = build_request_prompt(function_choice, prompt_style, user_input)
+    except GeminiError as e:
+        return Response(sse_event('error', {'message': e.user_message}), mimetype='text/event-stream')
+    if not prompt:
+        log_event(f"Invalid function or prompt style received: {function_choice}/{prompt_style}", "data/errors.log")
+        return Response(sse_event('error', {'message': "Invalid function or prompt style selected."}), mimetype='text/event-stream')
+
+    log_event(f"Streaming response for function: {function_choice}, style: {prompt_style}, input: '{user_input[:50]}...' using Gemini.")
+
+    timer = detach_request_timer() # The stream outlives the request's teardown
+
+    def upstream_chunks():
+        with phase("upstream"):
+            yield from stream_gemini_response(prompt, max_output_tokens=output_budget(function_choice))
+
+    def sse_events():
+        renderer = IncrementalMarkdownRenderer()
+        cached_response = response_cache.get(prompt, CACHE_MODEL_NAME)
+        if cached_response is None:
+            cached_response = semantic_cache.lookup(function_choice, prompt_style, user_input)
+        if cached_response is not None:
+            chunks = [cached_response]
         else:
-            content_type = "story"
-            creative_prompt_type = prompt_style
-        prompt = get_creative_content_prompt(user_input, content_type=content_type, prompt_type=creative_prompt_type)
-    else:
-        log_event(f"Invalid function choice received: {function_choice}", "data/errors.log")
-        ai_response = "Invalid function selected."
+            chunks = upstream_chunks()
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                block_html, tail_html = renderer.feed(chunk)
+                if block_html:
+                    yield sse_event('block', {'html': block_html})
+                yield sse_event('tail', {'html': tail_html})
+        except GeminiError as e:
+            # No 'done' event: the feedback buttons stay disabled for a failed response
+            yield sse_event('error', {'message': e.user_message})
+            return
+        yield sse_event('block', {'html': renderer.finish()})
 
-    if prompt:
-        log_event(f"Generating response for function: {function_choice}, style: {prompt_style}, input: '{user_input[:50]}...' using Gemini.")
-        original_ai_response = get_gemini_response(prompt) # Get the raw response
-        log_event(f"AI Response generated: '{original_ai_response[:50]}...'")
+        original_ai_response = "".join(parts)
+        if cached_response is None:
+            response_cache.set(prompt, CACHE_MODEL_NAME, original_ai_response)
+            semantic_cache.add(function_choice, prompt_style, user_input, original_ai_response)
+        log_event(f"AI Response streamed: '{original_ai_response[:50]}...'")
+        response_id = response_store.save(user_input, original_ai_response, function_choice, prompt_style)
+        yield sse_event('done', {'response_id': response_id})
 
-        # Convert Markdown response to HTML for proper rendering
-        ai_response_html = markdown.markdown(original_ai_response)
+    def events():
+        with streamed_request(timer):
+            yield from sse_events()
 
-    # Pass both the HTML for display and the original raw text for feedback logging
-    return render_template('result.html', query=user_input, response=ai_response_html, original_ai_response=original_ai_response)
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-@app.route('/feedback', methods=['POST'])
+@views.route('/feedback', methods=['POST'])
 def feedback():
     """
     Collects user feedback on the AI's response.
+    The form posts only the response's id; the text itself is taken from the response store.
     """
-    query = request.form['query']
-    response = request.form['response'] # This will now be the original raw response
+    response_id = request.form.get('response_id', '')
     helpful = request.form['helpful'] == 'yes'
     timestamp = datetime.now().isoformat()
 
-    save_feedback(query, response, helpful, timestamp)
-    log_event(f"User feedback received: Query='{query[:50]}...', Helpful={helpful}")
+    with phase("save_feedback"):
+        record = save_feedback_for_response(response_id, helpful, timestamp)
+    if record is None:
+        return "This response has expired, so the feedback could not be recorded.", 404
+    log_event(f"User feedback received: Query='{record['query'][:50]}...', Helpful={helpful}")
+
+    return redirect(url_for('.index'))
+
+@views.route('/batch', methods=['POST'])
+def batch():
+    """
+    Starts a batch job over an uploaded JSONL file (form field 'file', or the raw request body)
+    and returns its job id. Progress is polled at /batch/<job_id>.
+    """
+    upload = request.files.get('file')
+    data = upload.read() if upload else request.get_data()
+    if not data.strip():
+        return jsonify({'error': "No JSONL input provided."}), 400
+
+    try:
+        job = submit_batch(data, **batch_options(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    log_event(f"Batch job {job.job_id} submitted.")
+    return jsonify({'job_id': job.job_id, 'status_url': url_for('.batch_status', job_id=job.job_id),
+                    'results_url': url_for('.batch_results', job_id=job.job_id)}), 202
+
+@views.route('/batch/<job_id>')
+def batch_status(job_id):
+    """
+    Reports a batch job's status and progress as JSON, whichever worker process runs it.
+    """
+    progress = get_batch_progress(job_id)
+    if progress is None:
+        return jsonify({'error': f"Unknown batch job: {job_id}"}), 404
+    return jsonify(progress)
+
+@views.route('/batch/<job_id>/results')
+def batch_results(job_id):
+    """
+    Returns the JSONL results written so far by a batch job.
+    """
+    output_path = batch_output_path(job_id)
+    if output_path is None or not os.path.exists(output_path):
+        return jsonify({'error': f"No results for batch job: {job_id}"}), 404
+    return send_file(os.path.abspath(output_path), mimetype='application/x-ndjson')
+
+@views.route('/batch/<job_id>/resume', methods=['POST'])
+def batch_resume(job_id):
+    """
+    Resumes a stored batch job from its checkpoint, e.g. after a restart.
+    """
+    try:
+        job = resume_batch(job_id, **batch_options(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if job is None:
+        return jsonify({'error': f"Batch job {job_id} is running or does not exist."}), 409
+    return jsonify({'job_id': job.job_id, 'status_url': url_for('.batch_status', job_id=job.job_id)}), 202
+
+@views.route('/stats')
+def stats():
+    """
+    Reports helpful-rates per function and prompt style over time windows as JSON.
+    Windows are given in days as ?windows=1,7,30; all-time totals are always included.
+    """
+    try:
+        windows = [int(days) for days in request.args.get('windows', '1,7,30').split(',') if days.strip()]
+    except ValueError:
+        return jsonify({'error': "windows must be a comma-separated list of days."}), 400
+    return jsonify(feedback_stats.report(windows=windows))
+
+@views.route('/metrics')
+def metrics():
+    """
+    Exposes request phase latencies, upstream call, token and retry counters, and cache outcomes
+    in the Prometheus text format.
+    """
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
 
-    return redirect(url_for('index'))
+@views.route('/cache/stats')
+def cache_stats():
+    """
+    Reports response cache hit/miss counters and tier sizes, and the semantic cache's counters, as JSON.
+    """
+    return jsonify(dict(response_cache.stats(), semantic=semantic_cache.stats(), render=render_cache.stats()))
+
+@views.route('/upstream/stats')
+def upstream_status():
+    """
+    Reports the Gemini rate limiter and circuit breaker state, and the model router's per-provider
+    latency and health when a router is configured, as JSON.
+    """
+    stats = upstream_stats()
+    if model_router is not None:
+        stats["router"] = model_router.stats()
+    return jsonify(stats)
+
+@views.route('/coalescing/stats')
+def coalescing_stats():
+    """
+    Reports how many model calls were executed and how many identical calls were coalesced onto them.
+    """
+    return jsonify(single_flight.stats())
+
+@views.route('/jobs/stats')
+def jobs_stats():
+    """
+    Reports the background job queue's jobs by status and function as JSON.
+    """
+    return jsonify(job_queue.stats())
+
+@views.route('/sessions/stats')
+def session_stats():
+    """
+    Reports how many conversations are held, and the turns and history compactions so far.
+    """
+    return jsonify(conversations.stats())
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Development server; use gunicorn (see gunicorn.conf.py) in production
+    app = create_app()
+    app.run(debug=app.config["DEBUG"], host=app.config["HOST"], port=app.config["PORT"])
 
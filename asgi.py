@@ -0,0 +1,418 @@
+"""
+Async (ASGI) entry point for the AI Assistant, served by Quart alongside the Flask app in app.py.
+Model calls are awaited on the Gemini SDK's asyncio transport, so a slow upstream call does not
+hold a worker thread. The number of concurrent upstream calls is capped by UPSTREAM_CONCURRENCY.
+
+Run with an ASGI server, e.g.: hypercorn "asgi:create_app()" --bind 0.0.0.0:5000 --workers 4
+"""
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+import os
+import math
+import asyncio
+from datetime import datetime
+from quart import Quart, Blueprint, request, render_template, redirect, url_for, jsonify, Response, send_file
+from utils import log_event, ensure_directory_exists
+from config import load_config, DATA_DIR
+from feedback import save_feedback_for_response, feedback_stats
+from response_store import response_store
+from prompts import PROMPT_OPTIONS
+from gemini_api import get_gemini_response_async, stream_gemini_response_async, client_manager, upstream_stats, GeminiError
+from cache import make_cache_key
+from assistant import (response_cache, semantic_cache, single_flight, model_router, conversations, resume_conversation,
+                       build_request_prompt_async, generate_response_async, continue_conversation_async, CACHE_MODEL_NAME)
+from streaming import IncrementalMarkdownRenderer, sse_event
+from batch import submit_batch, resume_batch, get_batch_progress, batch_output_path, batch_options
+from jobqueue import job_queue, enqueue_job, runs_in_background, status_report, stored_response_id
+from budget import output_budget
+from metrics import (registry, phase, start_request_timer, finish_request_timer, detach_request_timer, streamed_request,
+                     STARTUP_SECONDS)
+from rendering import render_markdown, render_cache
+
+STARTUP_SECONDS.set(time.perf_counter() - _IMPORT_STARTED, phase="import")
+
+views = Blueprint('views', __name__)
+
+# Cap on model calls in flight at once; requests beyond it wait without holding a thread
+UPSTREAM_CONCURRENCY = int(os.environ.get("UPSTREAM_CONCURRENCY", 32))
+upstream_semaphore = asyncio.Semaphore(UPSTREAM_CONCURRENCY)
+
+def create_app(config=None):
+    """
+    Builds the Quart application; see create_app in app.py.
+    :param config: Optional dict of settings overriding those read from the environment (see config.py).
+    """
+    started = time.perf_counter()
+    settings = load_config(config)
+    quart_app = Quart(__name__)
+    quart_app.config.update(settings)
+    quart_app.register_blueprint(views)
+    ensure_directory_exists(DATA_DIR)
+    STARTUP_SECONDS.set(time.perf_counter() - started, phase="create_app")
+
+    if settings["GEMINI_PREWARM"]:
+        prewarm_started = time.perf_counter()
+        client_manager.prewarm()
+        STARTUP_SECONDS.set(time.perf_counter() - prewarm_started, phase="prewarm")
+    log_event(f"Async application started in {time.perf_counter() - started:.3f}s "
+              f"({STARTUP_SECONDS.value(phase='import'):.3f}s importing) and data directory ensured.")
+    return quart_app
+
+def __getattr__(name):
+    # Built on first use, like app.app
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _route_name():
+    return (request.endpoint or 'unknown').rpartition('.')[2]
+
+async def limited_gemini_response(prompt, max_output_tokens=None, history=None):
+    """
+    Awaits the model call once a slot under UPSTREAM_CONCURRENCY is free.
+    Identical in-flight prompts are coalesced onto one call, which takes a single slot;
+    a conversation turn (with history) depends on the turns before it and is never coalesced.
+    """
+    async def call():
+        async with upstream_semaphore:
+            if model_router is not None:
+                return await model_router.generate_async(prompt, max_output_tokens, history)
+            return await get_gemini_response_async(prompt, max_output_tokens=max_output_tokens, history=history)
+    if history:
+        return await call()
+    return await single_flight.do_async(make_cache_key(prompt, CACHE_MODEL_NAME), call)
+
+@views.before_app_request
+async def start_timing():
+    """
+    Starts timing the request and its phases for /metrics. Slow request profiles sample the event
+    loop thread, so they include whatever other requests were running at the time.
+    """
+    if _route_name() not in ('metrics', 'static'):
+        start_request_timer(_route_name())
+
+@views.teardown_app_request
+async def finish_timing(_error=None):
+    """
+    Records the request's latency histograms.
+    """
+    finish_request_timer()
+
+async def error_page(query, error):
+    """
+    Renders the result page for a failed model call with the error's HTTP status.
+    """
+    headers = {}
+    if error.retry_after:
+        headers['Retry-After'] = str(math.ceil(error.retry_after))
+    with phase("render_template"):
+        return await render_template('result.html', query=query, error_message=error.user_message), error.status_code, headers
+
+@views.route('/')
+async def index():
+    """
+    Renders the main input page for the AI Assistant.
+    """
+    return await render_template('index.html', prompt_options=PROMPT_OPTIONS)
+
+@views.route('/generate', methods=['POST'])
+async def generate():
+    """
+    Handles the user's request, awaits a response from the AI model,
+    converts markdown to HTML, and displays the result.
+    """
+    form = await request.form
+    function_choice = form['function_choice']
+    prompt_style = form['prompt_style']
+    user_input = form['user_input']
+
+    if form.get('stream') == 'on':
+        # Render the page right away; it fetches the response from /generate/stream
+        return await render_template('stream.html', query=user_input, function_choice=function_choice, prompt_style=prompt_style)
+
+    if runs_in_background(form, prompt_style):
+        job_id = await asyncio.to_thread(enqueue_job, job_queue, function_choice, prompt_style, user_input)
+        return redirect(url_for('.job_page', job_id=job_id), code=303)
+
+    original_ai_response = "" # Store the original, raw AI response
+    ai_response_html = "" # Store the HTML converted response
+    response_id = None # Id of the stored response, posted back by the feedback form
+
+    # The same pipeline as app.py's /generate, awaiting the model call under the upstream cap
+    try:
+        response = await generate_response_async(function_choice, prompt_style, user_input, limited_gemini_response)
+    except GeminiError as e:
+        return await error_page(user_input, e)
+    if response is not None:
+        original_ai_response = response
+
+        # Convert the Markdown response to sanitized HTML, once per distinct response
+        with phase("render_markdown"):
+            ai_response_html = render_markdown(original_ai_response)
+        # Keep the raw text on the server; the feedback form only posts its id back
+        with phase("store_response"):
+            response_id = await asyncio.to_thread(response_store.save, user_input, original_ai_response, function_choice, prompt_style)
+
+    with phase("render_template"):
+        return await render_template('result.html', query=user_input, response=ai_response_html, response_id=response_id)
+
+@views.route('/follow_up', methods=['POST'])
+async def follow_up():
+    """
+    Answers a follow-up question with the conversation so far as chat history; see follow_up in app.py.
+    """
+    form = await request.form
+    user_input = form['user_input']
+    session = await asyncio.to_thread(resume_conversation, form.get('session_id', ''), form.get('response_id', ''))
+    if session is None:
+        return "This conversation has expired, so the follow-up could not be answered.", 404
+
+    try:
+        with phase("upstream"):
+            original_ai_response = await continue_conversation_async(session, user_input, limited_gemini_response)
+    except GeminiError as e:
+        return await error_page(user_input, e)
+    with phase("render_markdown"):
+        ai_response_html = render_markdown(original_ai_response)
+    with phase("store_response"):
+        response_id = await asyncio.to_thread(response_store.save, user_input, original_ai_response, 'follow_up', None)
+    with phase("render_template"):
+        return await render_template('result.html', query=user_input, response=ai_response_html,
+                                     response_id=response_id, session_id=session['id'])
+
+@views.route('/jobs/<job_id>')
+async def job_page(job_id):
+    """
+    Shows a background job's progress, then its result; see job_page in app.py.
+    """
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        return "This job has expired or does not exist.", 404
+    if job['status'] == 'failed':
+        with phase("render_template"):
+            return await render_template('result.html', query=job['user_input'], error_message=job['error_message']), job['error_status']
+    if job['status'] != 'done':
+        with phase("render_template"):
+            return await render_template('job.html', query=job['user_input'], job=status_report(job),
+                                         status_url=url_for('.job_status', job_id=job_id))
+    with phase("render_markdown"):
+        response_html = render_markdown(job['response'])
+    with phase("store_response"):
+        response_id = await asyncio.to_thread(stored_response_id, job_queue, job)
+    with phase("render_template"):
+        return await render_template('result.html', query=job['user_input'], response=response_html, response_id=response_id)
+
+@views.route('/jobs/<job_id>/status')
+async def job_status(job_id):
+    """
+    Reports a background job's status as JSON.
+    """
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job: {job_id}"}), 404
+    return jsonify(status_report(job))
+
+@views.route('/generate/stream', methods=['POST'])
+async def generate_stream():
+    """
+    Streams the AI response as Server-Sent Events; see generate_stream in app.py for the event format.
+    """
+    form = await request.form
+    function_choice = form['function_choice']
+    prompt_style = form['prompt_style']
+    user_input = form['user_input']
+
+    try:
+        with phase("build_prompt"):
+            prompt = await build_request_prompt_async(function_choice, prompt_style, user_input, limited_gemini_response)
+    except GeminiError as e:
+        return Response(sse_event('error', {'message': e.user_message}), mimetype='text/event-stream')
+    if not prompt:
+        log_event(f"Invalid function or prompt style received: {function_choice}/{prompt_style}", "data/errors.log")
+        return Response(sse_event('error', {'message': "Invalid function or prompt style selected."}), mimetype='text/event-stream')
+
+    log_event(f"Streaming response for function: {function_choice}, style: {prompt_style}, input: '{user_input[:50]}...' using Gemini.")
+
+    timer = detach_request_timer() # The stream outlives the request's teardown
+
+    async def chunks():
+        # The cache lookups and stores below read and write files, so they run off the event loop
+        cached_response = await asyncio.to_thread(response_cache.get, prompt, CACHE_MODEL_NAME)
+        if cached_response is None:
+            cached_response = await asyncio.to_thread(semantic_cache.lookup, function_choice, prompt_style, user_input)
+        if cached_response is not None:
+            yield cached_response, True
+            return
+        async with upstream_semaphore:
+            with phase("upstream"):
+                async for chunk in stream_gemini_response_async(prompt, max_output_tokens=output_budget(function_choice)):
+                    yield chunk, False
+
+    async def sse_events():
+        renderer = IncrementalMarkdownRenderer()
+        parts = []
+        from_cache = False
+        try:
+            async for chunk, from_cache in chunks():
+                parts.append(chunk)
+                block_html, tail_html = renderer.feed(chunk)
+                if block_html:
+                    yield sse_event('block', {'html': block_html})
+                yield sse_event('tail', {'html': tail_html})
+        except GeminiError as e:
+            yield sse_event('error', {'message': e.user_message})
+            return
+        yield sse_event('block', {'html': renderer.finish()})
+
+        original_ai_response = "".join(parts)
+        if not from_cache:
+            await asyncio.to_thread(response_cache.set, prompt, CACHE_MODEL_NAME, original_ai_response)
+            await asyncio.to_thread(semantic_cache.add, function_choice, prompt_style, user_input, original_ai_response)
+        log_event(f"AI Response streamed: '{original_ai_response[:50]}...'")
+        response_id = await asyncio.to_thread(response_store.save, user_input, original_ai_response, function_choice, prompt_style)
+        yield sse_event('done', {'response_id': response_id})
+
+    async def events():
+        with streamed_request(timer):
+            async for event in sse_events():
+                yield event
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@views.route('/feedback', methods=['POST'])
+async def feedback():
+    """
+    Collects user feedback on the AI's response, posted as the stored response's id.
+    """
+    form = await request.form
+    response_id = form.get('response_id', '')
+    helpful = form['helpful'] == 'yes'
+    timestamp = datetime.now().isoformat()
+
+    # The append takes a file lock, so keep it off the event loop
+    with phase("save_feedback"):
+        record = await asyncio.to_thread(save_feedback_for_response, response_id, helpful, timestamp)
+    if record is None:
+        return "This response has expired, so the feedback could not be recorded.", 404
+    log_event(f"User feedback received: Query='{record['query'][:50]}...', Helpful={helpful}")
+
+    return redirect(url_for('.index'))
+
+@views.route('/batch', methods=['POST'])
+async def batch():
+    """
+    Starts a batch job over an uploaded JSONL file; see batch in app.py. The job runs the
+    synchronous pipeline on its own threads, so the event loop only stores the upload.
+    """
+    upload = (await request.files).get('file')
+    data = upload.read() if upload else await request.get_data()
+    if not data.strip():
+        return jsonify({'error': "No JSONL input provided."}), 400
+
+    try:
+        job = await asyncio.to_thread(submit_batch, data, **batch_options(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    log_event(f"Batch job {job.job_id} submitted.")
+    return jsonify({'job_id': job.job_id, 'status_url': url_for('.batch_status', job_id=job.job_id),
+                    'results_url': url_for('.batch_results', job_id=job.job_id)}), 202
+
+@views.route('/batch/<job_id>')
+async def batch_status(job_id):
+    """
+    Reports a batch job's status and progress as JSON, whichever worker process runs it.
+    """
+    progress = await asyncio.to_thread(get_batch_progress, job_id)
+    if progress is None:
+        return jsonify({'error': f"Unknown batch job: {job_id}"}), 404
+    return jsonify(progress)
+
+@views.route('/batch/<job_id>/results')
+async def batch_results(job_id):
+    """
+    Returns the JSONL results written so far by a batch job.
+    """
+    output_path = batch_output_path(job_id)
+    if output_path is None or not os.path.exists(output_path):
+        return jsonify({'error': f"No results for batch job: {job_id}"}), 404
+    return await send_file(os.path.abspath(output_path), mimetype='application/x-ndjson')
+
+@views.route('/batch/<job_id>/resume', methods=['POST'])
+async def batch_resume(job_id):
+    """
+    Resumes a stored batch job from its checkpoint, e.g. after a restart.
+    """
+    try:
+        job = await asyncio.to_thread(resume_batch, job_id, **batch_options(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if job is None:
+        return jsonify({'error': f"Batch job {job_id} is running or does not exist."}), 409
+    return jsonify({'job_id': job.job_id, 'status_url': url_for('.batch_status', job_id=job.job_id)}), 202
+
+@views.route('/stats')
+async def stats():
+    """
+    Reports helpful-rates per function and prompt style over time windows; see stats in app.py.
+    """
+    try:
+        windows = [int(days) for days in request.args.get('windows', '1,7,30').split(',') if days.strip()]
+    except ValueError:
+        return jsonify({'error': "windows must be a comma-separated list of days."}), 400
+    # Catching up on new feedback reads the log tail, so keep it off the event loop
+    return jsonify(await asyncio.to_thread(feedback_stats.report, windows))
+
+@views.route('/metrics')
+async def metrics():
+    """
+    Exposes the same Prometheus metrics as app.py's /metrics.
+    """
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@views.route('/cache/stats')
+async def cache_stats():
+    """
+    Reports response cache hit/miss counters and tier sizes, and the semantic cache's counters, as JSON.
+    """
+    # Sizing the disk tier lists its directory, so keep it off the event loop
+    cache = await asyncio.to_thread(response_cache.stats)
+    return jsonify(dict(cache, semantic=semantic_cache.stats(), render=render_cache.stats()))
+
+@views.route('/upstream/stats')
+async def upstream_status():
+    """
+    Reports the Gemini rate limiter and circuit breaker state, and the model router's per-provider
+    latency and health when a router is configured, as JSON.
+    """
+    stats = upstream_stats()
+    if model_router is not None:
+        stats["router"] = model_router.stats()
+    return jsonify(stats)
+
+@views.route('/coalescing/stats')
+async def coalescing_stats():
+    """
+    Reports how many model calls were executed and how many identical calls were coalesced onto them.
+    """
+    return jsonify(single_flight.stats())
+
+@views.route('/jobs/stats')
+async def jobs_stats():
+    """
+    Reports the background job queue's jobs by status and function as JSON.
+    """
+    return jsonify(await asyncio.to_thread(job_queue.stats))
+
+@views.route('/sessions/stats')
+async def session_stats():
+    """
+    Reports how many conversations are held, and the turns and history compactions so far.
+    """
+    return jsonify(conversations.stats())
+
+if __name__ == '__main__':
+    app = create_app()
+    app.run(debug=app.config["DEBUG"], host=app.config["HOST"], port=app.config["PORT"])
@@ -0,0 +1,228 @@
+"""
+This module holds the shared response pipeline used by the web routes and the batch runner:
+prompt building (with per-function token budgets, see budget.py, and map-reduce summarization
+of long documents), the exact and
+semantic response caches, request coalescing and the model call (Gemini, or the model router
+in providers.py when MODEL_PROVIDERS lists more than one provider), and follow-up questions in
+multi-turn conversations (see sessions.py). The async variants serve asgi.py: they await the model
+call they are given and run the caches' and stores' blocking work in worker threads.
+"""
+import asyncio
+from utils import log_event
+from metrics import phase, registry
+from prompts import build_prompt
+from gemini_api import get_gemini_response, upstream_stats, MODEL_NAME
+from cache import create_response_cache_from_env, make_cache_key
+from semantic_cache import create_semantic_cache_from_env
+from singleflight import SingleFlight
+from summarize import build_long_summary_prompt, build_long_summary_prompt_async
+from providers import create_router_from_env
+from budget import fit_input, output_budget, truncate_to_tokens
+from sessions import create_conversation_store_from_env
+from response_store import response_store
+from rendering import render_cache
+
+# Cache of model responses keyed on the rendered prompt, shared by all requests
+response_cache = create_response_cache_from_env()
+
+# Responses looked up by query similarity, so rephrased questions skip the model (SEMANTIC_CACHE=1)
+semantic_cache = create_semantic_cache_from_env()
+
+# Identical prompts in flight at the same time share a single upstream call
+single_flight = SingleFlight()
+
+# Failover and hedging across model providers; None when Gemini is the only provider
+model_router = create_router_from_env()
+
+# Model name the response cache is keyed on: routed answers are kept apart from Gemini's own
+CACHE_MODEL_NAME = model_router.cache_name if model_router is not None else MODEL_NAME
+
+# Multi-turn conversations, started by a follow-up question to a response
+conversations = create_conversation_store_from_env()
+
+def call_model(prompt, max_output_tokens=None, history=None):
+    """
+    Returns the model's response for a prompt, from the model router if one is configured.
+    :param max_output_tokens: Cap on the response length, or None for the model's default.
+    :param history: Earlier turns of the conversation the prompt continues, if any.
+    """
+    if model_router is not None:
+        return model_router.generate(prompt, max_output_tokens, history)
+    return get_gemini_response(prompt, max_output_tokens=max_output_tokens, history=history)
+
+def is_cacheable(response):
+    """
+    Returns False for a routed answer that must not be reused: a failover, a hedge or a stand-in's
+    (see providers.RoutedResponse). Such answers are neither cached nor added to the semantic cache.
+    """
+    return getattr(response, "cacheable", True)
+
+def coalesced_gemini_response(prompt, max_output_tokens=None):
+    """
+    Calls the model for a prompt, waiting on an identical in-flight call instead of issuing another.
+    """
+    return single_flight.do(make_cache_key(prompt, CACHE_MODEL_NAME), lambda: call_model(prompt, max_output_tokens))
+
+def cached_gemini_response(prompt):
+    """
+    Returns the cached response for a prompt, calling Gemini (coalesced) on a miss.
+    """
+    return response_cache.get_or_generate(prompt, CACHE_MODEL_NAME, coalesced_gemini_response, is_cacheable)
+
+def build_request_prompt(function_choice, prompt_style, user_input):
+    """
+    Builds the final prompt for a request. The input is first fitted to its function's token budget
+    (see budget.py). Long summarize_text inputs are then summarized chunk by chunk (see summarize.py),
+    and the prompt returned combines the chunk summaries.
+    :return: The prompt string, or an empty string if the function or prompt style is unknown.
+    Raises a GeminiError subclass if summarizing a chunk fails.
+    """
+    user_input, _decision = fit_input(function_choice, user_input)
+    if function_choice == "summarize_text":
+        return build_long_summary_prompt(user_input, prompt_style, cached_gemini_response)
+    return build_prompt(function_choice, prompt_style, user_input)
+
+def generate_response(function_choice, prompt_style, user_input):
+    """
+    Builds the prompt for a request and returns the raw AI response for it,
+    reusing a cached answer for a repeated or rephrased prompt.
+    :param function_choice: One of answer_question, summarize_text, generate_creative_content.
+    :param prompt_style: The style chosen for that function.
+    :param user_input: The user's question, text or topic.
+    :return: The raw response text, or None if the function or prompt style is unknown.
+    Raises a GeminiError subclass if the model call fails; failures are never cached.
+    """
+    with phase("build_prompt"):
+        prompt = build_request_prompt(function_choice, prompt_style, user_input)
+    if not prompt:
+        log_event(f"Invalid function or prompt style received: {function_choice}/{prompt_style}", "data/errors.log")
+        return None
+
+    def generate(prompt):
+        # On an exact cache miss, a near-duplicate earlier query can still answer without a model call
+        response = semantic_cache.lookup(function_choice, prompt_style, user_input)
+        if response is None:
+            response = coalesced_gemini_response(prompt, output_budget(function_choice))
+            if is_cacheable(response):
+                semantic_cache.add(function_choice, prompt_style, user_input, response)
+        return response
+
+    log_event(f"Generating response for function: {function_choice}, style: {prompt_style}, input: '{user_input[:50]}...' using Gemini.")
+    with phase("upstream"):
+        response = response_cache.get_or_generate(prompt, CACHE_MODEL_NAME, generate, is_cacheable)
+    log_event(f"AI Response generated: '{response[:50]}...'")
+    return response
+
+async def build_request_prompt_async(function_choice, prompt_style, user_input, call_model_async):
+    """
+    Async variant of build_request_prompt. Chunk summaries of long documents are cached and awaited
+    through call_model_async(prompt, max_output_tokens).
+    """
+    user_input, _decision = fit_input(function_choice, user_input)
+    if function_choice == "summarize_text":
+        async def cached_response(prompt):
+            return await response_cache.get_or_generate_async(prompt, CACHE_MODEL_NAME, lambda prompt: call_model_async(prompt, None),
+                                                              is_cacheable)
+        return await build_long_summary_prompt_async(user_input, prompt_style, cached_response)
+    return build_prompt(function_choice, prompt_style, user_input)
+
+async def generate_response_async(function_choice, prompt_style, user_input, call_model_async):
+    """
+    Async variant of generate_response, for the same request pipeline on an event loop.
+    :param call_model_async: Coroutine function (prompt, max_output_tokens) awaiting the model, e.g. with
+                             asgi.py's cap on concurrent upstream calls.
+    :return: The raw response text, or None if the function or prompt style is unknown.
+    Raises a GeminiError subclass if the model call fails; failures are never cached.
+    """
+    with phase("build_prompt"):
+        prompt = await build_request_prompt_async(function_choice, prompt_style, user_input, call_model_async)
+    if not prompt:
+        log_event(f"Invalid function or prompt style received: {function_choice}/{prompt_style}", "data/errors.log")
+        return None
+
+    async def generate(prompt):
+        # On an exact cache miss, a near-duplicate earlier query can still answer without a model call
+        response = await asyncio.to_thread(semantic_cache.lookup, function_choice, prompt_style, user_input)
+        if response is None:
+            response = await call_model_async(prompt, output_budget(function_choice))
+            if is_cacheable(response):
+                await asyncio.to_thread(semantic_cache.add, function_choice, prompt_style, user_input, response)
+        return response
+
+    log_event(f"Generating response for function: {function_choice}, style: {prompt_style}, input: '{user_input[:50]}...' using Gemini.")
+    with phase("upstream"):
+        response = await response_cache.get_or_generate_async(prompt, CACHE_MODEL_NAME, generate, is_cacheable)
+    log_event(f"AI Response generated: '{response[:50]}...'")
+    return response
+
+def resume_conversation(session_id, response_id):
+    """
+    Returns the conversation a follow-up question continues: the session stored under session_id or,
+    for the first follow-up to a response, a new session seeded with that response's exchange.
+    :return: The session, or None if both the session and the response have expired.
+    """
+    session = conversations.get(session_id)
+    if session is not None:
+        return session
+    record = response_store.get(response_id)
+    if record is None:
+        return None
+    prompt = build_prompt(record["function_choice"], record["prompt_style"], record["query"]) or record["query"]
+    # A long document stays out of the history; the response already covers it
+    prompt = truncate_to_tokens(prompt, conversations.max_history_tokens // 2)
+    return conversations.start([{"role": "user", "text": prompt}, {"role": "model", "text": record["response"]}])
+
+def continue_conversation(session, user_input):
+    """
+    Sends a follow-up question with the conversation's history and returns the model's response.
+    Follow-ups are not cached: the answer depends on the conversation before them.
+    Raises a GeminiError subclass if the model call fails.
+    """
+    message, _decision = fit_input("follow_up", user_input)
+    log_event(f"Continuing session {session['id']} with a follow-up: '{user_input[:50]}...'", event="follow_up")
+    return conversations.reply(session, message,
+                               lambda prompt, history: call_model(prompt, output_budget("follow_up"), history))
+
+async def continue_conversation_async(session, user_input, call_model_async):
+    """
+    Async variant of continue_conversation; call_model_async(prompt, max_output_tokens, history) is awaited.
+    """
+    message, _decision = fit_input("follow_up", user_input)
+    log_event(f"Continuing session {session['id']} with a follow-up: '{user_input[:50]}...'", event="follow_up")
+    return await conversations.reply_async(
+        session, message, lambda prompt, history: call_model_async(prompt, output_budget("follow_up"), history))
+
+@registry.register_collector
+def pipeline_metrics():
+    """
+    Exposes the caches' (including the rendered HTML cache), coalescing, upstream limiter and
+    context cache counters on /metrics at scrape time.
+    """
+    cache = response_cache.stats()
+    semantic = semantic_cache.stats()
+    rendered = render_cache.stats()
+    coalescing = single_flight.stats()
+    upstream = upstream_stats()
+    breaker_states = ("closed", "half_open", "open")
+    return [
+        ("assistant_cache_lookups_total", "counter", "Response cache lookups by cache and result.",
+         [({"cache": "exact", "tier": tier, "result": "hit"}, hits) for tier, hits in cache["tier_hits"].items()]
+         + [({"cache": "exact", "tier": "", "result": "miss"}, cache["misses"]),
+            ({"cache": "semantic", "tier": "", "result": "hit"}, semantic["hits"]),
+            ({"cache": "semantic", "tier": "", "result": "miss"}, semantic["misses"]),
+            ({"cache": "render", "tier": "", "result": "hit"}, rendered["hits"]),
+            ({"cache": "render", "tier": "", "result": "miss"}, rendered["misses"])]),
+        ("assistant_coalesced_calls_total", "counter", "Model calls executed and coalesced by single-flight.",
+         [({"result": "executed"}, coalescing["executed"]), ({"result": "coalesced"}, coalescing["coalesced"])]),
+        ("assistant_upstream_requests_per_minute", "gauge", "Current adaptive request rate limit.",
+         [({}, upstream["rate_limiter"]["requests_per_minute"])]),
+        ("assistant_upstream_rate_limited_total", "counter", "429 responses seen by the rate limiter.",
+         [({}, upstream["rate_limiter"]["rate_limited"])]),
+        ("assistant_circuit_breaker_state", "gauge", "Circuit breaker state (0 closed, 1 half-open, 2 open).",
+         [({}, breaker_states.index(upstream["circuit_breaker"]["state"]))]),
+        ("assistant_context_cache_calls_total", "counter", "Calls sent with a cached prompt prefix, or in full after a fallback.",
+         [({"result": "hit"}, upstream["context_cache"]["hits"]),
+          ({"result": "fallback"}, upstream["context_cache"]["fallbacks"])]),
+        ("assistant_context_cache_tokens_saved_total", "counter", "Estimated prompt tokens sent as a context cache reference.",
+         [({}, upstream["context_cache"]["tokens_saved"])]),
+    ]
@@ -0,0 +1,438 @@
+"""
+This module runs the AI Assistant over a JSONL file of requests, offline or from the /batch endpoint.
+Each input line is a JSON object with function_choice, prompt_style and user_input, and goes through
+the same pipeline as the /generate route (see assistant.generate_response).
+
+Usage:
+    python batch.py input.jsonl output.jsonl [--concurrency 4] [--rate 60]
+
+Results are appended to the output file as JSON Lines as soon as each record finishes, tagged with
+the record's line index. The output file doubles as the checkpoint: re-running with the same output
+skips records that already have a successful result, so an interrupted batch resumes where it stopped.
+When a record is retried after a failure, its latest line is the one that counts.
+
+Each record is attempted once per run: transient upstream errors are already retried with backoff by
+the Gemini client (GEMINI_MAX_RETRIES), so a failed line is final until the batch is resumed.
+
+Jobs started from /batch report their progress to a SQLite registry (data/batch.sqlite3), so any
+worker process of the web server can report on and resume a job another one runs. A running job
+refreshes its row every BATCH_PROGRESS_SECONDS; one that stops doing so (its process died) is
+reported as interrupted and may be resumed.
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from utils import ensure_directory_exists, log_event
+from assistant import generate_response
+from gemini_api import GeminiError
+from ratelimit import TokenBucket
+
+BATCH_DIR = "data/batch"
+BATCH_DB_PATH = "data/batch.sqlite3"
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RATE_PER_MINUTE = 60
+REQUIRED_FIELDS = ("function_choice", "prompt_style", "user_input")
+BATCH_PROGRESS_SECONDS = float(os.environ.get("BATCH_PROGRESS_SECONDS", 2)) # How often a running job saves its progress
+DEFAULT_STALE_SECONDS = 30 # A job that has not saved progress for this long is no longer running
+
+_ID_RE = re.compile(r"[0-9a-f]{12}")
+_PROGRESS_FIELDS = ("status", "total", "succeeded", "failed", "skipped", "started_at", "finished_at")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    succeeded INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    started_at TEXT,
+    finished_at TEXT,
+    heartbeat_at REAL NOT NULL
+);
+"""
+
+def read_records(input_path):
+    """
+    Lazily yields (index, record, error) for each non-blank line of a JSONL file.
+    The index is the zero-based line number; error is set when the line is not a valid request.
+    """
+    with open(input_path, "r", encoding="utf-8") as f:
+        for index, line in enumerate(f):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield index, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield index, None, "Each line must be a JSON object."
+                continue
+            missing = [field for field in REQUIRED_FIELDS if not isinstance(record.get(field), str)]
+            if missing:
+                yield index, record, f"Missing fields: {', '.join(missing)}"
+                continue
+            yield index, record, None
+
+def load_checkpoint(output_path):
+    """
+    Returns the indices of records that already have a successful result in the output file.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue # A partially written last line from an interrupted run
+            if result.get("error") is None:
+                completed.add(result["index"])
+            else:
+                completed.discard(result["index"])
+    return completed
+
+class BatchRegistry:
+    """
+    Progress of the batch jobs started by any process, in SQLite. Like jobqueue.JobQueue, each call
+    opens its own connection, so an instance is safe to use from any thread and across fork.
+    Each run of a job has its own run id, and only the run that claimed the job updates its row.
+    """
+
+    def __init__(self, path=BATCH_DB_PATH, stale_seconds=DEFAULT_STALE_SECONDS):
+        self.path = path
+        self.stale_seconds = stale_seconds
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            ensure_directory_exists(os.path.dirname(self.path) or ".")
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        if not self._initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+            self._initialized = True
+        return connection
+
+    def _transaction(self, work):
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(connection)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            return result
+        finally:
+            connection.close()
+
+    def _is_active(self, row, now):
+        return row["status"] in ("pending", "running") and row["heartbeat_at"] >= now - self.stale_seconds
+
+    def claim(self, job_id, run_id):
+        """
+        Registers a new run of a job, unless a live run of it is still pending or running.
+        :return: True if the run may start.
+        """
+        def claim_job(connection):
+            now = time.time()
+            row = connection.execute("SELECT status, heartbeat_at FROM batches WHERE id = ?", (job_id,)).fetchone()
+            if row is not None and self._is_active(row, now):
+                return False
+            connection.execute("INSERT OR REPLACE INTO batches (id, run_id, status, heartbeat_at) VALUES (?, ?, 'pending', ?)",
+                               (job_id, run_id, now))
+            return True
+        return self._transaction(claim_job)
+
+    def update(self, job_id, run_id, progress):
+        """
+        Saves a run's progress (a BatchJob.progress() dict), which also shows the run is alive.
+        """
+        assignments = ", ".join(f"{name} = ?" for name in _PROGRESS_FIELDS)
+        self._transaction(lambda connection: connection.execute(
+            f"UPDATE batches SET {assignments}, heartbeat_at = ? WHERE id = ? AND run_id = ?",
+            (*(progress[name] for name in _PROGRESS_FIELDS), time.time(), job_id, run_id)))
+
+    def get(self, job_id):
+        """
+        Returns a job's progress as a dict like BatchJob.progress(), or None if it is unknown.
+        A job whose run stopped saving progress is reported with the status "interrupted".
+        """
+        if not isinstance(job_id, str) or not _ID_RE.fullmatch(job_id):
+            return None
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT * FROM batches WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            return None
+        progress = {name: row[name] for name in _PROGRESS_FIELDS}
+        if progress["status"] in ("pending", "running") and not self._is_active(row, time.time()):
+            progress["status"] = "interrupted"
+        return _with_totals(job_id, progress)
+
+def _with_totals(job_id, counts):
+    processed = counts["succeeded"] + counts["failed"] + counts["skipped"]
+    return {
+        "job_id": job_id,
+        "status": counts["status"],
+        "total": counts["total"],
+        "processed": processed,
+        "succeeded": counts["succeeded"],
+        "failed": counts["failed"],
+        "skipped": counts["skipped"],
+        "percent": round(100.0 * processed / counts["total"], 1) if counts["total"] else 0.0,
+        "started_at": counts["started_at"],
+        "finished_at": counts["finished_at"],
+    }
+
+# Shared by the web worker processes that start, poll and resume batch jobs
+batch_registry = BatchRegistry()
+
+class BatchJob:
+    """
+    One batch run: reads the input file, processes records on a bounded worker pool
+    under a shared rate limit, and appends results to the output file.
+    With a registry, the run's progress is saved there while it runs (see BatchRegistry).
+    Raises ValueError if concurrency is below 1 or rate_per_minute is not positive.
+    """
+
+    def __init__(self, input_path, output_path, concurrency=DEFAULT_CONCURRENCY,
+                 rate_per_minute=DEFAULT_RATE_PER_MINUTE, job_id=None, registry=None):
+        if concurrency is None or concurrency < 1:
+            raise ValueError("concurrency must be at least 1.")
+        if rate_per_minute is None or not rate_per_minute > 0:
+            raise ValueError("rate must be a positive number of requests per minute.")
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.input_path = input_path
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.limiter = TokenBucket(rate_per_minute)
+        self.status = "pending"
+        self.total = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.started_at = None
+        self.finished_at = None
+        self.registry = registry
+        self.run_id = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._done = threading.Event()
+
+    def progress(self):
+        """
+        Returns the job's status and counters as a dict.
+        """
+        with self._lock:
+            return _with_totals(self.job_id, {name: getattr(self, name) for name in _PROGRESS_FIELDS})
+
+    def _publish(self):
+        if self.registry is None:
+            return
+        with self._publish_lock: # Keeps a heartbeat from overwriting the final progress with an older one
+            try:
+                self.registry.update(self.job_id, self.run_id, self.progress())
+            except Exception as e:
+                log_event(f"Batch {self.job_id} could not save its progress: {e!r}", "data/errors.log", event="batch_error")
+
+    def _heartbeat(self):
+        while not self._done.wait(BATCH_PROGRESS_SECONDS):
+            self._publish()
+
+    def run(self):
+        """
+        Processes every record that does not yet have a successful result, then returns the progress.
+        """
+        self.status = "running"
+        self.started_at = datetime.now().isoformat()
+        log_event(f"Batch {self.job_id} started: {self.input_path} -> {self.output_path}")
+        self._publish()
+        if self.registry is not None:
+            threading.Thread(target=self._heartbeat, name=f"batch-{self.job_id}-progress", daemon=True).start()
+        try:
+            completed = load_checkpoint(self.output_path)
+            with open(self.input_path, "r", encoding="utf-8") as f:
+                self.total = sum(1 for line in f if line.strip())
+            ensure_directory_exists(os.path.dirname(os.path.abspath(self.output_path)))
+
+            # Bound the records queued ahead of the workers so large inputs are never fully loaded.
+            slots = threading.BoundedSemaphore(self.concurrency * 2)
+            with open(self.output_path, "a", encoding="utf-8") as out, \
+                 ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"batch-{self.job_id}") as pool:
+                for index, record, error in read_records(self.input_path):
+                    if index in completed:
+                        with self._lock:
+                            self.skipped += 1
+                        continue
+                    slots.acquire()
+                    future = pool.submit(self._process, index, record, error)
+                    future.add_done_callback(
+                        lambda done, index=index, record=record: self._finish(out, slots, index, record, done))
+            self.status = "completed"
+        except Exception as e:
+            self.status = "failed"
+            log_event(f"Batch {self.job_id} failed: {e}", "data/errors.log")
+        self.finished_at = datetime.now().isoformat()
+        self._done.set()
+        self._publish()
+        log_event(f"Batch {self.job_id} {self.status}: {self.progress()}")
+        return self.progress()
+
+    def _process(self, index, record, error):
+        result = {"index": index}
+        if record is not None:
+            result.update({field: record.get(field) for field in REQUIRED_FIELDS})
+        if error is not None:
+            result.update({"response": None, "error": error})
+            return result
+
+        self.limiter.acquire()
+        try:
+            response = generate_response(record["function_choice"], record["prompt_style"], record["user_input"])
+        except GeminiError as e:
+            result.update({"response": None, "error": str(e)})
+            return result
+        if response is None:
+            result.update({"response": None, "error": "Invalid function or prompt style selected."})
+        else:
+            result.update({"response": response, "error": None})
+        return result
+
+    def _finish(self, out, slots, index, record, done):
+        # Runs as the task's done callback: whatever happens, the record gets a result and frees its slot
+        try:
+            try:
+                result = done.result()
+            except Exception as e:
+                log_event(f"Batch {self.job_id} record {index} failed: {e!r}", "data/errors.log", event="batch_error")
+                result = {"index": index, "response": None, "error": f"Unexpected error: {e}"}
+                if isinstance(record, dict):
+                    result.update({field: record.get(field) for field in REQUIRED_FIELDS})
+            self._record_result(out, result)
+        except Exception as e:
+            log_event(f"Batch {self.job_id} could not record the result of record {index}: {e!r}", "data/errors.log")
+            with self._lock:
+                self.failed += 1
+        finally:
+            slots.release()
+
+    def _record_result(self, out, result):
+        with self._lock:
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            if result["error"] is None:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+
+def batch_output_path(job_id):
+    """
+    Returns the path of a stored batch job's results, or None if job_id is not a valid id.
+    """
+    if not isinstance(job_id, str) or not _ID_RE.fullmatch(job_id):
+        return None
+    return _job_paths(job_id)[1]
+
+def _job_paths(job_id):
+    job_dir = os.path.join(BATCH_DIR, job_id)
+    return os.path.join(job_dir, "input.jsonl"), os.path.join(job_dir, "output.jsonl")
+
+def _start_in_background(job):
+    if not job.registry.claim(job.job_id, job.run_id):
+        return None
+    threading.Thread(target=job.run, name=f"batch-{job.job_id}", daemon=True).start()
+    return job
+
+def submit_batch(data, registry=None, **options):
+    """
+    Stores uploaded JSONL data under data/batch/<job_id>/ and starts processing it in the background.
+    :param data: The JSONL input as bytes.
+    :param registry: The BatchRegistry to report progress to; batch_registry by default.
+    :param options: BatchJob options (concurrency, rate_per_minute).
+    :return: The started BatchJob.
+    Raises ValueError if the options are out of range; nothing is stored then.
+    """
+    job_id = uuid.uuid4().hex[:12]
+    input_path, output_path = _job_paths(job_id)
+    # Validates the options first
+    job = BatchJob(input_path, output_path, job_id=job_id, registry=registry or batch_registry, **options)
+    ensure_directory_exists(os.path.dirname(input_path))
+    with open(input_path, "wb") as f:
+        f.write(data)
+    return _start_in_background(job)
+
+def resume_batch(job_id, registry=None, **options):
+    """
+    Restarts a stored batch job from its checkpoint, e.g. after a server restart.
+    :return: The BatchJob, or None if there is no stored job with that id or it is still running
+    in any process.
+    """
+    if batch_output_path(job_id) is None:
+        return None
+    input_path, output_path = _job_paths(job_id)
+    if not os.path.exists(input_path):
+        return None
+    return _start_in_background(BatchJob(input_path, output_path, job_id=job_id,
+                                         registry=registry or batch_registry, **options))
+
+def batch_options(args):
+    """
+    Reads batch worker options from a request's query string arguments.
+    Raises ValueError if an option is not a number; BatchJob rejects out-of-range values.
+    """
+    options = {}
+    for name, option, default, cast in (('concurrency', 'concurrency', DEFAULT_CONCURRENCY, int),
+                                        ('rate', 'rate_per_minute', DEFAULT_RATE_PER_MINUTE, float)):
+        value = args.get(name)
+        try:
+            options[option] = default if value is None else cast(value)
+        except ValueError:
+            raise ValueError(f"{name} must be a number.")
+    return options
+
+def get_batch_progress(job_id, registry=None):
+    """
+    Returns the progress of a batch job started by any process, or None if it is unknown.
+    """
+    return (registry or batch_registry).get(job_id)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the AI Assistant over a JSONL file of requests.")
+    parser.add_argument("input", help="JSONL file with function_choice, prompt_style and user_input per line")
+    parser.add_argument("output", help="JSONL file to append results to (also used to resume)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Worker threads")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE_PER_MINUTE, help="Maximum requests per minute")
+    args = parser.parse_args(argv)
+
+    try:
+        job = BatchJob(args.input, args.output, concurrency=args.concurrency, rate_per_minute=args.rate)
+    except ValueError as e:
+        parser.error(str(e))
+    worker = threading.Thread(target=job.run, daemon=True)
+    worker.start()
+    while worker.is_alive():
+        worker.join(timeout=2)
+        progress = job.progress()
+        print(f"[{progress['status']}] {progress['processed']}/{progress['total']} "
+              f"({progress['succeeded']} ok, {progress['failed']} failed, {progress['skipped']} skipped)")
+    return 0 if job.status == "completed" and job.failed == 0 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
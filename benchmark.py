@@ -0,0 +1,377 @@
+"""
+This module benchmarks the AI Assistant, so throughput and latency regressions show up before deploy.
+
+    python benchmark.py load [--requests 200] [--concurrency 8] [--latency-ms 200] [--error-rate 0.01]
+                             [--rate-limit-rate 0.02] [--feedback-ratio 0.5] [--distinct 0] [--url URL] [--json]
+    python benchmark.py micro [--json] [--save baseline.json] [--compare baseline.json] [--tolerance 0.25]
+    python benchmark.py context-cache [--requests 20] [--instruction-tokens 6000] [--json]
+
+The load benchmark drives /generate and /feedback at a fixed concurrency and reports requests per second
+and p50/p95/p99 latency per route. By default it runs app.py in-process against the stand-in Gemini
+server in mock_gemini.py, in a temporary working directory so the real data/ files are left alone.
+With --url it drives an already running server instead (start that server with GEMINI_API_ENDPOINT
+pointing at `python mock_gemini.py`).
+
+The microbenchmarks time the prompt builders, log_event and the feedback store. --save writes the
+results as a baseline; --compare exits with status 1 if any result is slower than the baseline by
+more than the tolerance.
+
+The context cache benchmark sends the same prompts, built from a template with long instructions,
+to the stand-in server with context caching off and then on (see context_cache.py), and reports
+the prompt tokens the upstream had to process in each mode.
+"""
+import os
+import re
+import sys
+import json
+import time
+import timeit
+import tempfile
+import argparse
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from mock_gemini import MockGeminiConfig, MockGeminiServer
+
+DEFAULT_REQUESTS = 200
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TOLERANCE = 0.25 # Fraction a microbenchmark may slow down before --compare fails
+PERCENTILES = (50, 95, 99)
+
+_RESPONSE_ID_RE = re.compile(r'name="response_id" value="([^"]+)"')
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of a list of numbers (None for an empty list).
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100)) # ceil(n * p / 100)
+    return ordered[int(rank) - 1]
+
+def summarize_latencies(latencies, elapsed_seconds):
+    """
+    Reports the count, throughput and latency percentiles (in milliseconds) of one route's requests.
+    """
+    summary = {"requests": len(latencies),
+               "requests_per_second": round(len(latencies) / elapsed_seconds, 2) if elapsed_seconds else None}
+    for percent in PERCENTILES:
+        value = percentile(latencies, percent)
+        summary[f"p{percent}_ms"] = round(value * 1000, 2) if value is not None else None
+    summary["max_ms"] = round(max(latencies) * 1000, 2) if latencies else None
+    return summary
+
+class _HttpClient:
+    """
+    Posts forms to a running server over HTTP.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def post(self, path, data):
+        request = urllib.request.Request(self.base_url + path, data=urllib.parse.urlencode(data).encode("utf-8"))
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                return response.status, response.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode("utf-8", "replace")
+
+class _FlaskClient:
+    """
+    Posts forms to the in-process Flask app, with one test client per worker thread.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self._local = threading.local()
+
+    def post(self, path, data):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.flask_app.test_client()
+        response = client.post(path, data=data)
+        return response.status_code, response.get_data(as_text=True)
+
+def run_load(client, requests=DEFAULT_REQUESTS, concurrency=DEFAULT_CONCURRENCY, feedback_ratio=0.5, distinct=0,
+             function_choice="answer_question", prompt_style="general"):
+    """
+    Sends `requests` /generate posts (each followed, for feedback_ratio of them, by a /feedback post
+    for the returned response id) from `concurrency` worker threads.
+    :param client: An object with post(path, form_data) returning (status, body text).
+    :param distinct: Cycle through this many distinct questions (0 makes every question unique,
+                     so no request is answered from a cache).
+    :return: A report with per-route summaries and counts of responses by status.
+    """
+    latencies = {"generate": [], "feedback": []}
+    statuses = {"generate": {}, "feedback": {}}
+    lock = threading.Lock()
+
+    def timed_post(route, path, data):
+        started = time.perf_counter()
+        status, body = client.post(path, data)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies[route].append(elapsed)
+            statuses[route][status] = statuses[route].get(status, 0) + 1
+        return status, body
+
+    def one_request(index):
+        question = index % distinct if distinct else index
+        status, body = timed_post("generate", "/generate", {
+            "function_choice": function_choice, "prompt_style": prompt_style,
+            "user_input": f"Benchmark question {question}: how do caches reduce latency?"})
+        match = _RESPONSE_ID_RE.search(body) if status == 200 else None
+        if match and int((index + 1) * feedback_ratio) > int(index * feedback_ratio):
+            timed_post("feedback", "/feedback", {"response_id": match.group(1), "helpful": "yes" if index % 3 else "no"})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="benchmark") as pool:
+        list(pool.map(one_request, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    report = {"concurrency": concurrency, "elapsed_seconds": round(elapsed, 3)}
+    for route in latencies:
+        report[route] = dict(summarize_latencies(latencies[route], elapsed), statuses=statuses[route])
+    return report
+
+@contextmanager
+def _temporary_workdir():
+    """
+    Runs the block in a temporary directory, so the app's relative data/ paths point there.
+    Queued log records are written before leaving it.
+    """
+    from utils import flush_logs
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="assistant-benchmark-") as directory:
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            flush_logs(timeout=30)
+            os.chdir(previous)
+
+def run_local_load(mock_config, **load_options):
+    """
+    Runs the load benchmark against app.py in-process, with the Gemini calls going to a mock server.
+    The client-side rate limit is lifted (unless GEMINI_RPM is set) so the app, not the limiter, is measured.
+    """
+    server = MockGeminiServer(mock_config).start()
+    os.environ["GEMINI_API_ENDPOINT"] = server.url
+    os.environ.setdefault("GEMINI_RPM", "1000000")
+    os.environ.setdefault("GEMINI_BACKOFF_BASE", "0.05")
+    os.environ.setdefault("LOG_ECHO", "0")
+    try:
+        with _temporary_workdir():
+            import app as app_module # Imported here so the settings above apply
+            from gemini_api import client_manager
+            client_manager.reset()
+            report = run_load(_FlaskClient(app_module.app), **load_options)
+    finally:
+        server.stop()
+    report["upstream"] = server.stats()
+    return report
+
+def _time_per_call(function, repeat=5):
+    """
+    Returns the best per-call time of function over `repeat` timing runs of at least 0.2 seconds each.
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def run_microbenchmarks(repeat=5):
+    """
+    Times the hot helpers on the request path, in a temporary working directory.
+    :return: A dict mapping each benchmark name to seconds per call.
+    """
+    os.environ.setdefault("LOG_ECHO", "0")
+    with _temporary_workdir():
+        import utils
+        from prompts import build_prompt, get_question_answering_prompt, PROMPT_OPTIONS
+        from feedback import save_feedback, feedback_stats
+
+        pairs = [(option["value"], style["value"]) for option in PROMPT_OPTIONS for style in option["styles"]]
+        question = "How do content delivery networks reduce page load times? " * 4
+        results = {
+            "prompts.build_prompt (all styles)": _time_per_call(
+                lambda: [build_prompt(function_choice, prompt_style, question) for function_choice, prompt_style in pairs],
+                repeat) / len(pairs),
+            "prompts.get_question_answering_prompt": _time_per_call(
+                lambda: get_question_answering_prompt(question, "detailed"), repeat),
+            "utils.log_event": _time_per_call(
+                lambda: utils.log_event("Benchmark log record with a typical length for a request summary."), repeat),
+        }
+        started = time.perf_counter()
+        for _ in range(1000):
+            utils.log_event("Benchmark log record with a typical length for a request summary.")
+        utils.flush_logs(timeout=30)
+        results["utils.log_event (written)"] = (time.perf_counter() - started) / 1000
+
+        results["feedback.save_feedback"] = _time_per_call(
+            lambda: save_feedback(question, "A typical response. " * 40, True, "2026-01-01T00:00:00",
+                                  "answer_question", "general"), repeat)
+        results["feedback_stats.report"] = _time_per_call(feedback_stats.report, repeat)
+    return results
+
+def _instructions(tokens):
+    """
+    Returns house-style instructions with few-shot examples of about `tokens` estimated tokens.
+    """
+    rules = []
+    while sum(len(rule) + 1 for rule in rules) < tokens * 4:
+        index = len(rules) + 1
+        rules.append(f"Rule {index}: keep answer section {index} factual, cite the figure it relies on, and "
+                     f"prefer plain words. Example question {index}: what changed? Example answer: it was updated.")
+    return "\n".join(rules)
+
+def run_context_cache_benchmark(requests=20, instruction_tokens=6000):
+    """
+    Measures the prompt tokens that context caching saves, against a mock server in-process.
+    :param requests: Distinct questions sent in each mode.
+    :param instruction_tokens: Estimated length of the template's instructions, the cached prefix.
+    :return: A report with the prompt, cached and uncached tokens per mode, and the fraction saved.
+    """
+    server = MockGeminiServer(MockGeminiConfig(latency_ms=0, jitter_ms=0)).start()
+    os.environ["GEMINI_API_ENDPOINT"] = server.url
+    os.environ.setdefault("GEMINI_RPM", "1000000")
+    os.environ.setdefault("LOG_ECHO", "0")
+    try:
+        with _temporary_workdir() as directory:
+            import gemini_api
+            from prompts import load_prompt_registry, prompt_prefixes
+            from context_cache import ContextCache
+            gemini_api.client_manager.reset()
+            templates_file = os.path.join(directory, "prompt_templates.json")
+            with open(templates_file, "w", encoding="utf-8") as f:
+                json.dump({"answer_question": {"fallback": "{input}", "instructions": _instructions(instruction_tokens),
+                                               "styles": {"general": {"template": "Answer the question: {input}"}}}}, f)
+            registry, fallbacks, _options = load_prompt_registry(templates_file)
+            prompts = [registry[("answer_question", "general")](input=f"How does caching step {index} work?")
+                       for index in range(requests)]
+
+            report = {"requests": requests, "instruction_tokens": instruction_tokens}
+            previous_cache = gemini_api.context_cache
+            try:
+                for mode, prefixes in (("off", ()), ("on", prompt_prefixes(registry, fallbacks))):
+                    gemini_api.context_cache = ContextCache(gemini_api.GeminiContextBackend(), prefixes, min_tokens=1024)
+                    before = server.token_usage()
+                    started = time.perf_counter()
+                    responses = [gemini_api.get_gemini_response(prompt) for prompt in prompts]
+                    after = server.token_usage()
+                    prompt_tokens = after["prompt_tokens"] - before["prompt_tokens"]
+                    cached_tokens = after["cached_tokens"] - before["cached_tokens"]
+                    report[mode] = {"seconds": round(time.perf_counter() - started, 3), "prompt_tokens": prompt_tokens,
+                                    "cached_tokens": cached_tokens, "uncached_tokens": prompt_tokens - cached_tokens,
+                                    "context_cache": gemini_api.context_cache.stats()}
+                    report.setdefault("responses", responses)
+            finally:
+                gemini_api.context_cache = previous_cache
+    finally:
+        server.stop()
+    # Caching must not change the answers, only how the prompt reaches the model
+    report["responses_identical"] = report.pop("responses") == responses
+    report["uncached_tokens_saved"] = round(1 - report["on"]["uncached_tokens"] / report["off"]["uncached_tokens"], 3)
+    return report
+
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Returns (name, baseline seconds, current seconds) for each benchmark slower than its baseline
+    by more than the tolerance. Benchmarks missing from either side are skipped.
+    """
+    return [(name, baseline[name], seconds) for name, seconds in results.items()
+            if name in baseline and seconds > baseline[name] * (1 + tolerance)]
+
+def _print_load_report(report):
+    print(f"Concurrency {report['concurrency']}, {report['elapsed_seconds']}s")
+    for route in ("generate", "feedback"):
+        summary = report[route]
+        print(f"  /{route:<9} {summary['requests']:>6} requests  {summary['requests_per_second'] or 0:>8} req/s  "
+              f"p50 {summary['p50_ms']} ms  p95 {summary['p95_ms']} ms  p99 {summary['p99_ms']} ms  "
+              f"statuses {summary['statuses']}")
+    if "upstream" in report:
+        print(f"  upstream calls {report['upstream']['calls']}, by status {report['upstream']['by_status']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the AI Assistant.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("load", help="Drive /generate and /feedback and report throughput and latency")
+    load.add_argument("--requests", type=int, default=DEFAULT_REQUESTS)
+    load.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    load.add_argument("--feedback-ratio", type=float, default=0.5, help="Fraction of responses given feedback")
+    load.add_argument("--distinct", type=int, default=0, help="Distinct questions to cycle through (0: all unique)")
+    load.add_argument("--url", help="Drive a running server instead of app.py in-process")
+    load.add_argument("--latency-ms", type=float, default=200.0, help="Mock upstream mean latency")
+    load.add_argument("--jitter-ms", type=float, default=50.0)
+    load.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock upstream calls failing with 500")
+    load.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of mock upstream calls failing with 429")
+    load.add_argument("--rpm", type=int, default=0, help="Mock upstream quota in requests per minute")
+    load.add_argument("--seed", type=int, default=None)
+    load.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    micro = commands.add_parser("micro", help="Time the prompt builders, log_event and the feedback store")
+    micro.add_argument("--repeat", type=int, default=5)
+    micro.add_argument("--save", help="Write the results to this baseline file")
+    micro.add_argument("--compare", help="Fail if any result is slower than this baseline file allows")
+    micro.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    micro.add_argument("--json", action="store_true", help="Print the results as JSON")
+
+    context = commands.add_parser("context-cache", help="Measure the prompt tokens saved by context caching")
+    context.add_argument("--requests", type=int, default=20)
+    context.add_argument("--instruction-tokens", type=int, default=6000)
+    context.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == "context-cache":
+        report = run_context_cache_benchmark(requests=args.requests, instruction_tokens=args.instruction_tokens)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            for mode in ("off", "on"):
+                print(f"Context cache {mode:<3} prompt tokens {report[mode]['prompt_tokens']:>8}  "
+                      f"cached {report[mode]['cached_tokens']:>8}  uncached {report[mode]['uncached_tokens']:>8}  "
+                      f"{report[mode]['seconds']}s")
+            print(f"Uncached prompt tokens saved: {report['uncached_tokens_saved']:.1%}, "
+                  f"responses identical: {report['responses_identical']}")
+        return 0
+
+    if args.command == "load":
+        load_options = dict(requests=args.requests, concurrency=args.concurrency,
+                            feedback_ratio=args.feedback_ratio, distinct=args.distinct)
+        if args.url:
+            report = run_load(_HttpClient(args.url), **load_options)
+        else:
+            mock_config = MockGeminiConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                                           rate_limit_rate=args.rate_limit_rate, rpm=args.rpm, seed=args.seed)
+            report = run_local_load(mock_config, **load_options)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            _print_load_report(report)
+        return 0
+
+    results = run_microbenchmarks(repeat=args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, seconds in results.items():
+            print(f"{name:<42} {seconds * 1e6:>10.2f} us/call")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare_results(results, json.load(f), args.tolerance)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before * 1e6:.2f} -> {after * 1e6:.2f} us/call")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+This module keeps each request within a token budget before it reaches the model. Sizes are
+estimated locally with gemini_api.estimate_tokens, the same estimate the rate limiter and the
+summarization chunker use. Each function has an input budget, and an output budget that is sent
+to the model as max_output_tokens.
+
+Input over its budget is compressed first (runs of whitespace collapsed). If it is still too long,
+it is truncated at a paragraph, sentence or word boundary and the model is told it was cut. Long
+summarize_text input is not truncated until it exceeds its (much larger) budget; below that it goes
+to the map-reduce path in summarize.py. Every decision other than passing the input through is
+logged and counted on /metrics.
+"""
+import os
+import re
+from utils import log_event
+from metrics import INPUT_BUDGET_DECISIONS
+from gemini_api import estimate_tokens
+from summarize import needs_chunking
+
+# Estimated tokens of user input per function
+DEFAULT_INPUT_BUDGETS = {"answer_question": 8000, "summarize_text": 100000, "generate_creative_content": 2000,
+                         "follow_up": 4000}
+# max_output_tokens per function; summaries are short by design
+DEFAULT_OUTPUT_BUDGETS = {"answer_question": 2048, "summarize_text": 1024, "generate_creative_content": 2048,
+                          "follow_up": 2048}
+
+TRUNCATION_NOTE = "\n\n[The input above was truncated to fit the length limit.]"
+
+_SPACES_RE = re.compile(r"[ \t\f\v\u00a0]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+def parse_budgets(spec):
+    """
+    Parses a budget list such as "answer_question=4000,summarize_text=50000".
+    :return: A dict mapping function names to token budgets.
+    """
+    budgets = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        budgets[name.strip()] = int(value)
+    return budgets
+
+def _budgets_from_env(name, defaults):
+    spec = os.environ.get(name)
+    return dict(defaults, **parse_budgets(spec)) if spec else dict(defaults)
+
+# Overridden per function with INPUT_TOKEN_BUDGETS / OUTPUT_TOKEN_BUDGETS
+INPUT_BUDGETS = _budgets_from_env("INPUT_TOKEN_BUDGETS", DEFAULT_INPUT_BUDGETS)
+OUTPUT_BUDGETS = _budgets_from_env("OUTPUT_TOKEN_BUDGETS", DEFAULT_OUTPUT_BUDGETS)
+
+def compress_whitespace(text):
+    """
+    Collapses runs of spaces and tabs to one space and runs of blank lines to one blank line,
+    keeping the paragraph breaks the summarization chunker splits on.
+    """
+    text = _SPACES_RE.sub(" ", text.replace("\r\n", "\n").replace("\r", "\n"))
+    text = text.replace(" \n", "\n").replace("\n ", "\n")
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Cuts text to at most max_tokens (estimated), at the last paragraph, sentence or word
+    boundary in the final fifth of the allowance, or mid-word if there is none.
+    """
+    max_chars = max(0, (max_tokens - 1) * 4) # The inverse of estimate_tokens
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    for boundary, keep in (("\n\n", 0), (". ", 1), (" ", 0)):
+        index = cut.rfind(boundary)
+        if index >= max_chars * 0.8:
+            return cut[:index + keep]
+    return cut
+
+def fit_input(function_choice, user_input, input_budgets=None):
+    """
+    Fits a request's input to its function's input budget.
+    :param input_budgets: Budgets per function (default INPUT_BUDGETS); functions without one are left as is.
+    :return: (text, decision). The decision dict has the function, the action taken ("none",
+             "compress", "truncate" or "chunk"), whether the text goes to the chunked summarization
+             path, and the estimated tokens before and after.
+    """
+    budget = (INPUT_BUDGETS if input_budgets is None else input_budgets).get(function_choice)
+    tokens_before = estimate_tokens(user_input)
+    text = user_input
+    action = "none"
+    if budget is not None and tokens_before > budget:
+        text = compress_whitespace(text)
+        action = "compress"
+        if estimate_tokens(text) > budget:
+            text = truncate_to_tokens(text, budget - estimate_tokens(TRUNCATION_NOTE)) + TRUNCATION_NOTE
+            action = "truncate"
+    chunked = function_choice == "summarize_text" and needs_chunking(text)
+    if chunked and action == "none":
+        action = "chunk"
+    decision = {"function": function_choice, "action": action, "chunked": chunked, "budget": budget,
+                "tokens_before": tokens_before, "tokens_after": estimate_tokens(text)}
+    if action != "none":
+        INPUT_BUDGET_DECISIONS.inc(function=function_choice, action=action)
+        log_event(f"Input budget for {function_choice}: {action} ({decision['tokens_before']} -> "
+                  f"{decision['tokens_after']} estimated tokens, budget {budget}, chunked={chunked}).")
+    return text, decision
+
+def output_budget(function_choice):
+    """
+    Returns the max_output_tokens for a function, or None to leave the model's default.
+    """
+    return OUTPUT_BUDGETS.get(function_choice)
@@ -0,0 +1,283 @@
+"""
+This module provides the response cache that sits in front of the Gemini API.
+Responses are keyed on a normalized hash of the final prompt and the model name,
+and are stored in an in-memory LRU tier with an optional on-disk tier under data/.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from utils import ensure_directory_exists, log_event
+
+CACHE_DIR = "data/cache"
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_DISK_MAX_ENTRIES = 10000
+
+def normalize_prompt(prompt):
+    """
+    Normalizes a prompt so that trivially different submissions share a cache entry.
+    Unicode is NFC-normalized and runs of whitespace are collapsed to a single space.
+    """
+    return " ".join(unicodedata.normalize("NFC", prompt).split())
+
+def make_cache_key(prompt, model_name):
+    """
+    Returns the cache key for a prompt sent to a given model.
+    :param prompt: The final prompt string sent to the model.
+    :param model_name: The name of the model the prompt is sent to.
+    """
+    payload = f"{model_name}\n{normalize_prompt(prompt)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class MemoryCache:
+    """
+    Thread-safe in-memory LRU cache with a per-entry TTL and a bound on the number of entries.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class DiskCache:
+    """
+    On-disk cache tier that survives restarts. Each entry is a small JSON file
+    stored under a two-character shard directory of the cache root.
+    The tier holds at most max_entries files: expired files are swept, and the oldest written
+    ones removed beyond the bound, when the cache is opened and after every tenth of
+    max_entries writes (so the directory never exceeds the bound by more than that).
+    """
+
+    name = "disk"
+
+    def __init__(self, directory=CACHE_DIR, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_DISK_MAX_ENTRIES):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._sweep_every = max(1, max_entries // 10)
+        self._writes = 0
+        self._lock = threading.Lock()
+        ensure_directory_exists(directory)
+        self.sweep()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            log_event(f"Discarding unreadable cache entry {path}: {e}", "data/errors.log")
+            self._remove(path)
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            self._remove(path)
+            return None
+        return entry.get("value")
+
+    def set(self, key, value):
+        path = self._path(key)
+        ensure_directory_exists(os.path.dirname(path))
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"value": value, "expires_at": time.time() + self.ttl_seconds}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log_event(f"Could not write cache entry {path}: {e}", "data/errors.log")
+            self._remove(tmp_path)
+            return
+        with self._lock:
+            self._writes += 1
+            due = self._writes >= self._sweep_every
+            if due:
+                self._writes = 0
+        if due:
+            self.sweep()
+
+    def sweep(self):
+        """
+        Removes expired entries, then the oldest written entries beyond max_entries.
+        An entry's file is written when it is set, so it expires ttl_seconds after its mtime.
+        :return: The number of entries removed.
+        """
+        entries = []
+        for path in self._entry_paths():
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except OSError:
+                continue # Removed by another process
+        cutoff = time.time() - self.ttl_seconds
+        expired = [path for mtime, path in entries if mtime < cutoff]
+        live = sorted((mtime, path) for mtime, path in entries if mtime >= cutoff)
+        evicted = [path for _mtime, path in live[:max(0, len(live) - self.max_entries)]]
+        for path in expired + evicted:
+            self._remove(path)
+        return len(expired) + len(evicted)
+
+    def _entry_paths(self):
+        for root, _dirs, files in os.walk(self.directory):
+            for filename in files:
+                if filename.endswith(".json"):
+                    yield os.path.join(root, filename)
+
+    def clear(self):
+        for path in list(self._entry_paths()):
+            self._remove(path)
+
+    def __len__(self):
+        return sum(1 for _path in self._entry_paths())
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+class ResponseCache:
+    """
+    Layered response cache. Tiers are consulted in order; a hit in a slower tier
+    is promoted into the faster tiers in front of it.
+    Any object with get(key), set(key, value), clear() and __len__ can be used as a tier.
+    """
+
+    def __init__(self, tiers):
+        self.tiers = list(tiers)
+        self._lock = threading.Lock()
+        self._hits = {tier.name: 0 for tier in self.tiers}
+        self._misses = 0
+
+    def get(self, prompt, model_name):
+        """
+        Returns the cached response for a prompt, or None on a miss.
+        """
+        key = make_cache_key(prompt, model_name)
+        for index, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster_tier in self.tiers[:index]:
+                    faster_tier.set(key, value)
+                with self._lock:
+                    self._hits[tier.name] += 1
+                return value
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def set(self, prompt, model_name, response):
+        """
+        Stores a response in every tier.
+        """
+        key = make_cache_key(prompt, model_name)
+        for tier in self.tiers:
+            tier.set(key, response)
+
+    def get_or_generate(self, prompt, model_name, generate, should_cache=None):
+        """
+        Returns the cached response for a prompt, calling generate(prompt) on a miss.
+        :param generate: Callable producing the response text for a prompt.
+        :param should_cache: Optional predicate; responses for which it returns False are not stored.
+        """
+        response = self.get(prompt, model_name)
+        if response is not None:
+            return response
+        response = generate(prompt)
+        if should_cache is None or should_cache(response):
+            self.set(prompt, model_name, response)
+        return response
+
+    async def get_or_generate_async(self, prompt, model_name, generate, should_cache=None):
+        """
+        Async variant of get_or_generate, for a coroutine function generate(prompt).
+        Lookups and stores run in a worker thread, since the disk tier reads and writes files.
+        """
+        response = await asyncio.to_thread(self.get, prompt, model_name)
+        if response is not None:
+            return response
+        response = await generate(prompt)
+        if should_cache is None or should_cache(response):
+            await asyncio.to_thread(self.set, prompt, model_name, response)
+        return response
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def stats(self):
+        """
+        Returns hit/miss counters and tier sizes, for sizing the cache.
+        """
+        with self._lock:
+            hits = dict(self._hits)
+            misses = self._misses
+        total_hits = sum(hits.values())
+        lookups = total_hits + misses
+        return {
+            "hits": total_hits,
+            "misses": misses,
+            "hit_rate": total_hits / lookups if lookups else 0.0,
+            "tier_hits": hits,
+            "tier_sizes": {tier.name: len(tier) for tier in self.tiers},
+        }
+
+def create_response_cache(max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                          use_disk=False, directory=CACHE_DIR, disk_max_entries=DEFAULT_DISK_MAX_ENTRIES):
+    """
+    Builds a ResponseCache with an in-memory tier and, optionally, a disk tier.
+    """
+    tiers = [MemoryCache(max_entries=max_entries, ttl_seconds=ttl_seconds)]
+    if use_disk:
+        tiers.append(DiskCache(directory=directory, ttl_seconds=ttl_seconds, max_entries=disk_max_entries))
+    return ResponseCache(tiers)
+
+def create_response_cache_from_env():
+    """
+    Builds the application's response cache from environment variables:
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DISK ("1" to enable the disk tier)
+    and RESPONSE_CACHE_DISK_SIZE (maximum entries on disk).
+    """
+    return create_response_cache(
+        max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", DEFAULT_MAX_ENTRIES)),
+        ttl_seconds=int(os.environ.get("RESPONSE_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+        use_disk=os.environ.get("RESPONSE_CACHE_DISK", "0") == "1",
+        disk_max_entries=int(os.environ.get("RESPONSE_CACHE_DISK_SIZE", DEFAULT_DISK_MAX_ENTRIES)),
+    )
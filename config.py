@@ -0,0 +1,34 @@
+"""
+This module reads the web applications' runtime settings from the environment, so deployments
+configure the app with variables instead of code changes. create_app() in app.py and asgi.py
+applies them to the Flask/Quart config; gunicorn.conf.py uses the server settings.
+"""
+import os
+
+DATA_DIR = "data"
+
+def _flag(name, default):
+    return os.environ.get(name, "1" if default else "0") == "1"
+
+def load_config(overrides=None):
+    """
+    Returns the application settings read from the environment, updated with any overrides.
+    :param overrides: Optional dict of settings that take precedence (e.g. TESTING=True in tests).
+    """
+    config = {
+        "HOST": os.environ.get("HOST", "0.0.0.0"),
+        "PORT": int(os.environ.get("PORT", 5000)),
+        "DEBUG": _flag("FLASK_DEBUG", False),
+        # Workers and threads per worker for the pre-forking production server
+        "WORKERS": int(os.environ.get("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1)),
+        "THREADS": int(os.environ.get("WEB_THREADS", 8)),
+        # Build the Gemini client when the app starts, so the first request doesn't pay the cold start.
+        # Pre-forking servers turn this off in the parent and pre-warm in each worker instead.
+        "GEMINI_PREWARM": _flag("GEMINI_PREWARM", True),
+        # Import the Gemini SDK in the parent before forking, so workers share its memory
+        "PRELOAD_SDK": _flag("PRELOAD_SDK", True),
+        # Fill the master's response cache from helpful feedback before forking (see warmup.py)
+        "WARMUP": _flag("WARMUP", False),
+    }
+    config.update(overrides or {})
+    return config
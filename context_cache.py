@@ -0,0 +1,195 @@
+"""
+This module caches the static prefixes of prompts with the model provider's context caching, so a
+long prefix (a style's instructions, few-shot examples and the template wording before the input)
+is processed once and then referenced by its cache id instead of being sent with every call.
+
+The prefixes come from the prompt templates (prompts.prompt_prefixes). Only prefixes of at least
+CONTEXT_CACHE_MIN_TOKENS (estimated) are cached: shorter ones are below the provider's minimum and
+would cost more to store than they save. A prefix's cache is created by the first call that uses it
+and lives for CONTEXT_CACHE_TTL seconds. A call that finds it within CONTEXT_CACHE_REFRESH_SECONDS of
+expiring extends it, so prefixes that stop being used simply expire.
+
+Caching never changes what the model is asked: when a cache cannot be created or is rejected, calls
+send the full prompt as before, and the prefix is tried again after CONTEXT_CACHE_RETRY_SECONDS.
+"""
+import os
+import time
+import asyncio
+import threading
+from utils import log_event, estimate_tokens
+from prompts import prompt_prefixes
+
+DEFAULT_MIN_TOKENS = 4096 # Gemini's minimum for a cached context
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_REFRESH_SECONDS = 300 # Extend a cache this long before it expires
+DEFAULT_RETRY_SECONDS = 600 # Wait before retrying a prefix whose cache could not be created or used
+
+class CachedPrefix:
+    """
+    A prefix registered with the provider: its handle, the model object bound to it and its expiry.
+    """
+
+    def __init__(self, prefix, handle, model, expires_at):
+        self.prefix = prefix
+        self.handle = handle
+        self.model = model
+        self.expires_at = expires_at
+        self.tokens = estimate_tokens(prefix)
+
+class ContextCache:
+    """
+    Maps prompts onto cached prefixes. The provider is reached through a backend with the methods
+    create(prefix, ttl_seconds) returning a handle, refresh(handle, ttl_seconds), model(handle)
+    returning the object whose generate_content sends the rest of the prompt after the cached
+    prefix, and is_cache_error(exception). Safe to share across threads; a call never waits for
+    another thread creating a cache, it sends the full prompt instead.
+    """
+
+    def __init__(self, backend, prefixes=(), min_tokens=DEFAULT_MIN_TOKENS, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 refresh_seconds=DEFAULT_REFRESH_SECONDS, retry_seconds=DEFAULT_RETRY_SECONDS, clock=time.monotonic):
+        self.backend = backend
+        # Longest first, so a prompt matches the most specific prefix
+        self.prefixes = sorted({prefix for prefix in prefixes if estimate_tokens(prefix) >= min_tokens},
+                               key=len, reverse=True)
+        self.ttl_seconds = ttl_seconds
+        self.refresh_seconds = min(refresh_seconds, ttl_seconds / 2)
+        self.retry_seconds = retry_seconds
+        self.clock = clock
+        self._entries = {}
+        self._retry_at = {}
+        self._renewing = set()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._fallbacks = 0
+        self._created = 0
+        self._refreshed = 0
+        self._failures = 0
+        self._tokens_saved = 0
+
+    def _match(self, prompt):
+        for prefix in self.prefixes:
+            if prompt.startswith(prefix) and len(prompt) > len(prefix):
+                return prefix
+        return None
+
+    def _fresh_entry(self, prefix):
+        entry = self._entries.get(prefix)
+        if entry is not None and self.clock() < entry.expires_at - self.refresh_seconds:
+            return entry
+        return None
+
+    def _hit(self, entry, prompt):
+        with self._lock:
+            self._hits += 1
+            self._tokens_saved += entry.tokens
+        return entry, prompt[len(entry.prefix):]
+
+    def _fallback(self):
+        with self._lock:
+            self._fallbacks += 1
+        return None
+
+    def lookup(self, prompt):
+        """
+        Finds the cached prefix a prompt starts with, creating or extending its cache when needed.
+        :return: A tuple (entry, rest of the prompt) to send with entry.model, or None to send the full prompt.
+        """
+        prefix = self._match(prompt)
+        if prefix is None:
+            return None
+        entry = self._fresh_entry(prefix) or self._renew(prefix)
+        return self._hit(entry, prompt) if entry is not None else self._fallback()
+
+    async def lookup_async(self, prompt):
+        """
+        Async variant of lookup; creating or extending a cache runs in a worker thread.
+        """
+        prefix = self._match(prompt)
+        if prefix is None:
+            return None
+        entry = self._fresh_entry(prefix) or await asyncio.to_thread(self._renew, prefix)
+        return self._hit(entry, prompt) if entry is not None else self._fallback()
+
+    def _renew(self, prefix):
+        """
+        Creates the prefix's cache, or extends it if it is about to expire.
+        :return: The usable entry, or None if there is none (creation failed, is backing off,
+                 or is in progress in another thread).
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(prefix)
+            usable = entry if entry is not None and now < entry.expires_at else None
+            if prefix in self._renewing or now < self._retry_at.get(prefix, 0):
+                return usable
+            self._renewing.add(prefix)
+        refreshing = usable is not None
+        try:
+            if refreshing:
+                self.backend.refresh(usable.handle, self.ttl_seconds)
+                usable.expires_at = now + self.ttl_seconds
+            else:
+                handle = self.backend.create(prefix, self.ttl_seconds)
+                usable = CachedPrefix(prefix, handle, self.backend.model(handle), now + self.ttl_seconds)
+        except Exception as e:
+            log_event(f"Context cache {'refresh' if refreshing else 'creation'} failed for prefix "
+                      f"'{prefix[:50]}...': {e}", "data/errors.log", event="context_cache_error")
+            with self._lock:
+                self._failures += 1
+                self._retry_at[prefix] = now + self.retry_seconds
+                self._renewing.discard(prefix)
+            return usable # An entry that is not yet expired stays usable until it does
+        with self._lock:
+            self._entries[prefix] = usable
+            if refreshing:
+                self._refreshed += 1
+            else:
+                self._created += 1
+            self._renewing.discard(prefix)
+        log_event(f"Context cache {'refreshed' if refreshing else 'created'} for prefix '{prefix[:50]}...' "
+                  f"({usable.tokens} estimated tokens).")
+        return usable
+
+    def discard(self, entry, error):
+        """
+        Drops a cached prefix after a call that used it failed, if the failure was caused by the
+        cache (e.g. it expired upstream or is not supported for the model).
+        :return: True if the caller should retry the call with the full prompt.
+        """
+        if not self.backend.is_cache_error(error):
+            return False
+        log_event(f"Context cache for prefix '{entry.prefix[:50]}...' rejected; sending full prompts: {error}",
+                  "data/errors.log", event="context_cache_error")
+        with self._lock:
+            if self._entries.get(entry.prefix) is entry:
+                del self._entries[entry.prefix]
+            self._retry_at[entry.prefix] = self.clock() + self.retry_seconds
+            self._failures += 1
+            self._hits -= 1
+            self._tokens_saved -= entry.tokens
+            self._fallbacks += 1
+        return True
+
+    def stats(self):
+        now = self.clock()
+        with self._lock:
+            active = sum(1 for entry in self._entries.values() if now < entry.expires_at)
+            return {"prefixes": len(self.prefixes), "active": active, "hits": self._hits,
+                    "fallbacks": self._fallbacks, "created": self._created, "refreshed": self._refreshed,
+                    "failures": self._failures, "tokens_saved": self._tokens_saved}
+
+def create_context_cache_from_env(backend):
+    """
+    Builds the context cache for the prompt templates' prefixes from environment variables:
+    CONTEXT_CACHE ("0" to disable), CONTEXT_CACHE_MIN_TOKENS, CONTEXT_CACHE_TTL,
+    CONTEXT_CACHE_REFRESH_SECONDS and CONTEXT_CACHE_RETRY_SECONDS.
+    """
+    enabled = os.environ.get("CONTEXT_CACHE", "1") == "1"
+    return ContextCache(
+        backend,
+        prompt_prefixes() if enabled else (),
+        min_tokens=int(os.environ.get("CONTEXT_CACHE_MIN_TOKENS", DEFAULT_MIN_TOKENS)),
+        ttl_seconds=float(os.environ.get("CONTEXT_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+        refresh_seconds=float(os.environ.get("CONTEXT_CACHE_REFRESH_SECONDS", DEFAULT_REFRESH_SECONDS)),
+        retry_seconds=float(os.environ.get("CONTEXT_CACHE_RETRY_SECONDS", DEFAULT_RETRY_SECONDS)),
+    )
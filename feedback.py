@@ -1,32 +1,142 @@
 import os
-from utils import ensure_directory_exists, load_json, save_json, log_event
+import json
+import threading
+from utils import ensure_directory_exists, load_json, log_event
+from feedback_stats import FeedbackStats
+from response_store import response_store
 
-FEEDBACK_FILE = "data/feedback_log.json"
+try:
+    import fcntl # Cross-process file locks; not available on Windows
+except ImportError:
+    fcntl = None
+
+# Feedback is stored as JSON Lines: one JSON object per line, appended in place.
+FEEDBACK_FILE = "data/feedback_log.jsonl"
+# The original storage format: a single JSON array rewritten on every save.
+LEGACY_FEEDBACK_FILE = "data/feedback_log.json"
+
+_write_lock = threading.Lock()
+
+# Helpful-rate counters over the log, updated as feedback is saved (see feedback_stats.py)
+feedback_stats = FeedbackStats(FEEDBACK_FILE)
+
+class _FileLock:
+    """
+    Holds the in-process write lock and, where supported, an exclusive flock on a file descriptor.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __enter__(self):
+        _write_lock.acquire()
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        _write_lock.release()
+
+def migrate_legacy_feedback(legacy_file=LEGACY_FEEDBACK_FILE, feedback_file=FEEDBACK_FILE):
+    """
+    One-time migration from the legacy JSON array file to the JSON Lines store.
+    Runs only when the legacy file exists and the JSON Lines file does not yet exist;
+    the new file is written to a temporary path and moved into place atomically, and
+    the legacy file is renamed with a .migrated suffix.
+    :return: The number of migrated entries.
+    """
+    if not os.path.exists(legacy_file) or os.path.exists(feedback_file):
+        return 0
+    ensure_directory_exists(os.path.dirname(feedback_file))
+    lock_fd = os.open(f"{feedback_file}.lock", os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        with _FileLock(lock_fd):
+            if not os.path.exists(legacy_file) or os.path.exists(feedback_file):
+                # Another process finished the migration while we waited for the lock.
+                return 0
+            entries = load_json(legacy_file, default_value=[])
+            tmp_file = f"{feedback_file}.{os.getpid()}.tmp"
+            with open(tmp_file, "w") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp_file, feedback_file)
+            os.replace(legacy_file, f"{legacy_file}.migrated")
+    finally:
+        os.close(lock_fd)
+    log_event(f"Migrated {len(entries)} feedback entries from {legacy_file} to {feedback_file}.")
+    return len(entries)
 
 def get_all_feedback():
     """
-    Retrieves all feedback entries from the feedback log file.
-    Ensures the data directory exists before attempting to read.
+    Iterates over all feedback entries in the feedback log, oldest first.
+    Entries are read one line at a time, so the whole log is never held in memory.
+    Ensures the data directory exists (and the legacy log is migrated) before reading.
     """
     ensure_directory_exists(os.path.dirname(FEEDBACK_FILE))
-    return load_json(FEEDBACK_FILE, default_value=[])
+    migrate_legacy_feedback()
+    if not os.path.exists(FEEDBACK_FILE):
+        return
+    with open(FEEDBACK_FILE, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                log_event(f"Skipping malformed feedback entry on line {line_number} of {FEEDBACK_FILE}.", "data/errors.log")
 
-def save_feedback(query, response, helpful, timestamp):
+def save_feedback(query, response, helpful, timestamp, function_choice=None, prompt_style=None, response_id=None):
     """
-    Saves a new feedback entry to the feedback log file.
+    Appends a new feedback entry to the feedback log file and updates the helpful-rate counters.
+    The entry is written as one line with a single write on an O_APPEND descriptor,
+    under a lock, so concurrent writers never lose or interleave entries.
     :param query: The original user query.
     :param response: The AI's response.
     :param helpful: Boolean indicating if the response was helpful.
     :param timestamp: Timestamp of the feedback.
+    :param function_choice: The function that produced the response, if known.
+    :param prompt_style: The prompt style that produced the response, if known.
+    :param response_id: The response store id the feedback was given for, if any.
     """
-    feedback_data = get_all_feedback()
+    ensure_directory_exists(os.path.dirname(FEEDBACK_FILE))
+    migrate_legacy_feedback()
     feedback_entry = {
         "query": query,
         "response": response,
         "helpful": helpful,
-        "timestamp": timestamp
+        "timestamp": timestamp,
+        "function_choice": function_choice,
+        "prompt_style": prompt_style,
+        "response_id": response_id
     }
-    feedback_data.append(feedback_entry)
-    save_json(FEEDBACK_FILE, feedback_data)
+    line = (json.dumps(feedback_entry) + "\n").encode("utf-8")
+    fd = os.open(FEEDBACK_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        with _FileLock(fd):
+            while line:
+                line = line[os.write(fd, line):]
+            feedback_stats.catch_up()
+    finally:
+        os.close(fd)
     log_event(f"Feedback saved: Query='{query[:50]}...', Helpful={helpful}")
 
+def save_feedback_for_response(response_id, helpful, timestamp):
+    """
+    Saves feedback for a response kept in the server-side response store.
+    The query, response text, function and style are taken from the stored record,
+    so the client only sends the id and the vote and cannot alter what is logged.
+    :param response_id: The id the response was stored under by the generate routes.
+    :param helpful: Boolean indicating if the response was helpful.
+    :param timestamp: Timestamp of the feedback.
+    :return: The stored record, or None if the id is unknown or has expired (nothing is saved).
+    """
+    record = response_store.get(response_id)
+    if record is None:
+        log_event(f"Feedback for unknown or expired response id: {response_id!r}", "data/errors.log")
+        return None
+    save_feedback(record["query"], record["response"], helpful, timestamp,
+                  function_choice=record["function_choice"], prompt_style=record["prompt_style"],
+                  response_id=response_id)
+    return record
@@ -0,0 +1,166 @@
+"""
+This module maintains helpful-rate counters over the feedback log, for the /stats endpoint and CLI.
+Counters are kept per (function_choice, prompt_style, day) and updated incrementally: each save
+reads only the lines appended since the last update, and the counters are snapshotted to
+data/feedback_stats.json together with the log offset they cover, so a restart does not rescan the log.
+Reporting sums the daily counters and never reads the feedback log itself.
+
+Usage:
+    python feedback_stats.py [--windows 1 7 30] [--json]
+"""
+import os
+import sys
+import json
+import argparse
+import threading
+from datetime import date, timedelta
+from utils import ensure_directory_exists, log_event
+
+FEEDBACK_STATS_FILE = "data/feedback_stats.json"
+DEFAULT_WINDOWS = (1, 7, 30) # Days
+UNKNOWN = "unknown" # Entries saved before feedback recorded the function and style
+_HEAD_BYTES = 64
+
+def _rate(counts):
+    total, helpful = counts
+    return {"total": total, "helpful": helpful, "helpful_rate": round(helpful / total, 4) if total else None}
+
+class FeedbackStats:
+    """
+    Incremental helpful/total counters over a JSON Lines feedback log.
+    Callers that append to the log should call catch_up() while holding the log's write lock.
+    """
+
+    def __init__(self, feedback_file, stats_file=FEEDBACK_STATS_FILE):
+        self.feedback_file = feedback_file
+        self.stats_file = stats_file
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._reset()
+
+    def _reset(self):
+        self.counters = {} # (function_choice, prompt_style, "YYYY-MM-DD") -> [total, helpful]
+        self.offset = 0
+        self.head = ""
+
+    def _load_snapshot(self):
+        self._loaded = True
+        if not self.stats_file or not os.path.exists(self.stats_file):
+            return
+        try:
+            with open(self.stats_file, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self.counters = {tuple(key.split("\t")): counts for key, counts in snapshot["counters"].items()}
+            self.offset = snapshot["offset"]
+            self.head = snapshot["head"]
+        except (OSError, ValueError, KeyError) as e:
+            log_event(f"Rebuilding feedback stats, snapshot {self.stats_file} is unreadable: {e}", "data/errors.log")
+            self._reset()
+
+    def _save_snapshot(self):
+        if not self.stats_file:
+            return
+        ensure_directory_exists(os.path.dirname(self.stats_file) or ".")
+        snapshot = {
+            "offset": self.offset,
+            "head": self.head,
+            "counters": {"\t".join(key): counts for key, counts in self.counters.items()},
+        }
+        tmp_file = f"{self.stats_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_file, self.stats_file)
+
+    def _record(self, entry):
+        day = str(entry.get("timestamp") or "")[:10] or UNKNOWN
+        key = (entry.get("function_choice") or UNKNOWN, entry.get("prompt_style") or UNKNOWN, day)
+        counts = self.counters.setdefault(key, [0, 0])
+        counts[0] += 1
+        if entry.get("helpful"):
+            counts[1] += 1
+
+    def catch_up(self):
+        """
+        Counts the entries appended to the feedback log since the last update and snapshots the counters.
+        If the log was truncated or replaced, the counters are rebuilt from the start of the log.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load_snapshot()
+            if not os.path.exists(self.feedback_file):
+                return
+            with open(self.feedback_file, "rb") as f:
+                head = f.read(_HEAD_BYTES).decode("utf-8", "replace")
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                if size < self.offset or head[:len(self.head)] != self.head:
+                    self._reset()
+                if size == self.offset:
+                    return
+                self.head = head
+                f.seek(self.offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break # A line still being written; it is counted on the next update
+                    self.offset += len(line)
+                    try:
+                        self._record(json.loads(line))
+                    except ValueError:
+                        continue
+            self._save_snapshot()
+
+    def report(self, windows=DEFAULT_WINDOWS, today=None):
+        """
+        Returns helpful rates per function and per function/style for the last N days of each window
+        (today included) and for all time.
+        """
+        self.catch_up()
+        today = today or date.today()
+        cutoffs = {f"{days}d": (today - timedelta(days=days - 1)).isoformat() for days in windows}
+        cutoffs["all"] = ""
+        report = {}
+        with self._lock:
+            counters = list(self.counters.items())
+        for name, cutoff in cutoffs.items():
+            overall = [0, 0]
+            by_function = {}
+            by_style = {}
+            for (function_choice, prompt_style, day), (total, helpful) in counters:
+                if day < cutoff:
+                    continue
+                for counts in (overall, by_function.setdefault(function_choice, [0, 0]),
+                               by_style.setdefault(f"{function_choice}/{prompt_style}", [0, 0])):
+                    counts[0] += total
+                    counts[1] += helpful
+            report[name] = dict(_rate(overall),
+                                by_function={key: _rate(counts) for key, counts in sorted(by_function.items())},
+                                by_style={key: _rate(counts) for key, counts in sorted(by_style.items())})
+        return report
+
+def _format_rate(stats):
+    rate = "-" if stats["helpful_rate"] is None else f"{100 * stats['helpful_rate']:.1f}%"
+    return f"{stats['helpful']}/{stats['total']} helpful ({rate})"
+
+def main(argv=None):
+    from feedback import feedback_stats # Imported here: feedback.py imports this module
+
+    parser = argparse.ArgumentParser(description="Report helpful-rates from the AI Assistant's feedback log.")
+    parser.add_argument("--windows", type=int, nargs="+", default=list(DEFAULT_WINDOWS), help="Window sizes in days")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = feedback_stats.report(windows=args.windows)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    for name, stats in report.items():
+        print(f"[{name}] {_format_rate(stats)}")
+        for function_choice, function_stats in stats["by_function"].items():
+            print(f"    {function_choice:<45} {_format_rate(function_stats)}")
+            for key, style_stats in stats["by_style"].items():
+                if key.startswith(function_choice + "/"):
+                    print(f"        {key.split('/', 1)[1]:<41} {_format_rate(style_stats)}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,55 +1,560 @@
 import os
-import google.generativeai as genai
-from utils import log_event
+import re
+import time
+import asyncio
+import threading
+import importlib
+from datetime import timedelta
+from utils import log_event, estimate_tokens
+from ratelimit import AdaptiveRateLimiter, CircuitBreaker, backoff_delay
+from metrics import UPSTREAM_SECONDS, UPSTREAM_TOKENS, UPSTREAM_RETRIES
+from context_cache import create_context_cache_from_env
 
-def get_gemini_response(prompt):
+MODEL_NAME = 'gemini-2.0-flash'
+# Context caches are bound to a stable model version
+CONTEXT_CACHE_MODEL = os.environ.get("CONTEXT_CACHE_MODEL", f"models/{MODEL_NAME}-001")
+
+# Client-side limits kept under the project's Gemini quota
+GEMINI_RPM = float(os.environ.get("GEMINI_RPM", 60)) # Requests per minute
+GEMINI_TPM = float(os.environ.get("GEMINI_TPM", 1000000)) # Input tokens per minute
+GEMINI_MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", 3))
+GEMINI_BACKOFF_BASE = float(os.environ.get("GEMINI_BACKOFF_BASE", 1.0)) # Seconds
+GEMINI_BACKOFF_MAX = float(os.environ.get("GEMINI_BACKOFF_MAX", 30.0)) # Seconds
+GEMINI_MAX_QUEUE_SECONDS = float(os.environ.get("GEMINI_MAX_QUEUE_SECONDS", 20.0)) # Longest wait for rate limit capacity
+GEMINI_BREAKER_THRESHOLD = int(os.environ.get("GEMINI_BREAKER_THRESHOLD", 5)) # Consecutive failures that open the circuit
+GEMINI_BREAKER_COOLDOWN = float(os.environ.get("GEMINI_BREAKER_COOLDOWN", 30.0)) # Seconds the circuit stays open
+
+# User-facing messages shown in place of a model answer when a call fails.
+NO_CONTENT_MESSAGE = "Could not generate a response. Please try again."
+BLOCKED_MESSAGE = "Your request was blocked due to safety concerns. Please try a different query."
+BUSY_MESSAGE = "The AI service is busy right now. Please try again in a moment."
+ERROR_MESSAGE_PREFIX = "An error occurred while generating response"
+
+class GeminiError(Exception):
+    """
+    Base class for failed Gemini API calls.
+    user_message is safe to show to the user; status_code is the HTTP status to answer with.
+    """
+    user_message = f"{ERROR_MESSAGE_PREFIX}. Please check the logs."
+    status_code = 502
+    retryable = False
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class GeminiBlockedError(GeminiError):
+    """
+    The prompt or the response was blocked by the safety filters.
+    """
+    user_message = BLOCKED_MESSAGE
+    status_code = 422
+
+class GeminiEmptyResponseError(GeminiError):
+    """
+    The model answered without any content.
+    """
+    user_message = NO_CONTENT_MESSAGE
+
+class GeminiRateLimitError(GeminiError):
+    """
+    The upstream quota (429) or the client-side rate limit was exhausted.
+    """
+    user_message = BUSY_MESSAGE
+    status_code = 503
+    retryable = True
+
+class GeminiUnavailableError(GeminiError):
+    """
+    The upstream failed with a transient server error (5xx or timeout).
+    """
+    user_message = BUSY_MESSAGE
+    status_code = 503
+    retryable = True
+
+class GeminiCircuitOpenError(GeminiUnavailableError):
+    """
+    The circuit breaker is open, so the call was refused without contacting the upstream.
+    """
+    retryable = False
+
+def is_error_response(text):
+    """
+    Returns True if the text is a failure message that earlier versions of get_gemini_response
+    returned in place of a model answer (and which may still be found in stored feedback).
+    """
+    return text in (NO_CONTENT_MESSAGE, BLOCKED_MESSAGE) or text.startswith(ERROR_MESSAGE_PREFIX)
+
+_SDK_MODULES = {
+    "genai": "google.generativeai",
+    "genai_client": "google.generativeai.client",
+    "google_exceptions": "google.api_core.exceptions",
+}
+
+def load_sdk():
+    """
+    Imports the Gemini SDK, which takes most of the app's import time, on first use.
+    A pre-forking server calls this in the parent so workers share the imported modules;
+    no client or connection is created here, since gRPC channels must not cross a fork.
+    :return: The google.generativeai module.
+    """
+    for name, module_name in _SDK_MODULES.items():
+        if name not in globals():
+            globals()[name] = importlib.import_module(module_name)
+    return globals()["genai"]
+
+def __getattr__(name):
+    # gemini_api.genai and friends stay available as module attributes, imported on first access
+    if name in _SDK_MODULES:
+        load_sdk()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class ClientManager:
+    """
+    Process-wide owner of the Gemini SDK configuration and GenerativeModel instances.
+    The SDK is configured once, and one model object is kept per model name, so every
+    request reuses the same underlying transport instead of rebuilding it.
+    Safe to share across Flask worker threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured = False
+        self._models = {}
+
+    def configure(self):
+        """
+        Configures the SDK with GOOGLE_API_KEY (and GEMINI_API_ENDPOINT, if set) once per process.
+        Calling genai.configure again would drop the SDK's cached transports.
+        """
+        if self._configured:
+            return
+        with self._lock:
+            if self._configured:
+                return
+            genai = load_sdk()
+            api_key = os.environ.get("GOOGLE_API_KEY", "")
+            endpoint = os.environ.get("GEMINI_API_ENDPOINT", "") # e.g. the stand-in server in mock_gemini.py
+            if endpoint:
+                # The SDK reaches a plain HTTP endpoint only over its REST transport, which has no async calls
+                genai.configure(api_key=api_key or "unused", transport="rest", client_options={"api_endpoint": endpoint})
+                log_event(f"Gemini API endpoint overridden: {endpoint}")
+            elif api_key:
+                genai.configure(api_key=api_key)
+            else:
+                # In the Canvas environment the key is injected at runtime, so carry on without it.
+                log_event("GOOGLE_API_KEY environment variable not set. API calls might fail.", "data/errors.log")
+            self._configured = True
+
+    def get_model(self, model_name=MODEL_NAME):
+        """
+        Returns the shared GenerativeModel for a model name, creating it on first use.
+        """
+        model = self._models.get(model_name)
+        if model is not None:
+            return model
+        self.configure()
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                model = load_sdk().GenerativeModel(model_name)
+                self._models[model_name] = model
+        return model
+
+    def prewarm(self, model_names=(MODEL_NAME,)):
+        """
+        Builds the model objects and the generative transport ahead of the first request.
+        Failures are logged rather than raised, so startup never depends on the upstream.
+        """
+        if not os.environ.get("GOOGLE_API_KEY") and not os.environ.get("GEMINI_API_ENDPOINT"):
+            log_event("Skipping Gemini client pre-warm: GOOGLE_API_KEY is not set.")
+            return False
+        try:
+            for model_name in model_names:
+                self.get_model(model_name)
+            load_sdk()
+            genai_client.get_default_generative_client()
+        except Exception as e:
+            log_event(f"Gemini client pre-warm failed: {e}", "data/errors.log")
+            return False
+        log_event(f"Gemini client pre-warmed for models: {', '.join(model_names)}")
+        return True
+
+    def reset(self):
+        """
+        Forgets the configuration and all model instances.
+        """
+        with self._lock:
+            self._configured = False
+            self._models = {}
+
+client_manager = ClientManager()
+
+class GeminiContextBackend:
+    """
+    Context cache backend (see context_cache.py) on the Gemini API's cachedContents resource.
+    A cached prefix is sent as the first user turn; generate_content on the model returned by
+    model() sends the rest of the prompt after it.
+    """
+
+    def __init__(self, model_name=CONTEXT_CACHE_MODEL):
+        self.model_name = model_name
+
+    def create(self, prefix, ttl_seconds):
+        client_manager.configure()
+        return load_sdk().caching.CachedContent.create(model=self.model_name, contents=[prefix],
+                                                       ttl=timedelta(seconds=ttl_seconds))
+
+    def refresh(self, cached_content, ttl_seconds):
+        cached_content.update(ttl=timedelta(seconds=ttl_seconds))
+
+    def model(self, cached_content):
+        return load_sdk().GenerativeModel.from_cached_content(cached_content)
+
+    def is_cache_error(self, e):
+        # The cache expired or was deleted upstream, or the model refuses it
+        load_sdk()
+        return isinstance(e, (google_exceptions.NotFound, google_exceptions.PermissionDenied,
+                              google_exceptions.InvalidArgument, google_exceptions.FailedPrecondition))
+
+context_cache = create_context_cache_from_env(GeminiContextBackend())
+
+rate_limiter = AdaptiveRateLimiter(GEMINI_RPM, GEMINI_TPM)
+circuit_breaker = CircuitBreaker(GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_COOLDOWN)
+
+_RETRY_AFTER_RE = re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE)
+
+def _retry_after_seconds(e):
+    """
+    Extracts the upstream's retry-after hint from an API exception, if it has one.
+    """
+    for detail in getattr(e, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    response = getattr(e, "response", None)
+    header = getattr(response, "headers", {}).get("Retry-After") if response is not None else None
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+    match = _RETRY_AFTER_RE.search(str(e))
+    return float(match.group(1)) if match else None
+
+def _classify_error(e):
+    """
+    Maps an exception raised by the SDK onto the matching GeminiError.
+    """
+    if isinstance(e, GeminiError):
+        return e
+    genai = load_sdk()
+    if isinstance(e, (genai.types.BlockedPromptException, genai.types.StopCandidateException)):
+        return GeminiBlockedError(str(e))
+    if isinstance(e, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+        return GeminiRateLimitError(str(e), retry_after=_retry_after_seconds(e))
+    if isinstance(e, (google_exceptions.ServiceUnavailable, google_exceptions.InternalServerError,
+                      google_exceptions.DeadlineExceeded, google_exceptions.GatewayTimeout,
+                      google_exceptions.BadGateway)):
+        return GeminiUnavailableError(str(e), retry_after=_retry_after_seconds(e))
+    return GeminiError(str(e))
+
+def _refuse_if_circuit_open():
+    allowed, retry_after = circuit_breaker.allow()
+    if not allowed:
+        raise GeminiCircuitOpenError("Gemini circuit breaker is open; refusing call.", retry_after=retry_after)
+
+def _rate_limit_exhausted():
+    return GeminiRateLimitError(f"No client-side rate limit capacity within {GEMINI_MAX_QUEUE_SECONDS}s.",
+                                retry_after=GEMINI_MAX_QUEUE_SECONDS)
+
+def _request_tokens(prompt, history):
+    return estimate_tokens(prompt) + sum(estimate_tokens(turn["text"]) for turn in history or ())
+
+def _before_call(prompt, history=None):
+    """
+    Fails fast if the circuit is open, then waits for rate limit capacity for the prompt
+    (and the conversation history sent with it).
+    """
+    _refuse_if_circuit_open()
+    if not rate_limiter.acquire(_request_tokens(prompt, history), timeout=GEMINI_MAX_QUEUE_SECONDS):
+        circuit_breaker.release_probe()
+        raise _rate_limit_exhausted()
+
+async def _before_call_async(prompt, history=None):
+    _refuse_if_circuit_open()
+    if not await rate_limiter.acquire_async(_request_tokens(prompt, history), timeout=GEMINI_MAX_QUEUE_SECONDS):
+        circuit_breaker.release_probe()
+        raise _rate_limit_exhausted()
+
+def _contents(prompt, history):
+    """
+    Returns what generate_content is sent: the prompt alone or, for a conversation, the earlier
+    turns followed by the prompt, which is the request a start_chat() session's send_message makes.
+    :param history: List of {"role": "user" or "model", "text": ...} turns, oldest first.
+    """
+    if not history:
+        return prompt
+    return [{"role": turn["role"], "parts": [turn["text"]]} for turn in history] + [{"role": "user", "parts": [prompt]}]
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+def _record_usage(response):
+    """
+    Counts the prompt and response tokens Gemini reports for a call, when it reports them.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    for kind, field in (("prompt", "prompt_token_count"), ("response", "candidates_token_count"),
+                        ("cached", "cached_content_token_count")):
+        count = getattr(usage, field, None)
+        if isinstance(count, int):
+            UPSTREAM_TOKENS.inc(count, kind=kind)
+
+def _record_success(mode, started):
+    UPSTREAM_SECONDS.observe(time.perf_counter() - started, mode=mode, outcome="ok")
+    circuit_breaker.record_success()
+    rate_limiter.on_success()
+
+def _record_failure(e, prompt, attempt, mode, started):
+    """
+    Logs a failed call, feeds it to the rate limiter and circuit breaker, and returns the typed error.
+    """
+    error = _classify_error(e)
+    UPSTREAM_SECONDS.observe(time.perf_counter() - started, mode=mode, outcome=type(error).__name__)
+    log_event(f"Gemini API call failed (attempt {attempt + 1}) for prompt: '{prompt[:50]}...'. "
+              f"{type(error).__name__}: {error}", "data/errors.log",
+              event="upstream_error", error_code=type(error).__name__, latency_ms=_elapsed_ms(started))
+    if isinstance(error, GeminiRateLimitError):
+        rate_limiter.on_rate_limited(error.retry_after)
+    if error.retryable:
+        circuit_breaker.record_failure(error.retry_after)
+    else:
+        # Blocked or empty answers mean the upstream itself is healthy.
+        circuit_breaker.record_success()
+    return error
+
+def _should_retry(error, attempt, max_retries=None):
+    # A retry-after longer than the backoff cap would hold the request past the server's timeout;
+    # the error is raised at once so the route can tell the user to try again later
+    if error.retry_after and error.retry_after > GEMINI_BACKOFF_MAX:
+        return False
+    return error.retryable and attempt < (GEMINI_MAX_RETRIES if max_retries is None else max_retries)
+
+def _retry_delay(error, attempt):
+    UPSTREAM_RETRIES.inc(error=type(error).__name__)
+    return backoff_delay(attempt, GEMINI_BACKOFF_BASE, GEMINI_BACKOFF_MAX, error.retry_after)
+
+def _extract_response_text(response, prompt, started):
+    """
+    Returns the generated text from a Gemini response.
+    Raises GeminiEmptyResponseError if the response has no content.
+    """
+    # Check if candidates and content exist
+    if response.candidates and len(response.candidates) > 0 and \
+       response.candidates[0].content and len(response.candidates[0].content.parts) > 0:
+        generated_text = response.candidates[0].content.parts[0].text
+        log_event(f"Gemini API call successful for prompt: '{prompt[:50]}...'",
+                  latency_ms=_elapsed_ms(started))
+        return generated_text
+    raise GeminiEmptyResponseError(f"Gemini API returned no content. Full response: {response}")
+
+def _generation_options(max_output_tokens):
+    """
+    Extra generate_content arguments: a cap on the response length, when one is given.
+    """
+    return {"generation_config": {"max_output_tokens": max_output_tokens}} if max_output_tokens else {}
+
+def _generate_content(prompt, model_name, history, options):
+    """
+    Calls generate_content for a prompt. A prompt that starts with a cached prefix (see context_cache.py)
+    is sent as the rest of the prompt with a reference to the cache; if the cache is rejected, or for
+    other prompts, the full prompt is sent.
+    """
+    cached = context_cache.lookup(prompt) if model_name == MODEL_NAME and not history else None
+    if cached is not None:
+        entry, rest = cached
+        try:
+            return entry.model.generate_content(rest, **options)
+        except Exception as e:
+            if not context_cache.discard(entry, e):
+                raise
+    return client_manager.get_model(model_name).generate_content(_contents(prompt, history), **options)
+
+async def _generate_content_async(prompt, model_name, history, options):
+    cached = await context_cache.lookup_async(prompt) if model_name == MODEL_NAME and not history else None
+    if cached is not None:
+        entry, rest = cached
+        try:
+            return await entry.model.generate_content_async(rest, **options)
+        except Exception as e:
+            if not context_cache.discard(entry, e):
+                raise
+    return await client_manager.get_model(model_name).generate_content_async(_contents(prompt, history), **options)
+
+def _stream_content(prompt, model_name, options):
+    """
+    Yields the chunks of a streamed generate_content call, using a cached prefix like _generate_content.
+    The SDK raises most errors only once the stream is read, so a cache error raised before the first
+    chunk also falls back to the full prompt; after that it is raised.
+    """
+    cached = context_cache.lookup(prompt) if model_name == MODEL_NAME else None
+    if cached is not None:
+        entry, rest = cached
+        streamed = False
+        try:
+            for chunk in entry.model.generate_content(rest, **options):
+                streamed = True
+                yield chunk
+            return
+        except Exception as e:
+            if streamed or not context_cache.discard(entry, e):
+                raise
+    yield from client_manager.get_model(model_name).generate_content(_contents(prompt, None), **options)
+
+async def _stream_content_async(prompt, model_name, options):
+    """
+    Async variant of _stream_content.
+    """
+    cached = await context_cache.lookup_async(prompt) if model_name == MODEL_NAME else None
+    if cached is not None:
+        entry, rest = cached
+        streamed = False
+        try:
+            async for chunk in await entry.model.generate_content_async(rest, **options):
+                streamed = True
+                yield chunk
+            return
+        except Exception as e:
+            if streamed or not context_cache.discard(entry, e):
+                raise
+    async for chunk in await client_manager.get_model(model_name).generate_content_async(_contents(prompt, None), **options):
+        yield chunk
+
+def _chunk_text(chunk):
+    if chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts:
+        return "".join(part.text for part in chunk.candidates[0].content.parts)
+    return ""
+
+def get_gemini_response(prompt, model_name=MODEL_NAME, max_retries=None, max_output_tokens=None, history=None):
     """
     Sends a prompt to the Gemini API and returns the generated text response.
     It expects the GOOGLE_API_KEY to be set as an environment variable.
+    Calls go through the client-side rate limiter and circuit breaker; rate limit (429) and
+    transient server errors are retried with jittered exponential backoff.
+    :param max_retries: Retries after the first attempt (default GEMINI_MAX_RETRIES); the model
+                        router passes 0 so it can fail over to another provider instead.
+    :param max_output_tokens: Cap on the response length in tokens (see budget.py); None for the model's default.
+    :param history: Earlier turns of a conversation the prompt continues (see sessions.py).
+    Raises a GeminiError subclass if no answer could be produced.
     """
-    # NOTE: In a real application, you should load the API key from environment variables
-    # For this demonstration, we'll use an empty string and rely on the Canvas environment
-    # automatically providing the key in runtime.
-    api_key = os.environ.get("GOOGLE_API_KEY", "") # Fallback to empty string if not set
-
-    if not api_key:
-        log_event("GOOGLE_API_KEY environment variable not set. API calls might fail.", "data/errors.log")
-        # In the Canvas environment, __initial_auth_token will provide the key
-        # We don't need to explicitly set it here if running inside Canvas.
-        pass # Allow the API to be called without a visible key here, Canvas will inject it
-
-    try:
-        # Configure the Generative AI client
-        # In a real environment, you'd do: genai.configure(api_key=api_key)
-        # However, for Canvas, the API key is handled automatically.
-
-        # For the prompt engineering project, we're using gemini-2.0-flash as instructed.
-        model = genai.GenerativeModel('gemini-2.0-flash')
-
-        # Generate content
-        # chat_history = [] # This line was causing issues in a previous attempt, removed for clarity.
-        # chat_history.push({"role": "user", "parts": [{"text": prompt}]}) # This method is for JS fetch.
-        # payload = {"contents": chat_history} # This payload structure is for JS fetch.
-
-        # For Python client library, direct call to generate_content is used.
-        if api_key:
-            genai.configure(api_key=api_key) # Explicitly configure if key is found
-
-        response = model.generate_content(prompt)
-        # Check if candidates and content exist
-        if response.candidates and len(response.candidates) > 0 and \
-           response.candidates[0].content and len(response.candidates[0].content.parts) > 0:
-            generated_text = response.candidates[0].content.parts[0].text
-            log_event(f"Gemini API call successful for prompt: '{prompt[:50]}...'")
-            return generated_text
-        else:
-            log_event(f"Gemini API returned no content for prompt: '{prompt[:50]}...'. Full response: {response}", "data/errors.log")
-            return "Could not generate a response. Please try again."
-
-    except genai.types.BlockedPromptException as e:
-        log_event(f"Gemini API call blocked for prompt: '{prompt[:50]}...'. Reason: {e.response.prompt_feedback}", "data/errors.log")
-        return "Your request was blocked due to safety concerns. Please try a different query."
-    except Exception as e:
-        log_event(f"Error calling Gemini API: {e}", "data/errors.log")
-        return f"An error occurred while generating response: {e}. Please check the logs."
+    max_retries = GEMINI_MAX_RETRIES if max_retries is None else max_retries
+    for attempt in range(max_retries + 1):
+        _before_call(prompt, history)
+        started = time.perf_counter()
+        try:
+            # For the prompt engineering project, we're using gemini-2.0-flash as instructed.
+            response = _generate_content(prompt, model_name, history, _generation_options(max_output_tokens))
+            _record_usage(response)
+            text = _extract_response_text(response, prompt, started)
+        except Exception as e:
+            error = _record_failure(e, prompt, attempt, "generate", started)
+            if not _should_retry(error, attempt, max_retries):
+                raise error from e
+            time.sleep(_retry_delay(error, attempt))
+            continue
+        _record_success("generate", started)
+        return text
 
+async def get_gemini_response_async(prompt, model_name=MODEL_NAME, max_retries=None, max_output_tokens=None, history=None):
+    """
+    Async variant of get_gemini_response for the ASGI app. Awaits the model call on the
+    SDK's asyncio transport, so no thread is held while the request is in flight.
+    """
+    max_retries = GEMINI_MAX_RETRIES if max_retries is None else max_retries
+    for attempt in range(max_retries + 1):
+        await _before_call_async(prompt, history)
+        started = time.perf_counter()
+        try:
+            response = await _generate_content_async(prompt, model_name, history, _generation_options(max_output_tokens))
+            _record_usage(response)
+            text = _extract_response_text(response, prompt, started)
+        except Exception as e:
+            error = _record_failure(e, prompt, attempt, "generate", started)
+            if not _should_retry(error, attempt, max_retries):
+                raise error from e
+            await asyncio.sleep(_retry_delay(error, attempt))
+            continue
+        _record_success("generate", started)
+        return text
+
+def stream_gemini_response(prompt, model_name=MODEL_NAME, max_output_tokens=None):
+    """
+    Sends a prompt to the Gemini API using its streaming mode and yields the
+    generated text in chunks as they arrive.
+    Failures before the first chunk are retried like get_gemini_response; once text has been
+    yielded, a failure is raised as a GeminiError.
+    """
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        _before_call(prompt)
+        started = time.perf_counter()
+        produced_text = False
+        chunk = None
+        try:
+            for chunk in _stream_content(prompt, model_name, dict(_generation_options(max_output_tokens), stream=True)):
+                text = _chunk_text(chunk)
+                if text:
+                    produced_text = True
+                    yield text
+            if not produced_text:
+                raise GeminiEmptyResponseError("Gemini API stream returned no content.")
+        except Exception as e:
+            error = _record_failure(e, prompt, attempt, "stream", started)
+            if produced_text or not _should_retry(error, attempt):
+                raise error from e
+            time.sleep(_retry_delay(error, attempt))
+            continue
+        # The last chunk carries the usage totals for the whole stream
+        _record_usage(chunk)
+        _record_success("stream", started)
+        log_event(f"Gemini API streaming call successful for prompt: '{prompt[:50]}...'",
+                  latency_ms=_elapsed_ms(started))
+        return
+
+async def stream_gemini_response_async(prompt, model_name=MODEL_NAME, max_output_tokens=None):
+    """
+    Async variant of stream_gemini_response for the ASGI app.
+    """
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        await _before_call_async(prompt)
+        started = time.perf_counter()
+        produced_text = False
+        chunk = None
+        try:
+            async for chunk in _stream_content_async(prompt, model_name, dict(_generation_options(max_output_tokens), stream=True)):
+                text = _chunk_text(chunk)
+                if text:
+                    produced_text = True
+                    yield text
+            if not produced_text:
+                raise GeminiEmptyResponseError("Gemini API stream returned no content.")
+        except Exception as e:
+            error = _record_failure(e, prompt, attempt, "stream", started)
+            if produced_text or not _should_retry(error, attempt):
+                raise error from e
+            await asyncio.sleep(_retry_delay(error, attempt))
+            continue
+        # The last chunk carries the usage totals for the whole stream
+        _record_usage(chunk)
+        _record_success("stream", started)
+        log_event(f"Gemini API streaming call successful for prompt: '{prompt[:50]}...'",
+                  latency_ms=_elapsed_ms(started))
+        return
+
+def upstream_stats():
+    """
+    Reports the adaptive rate limiter, circuit breaker and context cache state.
+    """
+    return {"rate_limiter": rate_limiter.stats(), "circuit_breaker": circuit_breaker.stats(),
+            "context_cache": context_cache.stats()}
@@ -0,0 +1,59 @@
+"""
+Gunicorn settings for running the Flask app with pre-forked workers:
+
+    gunicorn app:app
+
+Worker and thread counts, and the bind address, come from the environment (see config.py).
+With more than one worker, response ids and conversation sessions must resolve in every worker, so
+the response and session stores are kept on disk (RESPONSE_STORE_DISK and SESSION_STORE_DISK
+default to "1"); setting either to "0" then stops the server at startup.
+The app is loaded once in the master and workers are forked from it, so the imported modules,
+including the Gemini SDK when PRELOAD_SDK=1, are shared copy-on-write. The SDK's gRPC channels
+must not be shared across a fork, so the master never builds a client; each worker pre-warms its own.
+Background jobs are not run by gunicorn: start `python jobqueue.py work` under a supervisor (see jobqueue.py).
+"""
+import os
+import time
+from config import load_config
+
+_settings = load_config()
+_started = time.perf_counter()
+
+bind = f"{_settings['HOST']}:{_settings['PORT']}"
+workers = _settings["WORKERS"]
+threads = _settings["THREADS"]
+
+if workers > 1:
+    # Set before the app is imported, so the stores it builds are shared between the workers
+    for _name in ("RESPONSE_STORE_DISK", "SESSION_STORE_DISK"):
+        if os.environ.setdefault(_name, "1") != "1":
+            raise RuntimeError(f"{_name}={os.environ[_name]} keeps state in one worker's memory, so requests "
+                               f"served by the other {workers - 1} workers would not find it. "
+                               f"Unset {_name} or run with WEB_CONCURRENCY=1.")
+worker_class = "gthread"
+preload_app = True
+timeout = 120 # Long summaries make several model calls in one request
+graceful_timeout = 30
+
+if _settings["PRELOAD_SDK"]:
+    import gemini_api
+    gemini_api.load_sdk()
+
+# The master must not create the client; post_fork pre-warms in each worker
+os.environ["GEMINI_PREWARM"] = "0"
+
+def when_ready(server):
+    if _settings["WARMUP"]:
+        # Runs before the first worker is forked, so every worker starts with the warmed cache.
+        # Only stored responses are used: the master must not call the model.
+        from warmup import warm_up, WARMUP_REQUESTS
+        server.log.info("Response cache warm-up: %s", warm_up(WARMUP_REQUESTS))
+    server.log.info("Master ready in %.3fs with %d workers", time.perf_counter() - _started, workers)
+
+def post_fork(server, worker):
+    from gemini_api import client_manager
+    if _settings["GEMINI_PREWARM"]:
+        client_manager.prewarm()
+
+def post_worker_init(worker):
+    worker.log.info("Worker %s booted in %.3fs since master start", worker.pid, time.perf_counter() - _started)
@@ -0,0 +1,492 @@
+"""
+This module runs slow generations in the background, so /generate can answer at once with a job page
+instead of holding the HTTP request open until the model is done (which proxies time out).
+
+Jobs are kept in a local SQLite database (data/jobs.sqlite3), so no broker is needed and queued jobs
+survive restarts. Worker processes are started separately from the web server, under a process
+supervisor (systemd, supervisord, a container restart policy) so they come back after a crash:
+
+    python jobqueue.py work [--processes 2]
+
+The command restarts any of its worker processes that exits until it is stopped itself.
+claim the queued job with the highest priority whose function is under its concurrency cap, run it
+through the same pipeline as /generate (assistant.generate_response) and store the response. A claim
+is a lease that the worker renews while the job runs: if the worker dies, its job is queued again
+once JOB_LEASE_SECONDS pass without a renewal, up to JOB_MAX_ATTEMPTS times. Workers also record a
+heartbeat, so the web app can tell when no worker is running and queued jobs would wait forever.
+
+Priorities (higher runs first) and caps are set per function with JOB_PRIORITIES and JOB_CONCURRENCY,
+e.g. JOB_CONCURRENCY="generate_creative_content=2". Finished jobs are kept for JOB_RETENTION seconds.
+
+A request runs as a job when its form asks for it (the "Run in the background" box) or its prompt
+style is listed in JOB_QUEUE_STYLES, e.g. "story_structured,essay_idea_structured". The job page
+polls /jobs/<id>/status and shows the result page once the job is done.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import secrets
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+import multiprocessing.connection
+from contextlib import contextmanager
+from utils import ensure_directory_exists, log_event, flush_logs
+from budget import parse_budgets
+from response_store import response_store
+
+JOB_DB_PATH = "data/jobs.sqlite3"
+DEFAULT_PRIORITIES = {"answer_question": 20, "summarize_text": 10, "generate_creative_content": 0}
+DEFAULT_LEASE_SECONDS = 60 # Renewed while the job runs, so only a dead worker's lease runs out
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETENTION_SECONDS = 24 * 3600
+DEFAULT_WORKERS = 2
+POLL_SECONDS = 0.5 # Longest a worker waits before looking for new jobs again
+HEARTBEAT_SECONDS = 5.0 # How often a worker records that it is alive
+
+FAILED_MESSAGE = "The background job failed. Please try again."
+
+# Prompt styles that always run as background jobs
+BACKGROUND_STYLES = frozenset(style.strip() for style in os.environ.get("JOB_QUEUE_STYLES", "").split(",") if style.strip())
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    function_choice TEXT NOT NULL,
+    prompt_style TEXT NOT NULL,
+    user_input TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires_at REAL,
+    response TEXT,
+    response_id TEXT,
+    error_message TEXT,
+    error_status INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (status, priority DESC, created_at);
+CREATE TABLE IF NOT EXISTS workers (
+    name TEXT PRIMARY KEY,
+    heartbeat_at REAL NOT NULL
+);
+"""
+
+_ID_ALPHABET = set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-")
+
+class JobQueue:
+    """
+    A persistent priority queue of generation jobs in SQLite, shared by the web workers that enqueue
+    jobs and the worker processes that run them. Each call opens its own connection, so an instance
+    is safe to use from any thread and across fork.
+    :param caps: Dict mapping function names to the most jobs of that function running at once.
+    """
+
+    def __init__(self, path=JOB_DB_PATH, priorities=None, caps=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, retention_seconds=DEFAULT_RETENTION_SECONDS):
+        self.path = path
+        self.priorities = dict(DEFAULT_PRIORITIES if priorities is None else priorities)
+        self.caps = dict(caps or {})
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            ensure_directory_exists(os.path.dirname(self.path) or ".")
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        if not self._initialized:
+            # WAL lets the web workers read job status while a worker process writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+            self._initialized = True
+        return connection
+
+    def _transaction(self, work):
+        """
+        Runs work(connection) in a write transaction and returns its result.
+        """
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(connection)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            return result
+        finally:
+            connection.close()
+
+    def enqueue(self, function_choice, prompt_style, user_input, priority=None):
+        """
+        Queues a generation and returns its job id.
+        :param priority: Overrides the function's priority; jobs with a higher priority run first.
+        """
+        job_id = secrets.token_urlsafe(12)
+        if priority is None:
+            priority = self.priorities.get(function_choice, 0)
+        self._transaction(lambda connection: connection.execute(
+            "INSERT INTO jobs (id, function_choice, prompt_style, user_input, priority, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+            (job_id, function_choice, prompt_style, user_input, priority, time.time())))
+        return job_id
+
+    def get(self, job_id):
+        """
+        Returns a job as a dict, with its place in the queue while queued, or None if the id is unknown.
+        """
+        if not isinstance(job_id, str) or len(job_id) != 16 or not set(job_id) <= _ID_ALPHABET:
+            return None
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            if job["status"] == "queued":
+                job["position"] = connection.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND "
+                    "(priority > ? OR (priority = ? AND created_at < ?))",
+                    (job["priority"], job["priority"], job["created_at"])).fetchone()[0] + 1
+                job["workers"] = self._workers_alive(connection)
+            return job
+        finally:
+            connection.close()
+
+    def _requeue_expired(self, connection, now):
+        """
+        Puts jobs whose worker's lease ran out back in the queue, or fails them after max_attempts.
+        """
+        connection.execute("UPDATE jobs SET status = 'failed', error_message = ?, error_status = 500, finished_at = ? "
+                           "WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ?",
+                           (FAILED_MESSAGE, now, now, self.max_attempts))
+        connection.execute("UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND lease_expires_at < ?",
+                           (now,))
+
+    def claim(self, worker):
+        """
+        Leases the next job to a worker: the queued job with the highest priority (oldest first)
+        whose function is under its concurrency cap.
+        :return: The job as a dict, or None if no job can run now.
+        """
+        def claim_next(connection):
+            now = time.time()
+            self._requeue_expired(connection, now)
+            running = dict(connection.execute(
+                "SELECT function_choice, COUNT(*) FROM jobs WHERE status = 'running' GROUP BY function_choice").fetchall())
+            full = [function for function, cap in self.caps.items() if running.get(function, 0) >= cap]
+            excluded = f"AND function_choice NOT IN ({', '.join('?' * len(full))}) " if full else ""
+            row = connection.execute(f"SELECT * FROM jobs WHERE status = 'queued' {excluded}"
+                                     "ORDER BY priority DESC, created_at LIMIT 1", full).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                               "started_at = ?, lease_expires_at = ? WHERE id = ?",
+                               (worker, now, now + self.lease_seconds, row["id"]))
+            return dict(row, status="running", worker=worker, attempts=row["attempts"] + 1)
+        return self._transaction(claim_next)
+
+    def renew(self, job_id, worker):
+        """
+        Extends a running job's lease by lease_seconds and records the worker's heartbeat.
+        :return: False if the job is no longer leased to the worker.
+        """
+        def renew_lease(connection):
+            now = time.time()
+            self._heartbeat(connection, worker, now)
+            return connection.execute("UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = 'running' AND worker = ?",
+                                      (now + self.lease_seconds, job_id, worker)).rowcount == 1
+        return self._transaction(renew_lease)
+
+    @staticmethod
+    def _heartbeat(connection, worker, now):
+        connection.execute("INSERT OR REPLACE INTO workers (name, heartbeat_at) VALUES (?, ?)", (worker, now))
+
+    def heartbeat(self, worker):
+        """
+        Records that a worker is alive.
+        """
+        self._transaction(lambda connection: self._heartbeat(connection, worker, time.time()))
+
+    def retire(self, worker):
+        """
+        Forgets a worker that is stopping.
+        """
+        self._transaction(lambda connection: connection.execute("DELETE FROM workers WHERE name = ?", (worker,)))
+
+    def _workers_alive(self, connection):
+        cutoff = time.time() - 3 * HEARTBEAT_SECONDS
+        connection.execute("DELETE FROM workers WHERE heartbeat_at < ?", (cutoff - 24 * 3600,)) # Long gone
+        return connection.execute("SELECT COUNT(*) FROM workers WHERE heartbeat_at >= ?", (cutoff,)).fetchone()[0]
+
+    def workers_alive(self):
+        """
+        Returns the number of workers that recorded a heartbeat recently.
+        """
+        connection = self._connect()
+        try:
+            return self._workers_alive(connection)
+        finally:
+            connection.close()
+
+    def _finish(self, job_id, worker, **fields):
+        """
+        Records a job's outcome, unless its lease has passed to another worker meanwhile.
+        :return: True if the outcome was recorded.
+        """
+        fields["finished_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        return self._transaction(lambda connection: connection.execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ? AND status = 'running' AND worker = ?",
+            (*fields.values(), job_id, worker)).rowcount == 1)
+
+    def complete(self, job_id, worker, response):
+        return self._finish(job_id, worker, status="done", response=response)
+
+    def fail(self, job_id, worker, error_message, error_status):
+        return self._finish(job_id, worker, status="failed", error_message=error_message, error_status=error_status)
+
+    def set_response_id(self, job_id, response_id):
+        """
+        Remembers the response store id the finished job's result page was saved under.
+        """
+        self._transaction(lambda connection: connection.execute(
+            "UPDATE jobs SET response_id = ? WHERE id = ?", (response_id, job_id)))
+
+    def purge(self):
+        """
+        Deletes finished jobs older than the retention period and returns how many were deleted.
+        """
+        cutoff = time.time() - self.retention_seconds
+        return self._transaction(lambda connection: connection.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,)).rowcount)
+
+    def stats(self):
+        """
+        Reports the number of jobs by status, and by function for queued and running jobs.
+        """
+        connection = self._connect()
+        try:
+            rows = connection.execute("SELECT status, function_choice, COUNT(*) AS jobs FROM jobs "
+                                      "GROUP BY status, function_choice").fetchall()
+        finally:
+            connection.close()
+        stats = {"queued": 0, "running": 0, "done": 0, "failed": 0, "queued_by_function": {}, "running_by_function": {}}
+        for row in rows:
+            stats[row["status"]] += row["jobs"]
+            if row["status"] in ("queued", "running"):
+                stats[f"{row['status']}_by_function"][row["function_choice"]] = row["jobs"]
+        stats["caps"] = self.caps
+        stats["workers"] = self.workers_alive()
+        return stats
+
+def create_job_queue_from_env(path=JOB_DB_PATH):
+    """
+    Builds the job queue from environment variables: JOB_PRIORITIES and JOB_CONCURRENCY (lists such
+    as "answer_question=20,summarize_text=10"), JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS and JOB_RETENTION.
+    """
+    return JobQueue(
+        path,
+        priorities=dict(DEFAULT_PRIORITIES, **parse_budgets(os.environ.get("JOB_PRIORITIES", ""))),
+        caps=parse_budgets(os.environ.get("JOB_CONCURRENCY", "")),
+        lease_seconds=float(os.environ.get("JOB_LEASE_SECONDS", DEFAULT_LEASE_SECONDS)),
+        max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)),
+        retention_seconds=float(os.environ.get("JOB_RETENTION", DEFAULT_RETENTION_SECONDS)),
+    )
+
+# Shared by the web routes, which enqueue and look up jobs, and the worker processes
+job_queue = create_job_queue_from_env()
+
+def runs_in_background(form, prompt_style):
+    """
+    Returns True if a /generate request should be queued as a job instead of answered inline.
+    """
+    return form.get('background') == 'on' or prompt_style in BACKGROUND_STYLES
+
+def status_report(job):
+    """
+    Returns the fields of a job reported by /jobs/<id>/status (not its input or response).
+    """
+    return {name: job.get(name) for name in ("id", "status", "position", "workers", "function_choice", "prompt_style",
+                                             "attempts", "created_at", "started_at", "finished_at")}
+
+def enqueue_job(queue, function_choice, prompt_style, user_input):
+    """
+    Queues a generation for the web routes and returns its job id. Logs an error when no worker
+    is alive, since the job then waits until one is started.
+    """
+    job_id = queue.enqueue(function_choice, prompt_style, user_input)
+    log_event(f"Queued background job {job_id} for function: {function_choice}, style: {prompt_style}.", event="job_queued")
+    if queue.workers_alive() == 0:
+        log_event(f"Background job {job_id} is queued but no job worker is running. Start workers "
+                  "with 'python jobqueue.py work'.", "data/errors.log", event="job_no_workers")
+    return job_id
+
+def stored_response_id(queue, job):
+    """
+    Returns the response store id of a finished job's response, saving the response on its first
+    view (or once the store has expired it), so the result page's feedback form works as for /generate.
+    """
+    if job["response_id"] and response_store.get(job["response_id"]) is not None:
+        return job["response_id"]
+    response_id = response_store.save(job["user_input"], job["response"], job["function_choice"], job["prompt_style"])
+    queue.set_response_id(job["id"], response_id)
+    return response_id
+
+@contextmanager
+def _lease_renewed(queue, job, worker):
+    """
+    Renews a job's lease from a background thread while the body runs.
+    """
+    done = threading.Event()
+    interval = max(0.01, min(HEARTBEAT_SECONDS, queue.lease_seconds / 3))
+
+    def renew():
+        while not done.wait(interval):
+            try:
+                if not queue.renew(job["id"], worker):
+                    return
+            except sqlite3.Error as e:
+                log_event(f"Could not renew the lease of background job {job['id']}: {e}", "data/errors.log", event="job_error")
+    renewer = threading.Thread(target=renew, name=f"lease-{job['id']}", daemon=True)
+    renewer.start()
+    try:
+        yield
+    finally:
+        done.set()
+        renewer.join()
+
+def run_job(queue, job, worker):
+    """
+    Generates the response for a claimed job and records the outcome.
+    """
+    from assistant import generate_response # The pipeline is only needed in worker processes
+    from gemini_api import GeminiError
+    started = time.perf_counter()
+    try:
+        with _lease_renewed(queue, job, worker):
+            response = generate_response(job["function_choice"], job["prompt_style"], job["user_input"])
+    except GeminiError as e:
+        queue.fail(job["id"], worker, e.user_message, e.status_code)
+        return
+    except Exception as e:
+        log_event(f"Background job {job['id']} failed: {e}", "data/errors.log", event="job_error")
+        queue.fail(job["id"], worker, FAILED_MESSAGE, 500)
+        return
+    if response is None:
+        queue.fail(job["id"], worker, "Invalid function or prompt style.", 400)
+        return
+    if queue.complete(job["id"], worker, response):
+        log_event(f"Background job {job['id']} done in {time.perf_counter() - started:.2f}s "
+                  f"({job['function_choice']}/{job['prompt_style']}).", event="job_done")
+
+def work(queue, worker, should_stop=lambda: False, poll_seconds=POLL_SECONDS):
+    """
+    Runs jobs from the queue until should_stop() returns True, recording a heartbeat as it goes.
+    An error, such as a database that stays locked, is logged and the worker carries on after poll_seconds.
+    """
+    last_purge = 0.0
+    last_heartbeat = None
+    try:
+        while not should_stop():
+            try:
+                if last_heartbeat is None or time.monotonic() - last_heartbeat >= HEARTBEAT_SECONDS:
+                    queue.heartbeat(worker)
+                    last_heartbeat = time.monotonic()
+                job = queue.claim(worker)
+                if job is None:
+                    if time.monotonic() - last_purge > 3600:
+                        last_purge = time.monotonic()
+                        queue.purge()
+                    time.sleep(poll_seconds)
+                    continue
+                run_job(queue, job, worker)
+                last_heartbeat = time.monotonic() # Renewing the lease recorded heartbeats meanwhile
+            except Exception as e:
+                log_event(f"Job worker {worker} error: {e}", "data/errors.log", event="job_error")
+                time.sleep(poll_seconds)
+    finally:
+        try:
+            queue.retire(worker)
+        except sqlite3.Error as e:
+            log_event(f"Job worker {worker} could not retire: {e}", "data/errors.log", event="job_error")
+
+def _worker_process(index):
+    stopping = []
+    # Finish the job in hand on SIGTERM, then exit
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    log_event(f"Job worker {worker} started.")
+    work(job_queue, worker, should_stop=lambda: bool(stopping))
+    log_event(f"Job worker {worker} stopped.")
+    flush_logs() # Worker processes exit without running atexit handlers
+
+def _start_worker(index):
+    process = multiprocessing.Process(target=_worker_process, args=(index,), name=f"job-worker-{index}")
+    process.start()
+    return process
+
+def run_workers(processes=DEFAULT_WORKERS, restart_delay=1.0):
+    """
+    Starts the worker processes and waits for them, restarting any that exits (after restart_delay
+    seconds, so a worker that crashes at startup does not spin). Ctrl-C or SIGTERM stops them after
+    their current job.
+    """
+    workers = {index: _start_worker(index) for index in range(processes)}
+    stopping = []
+
+    def stop(*_):
+        stopping.append(True)
+        for process in workers.values():
+            if process.is_alive():
+                process.terminate() # SIGTERM: finish the current job
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while workers:
+            multiprocessing.connection.wait([process.sentinel for process in workers.values()])
+            for index, process in list(workers.items()):
+                if process.is_alive():
+                    continue
+                process.join()
+                del workers[index]
+                if not stopping:
+                    log_event(f"Job worker {index} exited with code {process.exitcode}; restarting it.",
+                              "data/errors.log", event="job_worker_restart")
+                    time.sleep(restart_delay)
+                    workers[index] = _start_worker(index)
+    except KeyboardInterrupt:
+        stop()
+        for process in workers.values():
+            process.join()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run or inspect the background generation job queue.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker = commands.add_parser("work", help="Run worker processes that consume the queue")
+    worker.add_argument("--processes", type=int, default=int(os.environ.get("JOB_WORKERS", DEFAULT_WORKERS)))
+    commands.add_parser("stats", help="Print the number of jobs by status as JSON")
+    commands.add_parser("purge", help="Delete finished jobs older than JOB_RETENTION")
+    args = parser.parse_args(argv)
+
+    if args.command == "work":
+        run_workers(args.processes)
+    elif args.command == "stats":
+        print(json.dumps(job_queue.stats(), indent=2))
+    else:
+        print(f"Deleted {job_queue.purge()} finished jobs.")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
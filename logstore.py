@@ -0,0 +1,353 @@
+"""
+This module stores log records as structured, compressed segments with a small index, so incident
+triage can filter by time, event type or error code without decompressing every record.
+
+Each log file (data/logs.txt, data/errors.log) has a stream directory under data/logstore/. A process
+appends each batch of records (JSON Lines) to its own active segment as one gzip member. When the
+segment grows past LOG_SEGMENT_BYTES or LOG_SEGMENT_SECONDS it is sealed: one line with its time
+range, record count, event types, levels and error codes is appended to the stream's index.jsonl,
+and the oldest segments beyond LOG_RETAIN_SEGMENTS are deleted. Queries skip sealed segments the
+index rules out and scan only the others (including active segments, which are not indexed yet).
+
+Usage:
+    python logstore.py query --stream errors --since 2h --code GeminiRateLimitError
+    python logstore.py query --since "2025-06-23 10:00" --until "2025-06-23 11:00" --event generate
+    python logstore.py export data/logs.txt.1 data/logs.txt data/errors.log
+"""
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import zlib
+import heapq
+import argparse
+import threading
+from datetime import datetime
+
+try:
+    import fcntl # Cross-process file locks; not available on Windows
+except ImportError:
+    fcntl = None
+
+LOG_STORE_DIRNAME = "logstore"
+LOG_SEGMENT_BYTES = int(os.environ.get("LOG_SEGMENT_BYTES", 1024 * 1024)) # Compressed bytes before a segment is sealed
+LOG_SEGMENT_SECONDS = float(os.environ.get("LOG_SEGMENT_SECONDS", 3600)) # Age before a segment is sealed
+LOG_RETAIN_SEGMENTS = int(os.environ.get("LOG_RETAIN_SEGMENTS", 200)) # Sealed segments kept per stream
+SEGMENT_SUFFIX = ".jsonl.gz"
+INDEX_FILE = "index.jsonl"
+
+_TEXT_LINE_RE = re.compile(r"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] (.*)$")
+
+# Event types recognized from the messages the application logs, for records that don't name one
+_MESSAGE_EVENTS = [
+    (re.compile(r"^Gemini API call failed \(attempt \d+\).*?\. (\w+): "), "upstream_error", "error_code"),
+    (re.compile(r"^Gemini API (?:streaming )?call successful"), "upstream_call", None),
+    (re.compile(r"^Model provider \S+ failed: (\w+): "), "provider_error", "error_code"),
+    (re.compile(r"^Error calling OpenAI API: Error code: (\d+)"), "upstream_error", "error_code"),
+    (re.compile(r"^(?:Generating|Streaming) response for function: (\w+)"), "generate", "function"),
+    (re.compile(r"^AI Response (?:generated|streamed)"), "response", None),
+    (re.compile(r"^Input budget for (\w+)"), "input_budget", "function"),
+    (re.compile(r"^Invalid function or prompt style"), "invalid_request", None),
+    (re.compile(r"^(?:User feedback received|Feedback saved|Feedback for unknown)"), "feedback", None),
+    (re.compile(r"^Semantic cache hit"), "semantic_cache_hit", None),
+    (re.compile(r"^Batch"), "batch", None),
+    (re.compile(r"^Slow request profile"), "slow_request", None),
+    (re.compile(r"^(?:Async a|A)pplication started"), "startup", None),
+]
+
+def stream_name(log_file):
+    """
+    Returns the stream a log file's records are stored under, e.g. "errors" for data/errors.log
+    and "logs" for the rotated data/logs.txt.1.
+    """
+    return os.path.basename(log_file).split(".")[0]
+
+def stream_directory(log_file):
+    """
+    Returns the segment directory for a log file: logstore/<stream> next to the file.
+    """
+    return os.path.join(os.path.dirname(log_file) or ".", LOG_STORE_DIRNAME, stream_name(log_file))
+
+def classify_message(message):
+    """
+    Returns (event type, extra fields) for a log message, recognized from its wording.
+    """
+    for pattern, event, field in _MESSAGE_EVENTS:
+        match = pattern.match(message)
+        if match:
+            return event, ({field: match.group(1)} if field else {})
+    return "message", {}
+
+def build_record(log_file, record):
+    """
+    Completes a record queued by log_event: the level follows the log file, and the event type
+    and fields are recognized from the message unless the caller gave them.
+    """
+    event, fields = classify_message(record["message"])
+    full = {"ts": record["ts"], "level": "error" if stream_name(log_file).startswith("error") else "info", "event": event}
+    full.update(fields)
+    full.update(record)
+    return full
+
+class _IndexLock:
+    """
+    Exclusive lock on a stream's index, held across processes where flock is supported.
+    """
+
+    _thread_lock = threading.Lock()
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, f"{INDEX_FILE}.lock")
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        self._thread_lock.release()
+
+class SegmentWriter:
+    """
+    Appends record batches to this process's active segment of one stream, sealing it into the
+    index when it is large or old enough. Used from the background log writer thread only.
+    """
+
+    def __init__(self, directory, max_bytes=LOG_SEGMENT_BYTES, max_age_seconds=LOG_SEGMENT_SECONDS,
+                 retain_segments=LOG_RETAIN_SEGMENTS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.retain_segments = retain_segments
+        self._path = None
+        self._sequence = 0
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._sequence}{SEGMENT_SUFFIX}"
+        self._path = os.path.join(self.directory, name)
+        self._opened = time.monotonic()
+        self._entry = {"segment": name, "start": None, "end": None, "count": 0, "bytes": 0,
+                       "events": set(), "levels": set(), "codes": set()}
+
+    def append(self, records):
+        """
+        Compresses a batch of records into one gzip member at the end of the active segment.
+        """
+        if not records:
+            return
+        if self._path is not None and (self._entry["bytes"] >= self.max_bytes
+                                       or time.monotonic() - self._opened >= self.max_age_seconds):
+            self.seal()
+        if self._path is None:
+            self._open_segment()
+        data = gzip.compress("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records).encode("utf-8"))
+        with open(self._path, "ab") as f:
+            f.write(data)
+        entry = self._entry
+        times = [record["ts"] for record in records]
+        entry["start"] = min(times) if entry["start"] is None else min(entry["start"], *times)
+        entry["end"] = max(times) if entry["end"] is None else max(entry["end"], *times)
+        entry["count"] += len(records)
+        entry["bytes"] += len(data)
+        for record in records:
+            entry["events"].add(record.get("event"))
+            entry["levels"].add(record.get("level"))
+            if record.get("error_code") is not None:
+                entry["codes"].add(str(record["error_code"]))
+
+    def seal(self):
+        """
+        Adds the active segment to the index and applies retention; the next batch starts a new segment.
+        """
+        if self._path is None or not os.path.exists(self._path):
+            self._path = None # Nothing written, or the directory was removed
+            return
+        entry = dict(self._entry, events=sorted(filter(None, self._entry["events"])),
+                     levels=sorted(filter(None, self._entry["levels"])), codes=sorted(self._entry["codes"]))
+        self._path = None
+        with _IndexLock(self.directory):
+            with open(os.path.join(self.directory, INDEX_FILE), "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._apply_retention()
+
+    def _apply_retention(self):
+        entries = read_index(self.directory)
+        if len(entries) <= self.retain_segments:
+            return
+        expired, kept = entries[:len(entries) - self.retain_segments], entries[len(entries) - self.retain_segments:]
+        for entry in expired:
+            try:
+                os.remove(os.path.join(self.directory, entry["segment"]))
+            except FileNotFoundError:
+                pass
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in kept)
+        os.replace(tmp_path, index_path)
+
+def read_index(directory):
+    """
+    Returns a stream's index entries, oldest sealed segment first.
+    """
+    try:
+        with open(os.path.join(directory, INDEX_FILE)) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+def _read_segment(path):
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+    except FileNotFoundError:
+        return # Removed by retention during the query
+    except (EOFError, zlib.error, gzip.BadGzipFile):
+        return # An active segment whose last batch is still being written
+
+def _entry_may_match(entry, since, until, events, codes, levels):
+    if entry["count"] == 0:
+        return False
+    if since is not None and entry["end"] < since:
+        return False
+    if until is not None and entry["start"] > until:
+        return False
+    if events and not events.intersection(entry["events"]):
+        return False
+    if codes and not codes.intersection(entry["codes"]):
+        return False
+    return not levels or bool(levels.intersection(entry["levels"]))
+
+def _record_matches(record, since, until, events, codes, levels, contains):
+    return ((since is None or record["ts"] >= since) and (until is None or record["ts"] <= until)
+            and (not events or record.get("event") in events)
+            and (not codes or str(record.get("error_code")) in codes)
+            and (not levels or record.get("level") in levels)
+            and (contains is None or contains in record.get("message", "")))
+
+def query_logs(directory, since=None, until=None, events=None, codes=None, levels=None, contains=None, stats=None):
+    """
+    Yields a stream's records that match every given filter, in time order.
+    :param since: / until: Epoch seconds bounding the record time (inclusive).
+    :param events: / codes: / levels: Collections of accepted event types, error codes and levels.
+    :param contains: Substring the message must contain.
+    :param stats: Optional dict that receives the number of segments scanned and skipped.
+    """
+    events, codes, levels = set(events or ()), {str(code) for code in codes or ()}, set(levels or ())
+    indexed = {entry["segment"]: entry for entry in read_index(directory)}
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+    except FileNotFoundError:
+        names = []
+    scanned = [name for name in names
+               if name not in indexed or _entry_may_match(indexed[name], since, until, events, codes, levels)]
+    if stats is not None:
+        stats.update(scanned=len(scanned), skipped=len(names) - len(scanned))
+    # Processes write their own segments, so merge them back into one timeline
+    records = heapq.merge(*(_read_segment(os.path.join(directory, name)) for name in scanned), key=lambda record: record["ts"])
+    for record in records:
+        if _record_matches(record, since, until, events, codes, levels, contains):
+            yield record
+
+def parse_text_log(path):
+    """
+    Yields (epoch seconds, message) for each entry of a text log written by log_event.
+    Lines without a timestamp continue the previous entry's message.
+    """
+    timestamp, parts = None, []
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            match = _TEXT_LINE_RE.match(line.rstrip("\n"))
+            if match is None:
+                parts.append(line.rstrip("\n"))
+                continue
+            if timestamp is not None:
+                yield timestamp, "\n".join(parts)
+            timestamp = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S").timestamp()
+            parts = [match.group(2)]
+    if timestamp is not None:
+        yield timestamp, "\n".join(parts)
+
+def export_text_log(path, directory=None, batch_size=1000):
+    """
+    Converts a text log into sealed segments of its stream (e.g. data/logs.txt.1 into data/logstore/logs).
+    :return: The number of records exported.
+    """
+    writer = SegmentWriter(directory or stream_directory(path), max_age_seconds=float("inf"))
+    batch, count = [], 0
+    for timestamp, message in parse_text_log(path):
+        batch.append(build_record(path, {"ts": timestamp, "message": message}))
+        if len(batch) >= batch_size:
+            writer.append(batch)
+            count, batch = count + len(batch), []
+    writer.append(batch)
+    writer.seal()
+    return count + len(batch)
+
+def parse_time(value, now=None):
+    """
+    Parses a query time: a relative age such as "30m", "2h" or "7d", or a local "YYYY-MM-DD[ HH:MM[:SS]]".
+    :return: Epoch seconds.
+    """
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", value.strip())
+    if match:
+        seconds = float(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+        return (time.time() if now is None else now) - seconds
+    return datetime.fromisoformat(value.strip()).timestamp()
+
+def format_record(record):
+    fields = " ".join(f"{name}={record[name]}" for name in ("function", "latency_ms", "error_code") if record.get(name) is not None)
+    timestamp = datetime.fromtimestamp(record["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+    return f"[{timestamp}] {record['level']:<5} {record['event']}{' ' + fields if fields else ''}: {record['message']}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query or build the compressed, indexed log store.")
+    parser.add_argument("--data-dir", default="data", help="Directory holding the logs (default: data)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query = commands.add_parser("query", help="Print records matching the filters, oldest first")
+    query.add_argument("--stream", default="logs", help="Stream to search: logs or errors (default: logs)")
+    query.add_argument("--since", help='Start time: an age like "2h", or "YYYY-MM-DD HH:MM"')
+    query.add_argument("--until", help="End time, in the same formats as --since")
+    query.add_argument("--event", action="append", help="Event type; may be repeated")
+    query.add_argument("--code", action="append", help="Error code; may be repeated")
+    query.add_argument("--level", action="append", help="Level (info or error); may be repeated")
+    query.add_argument("--grep", help="Substring the message must contain")
+    query.add_argument("--limit", type=int, help="Stop after this many records")
+    query.add_argument("--json", action="store_true", help="Print records as JSON Lines")
+
+    export = commands.add_parser("export", help="Convert text logs into the log store, oldest file first")
+    export.add_argument("files", nargs="+", help="Text logs, e.g. data/logs.txt.1 data/logs.txt data/errors.log")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        for path in args.files:
+            print(f"{path}: {export_text_log(path)} records exported")
+        return 0
+
+    stats = {}
+    records = query_logs(os.path.join(args.data_dir, LOG_STORE_DIRNAME, args.stream),
+                         since=parse_time(args.since) if args.since else None,
+                         until=parse_time(args.until) if args.until else None,
+                         events=args.event, codes=args.code, levels=args.level, contains=args.grep, stats=stats)
+    shown = 0
+    for record in records:
+        if args.limit is not None and shown >= args.limit:
+            break
+        print(json.dumps(record) if args.json else format_record(record))
+        shown += 1
+    sys.stderr.write(f"{shown} records; {stats['scanned']} segments scanned, {stats['skipped']} skipped by the index\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,346 @@
+"""
+This module provides low-overhead request instrumentation exposed in Prometheus text format at /metrics.
+Routes are timed per phase (prompt building, the upstream call, Markdown conversion, template rendering,
+log writes, feedback saving) into fixed-bucket histograms; code anywhere on the request path marks a
+phase with `with phase("name"):`, which is a no-op outside an instrumented request.
+
+An opt-in sampling profiler (PROFILE_SLOW_REQUEST_MS) samples the stack of each request's thread and,
+for requests slower than the threshold, writes the samples as folded stacks under data/profiles/,
+ready for flamegraph.pl or speedscope.
+"""
+import os
+import sys
+import time
+import bisect
+import threading
+import contextvars
+from collections import Counter as _StackCounter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROFILE_SLOW_REQUEST_MS = float(os.environ.get("PROFILE_SLOW_REQUEST_MS", 0)) # 0 disables the profiler
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 5))
+PROFILE_DIR = "data/profiles"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """
+    Monotonic counter with optional labels.
+    """
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, "") for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(self.labelnames, key), value) for key, value in sorted(self._values.items())]
+
+class Gauge(Counter):
+    """
+    Value that is set rather than incremented, with optional labels.
+    """
+
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram:
+    """
+    Fixed-bucket histogram with optional labels. observe() is a bisect and three additions under a lock.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {} # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels):
+        series = self._series.get(tuple(labels.get(name, "") for name in self.labelnames))
+        return series[-1] if series else 0
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            series_items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in series_items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), series[:-2] + [0]):
+                cumulative += bucket_count
+                if bound == float("inf"):
+                    cumulative = series[-1]
+                lines.append((f"{self.name}_bucket", _format_labels(self.labelnames, key, [("le", _format_value(bound))]), cumulative))
+            lines.append((f"{self.name}_sum", _format_labels(self.labelnames, key), series[-2]))
+            lines.append((f"{self.name}_count", _format_labels(self.labelnames, key), series[-1]))
+        return lines
+
+class Registry:
+    """
+    Holds metrics and scrape-time collectors, and renders them in the Prometheus text format.
+    A collector is a callable returning (name, type, documentation, [(labels dict, value), ...]) tuples,
+    for values that other components already track (cache and coalescing counters, limiter state).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in metric.samples())
+        for collector in self._collectors:
+            for name, metric_type, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    rendered = _format_labels(tuple(labels), tuple(labels.values()))
+                    lines.append(f"{name}{rendered} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    "assistant_request_seconds", "Request latency by route.", ["route"]))
+REQUEST_PHASE_SECONDS = registry.register(Histogram(
+    "assistant_request_phase_seconds", "Time spent in each phase of a request; phases may nest.", ["route", "phase"]))
+UPSTREAM_SECONDS = registry.register(Histogram(
+    "assistant_upstream_call_seconds", "Latency of individual Gemini call attempts by outcome.", ["mode", "outcome"]))
+UPSTREAM_TOKENS = registry.register(Counter(
+    "assistant_upstream_tokens_total", "Tokens reported by Gemini usage metadata.", ["kind"]))
+UPSTREAM_RETRIES = registry.register(Counter(
+    "assistant_upstream_retries_total", "Gemini call attempts that were retried, by error type.", ["error"]))
+PROVIDER_SECONDS = registry.register(Histogram(
+    "assistant_provider_call_seconds", "Latency of model router calls by provider and outcome.", ["provider", "outcome"]))
+HEDGED_CALLS = registry.register(Counter(
+    "assistant_hedged_calls_total", "Hedge calls started by the model router, by provider.", ["provider"]))
+INPUT_BUDGET_DECISIONS = registry.register(Counter(
+    "assistant_input_budget_decisions_total", "Inputs changed to fit their token budget, by function and action.",
+    ["function", "action"]))
+STARTUP_SECONDS = registry.register(Gauge(
+    "assistant_startup_seconds", "Time this process spent starting up, by phase.", ["phase"]))
+PROFILES_WRITTEN = registry.register(Counter(
+    "assistant_slow_request_profiles_total", "Slow request profiles written.", ["route"]))
+LOG_RECORDS_DROPPED = registry.register(Counter(
+    "assistant_log_records_dropped_total", "Log records dropped because the log writer fell behind."))
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of registered threads every interval seconds from a daemon thread,
+    which only runs while at least one request is being profiled.
+    """
+
+    def __init__(self, interval_seconds):
+        self.interval_seconds = interval_seconds
+        self._lock = threading.Lock()
+        self._active = {} # token -> (thread ident, stack counter)
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts sampling the calling thread and returns a token for stop().
+        """
+        token = object()
+        with self._lock:
+            self._active[token] = (threading.get_ident(), _StackCounter())
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return token
+
+    def stop(self, token):
+        """
+        Stops sampling for a token and returns its folded stack counts.
+        """
+        with self._lock:
+            _ident, stacks = self._active.pop(token, (None, _StackCounter()))
+        return stacks
+
+    @staticmethod
+    def _fold(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                idle = not self._active
+                if idle:
+                    self._wakeup.clear()
+            if idle:
+                self._wakeup.wait()
+                continue
+            time.sleep(self.interval_seconds)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, stacks in self._active.values():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[self._fold(frame)] += 1
+
+profiler = SamplingProfiler(PROFILE_INTERVAL_MS / 1000.0) if PROFILE_SLOW_REQUEST_MS > 0 else None
+
+def write_profile(route, elapsed_seconds, stacks, directory=None):
+    """
+    Writes folded stacks ("frame;frame;frame count" per line) for a slow request and returns the path.
+    """
+    from utils import ensure_directory_exists, log_event # utils marks log phases, so import lazily
+    directory = directory or PROFILE_DIR
+    ensure_directory_exists(directory)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    path = os.path.join(directory, f"{stamp}-{route}-{int(elapsed_seconds * 1000)}ms.folded")
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    PROFILES_WRITTEN.inc(route=route)
+    log_event(f"Slow request profile for {route} ({elapsed_seconds * 1000:.0f} ms) written to {path}")
+    return path
+
+_current_timer = contextvars.ContextVar("request_timer", default=None)
+
+class RequestTimer:
+    """
+    Accumulates phase durations for one request and records them when the request finishes.
+    """
+
+    def __init__(self, route):
+        self.route = route
+        self.phases = {}
+        self.started = time.perf_counter()
+        self._profile_token = profiler.start() if profiler is not None else None
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def finish(self):
+        """
+        Records the request and phase latencies, and writes a profile if the request was slow.
+        :return: The total request time in seconds.
+        """
+        elapsed = time.perf_counter() - self.started
+        REQUEST_SECONDS.observe(elapsed, route=self.route)
+        for name, seconds in self.phases.items():
+            REQUEST_PHASE_SECONDS.observe(seconds, route=self.route, phase=name)
+        if self._profile_token is not None:
+            stacks = profiler.stop(self._profile_token)
+            self._profile_token = None
+            if elapsed * 1000 >= PROFILE_SLOW_REQUEST_MS and stacks:
+                write_profile(self.route, elapsed, stacks)
+        return elapsed
+
+def start_request_timer(route):
+    """
+    Starts timing a request and makes it the current timer for phase() in this context.
+    """
+    timer = RequestTimer(route)
+    _current_timer.set(timer)
+    return timer
+
+def finish_request_timer():
+    """
+    Finishes the current request timer, if any.
+    """
+    timer = _current_timer.get()
+    if timer is not None:
+        _current_timer.set(None)
+        timer.finish()
+
+def detach_request_timer():
+    """
+    Takes the current timer away from the request, so the request's teardown does not finish it.
+    Streamed responses are generated after the view returns; they time their phases and finish the
+    timer with streamed_request().
+    """
+    timer = _current_timer.get()
+    _current_timer.set(None)
+    return timer
+
+@contextmanager
+def streamed_request(timer):
+    """
+    Makes a detached timer current while a streamed response is generated, and finishes it at the end.
+    """
+    if timer is None:
+        yield
+        return
+    _current_timer.set(timer)
+    try:
+        yield
+    finally:
+        _current_timer.set(None)
+        timer.finish()
+
+def phase(name):
+    """
+    Context manager timing a phase of the current request; does nothing outside an instrumented request.
+    """
+    timer = _current_timer.get()
+    return timer.phase(name) if timer is not None else nullcontext()
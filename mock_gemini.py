@@ -0,0 +1,373 @@
+"""
+This module is a stand-in for the Gemini API, for benchmarks and load tests. It serves the REST
+generateContent and streamGenerateContent endpoints with a configurable latency, error rate and
+rate limiting, so the real SDK and gemini_api.py's retries, rate limiter and circuit breaker are
+exercised without calling (or paying for) the real upstream. It also serves the cachedContents
+endpoints, and counts the prompt tokens it was sent and how many of them came from a cached
+context, so the savings of context_cache.py can be measured.
+
+Point the app at it with GEMINI_API_ENDPOINT (the SDK then uses its REST transport):
+
+    python mock_gemini.py --port 8089 --latency-ms 300 --error-rate 0.01 --rate-limit-rate 0.02
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8089 python app.py
+"""
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from collections import deque, Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_PORT = 8089
+
+_PATH_RE = re.compile(r"^/v1beta/models/(?P<model>[^/:?]+):(?P<method>generateContent|streamGenerateContent)(\?.*)?$")
+_CACHE_PATH_RE = re.compile(r"^/v1beta/(?P<name>cachedContents(/[^/:?]+)?)(\?.*)?$")
+_TTL_RE = re.compile(r"^([\d.]+)s$")
+_WORDS = ("the model response covers several points about this topic including background context "
+          "key details practical examples common questions trade offs and a short conclusion").split()
+
+class MockGeminiConfig:
+    """
+    Behaviour of the stand-in upstream.
+    :param latency_ms: Mean time to answer a call (for streams, spread across the chunks).
+    :param jitter_ms: Latency varies uniformly by up to this much either way.
+    :param error_rate: Fraction of calls answered with a 500 error.
+    :param rate_limit_rate: Fraction of calls answered with a 429 error.
+    :param rpm: Requests per minute accepted before every further call gets a 429 (0 for no quota).
+    :param retry_after: Seconds advertised in the Retry-After header of random 429s.
+    :param response_words: Length of each generated response in words.
+    :param stream_chunks: Number of chunks a streamed response is split into.
+    :param seed: Seed for the random latency and errors, for repeatable runs.
+    :param min_cache_tokens: Smallest context accepted by cachedContents; smaller ones are rejected
+                             with a 400 error, as the real API does.
+    """
+
+    def __init__(self, latency_ms=200.0, jitter_ms=50.0, error_rate=0.0, rate_limit_rate=0.0, rpm=0,
+                 retry_after=1.0, response_words=120, stream_chunks=8, seed=None, min_cache_tokens=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rpm = rpm
+        self.retry_after = retry_after
+        self.response_words = response_words
+        self.stream_chunks = stream_chunks
+        self.seed = seed
+        self.min_cache_tokens = min_cache_tokens
+
+def _error_body(code, status, message):
+    return {"error": {"code": code, "message": message, "status": status}}
+
+def _tokens(text):
+    return len(text) // 4 + 1
+
+def _contents_text(request):
+    return "".join(part.get("text", "") for content in request.get("contents", []) for part in content.get("parts", []))
+
+def _response_text(prompt, words):
+    """
+    Builds a deterministic Markdown answer for a prompt: a heading, paragraphs and a bullet list.
+    """
+    seed = int.from_bytes(hashlib.sha1(prompt.encode("utf-8")).digest()[:8], "little")
+    rng = random.Random(seed)
+    picked = [rng.choice(_WORDS) for _ in range(words)]
+    paragraphs = []
+    for start in range(0, len(picked), 40):
+        sentence = " ".join(picked[start:start + 40])
+        paragraphs.append(sentence[:1].upper() + sentence[1:] + ".")
+    bullets = "\n".join(f"- **{word}** {' '.join(picked[i:i + 6])}" for i, word in enumerate(picked[:5]))
+    return "## Answer\n\n" + "\n\n".join(paragraphs) + "\n\n" + bullets + "\n"
+
+class MockGeminiServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server answering Gemini REST calls according to a MockGeminiConfig.
+    Counts the calls it answered by HTTP status, for benchmark reports.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockGeminiConfig()
+        self.statuses = Counter()
+        self._lock = threading.Lock()
+        self._random = random.Random(self.config.seed)
+        self._recent_calls = deque()
+        self._cached_contents = {}
+        self._cache_ids = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self._thread = None
+        super().__init__((host, port), _MockGeminiHandler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """
+        Serves requests from a daemon thread and returns the server.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-gemini", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {"calls": sum(self.statuses.values()), "by_status": dict(self.statuses)}
+
+    def token_usage(self):
+        """
+        Reports the prompt tokens of the calls answered, and how many of them were read from a cached context.
+        """
+        with self._lock:
+            return {"prompt_tokens": self.prompt_tokens, "cached_tokens": self.cached_tokens,
+                    "cached_contents": len(self._cached_contents)}
+
+    def count_tokens(self, prompt_tokens, cached_tokens):
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+
+    def create_cached_content(self, request):
+        """
+        Stores a cached context and returns its resource, or None if it is below min_cache_tokens.
+        """
+        text = _contents_text(request)
+        if _tokens(text) < self.config.min_cache_tokens:
+            return None
+        with self._lock:
+            self._cache_ids += 1
+            name = f"cachedContents/mock-{self._cache_ids}"
+            self._cached_contents[name] = {"text": text, "model": request.get("model", ""), "expires_at": 0.0}
+        return self.update_cached_content(name, request.get("ttl", "3600s"))
+
+    def update_cached_content(self, name, ttl):
+        match = _TTL_RE.match(ttl or "")
+        with self._lock:
+            cached = self._cached_contents.get(name)
+            if cached is None or not match:
+                return None
+            cached["expires_at"] = time.time() + float(match.group(1))
+            return self._cached_resource(name, cached)
+
+    def get_cached_content(self, name):
+        """
+        Returns a cached context's text and token count, or None if it is unknown or has expired.
+        """
+        with self._lock:
+            cached = self._cached_contents.get(name)
+            if cached is None or cached["expires_at"] <= time.time():
+                self._cached_contents.pop(name, None)
+                return None
+            return cached["text"], _tokens(cached["text"])
+
+    def delete_cached_content(self, name):
+        with self._lock:
+            return self._cached_contents.pop(name, None) is not None
+
+    @staticmethod
+    def _cached_resource(name, cached):
+        expire_time = datetime.fromtimestamp(cached["expires_at"], timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        return {"name": name, "model": cached["model"], "expireTime": expire_time,
+                "usageMetadata": {"totalTokenCount": _tokens(cached["text"])}}
+
+    def decide(self):
+        """
+        Picks the outcome of one call.
+        :return: A tuple (status, retry_after seconds or None, latency in seconds).
+        """
+        config = self.config
+        now = time.monotonic()
+        with self._lock:
+            roll = self._random.random()
+            latency = max(0.0, config.latency_ms + self._random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000.0
+            if config.rpm:
+                while self._recent_calls and self._recent_calls[0] <= now - 60:
+                    self._recent_calls.popleft()
+                if len(self._recent_calls) >= config.rpm:
+                    status, retry_after = 429, self._recent_calls[0] + 60 - now
+                    self.statuses[status] += 1
+                    return status, retry_after, 0.0
+                self._recent_calls.append(now)
+            if roll < config.error_rate:
+                status, retry_after = 500, None
+            elif roll < config.error_rate + config.rate_limit_rate:
+                status, retry_after = 429, config.retry_after
+            else:
+                status, retry_after = 200, None
+            self.statuses[status] += 1
+        return status, retry_after, latency
+
+class _MockGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, as the SDK's requests session expects
+
+    def log_message(self, format, *args):
+        pass # Keep benchmark output readable
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _read_request(self):
+        """
+        Returns the JSON body of the request, or None (after answering with a 400) if it is not valid.
+        """
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+        try:
+            request = json.loads(body or b"{}")
+            _contents_text(request)
+            return request
+        except (ValueError, AttributeError):
+            self._send_json(400, _error_body(400, "INVALID_ARGUMENT", "Request body is not a valid request."))
+            return None
+
+    def _not_found(self):
+        self._send_json(404, _error_body(404, "NOT_FOUND", f"Unknown path {self.path}"))
+
+    def _cached_content_request(self):
+        """
+        Answers the cachedContents create, get, update and delete calls.
+        """
+        match = _CACHE_PATH_RE.match(self.path)
+        request = self._read_request() if match else None
+        if request is None:
+            if not match:
+                self._not_found()
+            return
+        name = match.group("name")
+        if self.command == "POST" and name == "cachedContents":
+            resource = self.server.create_cached_content(request)
+            if resource is None:
+                self._send_json(400, _error_body(400, "INVALID_ARGUMENT", "Cached content is too small. "
+                                                 f"min_total_token_count is {self.server.config.min_cache_tokens}."))
+                return
+        elif self.command == "PATCH":
+            resource = self.server.update_cached_content(name, request.get("ttl"))
+        elif self.command == "DELETE":
+            resource = {} if self.server.delete_cached_content(name) else None
+        elif self.command == "GET":
+            resource = {"name": name} if self.server.get_cached_content(name) is not None else None
+        else:
+            resource = None
+        if resource is None:
+            self._send_json(404, _error_body(404, "NOT_FOUND", f"CachedContent not found: {name}"))
+            return
+        self._send_json(200, resource)
+
+    do_PATCH = do_DELETE = do_GET = _cached_content_request
+
+    def do_POST(self):
+        match = _PATH_RE.match(self.path)
+        if not match:
+            self._cached_content_request()
+            return
+        request = self._read_request()
+        if request is None:
+            return
+        prompt, cached_tokens = _contents_text(request), 0
+        if request.get("cachedContent"):
+            cached = self.server.get_cached_content(request["cachedContent"])
+            if cached is None:
+                self._send_json(404, _error_body(404, "NOT_FOUND", f"CachedContent not found: {request['cachedContent']}"))
+                return
+            # The model sees the cached context followed by the request's contents
+            prompt, cached_tokens = cached[0] + prompt, cached[1]
+
+        status, retry_after, latency = self.server.decide()
+        if status == 429:
+            time.sleep(latency / 10) # Quota errors come back quickly
+            self._send_json(429, _error_body(429, "RESOURCE_EXHAUSTED",
+                                             f"Quota exceeded. Please retry in {retry_after:.1f}s."),
+                            {"Retry-After": f"{retry_after:.1f}"})
+            return
+        if status == 500:
+            time.sleep(latency)
+            self._send_json(500, _error_body(500, "INTERNAL", "An internal error has occurred."))
+            return
+
+        text = _response_text(prompt, self.server.config.response_words)
+        usage = {"promptTokenCount": _tokens(prompt), "candidatesTokenCount": _tokens(text)}
+        usage["totalTokenCount"] = usage["promptTokenCount"] + usage["candidatesTokenCount"]
+        if cached_tokens:
+            usage["cachedContentTokenCount"] = cached_tokens
+        self.server.count_tokens(usage["promptTokenCount"], cached_tokens)
+        if match.group("method") == "generateContent":
+            time.sleep(latency)
+            self._send_json(200, self._response(text, usage))
+            return
+
+        # Streams are a JSON array of responses, sent with chunked encoding as the text is "generated"
+        pieces = max(1, self.server.config.stream_chunks)
+        size = len(text) // pieces + 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._write_chunk(b"[")
+        for index, start in enumerate(range(0, len(text), size)):
+            time.sleep(latency / pieces)
+            last = start + size >= len(text)
+            piece = self._response(text[start:start + size], usage if last else None)
+            self._write_chunk((b"," if index else b"") + json.dumps(piece).encode("utf-8"))
+        self._write_chunk(b"]")
+        self._write_chunk(b"")
+
+    @staticmethod
+    def _response(text, usage):
+        response = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"},
+                                    "finishReason": "STOP", "index": 0}]}
+        if usage:
+            response["usageMetadata"] = usage
+        return response
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a stand-in Gemini API for benchmarks and load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="Uniform latency jitter either way")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of calls failing with 429")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before every call gets a 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on random 429s")
+    parser.add_argument("--response-words", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--min-cache-tokens", type=int, default=0, help="Smallest context cachedContents accepts")
+    args = parser.parse_args(argv)
+
+    config = MockGeminiConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                              rate_limit_rate=args.rate_limit_rate, rpm=args.rpm, retry_after=args.retry_after,
+                              response_words=args.response_words, seed=args.seed, min_cache_tokens=args.min_cache_tokens)
+    server = MockGeminiServer(config, args.host, args.port)
+    print(f"Mock Gemini API listening on {server.url}; set GEMINI_API_ENDPOINT={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(dict(server.stats(), **server.token_usage())))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
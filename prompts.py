@@ -1,7 +1,104 @@
 """
 This module contains various prompt designs for the AI Assistant's different functionalities.
-Each function provides multiple prompt variations to guide the AI's response.
+The templates live in prompt_templates.json and are loaded and validated once at import into
+a registry keyed on (function_choice, prompt_style), so building a prompt is a single dict lookup.
+Adding a style only needs a new entry in that file. A function or style may also give instructions
+(e.g. a system instruction or few-shot examples) that its prompts start with.
 """
+import os
+import json
+from string import Formatter
+
+PROMPT_TEMPLATES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt_templates.json")
+
+class PromptTemplateError(ValueError):
+    """
+    Raised when the prompt template file is malformed.
+    """
+
+def _compile_template(template, where, instructions=None):
+    """
+    Checks that a template only uses the {input} placeholder and returns its bound format method.
+    User input is passed as an argument, never parsed, so braces in it are safe.
+    :param instructions: Optional static text (system instructions, few-shot examples) placed before
+                         the template. Braces in it are literal text.
+    """
+    if not isinstance(template, str) or not template:
+        raise PromptTemplateError(f"{where}: template must be a non-empty string.")
+    try:
+        fields = [(name, spec, conversion) for _, name, spec, conversion in Formatter().parse(template) if name is not None]
+    except ValueError as e:
+        raise PromptTemplateError(f"{where}: {e}") from e
+    if not fields or any(field != ("input", "", None) for field in fields):
+        raise PromptTemplateError(f"{where}: template must use the {{input}} placeholder and no other fields.")
+    if instructions is not None:
+        if not isinstance(instructions, str) or not instructions:
+            raise PromptTemplateError(f"{where}: instructions must be a non-empty string.")
+        template = instructions.replace("{", "{{").replace("}", "}}") + "\n\n" + template
+    return template.format
+
+def load_prompt_registry(path=PROMPT_TEMPLATES_FILE):
+    """
+    Loads and validates a prompt template file.
+    :param path: Path to the JSON file mapping each function to its label, fallback and styles, and
+                 optionally the instructions its prompts start with (a style's own instructions
+                 replace its function's).
+    :return: A tuple (registry, fallbacks, options): registry maps (function, style) to a compiled
+             template, fallbacks maps each function to its compiled fallback template, and options
+             lists the functions and styles in file order for the input page.
+    Raises PromptTemplateError if the file is malformed.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            definitions = json.load(f)
+        except json.JSONDecodeError as e:
+            raise PromptTemplateError(f"{path}: {e}") from e
+    if not isinstance(definitions, dict) or not definitions:
+        raise PromptTemplateError(f"{path}: expected an object of functions.")
+
+    registry = {}
+    fallbacks = {}
+    options = []
+    for function_choice, definition in definitions.items():
+        styles = definition.get("styles") if isinstance(definition, dict) else None
+        if not isinstance(styles, dict) or not styles:
+            raise PromptTemplateError(f"{function_choice}: at least one style is required.")
+        instructions = definition.get("instructions")
+        fallbacks[function_choice] = _compile_template(definition.get("fallback"), f"{function_choice}.fallback", instructions)
+        style_options = []
+        for prompt_style, style in styles.items():
+            if not isinstance(style, dict):
+                raise PromptTemplateError(f"{function_choice}.{prompt_style}: expected an object.")
+            registry[(function_choice, prompt_style)] = _compile_template(style.get("template"), f"{function_choice}.{prompt_style}",
+                                                                          style.get("instructions", instructions))
+            style_options.append({"value": prompt_style, "label": style.get("label", prompt_style)})
+        options.append({"value": function_choice, "label": definition.get("label", function_choice), "styles": style_options})
+    return registry, fallbacks, options
+
+PROMPT_REGISTRY, PROMPT_FALLBACKS, PROMPT_OPTIONS = load_prompt_registry()
+
+def prompt_prefixes(registry=None, fallbacks=None):
+    """
+    Returns the distinct static prefixes of the templates: the text (instructions, examples and template
+    wording) that every prompt built from a template starts with, before the user's input.
+    Used to register the prefixes with the model's context cache (see context_cache.py).
+    """
+    templates = list((PROMPT_REGISTRY if registry is None else registry).values()) + \
+                list((PROMPT_FALLBACKS if fallbacks is None else fallbacks).values())
+    return sorted({_static_prefix(template) for template in templates} - {""})
+
+def _static_prefix(template):
+    prefix = []
+    # A compiled template is the bound format method of its template string
+    for literal_text, field_name, _spec, _conversion in Formatter().parse(template.__self__):
+        prefix.append(literal_text) # Split at each escaped brace
+        if field_name is not None:
+            break
+    return "".join(prefix)
+
+def _render(function_choice, prompt_style, user_input):
+    template = PROMPT_REGISTRY.get((function_choice, prompt_style)) or PROMPT_FALLBACKS[function_choice]
+    return template(input=user_input)
 
 def get_question_answering_prompt(query, prompt_type="general"):
     """
@@ -9,14 +106,7 @@ def get_question_answering_prompt(query, prompt_type="general"):
     :param query: The question asked by the user.
     :param prompt_type: Specifies the type of prompt (general, detailed, concise).
     """
-    if prompt_type == "general":
-        return f"Answer the following question clearly and concisely: {query}"
-    elif prompt_type == "detailed":
-        return f"Provide a comprehensive answer to the following question, including relevant context and details: {query}"
-    elif prompt_type == "concise":
-        return f"Give a brief, direct answer to: {query}"
-    else:
-        return f"Answer the question: {query}"
+    return _render("answer_question", prompt_type, query)
 
 def get_summarization_prompt(text, prompt_type="standard"):
     """
@@ -24,14 +114,7 @@ def get_summarization_prompt(text, prompt_type="standard"):
     :param text: The text to be summarized.
     :param prompt_type: Specifies the type of summary (standard, key_points, very_short).
     """
-    if prompt_type == "standard":
-        return f"Summarize the following text, capturing its main ideas and important details:\n\n{text}"
-    elif prompt_type == "key_points":
-        return f"Extract the most important key points and main arguments from the following text in bullet points:\n\n{text}"
-    elif prompt_type == "very_short":
-        return f"Provide a very brief, one-paragraph summary of the following text:\n\n{text}"
-    else:
-        return f"Summarize this text: {text}"
+    return _render("summarize_text", prompt_type, text)
 
 def get_creative_content_prompt(topic, content_type="story", prompt_type="standard"):
     """
@@ -40,26 +123,15 @@ def get_creative_content_prompt(topic, content_type="story", prompt_type="standa
     :param content_type: The type of content to generate (story, poem, essay_idea).
     :param prompt_type: Specifies the style/length (standard, imaginative, structured).
     """
-    if content_type == "story":
-        if prompt_type == "standard":
-            return f"Write a short story about: {topic}"
-        elif prompt_type == "imaginative":
-            return f"Craft an imaginative and engaging short story, full of vivid descriptions, centered around the theme of: {topic}"
-        elif prompt_type == "structured":
-            return f"Write a story about '{topic}' with a clear beginning, rising action, climax, falling action, and resolution. Aim for about 3-4 paragraphs."
-    elif content_type == "poem":
-        if prompt_type == "standard":
-            return f"Write a poem about: {topic}"
-        elif prompt_type == "imaginative":
-            return f"Compose an evocative and artistic poem that captures the essence of: {topic}. Use metaphors and imagery."
-        elif prompt_type == "structured":
-            return f"Write a four-stanza poem about '{topic}' with an AABB rhyme scheme."
-    elif content_type == "essay_idea":
-        if prompt_type == "standard":
-            return f"Generate an idea for an essay on the topic: {topic}"
-        elif prompt_type == "imaginative":
-            return f"Brainstorm a unique and thought-provoking essay topic related to: {topic}, including a potential thesis statement."
-        elif prompt_type == "structured":
-            return f"Suggest three distinct essay ideas for the topic '{topic}', each with a brief outline of key arguments."
-    return f"Generate creative content based on: {topic}"
+    return _render("generate_creative_content", f"{content_type}_{prompt_type}", topic)
 
+def build_prompt(function_choice, prompt_style, user_input):
+    """
+    Builds the final prompt for a function and prompt style chosen on the input page.
+    :param function_choice: One of the functions in prompt_templates.json, e.g. answer_question.
+    :param prompt_style: One of that function's styles, e.g. detailed, key_points, story_structured.
+    :param user_input: The user's question, text or topic.
+    :return: The prompt string, or an empty string if the function or style is unknown.
+    """
+    template = PROMPT_REGISTRY.get((function_choice, prompt_style))
+    return template(input=user_input) if template else ""
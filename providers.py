@@ -0,0 +1,470 @@
+"""
+This module puts the model backends behind one interface and routes each call to the fastest healthy one.
+Providers are Gemini (through gemini_api.py), any OpenAI-compatible chat completions endpoint, and a
+local stub for development. The router keeps a rolling window of each provider's latencies and errors,
+tries providers fastest first, fails over to the next one on rate limits (429), server errors (5xx)
+and timeouts, and can hedge a slow call by starting the same prompt on the next provider.
+
+Provider failures are raised as the GeminiError subclasses from gemini_api.py, which the routes
+already turn into error pages with the right HTTP status.
+"""
+import os
+import time
+import random
+import asyncio
+import importlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils import log_event
+from metrics import PROVIDER_SECONDS, HEDGED_CALLS
+from ratelimit import CircuitBreaker
+from gemini_api import (get_gemini_response, get_gemini_response_async, MODEL_NAME, GeminiError,
+                        GeminiBlockedError, GeminiEmptyResponseError, GeminiRateLimitError,
+                        GeminiUnavailableError, GeminiCircuitOpenError)
+
+DEFAULT_OPENAI_MODEL = "gpt-4o-mini"
+DEFAULT_WINDOW = 50 # Recent calls kept per provider
+DEFAULT_FAILURE_THRESHOLD = 3 # Consecutive failures that take a provider out of rotation
+DEFAULT_COOLDOWN_SECONDS = 30.0
+DEFAULT_EXPLORE_RATE = 0.05 # Share of calls tried on a slower provider first, to keep its latency current
+MIN_HEDGE_SAMPLES = 10 # Successful calls needed before an automatic hedge delay is used
+
+def can_fail_over(error):
+    """
+    Returns True if another provider might answer where this error's provider failed.
+    Blocked prompts are not retried elsewhere.
+    """
+    return isinstance(error, (GeminiRateLimitError, GeminiUnavailableError, GeminiEmptyResponseError))
+
+class RoutedResponse(str):
+    """
+    Response text from the model router, with the name of the provider that answered.
+    cacheable is False for answers that should not be reused for later requests: those from a
+    failover or hedge rather than the router's first choice, and those from a stand-in provider.
+    """
+
+    def __new__(cls, text, provider, cacheable=True):
+        response = super().__new__(cls, text)
+        response.provider = provider
+        response.cacheable = cacheable
+        return response
+
+class Provider:
+    """
+    A model backend. Subclasses implement generate(prompt, max_output_tokens, history) and may
+    override generate_async. Both return the response text or raise a GeminiError subclass;
+    max_output_tokens, when given, caps the length of the response, and history holds the earlier
+    {"role": "user" or "model", "text": ...} turns of a conversation the prompt continues.
+    model names the model behind the provider, and cacheable is False for stand-ins whose answers
+    must not be cached.
+    """
+
+    name = "provider"
+    model = ""
+    cacheable = True
+
+    def generate(self, prompt, max_output_tokens=None, history=None):
+        raise NotImplementedError
+
+    async def generate_async(self, prompt, max_output_tokens=None, history=None):
+        return await asyncio.to_thread(self.generate, prompt, max_output_tokens, history)
+
+class GeminiProvider(Provider):
+    """
+    Gemini through gemini_api.py, which keeps its own rate limiter and circuit breaker.
+    :param max_retries: Retries inside a call; behind the router 0 is best, so failures fail over at once.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, max_retries=0, name="gemini"):
+        self.name = name
+        self.model = self.model_name = model_name
+        self.max_retries = max_retries
+
+    def generate(self, prompt, max_output_tokens=None, history=None):
+        return get_gemini_response(prompt, self.model_name, max_retries=self.max_retries,
+                                   max_output_tokens=max_output_tokens, history=history)
+
+    async def generate_async(self, prompt, max_output_tokens=None, history=None):
+        return await get_gemini_response_async(prompt, self.model_name, max_retries=self.max_retries,
+                                               max_output_tokens=max_output_tokens, history=history)
+
+class OpenAICompatibleProvider(Provider):
+    """
+    Any endpoint that implements the OpenAI chat completions API (OpenAI itself, vLLM, Ollama, ...).
+    The SDK's own retries are turned off; the router fails over instead.
+    """
+
+    def __init__(self, name="openai", model=DEFAULT_OPENAI_MODEL, base_url=None, api_key=None, timeout_seconds=60.0):
+        try:
+            # Imported only when such a provider is configured; the SDK is slow to import
+            self._openai = openai = importlib.import_module("openai")
+        except ImportError as e:
+            raise RuntimeError(f"Provider {name!r} needs the openai package (pip install openai).") from e
+        self.name = name
+        self.model = model
+        options = dict(base_url=base_url or None, api_key=api_key or "unused", timeout=timeout_seconds, max_retries=0)
+        self._client = openai.OpenAI(**options)
+        self._async_client = openai.AsyncOpenAI(**options)
+
+    def _request(self, prompt, max_output_tokens, history):
+        messages = [{"role": "assistant" if turn["role"] == "model" else "user", "content": turn["text"]}
+                    for turn in history or ()]
+        request = {"model": self.model, "messages": messages + [{"role": "user", "content": prompt}]}
+        if max_output_tokens:
+            request["max_tokens"] = max_output_tokens
+        return request
+
+    def _classify_error(self, e):
+        openai = self._openai
+        if isinstance(e, openai.RateLimitError):
+            retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+            try:
+                retry_after = float(retry_after) if retry_after else None
+            except ValueError:
+                retry_after = None
+            return GeminiRateLimitError(f"{self.name}: {e}", retry_after=retry_after)
+        if isinstance(e, (openai.InternalServerError, openai.APITimeoutError, openai.APIConnectionError)):
+            return GeminiUnavailableError(f"{self.name}: {e}")
+        return GeminiError(f"{self.name}: {e}")
+
+    def _extract_text(self, completion):
+        choice = completion.choices[0] if completion.choices else None
+        if choice is not None and choice.finish_reason == "content_filter":
+            raise GeminiBlockedError(f"{self.name}: the response was filtered.")
+        if choice is None or not choice.message.content:
+            raise GeminiEmptyResponseError(f"{self.name}: the response had no content.")
+        return choice.message.content
+
+    def generate(self, prompt, max_output_tokens=None, history=None):
+        try:
+            completion = self._client.chat.completions.create(**self._request(prompt, max_output_tokens, history))
+        except self._openai.OpenAIError as e:
+            raise self._classify_error(e) from e
+        return self._extract_text(completion)
+
+    async def generate_async(self, prompt, max_output_tokens=None, history=None):
+        try:
+            completion = await self._async_client.chat.completions.create(**self._request(prompt, max_output_tokens, history))
+        except self._openai.OpenAIError as e:
+            raise self._classify_error(e) from e
+        return self._extract_text(completion)
+
+class StubProvider(Provider):
+    """
+    Local stand-in that answers every prompt with a fixed text after an optional delay.
+    Meant for development and tests: its answers are never cached.
+    """
+
+    model = "stub"
+    cacheable = False
+
+    def __init__(self, name="stub", text="This is a placeholder response from the local stub model.", latency_seconds=0.0):
+        self.name = name
+        self.text = text
+        self.latency_seconds = latency_seconds
+
+    def generate(self, prompt, max_output_tokens=None, history=None):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return self.text
+
+    async def generate_async(self, prompt, max_output_tokens=None, history=None):
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return self.text
+
+class ProviderHealth:
+    """
+    Rolling latency and error window for one provider, plus a circuit breaker that takes it out of
+    rotation after repeated failures (for at least the provider's retry-after, on a 429).
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 cooldown_seconds=DEFAULT_COOLDOWN_SECONDS):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window) # Seconds, successful calls only
+        self._outcomes = deque(maxlen=window) # True for success
+        self.breaker = CircuitBreaker(failure_threshold, cooldown_seconds)
+        self.calls = 0
+
+    def record(self, seconds, error=None):
+        with self._lock:
+            self.calls += 1
+            self._outcomes.append(error is None)
+            if error is None:
+                self._latencies.append(seconds)
+        if error is None:
+            self.breaker.record_success()
+        elif isinstance(error, (GeminiRateLimitError, GeminiUnavailableError)):
+            self.breaker.record_failure(error.retry_after)
+
+    def _latency_percentile(self, percent):
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100))]
+
+    def median_latency(self):
+        return self._latency_percentile(50)
+
+    def p95_latency(self):
+        with self._lock:
+            enough = len(self._latencies) >= MIN_HEDGE_SAMPLES
+        return self._latency_percentile(95) if enough else None
+
+    def error_rate(self):
+        with self._lock:
+            return 1 - sum(self._outcomes) / len(self._outcomes) if self._outcomes else 0.0
+
+    def score(self):
+        """
+        Expected cost of a call: the median latency, inflated by the recent error rate.
+        Providers without measurements score 0, so each one is tried early on.
+        """
+        latency = self.median_latency()
+        return 0.0 if latency is None else latency * (1 + 4 * self.error_rate())
+
+    def stats(self):
+        median = self.median_latency()
+        p95 = self._latency_percentile(95)
+        return {
+            "calls": self.calls,
+            "median_latency_ms": round(median * 1000, 1) if median is not None else None,
+            "p95_latency_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "error_rate": round(self.error_rate(), 4),
+            "circuit_breaker": self.breaker.stats(),
+        }
+
+class ModelRouter:
+    """
+    Sends each prompt to the fastest healthy provider and fails over to the next on 429s and 5xx errors.
+    :param providers: Provider instances, in order of preference while their latencies are unknown.
+    :param hedge_after: Seconds to wait before starting the same prompt on the next provider, "auto"
+                        to wait for the current provider's rolling p95 latency, or None to never hedge.
+                        The slower call is abandoned (not cancelled) in the sync path.
+    :param explore_rate: Share of calls that try a random healthy provider first.
+    """
+
+    def __init__(self, providers, hedge_after=None, window=DEFAULT_WINDOW, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 cooldown_seconds=DEFAULT_COOLDOWN_SECONDS, explore_rate=DEFAULT_EXPLORE_RATE):
+        if not providers:
+            raise ValueError("The model router needs at least one provider.")
+        self.providers = list(providers)
+        self.hedge_after = hedge_after
+        self.explore_rate = explore_rate
+        self.health = {provider.name: ProviderHealth(window, failure_threshold, cooldown_seconds)
+                       for provider in self.providers}
+        self._executor = ThreadPoolExecutor(max_workers=8 * len(self.providers), thread_name_prefix="model-router")
+
+    def candidates(self):
+        """
+        Returns the providers currently in rotation, best first.
+        Raises GeminiCircuitOpenError if every provider is cooling down.
+        """
+        available = []
+        retry_after = None
+        for order, provider in enumerate(self.providers):
+            allowed, wait_seconds = self.health[provider.name].breaker.allow()
+            if allowed:
+                available.append((self.health[provider.name].score(), order, provider))
+            else:
+                retry_after = wait_seconds if retry_after is None else min(retry_after, wait_seconds)
+        if not available:
+            raise GeminiCircuitOpenError("Every model provider is cooling down.", retry_after=retry_after)
+        ranked = [provider for _score, _order, provider in sorted(available, key=lambda item: item[:2])]
+        if len(ranked) > 1 and random.random() < self.explore_rate:
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+        return ranked
+
+    def _hedge_delay(self, provider):
+        if self.hedge_after == "auto":
+            return self.health[provider.name].p95_latency()
+        return self.hedge_after
+
+    def _finish(self, provider, started, error=None):
+        elapsed = time.perf_counter() - started
+        self.health[provider.name].record(elapsed, error)
+        PROVIDER_SECONDS.observe(elapsed, provider=provider.name, outcome="ok" if error is None else type(error).__name__)
+        if error is not None:
+            log_event(f"Model provider {provider.name} failed: {type(error).__name__}: {error}", "data/errors.log",
+                      event="provider_error", error_code=type(error).__name__, latency_ms=round(elapsed * 1000, 1))
+
+    @staticmethod
+    def _as_gemini_error(provider, e):
+        return e if isinstance(e, GeminiError) else GeminiError(f"{provider.name}: {e}")
+
+    @property
+    def cache_name(self):
+        """
+        Names the router's providers and models, for keying cached responses apart from Gemini's own.
+        """
+        return "router:" + ",".join(f"{provider.name}/{provider.model}" for provider in self.providers)
+
+    @staticmethod
+    def _response(text, provider, first):
+        return RoutedResponse(text, provider.name, cacheable=provider is first and provider.cacheable)
+
+    def _release_probes(self, providers):
+        """
+        Gives back the half-open probes taken by candidates() for providers that were never called.
+        """
+        for provider in providers:
+            self.health[provider.name].breaker.release_probe()
+
+    def _call(self, provider, prompt, max_output_tokens, history):
+        started = time.perf_counter()
+        try:
+            text = provider.generate(prompt, max_output_tokens, history)
+        except Exception as e:
+            error = self._as_gemini_error(provider, e)
+            self._finish(provider, started, error)
+            raise error from e
+        self._finish(provider, started)
+        return text
+
+    async def _call_async(self, provider, prompt, max_output_tokens, history):
+        started = time.perf_counter()
+        try:
+            text = await provider.generate_async(prompt, max_output_tokens, history)
+        except asyncio.CancelledError:
+            self.health[provider.name].breaker.release_probe()
+            raise # A hedge that lost the race
+        except Exception as e:
+            error = self._as_gemini_error(provider, e)
+            self._finish(provider, started, error)
+            raise error from e
+        self._finish(provider, started)
+        return text
+
+    def generate(self, prompt, max_output_tokens=None, history=None):
+        """
+        Returns the first successful response for a prompt, trying providers best first.
+        While a call is slower than the hedge delay, the next provider is started on the same prompt.
+        :return: A RoutedResponse, cacheable only if the first provider tried answered it.
+        Raises the last provider's GeminiError if none of them could answer.
+        """
+        remaining = iter(self.candidates())
+        pending = {}
+        last_error = None
+        hedged = False
+
+        def start_next():
+            provider = next(remaining, None)
+            if provider is not None:
+                pending[self._executor.submit(self._call, provider, prompt, max_output_tokens, history)] = provider
+            return provider
+
+        first = start_next()
+        try:
+            while pending:
+                delay = None if hedged else self._hedge_delay(next(iter(pending.values())))
+                done, _ = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    provider = start_next()
+                    if provider is not None:
+                        HEDGED_CALLS.inc(provider=provider.name)
+                    continue
+                for future in done:
+                    provider = pending.pop(future)
+                    try:
+                        return self._response(future.result(), provider, first)
+                    except GeminiError as e:
+                        if not can_fail_over(e):
+                            raise
+                        last_error = e
+                if not pending:
+                    start_next()
+            raise last_error
+        finally:
+            self._release_probes(remaining)
+
+    async def generate_async(self, prompt, max_output_tokens=None, history=None):
+        """
+        Async variant of generate; a hedge that loses the race is cancelled.
+        """
+        remaining = iter(self.candidates())
+        pending = {}
+        last_error = None
+        hedged = False
+
+        def start_next():
+            provider = next(remaining, None)
+            if provider is not None:
+                pending[asyncio.ensure_future(self._call_async(provider, prompt, max_output_tokens, history))] = provider
+            return provider
+
+        first = start_next()
+        try:
+            while pending:
+                delay = None if hedged else self._hedge_delay(next(iter(pending.values())))
+                done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    provider = start_next()
+                    if provider is not None:
+                        HEDGED_CALLS.inc(provider=provider.name)
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    try:
+                        return self._response(task.result(), provider, first)
+                    except GeminiError as e:
+                        if not can_fail_over(e):
+                            raise
+                        last_error = e
+                if not pending:
+                    start_next()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+            self._release_probes(remaining)
+
+    def stats(self):
+        """
+        Reports each provider's rolling latency, error rate and circuit state, in preference order.
+        """
+        return {"hedge_after": self.hedge_after,
+                "providers": {provider.name: self.health[provider.name].stats() for provider in self.providers}}
+
+def _create_provider(spec):
+    """
+    Builds a provider from a MODEL_PROVIDERS entry: "gemini", "stub" or "openai[:name]".
+    An OpenAI-compatible provider named NAME reads NAME_BASE_URL, NAME_API_KEY and NAME_MODEL
+    (OPENAI_BASE_URL, OPENAI_API_KEY and OPENAI_MODEL for the default name).
+    """
+    kind, _, name = spec.strip().partition(":")
+    name = name or kind
+    if kind == "gemini":
+        return GeminiProvider(name=name)
+    if kind == "stub":
+        return StubProvider(name=name)
+    if kind == "openai":
+        prefix = name.upper().replace("-", "_")
+        return OpenAICompatibleProvider(name=name, model=os.environ.get(f"{prefix}_MODEL", DEFAULT_OPENAI_MODEL),
+                                        base_url=os.environ.get(f"{prefix}_BASE_URL"),
+                                        api_key=os.environ.get(f"{prefix}_API_KEY"))
+    raise ValueError(f"Unknown model provider {spec!r}; expected gemini, stub or openai[:name].")
+
+def create_router_from_env():
+    """
+    Builds the model router from environment variables, or returns None when only Gemini is configured
+    (the routes then call gemini_api directly, with its own retries).
+    MODEL_PROVIDERS lists providers in order of preference, e.g. "gemini,openai,openai:local".
+    MODEL_HEDGE_MS is the hedge delay in milliseconds, or "auto" to hedge after the rolling p95.
+    MODEL_PROVIDER_COOLDOWN is the seconds a failing provider stays out of rotation.
+    """
+    specs = [spec for spec in os.environ.get("MODEL_PROVIDERS", "gemini").split(",") if spec.strip()]
+    if specs in ([], ["gemini"]):
+        return None
+    hedge = os.environ.get("MODEL_HEDGE_MS", "")
+    router = ModelRouter(
+        [_create_provider(spec) for spec in specs],
+        hedge_after="auto" if hedge == "auto" else (float(hedge) / 1000 if hedge else None),
+        cooldown_seconds=float(os.environ.get("MODEL_PROVIDER_COOLDOWN", DEFAULT_COOLDOWN_SECONDS)),
+    )
+    log_event(f"Model router enabled with providers: {', '.join(provider.name for provider in router.providers)}")
+    return router
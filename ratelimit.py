@@ -0,0 +1,277 @@
+"""
+This module provides client-side rate limiting for calls to the model API:
+token buckets, an adaptive limiter that backs off when the upstream returns 429s,
+a circuit breaker, and jittered exponential backoff.
+"""
+import time
+import random
+import asyncio
+import threading
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens refill continuously at rate_per_minute / 60 per second
+    up to capacity; acquire() blocks until enough tokens are available.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(rate_per_minute / 60.0, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate_per_minute):
+        """
+        Changes the refill rate, keeping the tokens already in the bucket.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate_per_second = rate_per_minute / 60.0
+
+    def drain(self):
+        """
+        Empties the bucket, so the next caller waits for a full refill interval.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = 0.0
+
+    def refund(self, tokens=1):
+        """
+        Returns tokens taken for a call that was not made, up to the bucket's capacity.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + min(tokens, self.capacity))
+
+    def _refill(self, now):
+        elapsed = now - self._updated_at
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate_per_second)
+        self._updated_at = now
+
+    def try_acquire(self, tokens=1):
+        """
+        Takes tokens if they are available right now.
+        :return: 0 on success, otherwise the number of seconds until they would be available.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate_per_second
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Blocks until tokens can be taken from the bucket.
+        Requests larger than the bucket's capacity take the whole bucket.
+        :param timeout: Maximum seconds to wait, or None to wait indefinitely.
+        :return: True once the tokens are taken, False if they would not be available within timeout.
+        """
+        tokens = min(tokens, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=1, timeout=None):
+        """
+        Async variant of acquire() that sleeps on the event loop.
+        """
+        tokens = min(tokens, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+class AdaptiveRateLimiter:
+    """
+    Limits requests and tokens per minute, and adapts the request rate to the upstream quota.
+    Each 429 halves the current request rate (down to min_fraction of the configured ceiling) and
+    empties the bucket; each success raises it again by increase_step of the ceiling. The rate
+    therefore settles just under the real quota instead of repeatedly overshooting it.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute=None, min_fraction=0.1,
+                 increase_step=0.05, decrease_factor=0.5):
+        self.max_requests_per_minute = requests_per_minute
+        self.min_requests_per_minute = requests_per_minute * min_fraction
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.requests_per_minute = requests_per_minute
+        self.request_bucket = TokenBucket(requests_per_minute)
+        # The token budget allows bursts of up to ten seconds' worth of tokens.
+        self.token_bucket = TokenBucket(tokens_per_minute, capacity=tokens_per_minute / 6.0) if tokens_per_minute else None
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+        self._rate_limited = 0
+
+    def _retry_after_wait(self):
+        return max(self._blocked_until - time.monotonic(), 0.0)
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        Blocks until one request and the given number of tokens may be sent.
+        :return: False if that would take longer than timeout seconds; nothing is taken then.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        blocked = self._retry_after_wait()
+        if blocked:
+            if deadline is not None and blocked > timeout:
+                return False
+            time.sleep(blocked)
+        remaining = lambda: None if deadline is None else max(deadline - time.monotonic(), 0.0)
+        if not self.request_bucket.acquire(1, remaining()):
+            return False
+        if self.token_bucket is None or self.token_bucket.acquire(tokens, remaining()):
+            return True
+        self.request_bucket.refund(1) # No call is made, so its request slot goes to the next caller
+        return False
+
+    async def acquire_async(self, tokens=1, timeout=None):
+        """
+        Async variant of acquire().
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        blocked = self._retry_after_wait()
+        if blocked:
+            if deadline is not None and blocked > timeout:
+                return False
+            await asyncio.sleep(blocked)
+        remaining = lambda: None if deadline is None else max(deadline - time.monotonic(), 0.0)
+        if not await self.request_bucket.acquire_async(1, remaining()):
+            return False
+        if self.token_bucket is None or await self.token_bucket.acquire_async(tokens, remaining()):
+            return True
+        self.request_bucket.refund(1)
+        return False
+
+    def on_success(self):
+        """
+        Records a successful call and raises the request rate towards the configured ceiling.
+        """
+        with self._lock:
+            if self.requests_per_minute < self.max_requests_per_minute:
+                self.requests_per_minute = min(self.max_requests_per_minute,
+                                               self.requests_per_minute + self.max_requests_per_minute * self.increase_step)
+                self.request_bucket.set_rate(self.requests_per_minute)
+
+    def on_rate_limited(self, retry_after=None):
+        """
+        Records a 429 from the upstream: cuts the request rate and, if the upstream said
+        how long to wait, holds all callers back until then.
+        """
+        with self._lock:
+            self._rate_limited += 1
+            self.requests_per_minute = max(self.min_requests_per_minute, self.requests_per_minute * self.decrease_factor)
+            self.request_bucket.set_rate(self.requests_per_minute)
+            self.request_bucket.drain()
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests_per_minute": round(self.requests_per_minute, 2),
+                "max_requests_per_minute": self.max_requests_per_minute,
+                "rate_limited": self._rate_limited,
+                "blocked_for_seconds": round(self._retry_after_wait(), 2),
+            }
+
+class CircuitBreaker:
+    """
+    Fails fast while the upstream is saturated. After failure_threshold consecutive failures
+    the circuit opens and calls are refused for cooldown_seconds (or the upstream's retry-after,
+    if longer). Once the cooldown passes the circuit is half-open: a single probe call is let through
+    and every other call is refused until its outcome closes the circuit again or re-opens it.
+    A probe whose outcome is never reported (see release_probe) is replaced after cooldown_seconds.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, cooldown_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._open_until = 0.0
+        self._rejected = 0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+
+    def allow(self):
+        """
+        :return: A tuple (allowed, retry_after_seconds).
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.OPEN:
+                remaining = self._open_until - now
+                if remaining > 0:
+                    self._rejected += 1
+                    return False, remaining
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN:
+                probe_remaining = self._probe_started + self.cooldown_seconds - now
+                if self._probe_in_flight and probe_remaining > 0:
+                    self._rejected += 1
+                    return False, probe_remaining
+                self._probe_in_flight = True
+                self._probe_started = now
+            return True, 0.0
+
+    def release_probe(self):
+        """
+        Lets another caller probe the upstream, for an allowed call that was not sent after all.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, retry_after=None):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._open_until = time.monotonic() + max(self.cooldown_seconds, retry_after or 0.0)
+
+    @property
+    def state(self):
+        return self._state
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "rejected": self._rejected,
+                "open_for_seconds": round(max(self._open_until - time.monotonic(), 0.0), 2) if self._state == self.OPEN else 0.0,
+            }
+
+def backoff_delay(attempt, base_seconds=1.0, max_seconds=30.0, retry_after=None):
+    """
+    Returns the delay before retry number attempt (0-based), using exponential backoff with
+    full jitter. A retry-after hint from the upstream is honoured as a lower bound, up to max_seconds.
+    """
+    delay = random.uniform(0, min(max_seconds, base_seconds * (2 ** attempt)))
+    if retry_after:
+        delay = max(delay, min(retry_after, max_seconds))
+    return delay
@@ -0,0 +1,183 @@
+"""
+This module turns model responses into safe HTML. Markdown is converted with a reusable Markdown
+instance per thread (building one per call re-loads its extensions), and the result is passed
+through an allowlist sanitizer, since the model can echo back raw HTML from the user's input.
+Converted HTML is memoized by the SHA-256 of the response text, so a cached or repeated response
+is converted and sanitized only once.
+"""
+import os
+import re
+import html
+import hashlib
+import threading
+from html.parser import HTMLParser
+import markdown
+from cache import MemoryCache
+
+RENDER_CACHE_SIZE = int(os.environ.get("RENDER_CACHE_SIZE", 2000)) # Rendered responses kept in memory
+RENDER_CACHE_TTL = int(os.environ.get("RENDER_CACHE_TTL", 24 * 3600)) # Seconds
+
+MARKDOWN_EXTENSIONS = ["fenced_code", "tables", "sane_lists"]
+MARKDOWN_EXTENSION_CONFIGS = {"tables": {"use_align_attribute": True}} # align="..." instead of inline styles
+
+ALLOWED_TAGS = frozenset(["p", "br", "hr", "h1", "h2", "h3", "h4", "h5", "h6", "strong", "em", "b", "i", "del",
+                          "code", "pre", "blockquote", "ul", "ol", "li", "a", "table", "thead", "tbody", "tr",
+                          "th", "td", "sup", "sub"])
+ALLOWED_ATTRIBUTES = {"a": {"href", "title"}, "ol": {"start"}, "th": {"align"}, "td": {"align"}, "code": {"class"}}
+VOID_TAGS = frozenset(["br", "hr"])
+DROP_CONTENT_TAGS = frozenset(["script", "style", "iframe", "object", "embed", "template", "textarea", "title"])
+ALLOWED_URL_SCHEMES = frozenset(["http", "https", "mailto"])
+
+_CODE_CLASS_RE = re.compile(r"^language-[\w+-]+$")
+_ALIGN_RE = re.compile(r"^(left|right|center)$")
+_SCHEME_RE = re.compile(r"^([a-zA-Z][a-zA-Z0-9+.-]*):")
+_URL_IGNORED_RE = re.compile(r"[\x00-\x20\x7f]+")
+
+def _safe_url(url):
+    """
+    Returns True for relative URLs and absolute URLs with an allowed scheme.
+    Control characters and whitespace are ignored the way browsers ignore them ("java\\tscript:").
+    """
+    match = _SCHEME_RE.match(_URL_IGNORED_RE.sub("", url))
+    return match is None or match.group(1).lower() in ALLOWED_URL_SCHEMES
+
+def _allowed_attribute(tag, name, value):
+    if name not in ALLOWED_ATTRIBUTES.get(tag, ()):
+        return False
+    if name == "href":
+        return _safe_url(value)
+    if name == "class":
+        return bool(_CODE_CLASS_RE.match(value))
+    if name == "align":
+        return bool(_ALIGN_RE.match(value))
+    if name == "start":
+        return value.isdigit()
+    return True
+
+class _Sanitizer(HTMLParser):
+    """
+    Re-serializes parsed HTML keeping only allowlisted tags and attributes. All text and attribute
+    values are re-escaped, unknown tags are dropped but keep their text (script-like tags lose it too),
+    and every allowed tag left open is closed, so the output is always well-formed.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._open = []
+        self._dropping = 0
+
+    def _start(self, tag, attrs, self_closing):
+        if tag in DROP_CONTENT_TAGS:
+            if not self_closing:
+                self._dropping += 1
+            return
+        if self._dropping or tag not in ALLOWED_TAGS:
+            return
+        rendered = "".join(f' {name}="{html.escape(value, quote=True)}"' for name, value in attrs
+                           if value is not None and _allowed_attribute(tag, name, value))
+        if tag == "a":
+            rendered += ' rel="nofollow noopener noreferrer"'
+        self.parts.append(f"<{tag}{rendered}>")
+        if tag not in VOID_TAGS and not self_closing:
+            self._open.append(tag)
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs, False)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, attrs, True)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self._dropping = max(0, self._dropping - 1)
+            return
+        if self._dropping or tag not in self._open:
+            return
+        while self._open:
+            open_tag = self._open.pop()
+            self.parts.append(f"</{open_tag}>")
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self._dropping:
+            self.parts.append(html.escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        self.parts.extend(f"</{tag}>" for tag in reversed(self._open))
+        self._open = []
+        return "".join(self.parts)
+
+def sanitize_html(fragment):
+    """
+    Returns an HTML fragment reduced to the allowlisted tags and attributes.
+    """
+    sanitizer = _Sanitizer()
+    sanitizer.feed(fragment)
+    return sanitizer.close()
+
+_local = threading.local()
+
+def _converter():
+    converter = getattr(_local, "converter", None)
+    if converter is None:
+        converter = _local.converter = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS,
+                                                         extension_configs=MARKDOWN_EXTENSION_CONFIGS)
+    return converter
+
+def markdown_to_html(text):
+    """
+    Converts Markdown to sanitized HTML with this thread's reusable Markdown instance.
+    """
+    converter = _converter()
+    try:
+        return sanitize_html(converter.convert(text))
+    finally:
+        converter.reset()
+
+class MarkdownRenderCache:
+    """
+    Memoizes sanitized HTML by the SHA-256 of the Markdown text, in an LRU tier from cache.py.
+    """
+
+    def __init__(self, max_entries=RENDER_CACHE_SIZE, ttl_seconds=RENDER_CACHE_TTL):
+        self._cache = MemoryCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def render(self, text):
+        """
+        Returns the sanitized HTML for a response, converting it only on the first request.
+        """
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        rendered = self._cache.get(key)
+        with self._lock:
+            if rendered is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        if rendered is None:
+            rendered = markdown_to_html(text)
+            self._cache.set(key, rendered)
+        return rendered
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {"hits": self._hits, "misses": self._misses,
+                    "hit_rate": self._hits / lookups if lookups else 0.0, "entries": len(self._cache)}
+
+# Shared by the web routes, so a response rendered once is reused by every later request for it
+render_cache = MarkdownRenderCache()
+
+def render_markdown(text):
+    """
+    Returns the memoized, sanitized HTML for a model response.
+    """
+    return render_cache.render(text)
@@ -0,0 +1,84 @@
+"""
+This module keeps generated responses on the server under short random ids, so the feedback
+form only has to post the id and the vote. The stored text cannot be altered by the client.
+Records live in an in-memory LRU tier with a TTL and, optionally, an on-disk tier under data/
+that lets several worker processes (and restarts) resolve each other's ids.
+"""
+import os
+import re
+import time
+import secrets
+from cache import MemoryCache, DiskCache
+
+RESPONSE_STORE_DIR = "data/responses"
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_MAX_ENTRIES = 10000
+
+_ID_RE = re.compile(r"[A-Za-z0-9_-]{16}")
+
+class ResponseStore:
+    """
+    Stores response records by id in one or more cache tiers (see cache.py).
+    A hit in a slower tier is promoted into the faster tiers in front of it.
+    """
+
+    def __init__(self, tiers):
+        self.tiers = list(tiers)
+
+    def save(self, query, response, function_choice=None, prompt_style=None):
+        """
+        Stores a completed response and returns its id.
+        """
+        response_id = secrets.token_urlsafe(12)
+        record = {
+            "query": query,
+            "response": response,
+            "function_choice": function_choice,
+            "prompt_style": prompt_style,
+            "created_at": time.time(),
+        }
+        for tier in self.tiers:
+            tier.set(response_id, record)
+        return response_id
+
+    def get(self, response_id):
+        """
+        Returns the record stored under an id, or None if the id is malformed, unknown or expired.
+        """
+        if not isinstance(response_id, str) or not _ID_RE.fullmatch(response_id):
+            return None
+        for index, tier in enumerate(self.tiers):
+            record = tier.get(response_id)
+            if record is not None:
+                for faster_tier in self.tiers[:index]:
+                    faster_tier.set(response_id, record)
+                return record
+        return None
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+def create_response_store(max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                          use_disk=False, directory=RESPONSE_STORE_DIR):
+    """
+    Builds a ResponseStore with an in-memory tier and, optionally, a disk tier.
+    """
+    tiers = [MemoryCache(max_entries=max_entries, ttl_seconds=ttl_seconds)]
+    if use_disk:
+        tiers.append(DiskCache(directory=directory, ttl_seconds=ttl_seconds))
+    return ResponseStore(tiers)
+
+def create_response_store_from_env():
+    """
+    Builds the application's response store from environment variables: RESPONSE_STORE_SIZE,
+    RESPONSE_STORE_TTL (seconds) and RESPONSE_STORE_DISK ("1" to share ids between worker processes).
+    """
+    return create_response_store(
+        max_entries=int(os.environ.get("RESPONSE_STORE_SIZE", DEFAULT_MAX_ENTRIES)),
+        ttl_seconds=int(os.environ.get("RESPONSE_STORE_TTL", DEFAULT_TTL_SECONDS)),
+        use_disk=os.environ.get("RESPONSE_STORE_DISK", "0") == "1",
+    )
+
+# Shared by the web routes (which save responses) and feedback.py (which resolves ids)
+response_store = create_response_store_from_env()
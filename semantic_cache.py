@@ -0,0 +1,464 @@
+"""
+This module provides a semantic response cache that answers rephrased questions from earlier responses.
+Queries are embedded on the CPU and looked up by cosine similarity in an in-process vector index,
+per function and prompt style. NumPy is used for the index when it is installed; otherwise a pure
+Python scan is used.
+
+By default queries are embedded with a hashed bag of words, word pairs and character trigrams (no
+model download). That only recognises near-duplicates (the same content words, modulo filler words,
+case, punctuation and plurals), so its threshold is set high. Paraphrases need a local
+sentence-transformers model (SEMANTIC_CACHE_MODEL), whose thresholds must be measured with
+calibrate() on labelled query pairs. With either embedder, queries that differ in a number or a
+negation never match.
+
+Entries are appended to data/semantic_cache.jsonl and reloaded at startup; the file is compacted
+to the live entries when it is loaded and whenever it grows past twice the cache size.
+
+Usage (measure thresholds):
+    python semantic_cache.py pairs.jsonl [--model all-MiniLM-L6-v2]
+where each line of pairs.jsonl is {"query": ..., "other": ..., "same": true or false}.
+"""
+import os
+import re
+import sys
+import json
+import time
+import math
+import hashlib
+import argparse
+import importlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from utils import ensure_directory_exists, log_event
+
+try:
+    import fcntl # Cross-process file locks; not available on Windows
+except ImportError:
+    fcntl = None
+
+try:
+    import numpy as np
+except ImportError: # NumPy is optional; the pure Python index is used without it
+    np = None
+
+SEMANTIC_CACHE_FILE = "data/semantic_cache.jsonl"
+DEFAULT_DIMENSIONS = 1024
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+# Functions without a threshold are never answered semantically: creative content should vary,
+# and a summary must match its exact input text. The hashing embedder's threshold was measured on
+# the labelled pairs in test/test_semantic_cache.py: different questions score up to 0.75, and
+# rephrasings that change more than filler words score no higher, so only near-duplicates clear 0.9.
+DEFAULT_THRESHOLDS = {"answer_question": 0.9}
+CALIBRATION_MARGIN = 0.05 # Added to the best-scoring different pair when suggesting a threshold
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("a an the is are was were be been am of to in on at for and or do does did can could "
+                       "would should will please tell me my i you your it its this that what which".split())
+_NEGATIONS = frozenset("not no never none nothing nobody nowhere neither nor without cannot".split())
+
+def _words(text):
+    text = unicodedata.normalize("NFKD", text).lower().replace("n't", " not")
+    return _WORD_RE.findall(text)
+
+def guard_terms(text):
+    """
+    Returns the numbers and negations in a query. Embeddings barely move when these change, but
+    the answer does ("World War 1" / "World War 2", "safe" / "not safe"), so queries only match
+    when their guard terms are the same.
+    """
+    return frozenset(word for word in _words(text) if word.isdigit() or word in _NEGATIONS)
+
+def parse_thresholds(spec):
+    """
+    Parses a threshold list such as "answer_question=0.8,answer_question:detailed=0.9".
+    :return: A dict mapping "function" or "function:style" to a similarity threshold.
+    """
+    thresholds = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        thresholds[name.strip()] = float(value)
+    return thresholds
+
+class HashingEmbedder:
+    """
+    Embeds text as a signed feature-hashing vector of content words and adjacent content word pairs
+    (weight 1, so reordered words score lower), and their character trigrams (which catch plurals
+    and small spelling differences), L2-normalized. Numbers and single characters are kept.
+    Hashes are stable across processes, so persisted entries embed the same way after a restart.
+    """
+
+    def __init__(self, dimensions=DEFAULT_DIMENSIONS, trigram_weight=0.25, pair_weight=1.0):
+        self.dimensions = dimensions
+        self.trigram_weight = trigram_weight
+        self.pair_weight = pair_weight
+
+    def _features(self, text):
+        words = [word for word in _words(text) if word not in _STOPWORDS]
+        for word in words:
+            yield word, 1.0
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield "3:" + padded[i:i + 3], self.trigram_weight
+        for first, second in zip(words, words[1:]):
+            yield f"2:{first} {second}", self.pair_weight
+
+    def embed(self, text):
+        """
+        Returns the unit-length embedding of text as a list of floats (all zeros for empty text).
+        """
+        vector = [0.0] * self.dimensions
+        for feature, weight in self._features(text):
+            digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[(digest >> 1) % self.dimensions] += weight if digest & 1 else -weight
+        norm = math.sqrt(sum(value * value for value in vector))
+        return [value / norm for value in vector] if norm else vector
+
+class SentenceTransformerEmbedder:
+    """
+    Embeds text with a local sentence-transformers model on the CPU, which recognises paraphrases
+    that share few words. The model is downloaded on first use and cached by the library.
+    """
+
+    def __init__(self, model_name):
+        try:
+            # Imported only when a model is configured; the library and PyTorch are slow to import
+            sentence_transformers = importlib.import_module("sentence_transformers")
+        except ImportError as e:
+            raise RuntimeError(f"SEMANTIC_CACHE_MODEL={model_name} needs the sentence-transformers package "
+                               "(pip install sentence-transformers).") from e
+        self.model_name = model_name
+        self.model = sentence_transformers.SentenceTransformer(model_name, device="cpu")
+        self.dimensions = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, text):
+        """
+        Returns the unit-length embedding of text as a list of floats.
+        """
+        return [float(value) for value in self.model.encode(text, normalize_embeddings=True)]
+
+def similarity(embedder, query, other):
+    """
+    Returns the cosine similarity of two queries, or 0.0 if their guard terms differ.
+    """
+    if guard_terms(query) != guard_terms(other):
+        return 0.0
+    return sum(a * b for a, b in zip(embedder.embed(query), embedder.embed(other)))
+
+def calibrate(embedder, pairs, margin=CALIBRATION_MARGIN):
+    """
+    Measures an embedder on labelled query pairs and suggests a threshold for it.
+    :param pairs: Iterable of (query, other, same) tuples; same is True if one answer fits both.
+    :return: Dict with the suggested threshold (the best-scoring different pair plus margin), the
+    number of same and different pairs, and the share of same pairs that would match at it.
+    """
+    same_scores, different_scores = [], []
+    for query, other, same in pairs:
+        (same_scores if same else different_scores).append(similarity(embedder, query, other))
+    threshold = round(min(max(different_scores, default=0.0) + margin, 1.0), 3)
+    return {"threshold": threshold, "same_pairs": len(same_scores), "different_pairs": len(different_scores),
+            "recall": sum(score >= threshold for score in same_scores) / len(same_scores) if same_scores else 0.0}
+
+class VectorIndex:
+    """
+    Brute-force inner-product index over unit vectors, keyed by an id.
+    Rows live in a preallocated NumPy matrix that doubles as needed (or a list without NumPy);
+    removal moves the last row into the freed slot.
+    """
+
+    def __init__(self, dimensions):
+        self.dimensions = dimensions
+        self._ids = []
+        self._positions = {}
+        self._vectors = np.zeros((16, dimensions), dtype=np.float32) if np is not None else []
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, item_id, vector):
+        if item_id in self._positions:
+            self.remove(item_id)
+        position = len(self._ids)
+        if np is not None:
+            if position == len(self._vectors):
+                grown = np.zeros((2 * len(self._vectors), self.dimensions), dtype=np.float32)
+                grown[:position] = self._vectors
+                self._vectors = grown
+            self._vectors[position] = vector
+        else:
+            self._vectors.append(vector)
+        self._ids.append(item_id)
+        self._positions[item_id] = position
+
+    def remove(self, item_id):
+        position = self._positions.pop(item_id, None)
+        if position is None:
+            return
+        last = len(self._ids) - 1
+        if position != last:
+            moved = self._ids[last]
+            self._ids[position] = moved
+            self._positions[moved] = position
+            self._vectors[position] = self._vectors[last]
+        self._ids.pop()
+        if np is None:
+            self._vectors.pop()
+
+    def search(self, vector):
+        """
+        Returns (item_id, similarity) for the closest vector, or (None, 0.0) if the index is empty.
+        """
+        if not self._ids:
+            return None, 0.0
+        if np is not None:
+            scores = self._vectors[:len(self._ids)] @ np.asarray(vector, dtype=np.float32)
+            best = int(np.argmax(scores))
+            return self._ids[best], float(scores[best])
+        nonzero = [(i, value) for i, value in enumerate(vector) if value]
+        best, best_score = None, -1.0
+        for position, row in enumerate(self._vectors):
+            score = sum(row[i] * value for i, value in nonzero)
+            if score > best_score:
+                best, best_score = position, score
+        return self._ids[best], best_score
+
+class SemanticCache:
+    """
+    Cache of responses looked up by query similarity within a (function_choice, prompt_style) pair.
+    Entries expire after ttl_seconds; beyond max_entries the least recently used entry is evicted.
+    """
+
+    def __init__(self, path=SEMANTIC_CACHE_FILE, thresholds=None, max_entries=DEFAULT_MAX_ENTRIES,
+                 ttl_seconds=DEFAULT_TTL_SECONDS, embedder=None, enabled=True):
+        self.path = path
+        self.thresholds = dict(DEFAULT_THRESHOLDS if thresholds is None else thresholds)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embedder = embedder or HashingEmbedder()
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # id -> entry dict, least recently used first
+        self._indexes = {} # (function_choice, prompt_style) -> VectorIndex
+        self._file_lines = 0
+        self._hits = 0
+        self._misses = 0
+        if enabled and path:
+            self._load()
+
+    def threshold_for(self, function_choice, prompt_style):
+        """
+        Returns the similarity threshold for a function and style, or None if it is not cached semantically.
+        A "function:style" threshold takes precedence over the function's.
+        """
+        return self.thresholds.get(f"{function_choice}:{prompt_style}", self.thresholds.get(function_choice))
+
+    @staticmethod
+    def _entry_id(function_choice, prompt_style, query):
+        normalized = " ".join(query.lower().split())
+        return hashlib.sha256(f"{function_choice}\n{prompt_style}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def lookup(self, function_choice, prompt_style, query):
+        """
+        Returns the stored response for the most similar earlier query, or None if none clears the threshold.
+        """
+        threshold = self.threshold_for(function_choice, prompt_style)
+        if not self.enabled or threshold is None:
+            return None
+        vector = self.embedder.embed(query)
+        with self._lock:
+            index = self._indexes.get((function_choice, prompt_style))
+            entry_id, score = index.search(vector) if index is not None else (None, 0.0)
+            entry = self._entries.get(entry_id)
+            if entry is not None and entry["created_at"] + self.ttl_seconds < time.time():
+                self._remove(entry_id)
+                entry = None
+            if entry is None or score < threshold or guard_terms(query) != guard_terms(entry["query"]):
+                self._misses += 1
+                return None
+            self._entries.move_to_end(entry_id)
+            self._hits += 1
+        log_event(f"Semantic cache hit ({score:.3f}) for '{query[:50]}...' matching '{entry['query'][:50]}...'")
+        return entry["response"]
+
+    def add(self, function_choice, prompt_style, query, response):
+        """
+        Stores a response for a query, if its function and style are cached semantically.
+        """
+        if not self.enabled or self.threshold_for(function_choice, prompt_style) is None:
+            return
+        entry = {"function_choice": function_choice, "prompt_style": prompt_style,
+                 "query": query, "response": response, "created_at": time.time()}
+        vector = self.embedder.embed(query)
+        with self._lock:
+            self._insert(entry, vector)
+            if self.path:
+                self._append(entry)
+
+    def _insert(self, entry, vector):
+        entry_id = self._entry_id(entry["function_choice"], entry["prompt_style"], entry["query"])
+        self._entries.pop(entry_id, None)
+        self._entries[entry_id] = entry
+        self._indexes.setdefault((entry["function_choice"], entry["prompt_style"]),
+                                 VectorIndex(self.embedder.dimensions)).add(entry_id, vector)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        self._indexes[(entry["function_choice"], entry["prompt_style"])].remove(entry_id)
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Exclusive lock on the cache file, held across processes where flock is supported.
+        """
+        ensure_directory_exists(os.path.dirname(self.path) or ".")
+        fd = os.open(f"{self.path}.lock", os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _append(self, entry):
+        with self._file_lock():
+            if self._file_lines >= 2 * self.max_entries:
+                self._compact()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._file_lines += 1
+
+    def _read_file(self):
+        """
+        Returns the unexpired entries in the cache file by id, keeping the latest line for each.
+        """
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        expired_before = time.time() - self.ttl_seconds
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # A partially written last line
+                if entry.get("created_at", 0) >= expired_before:
+                    entries[self._entry_id(entry["function_choice"], entry["prompt_style"], entry["query"])] = entry
+        return entries
+
+    def _compact(self, merge=True):
+        """
+        Rewrites the cache file with only the live entries. Other processes append to the same file,
+        so with merge the file keeps the newest max_entries entries of every process, and the entries
+        this process does not know are loaded as the least recently used while there is room.
+        The caller holds the file lock.
+        """
+        entries = list(self._entries.values())
+        if merge:
+            file_entries = self._read_file()
+            for entry_id, entry in sorted(file_entries.items(), key=lambda item: -item[1]["created_at"]):
+                if len(self._entries) >= self.max_entries:
+                    break
+                if entry_id not in self._entries:
+                    self._insert(entry, self.embedder.embed(entry["query"]))
+                    self._entries.move_to_end(entry_id, last=False)
+            file_entries.update(self._entries)
+            entries = sorted(file_entries.values(), key=lambda entry: entry["created_at"])[-self.max_entries:]
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+        os.replace(temp_path, self.path)
+        self._file_lines = len(entries)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with self._file_lock():
+                self._compact()
+        except (OSError, KeyError, TypeError) as e:
+            log_event(f"Error loading semantic cache from {self.path}: {e}", "data/errors.log")
+        log_event(f"Semantic cache loaded {len(self._entries)} entries from {self.path}.")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._indexes.clear()
+            if self.path and os.path.exists(self.path):
+                with self._file_lock():
+                    self._compact(merge=False)
+
+    def stats(self):
+        """
+        Returns hit/miss counters, the number of entries and the configured thresholds.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "thresholds": dict(self.thresholds),
+                "backend": "numpy" if np is not None else "python",
+            }
+
+def create_semantic_cache_from_env():
+    """
+    Builds the application's semantic cache from environment variables: SEMANTIC_CACHE ("1" to enable),
+    SEMANTIC_CACHE_MODEL (a sentence-transformers model name; "hashing", the default, needs no model),
+    SEMANTIC_CACHE_THRESHOLDS (e.g. "answer_question=0.9,answer_question:detailed=0.95"; required
+    with a model), SEMANTIC_CACHE_SIZE and SEMANTIC_CACHE_TTL (seconds).
+    The cache stays disabled, with an error logged, if the configured model cannot be used.
+    """
+    spec = os.environ.get("SEMANTIC_CACHE_THRESHOLDS")
+    model_name = os.environ.get("SEMANTIC_CACHE_MODEL", "hashing")
+    enabled = os.environ.get("SEMANTIC_CACHE", "0") == "1"
+    embedder = None
+    if enabled and model_name != "hashing":
+        try:
+            if not spec:
+                raise RuntimeError(f"SEMANTIC_CACHE_MODEL={model_name} needs SEMANTIC_CACHE_THRESHOLDS "
+                                   "measured for it (python semantic_cache.py pairs.jsonl --model ...).")
+            embedder = SentenceTransformerEmbedder(model_name)
+        except Exception as e:
+            log_event(f"Semantic cache disabled: {e}", "data/errors.log", event="semantic_cache_error")
+            enabled = False
+    return SemanticCache(
+        thresholds=parse_thresholds(spec) if spec else None,
+        max_entries=int(os.environ.get("SEMANTIC_CACHE_SIZE", DEFAULT_MAX_ENTRIES)),
+        ttl_seconds=int(os.environ.get("SEMANTIC_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+        embedder=embedder,
+        enabled=enabled,
+    )
+
+def read_pairs(path):
+    """
+    Yields (query, other, same) tuples from a JSONL file of labelled query pairs.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                pair = json.loads(line)
+                yield pair["query"], pair["other"], bool(pair["same"])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure a semantic cache threshold on labelled query pairs.")
+    parser.add_argument("pairs", help="JSONL file of {\"query\", \"other\", \"same\"} pairs")
+    parser.add_argument("--model", default="hashing", help="sentence-transformers model name, or hashing")
+    args = parser.parse_args(argv)
+    embedder = HashingEmbedder() if args.model == "hashing" else SentenceTransformerEmbedder(args.model)
+    print(json.dumps(calibrate(embedder, read_pairs(args.pairs)), indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+This module keeps multi-turn conversations on the server, so a follow-up question is sent to the
+model with the earlier turns as chat history instead of the user pasting them back in.
+
+A session holds the turns so far and, once they grow past SESSION_HISTORY_TOKENS (estimated), a
+rolling summary: the oldest turns are summarized by the model, merged with the previous summary,
+and dropped, keeping the SESSION_KEEP_TURNS most recent turns verbatim. The history sent with each
+turn therefore stays bounded however long the conversation runs.
+
+Sessions live in an in-memory LRU tier with a TTL, so memory holds at most SESSION_STORE_SIZE
+sessions of bounded history (least recently used ones are evicted first). Alternatively they are
+kept on disk only, under data/sessions, which keeps them across restarts and lets worker processes
+continue each other's sessions.
+"""
+import os
+import re
+import asyncio
+import time
+import secrets
+import threading
+from cache import MemoryCache, DiskCache
+from gemini_api import estimate_tokens
+
+SESSION_STORE_DIR = "data/sessions"
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_HISTORY_TOKENS = 3000 # Estimated history tokens before old turns are compacted
+DEFAULT_KEEP_TURNS = 4 # Most recent turns (user and model messages) kept verbatim
+
+COMPACTION_PROMPT = ("Summarize the conversation below so the summary can replace it as context for the rest of "
+                     "the conversation. Keep the facts, names, figures, decisions and open questions. "
+                     "Write it as concise notes.\n\n{summary}{transcript}")
+SUMMARY_TURN = "Summary of our conversation so far:\n{summary}"
+SUMMARY_ACKNOWLEDGEMENT = "Understood. I'll keep that in mind."
+
+_ID_RE = re.compile(r"[A-Za-z0-9_-]{16}")
+
+def _turns_text(turns):
+    return "\n\n".join(f"{'User' if turn['role'] == 'user' else 'Assistant'}: {turn['text']}" for turn in turns)
+
+class ConversationStore:
+    """
+    Stores sessions by id in one or more cache tiers (see cache.py), like response_store.ResponseStore.
+    Model calls are made through a generate(prompt, history) callable, so the store works with
+    Gemini or the model router. A session belongs to one user, whose turns arrive one at a time.
+    """
+
+    def __init__(self, tiers, max_history_tokens=DEFAULT_HISTORY_TOKENS, keep_turns=DEFAULT_KEEP_TURNS):
+        self.tiers = list(tiers)
+        self.max_history_tokens = max_history_tokens
+        self.keep_turns = max(2, keep_turns - keep_turns % 2) # Whole user/model exchanges
+        self._lock = threading.Lock()
+        self._started = 0
+        self._turns = 0
+        self._compactions = 0
+
+    def start(self, turns=()):
+        """
+        Starts a session, optionally seeded with earlier turns, and returns it.
+        """
+        now = time.time()
+        session = {"id": secrets.token_urlsafe(12), "turns": list(turns), "summary": None,
+                   "compactions": 0, "created_at": now, "updated_at": now}
+        self._save(session)
+        with self._lock:
+            self._started += 1
+        return session
+
+    def get(self, session_id):
+        """
+        Returns the session stored under an id, or None if the id is malformed, unknown or expired.
+        A hit in a slower tier is promoted into the faster tiers in front of it.
+        """
+        if not isinstance(session_id, str) or not _ID_RE.fullmatch(session_id):
+            return None
+        for index, tier in enumerate(self.tiers):
+            session = tier.get(session_id)
+            if session is not None:
+                for faster_tier in self.tiers[:index]:
+                    faster_tier.set(session_id, session)
+                return session
+        return None
+
+    def _save(self, session):
+        session["updated_at"] = time.time()
+        for tier in self.tiers:
+            tier.set(session["id"], session)
+
+    def history(self, session):
+        """
+        Returns the turns sent with the next prompt: the rolling summary, if any, then the recent turns.
+        """
+        if not session["summary"]:
+            return list(session["turns"])
+        return [{"role": "user", "text": SUMMARY_TURN.format(summary=session["summary"])},
+                {"role": "model", "text": SUMMARY_ACKNOWLEDGEMENT}] + session["turns"]
+
+    def _compaction_prompt(self, session, message):
+        """
+        Returns the prompt that summarizes the session's old turns, or None while the history
+        and the new message fit within max_history_tokens.
+        """
+        tokens = sum(estimate_tokens(turn["text"]) for turn in self.history(session)) + estimate_tokens(message)
+        old_turns = session["turns"][:-self.keep_turns]
+        if tokens <= self.max_history_tokens or not old_turns:
+            return None
+        summary = f"Earlier summary:\n{session['summary']}\n\nLater turns:\n" if session["summary"] else ""
+        return COMPACTION_PROMPT.format(summary=summary, transcript=_turns_text(old_turns))
+
+    def _compacted(self, session, summary):
+        session["summary"] = summary
+        session["turns"] = session["turns"][-self.keep_turns:]
+        session["compactions"] += 1
+        self._save(session)
+        with self._lock:
+            self._compactions += 1
+
+    def _record_turn(self, session, message, response):
+        session["turns"] += [{"role": "user", "text": message}, {"role": "model", "text": response}]
+        self._save(session)
+        with self._lock:
+            self._turns += 1
+
+    def reply(self, session, message, generate):
+        """
+        Sends a message with the session's history and records the exchange, compacting old turns first
+        if the history has grown too long.
+        :param generate: Callable (prompt, history) returning the model's response; history is None
+                         for the compaction prompt.
+        :return: The model's response. Raises a GeminiError subclass if a model call fails; the failed
+                 exchange is not recorded.
+        """
+        compaction_prompt = self._compaction_prompt(session, message)
+        if compaction_prompt is not None:
+            self._compacted(session, generate(compaction_prompt, None))
+        response = generate(message, self.history(session))
+        self._record_turn(session, message, response)
+        return response
+
+    async def reply_async(self, session, message, generate):
+        """
+        Async variant of reply; generate is awaited, and the session is stored from a worker thread.
+        """
+        compaction_prompt = self._compaction_prompt(session, message)
+        if compaction_prompt is not None:
+            await asyncio.to_thread(self._compacted, session, await generate(compaction_prompt, None))
+        response = await generate(message, self.history(session))
+        await asyncio.to_thread(self._record_turn, session, message, response)
+        return response
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"active": len(self.tiers[0]), "started": self._started, "turns": self._turns,
+                    "compactions": self._compactions}
+
+def create_conversation_store(max_sessions=DEFAULT_MAX_SESSIONS, ttl_seconds=DEFAULT_TTL_SECONDS, use_disk=False,
+                              directory=SESSION_STORE_DIR, max_history_tokens=DEFAULT_HISTORY_TOKENS,
+                              keep_turns=DEFAULT_KEEP_TURNS):
+    """
+    Builds a ConversationStore with an in-memory LRU tier or, with use_disk, a disk tier alone:
+    a session changes with every turn, so a copy cached in one process's memory would miss the
+    turns another process has added since.
+    """
+    if use_disk:
+        tiers = [DiskCache(directory=directory, ttl_seconds=ttl_seconds, max_entries=max_sessions)]
+    else:
+        tiers = [MemoryCache(max_entries=max_sessions, ttl_seconds=ttl_seconds)]
+    return ConversationStore(tiers, max_history_tokens=max_history_tokens, keep_turns=keep_turns)
+
+def create_conversation_store_from_env():
+    """
+    Builds the application's conversation store from environment variables: SESSION_STORE_SIZE,
+    SESSION_TTL (seconds), SESSION_STORE_DISK ("1" to keep sessions on disk), SESSION_HISTORY_TOKENS
+    and SESSION_KEEP_TURNS.
+    """
+    return create_conversation_store(
+        max_sessions=int(os.environ.get("SESSION_STORE_SIZE", DEFAULT_MAX_SESSIONS)),
+        ttl_seconds=int(os.environ.get("SESSION_TTL", DEFAULT_TTL_SECONDS)),
+        use_disk=os.environ.get("SESSION_STORE_DISK", "0") == "1",
+        max_history_tokens=int(os.environ.get("SESSION_HISTORY_TOKENS", DEFAULT_HISTORY_TOKENS)),
+        keep_turns=int(os.environ.get("SESSION_KEEP_TURNS", DEFAULT_KEEP_TURNS)),
+    )
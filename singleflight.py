@@ -0,0 +1,118 @@
+"""
+This module provides single-flight request coalescing for model calls.
+While a call for a given key is in flight, identical calls wait for its result
+instead of issuing their own upstream request.
+"""
+import asyncio
+import threading
+
+class _Call:
+    """
+    One in-flight call shared by a leader and any number of waiters.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class _LeaderCancelled(Exception):
+    """
+    Set on an async call's future when its leader is cancelled, so a waiter takes over the call.
+    """
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls that share a key. The first caller (the leader) runs the
+    function; callers arriving while it runs block until it finishes and receive the same
+    result, or the same exception. Once the call completes the key is forgotten, so later
+    calls run again (caching results is the response cache's job, not this one's).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self._executed = 0
+        self._coalesced = 0
+
+    def do(self, key, fn):
+        """
+        Runs fn() for key, or waits for the in-flight call with the same key.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._executed += 1
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key, coroutine_fn):
+        """
+        Async variant of do() for a coroutine function; waiters await the leader's future.
+        A cancelled leader (its client disconnected) does not fail the waiters: the first of them
+        runs the call again as the new leader.
+        """
+        future = self._async_calls.get(key)
+        while future is not None:
+            with self._lock:
+                self._coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                with self._lock:
+                    self._coalesced -= 1
+                future = self._async_calls.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = future
+        with self._lock:
+            self._executed += 1
+        try:
+            result = await coroutine_fn()
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else _LeaderCancelled())
+            # Mark the exception as retrieved in case nobody else was waiting on it.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._async_calls[key]
+
+    def stats(self):
+        """
+        Returns how many calls were executed upstream and how many were coalesced onto them.
+        """
+        with self._lock:
+            executed = self._executed
+            coalesced = self._coalesced
+            in_flight = len(self._calls) + len(self._async_calls)
+        total = executed + coalesced
+        return {
+            "executed": executed,
+            "coalesced": coalesced,
+            "coalesced_rate": coalesced / total if total else 0.0,
+            "in_flight": in_flight,
+        }
@@ -0,0 +1,74 @@
+"""
+This module contains the helpers for streaming AI responses to the browser:
+an incremental Markdown renderer and Server-Sent Events formatting.
+"""
+import re
+import json
+from rendering import markdown_to_html
+
+# A paragraph following a blank line that continues the previous block
+# (indented text or a list item) must not be rendered on its own.
+_CONTINUATION_RE = re.compile(r"^(\s|[-*+]\s|\d+[.)]\s)")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)", re.MULTILINE)
+
+class IncrementalMarkdownRenderer:
+    """
+    Renders a Markdown document that arrives in chunks.
+    Completed blocks (text up to a blank line that is not inside a code fence and is not
+    followed by a continuation of the same list) are rendered once and never re-rendered.
+    Only the unfinished tail is re-rendered as new chunks arrive, so the cost per chunk
+    stays bounded by the size of one block. All HTML is sanitized (see rendering.py).
+    """
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, chunk):
+        """
+        Adds a chunk of Markdown text.
+        :return: A tuple (block_html, tail_html): HTML for newly completed blocks, which the
+                 client appends permanently, and provisional HTML for the unfinished tail,
+                 which replaces the previous tail.
+        """
+        self._pending += chunk
+        boundary = self._find_boundary(self._pending)
+        block_html = ""
+        if boundary:
+            block, self._pending = self._pending[:boundary], self._pending[boundary:]
+            block_html = markdown_to_html(block)
+        return block_html, markdown_to_html(self._pending)
+
+    def finish(self):
+        """
+        Renders whatever text is still pending and returns its HTML.
+        """
+        html = markdown_to_html(self._pending)
+        self._pending = ""
+        return html
+
+    @staticmethod
+    def _find_boundary(text):
+        """
+        Returns the offset just past the last safe block boundary in text, or 0 if there is none.
+        """
+        boundary = 0
+        for match in re.finditer(r"\n[ \t]*\n+", text):
+            end = match.end()
+            following = text[end:]
+            if not following:
+                # Nothing after the blank line yet; we can't tell whether the block continues.
+                break
+            if len(_FENCE_RE.findall(text[:match.start()])) % 2:
+                continue
+            if _CONTINUATION_RE.match(following):
+                continue
+            boundary = end
+        return boundary
+
+def sse_event(event, data):
+    """
+    Formats a Server-Sent Event whose data is JSON-encoded.
+    :param event: The event name (e.g. block, tail, done).
+    :param data: A JSON-serializable payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
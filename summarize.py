@@ -0,0 +1,140 @@
+"""
+This module summarizes documents too long for a single prompt with a map-reduce pipeline.
+The text is split into token-bounded chunks, each chunk is summarized on its own (concurrently),
+and the partial summaries are then summarized with the style the user chose.
+
+Chunk boundaries are content-defined: a chunk ends at a paragraph that hashes to a cut point
+(or when the next paragraph would exceed the token bound), so an edit only moves the boundaries
+around it. Chunk summaries go through the response cache under their own prompts, so
+re-summarizing an edited document only calls the model for the chunks that changed.
+"""
+import os
+import re
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from prompts import build_prompt
+from gemini_api import estimate_tokens
+
+SUMMARY_CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", 4000)) # Token bound per chunk
+SUMMARY_CONCURRENCY = int(os.environ.get("SUMMARY_CONCURRENCY", 4)) # Chunks summarized at once
+MAX_REDUCE_ROUNDS = 4
+
+CHUNK_SUMMARY_PROMPT = ("Summarize the following section of a longer document. Keep its key facts, names, "
+                        "figures and arguments, as they will be combined with summaries of the other sections:\n\n{input}")
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+def needs_chunking(text, max_chunk_tokens=SUMMARY_CHUNK_TOKENS):
+    """
+    Returns True if the text is too long to summarize in a single prompt.
+    """
+    return estimate_tokens(text) > max_chunk_tokens
+
+def _split_oversized(unit, max_chunk_tokens):
+    """
+    Splits a paragraph longer than the token bound on sentences, and failing that into fixed windows.
+    """
+    max_chars = max_chunk_tokens * 4
+    pieces = []
+    current = ""
+    for sentence in _SENTENCE_RE.split(unit):
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and estimate_tokens(current + " " + sentence) > max_chunk_tokens:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+def _is_cut_point(unit):
+    return hashlib.sha1(unit.encode("utf-8")).digest()[0] % 4 == 0
+
+def split_into_chunks(text, max_chunk_tokens=SUMMARY_CHUNK_TOKENS):
+    """
+    Splits text into chunks of at most max_chunk_tokens (estimated), on paragraph boundaries where possible.
+    Once a chunk is at least half full it also ends after any paragraph that hashes to a cut point,
+    so boundaries depend on the content around them rather than on everything before them.
+    """
+    units = []
+    for paragraph in _PARAGRAPH_RE.split(text.strip()):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) > max_chunk_tokens:
+            units.extend(_split_oversized(paragraph, max_chunk_tokens))
+        else:
+            units.append(paragraph)
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for unit in units:
+        unit_tokens = estimate_tokens(unit)
+        if current and current_tokens + unit_tokens > max_chunk_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += unit_tokens
+        if current_tokens >= max_chunk_tokens // 2 and _is_cut_point(unit):
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def chunk_summary_prompt(chunk):
+    """
+    Returns the map-step prompt for one chunk. It does not mention the chunk's position,
+    so an unchanged chunk keeps its cache entry when other parts of the document change.
+    """
+    return CHUNK_SUMMARY_PROMPT.format(input=chunk)
+
+def build_long_summary_prompt(text, prompt_style, generate, max_chunk_tokens=SUMMARY_CHUNK_TOKENS,
+                              concurrency=SUMMARY_CONCURRENCY):
+    """
+    Runs the map step for a long document and returns the reduce prompt in the chosen style.
+    Short documents skip the map step and get the normal summarization prompt.
+    :param text: The document to summarize.
+    :param prompt_style: The summarize_text style (standard, key_points, very_short) for the reduce step.
+    :param generate: Callable returning the (cached) model response for a prompt.
+    :return: The final prompt string, or an empty string if the style is unknown.
+    Raises a GeminiError subclass if summarizing a chunk fails.
+    """
+    if not build_prompt("summarize_text", prompt_style, ""):
+        return ""
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="summarize") as pool:
+        for _ in range(MAX_REDUCE_ROUNDS):
+            if not needs_chunking(text, max_chunk_tokens):
+                break
+            chunks = split_into_chunks(text, max_chunk_tokens)
+            text = "\n\n".join(pool.map(generate, [chunk_summary_prompt(chunk) for chunk in chunks]))
+    return build_prompt("summarize_text", prompt_style, text)
+
+async def build_long_summary_prompt_async(text, prompt_style, generate, max_chunk_tokens=SUMMARY_CHUNK_TOKENS,
+                                          concurrency=SUMMARY_CONCURRENCY):
+    """
+    Async variant of build_long_summary_prompt for a coroutine function generate(prompt).
+    """
+    if not build_prompt("summarize_text", prompt_style, ""):
+        return ""
+    slots = asyncio.Semaphore(concurrency)
+
+    async def summarize_chunk(chunk):
+        async with slots:
+            return await generate(chunk_summary_prompt(chunk))
+
+    for _ in range(MAX_REDUCE_ROUNDS):
+        if not needs_chunking(text, max_chunk_tokens):
+            break
+        chunks = split_into_chunks(text, max_chunk_tokens)
+        text = "\n\n".join(await asyncio.gather(*(summarize_chunk(chunk) for chunk in chunks)))
+    return build_prompt("summarize_text", prompt_style, text)
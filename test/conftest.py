@@ -0,0 +1,19 @@
+import os
+import shutil
+import tempfile
+import pytest
+from utils import flush_logs
+
+@pytest.fixture(autouse=True, scope="session")
+def temporary_data_directory():
+    """
+    Runs the suite in a temporary working directory, so the logs, feedback log, caches and other
+    files the app keeps under data/ are written there instead of into the repository's data/.
+    """
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp()
+    os.chdir(directory)
+    yield directory
+    flush_logs()
+    os.chdir(cwd)
+    shutil.rmtree(directory, ignore_errors=True)
@@ -1,10 +1,13 @@
 import unittest
 import os
-import json
+import shutil
+import tempfile
+from unittest import mock
 from app import app
 from datetime import datetime
-from feedback import FEEDBACK_FILE
-from utils import ensure_directory_exists, save_json, load_json
+from feedback import get_all_feedback
+from response_store import create_response_store
+from utils import flush_logs
 
 class TestApp(unittest.TestCase):
     """
@@ -13,26 +16,29 @@ class TestApp(unittest.TestCase):
 
     def setUp(self):
         """
-        Set up for each test: Configure Flask app for testing and clear feedback log.
+        Set up for each test: Configure Flask app for testing and run it in a temporary working directory,
+        so the feedback log, logs and other files under data/ start empty and the real ones are not touched.
+        The routes and feedback.py share a fresh response store kept in that directory.
         """
         app.testing = True
         self.client = app.test_client()
-
-        # Ensure the data directory exists
-        ensure_directory_exists(os.path.dirname(FEEDBACK_FILE))
-        # Clear the feedback file before each test to ensure a clean state
-        with open(FEEDBACK_FILE, 'w') as f:
-            json.dump([], f)
-        print(f"Cleared {FEEDBACK_FILE} before test in TestApp.")
+        flush_logs() # Records queued by earlier tests belong in the previous directory
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        self.response_store = create_response_store(use_disk=True, directory=os.path.join(self.directory, "responses"))
+        for target in ('app.response_store', 'feedback.response_store'):
+            patcher = mock.patch(target, self.response_store)
+            patcher.start()
+            self.addCleanup(patcher.stop)
 
     def tearDown(self):
         """
-        Clean up after each test: Clear feedback log.
+        Clean up after each test: write out queued log records, then remove the temporary directory.
         """
-        # Clear the feedback file after each test
-        with open(FEEDBACK_FILE, 'w') as f:
-            json.dump([], f)
-        print(f"Cleared {FEEDBACK_FILE} after test in TestApp.")
+        flush_logs()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory, ignore_errors=True)
 
     def test_index_page(self):
         """
@@ -51,7 +57,7 @@ class TestApp(unittest.TestCase):
         not the actual AI-generated content due to mocking external API calls
         being outside the scope of basic Flask route tests.
         """
-        with unittest.mock.patch('gemini_api.get_gemini_response', return_value="Mocked AI Answer"):
+        with mock.patch('assistant.call_model', return_value="Mocked AI Answer"):
             response = self.client.post('/generate', data={
                 'function_choice': 'answer_question',
                 'prompt_style': 'general',
@@ -59,36 +65,37 @@ class TestApp(unittest.TestCase):
             })
             self.assertEqual(response.status_code, 200)
             self.assertIn(b"AI Assistant Response", response.data)
-            self.assertIn(b"Your Query: What is the capital of France?", response.data)
-            self.assertIn(b"AI Response: Mocked AI Answer", response.data)
+            self.assertIn(b"Your Query:", response.data)
+            self.assertIn(b"What is the capital of France?", response.data)
+            self.assertIn(b"<p>Mocked AI Answer</p>", response.data)
         print("test_generate_question_answering passed: Question answering route works with mock.")
 
     def test_generate_summarize_text(self):
         """
         Tests the 'summarize_text' functionality.
         """
-        with unittest.mock.patch('gemini_api.get_gemini_response', return_value="Mocked AI Summary"):
+        with mock.patch('assistant.call_model', return_value="Mocked AI Summary"):
             response = self.client.post('/generate', data={
                 'function_choice': 'summarize_text',
                 'prompt_style': 'standard',
                 'user_input': 'This is a long text to summarize.'
             })
             self.assertEqual(response.status_code, 200)
-            self.assertIn(b"AI Response: Mocked AI Summary", response.data)
+            self.assertIn(b"<p>Mocked AI Summary</p>", response.data)
         print("test_generate_summarize_text passed: Summarization route works with mock.")
 
     def test_generate_creative_content(self):
         """
         Tests the 'generate_creative_content' functionality.
         """
-        with unittest.mock.patch('gemini_api.get_gemini_response', return_value="Mocked AI Story"):
+        with mock.patch('assistant.call_model', return_value="Mocked AI Story"):
             response = self.client.post('/generate', data={
                 'function_choice': 'generate_creative_content',
                 'prompt_style': 'story_standard',
                 'user_input': 'a brave knight'
             })
             self.assertEqual(response.status_code, 200)
-            self.assertIn(b"AI Response: Mocked AI Story", response.data)
+            self.assertIn(b"<p>Mocked AI Story</p>", response.data)
         print("test_generate_creative_content passed: Creative content route works with mock.")
 
     def test_feedback_submission_helpful(self):
@@ -100,22 +107,19 @@ class TestApp(unittest.TestCase):
         helpful_status = "yes"
         current_time = datetime.now().isoformat()
 
-        # Mock datetime.now() to ensure consistent timestamp for verification
-        with unittest.mock.patch('datetime.datetime') as mock_dt:
+        # Mock datetime.now() in app.py to ensure consistent timestamp for verification
+        with mock.patch('app.datetime') as mock_dt:
             mock_dt.now.return_value = datetime.fromisoformat(current_time)
-            mock_dt.isoformat.return_value = current_time # For saving
-            mock_dt.fromisoformat.return_value = datetime.fromisoformat(current_time) # For loading
 
             response = self.client.post('/feedback', data={
-                'query': query,
-                'response': response_text,
+                'response_id': self.response_store.save(query, response_text),
                 'helpful': helpful_status
             }, follow_redirects=True) # Follow redirect back to index
 
             self.assertEqual(response.status_code, 200) # Should redirect to index page (200 OK)
             self.assertIn(b"AI Assistant", response.data) # Verify it landed on index
 
-            feedback_data = load_json(FEEDBACK_FILE)
+            feedback_data = list(get_all_feedback())
             self.assertEqual(len(feedback_data), 1)
             self.assertEqual(feedback_data[0]["query"], query)
             self.assertEqual(feedback_data[0]["helpful"], True)
@@ -132,21 +136,18 @@ class TestApp(unittest.TestCase):
         helpful_status = "no"
         current_time = datetime.now().isoformat()
 
-        with unittest.mock.patch('datetime.datetime') as mock_dt:
+        with mock.patch('app.datetime') as mock_dt:
             mock_dt.now.return_value = datetime.fromisoformat(current_time)
-            mock_dt.isoformat.return_value = current_time
-            mock_dt.fromisoformat.return_value = datetime.fromisoformat(current_time)
 
             response = self.client.post('/feedback', data={
-                'query': query,
-                'response': response_text,
+                'response_id': self.response_store.save(query, response_text),
                 'helpful': helpful_status
             }, follow_redirects=True)
 
             self.assertEqual(response.status_code, 200)
             self.assertIn(b"AI Assistant", response.data)
 
-            feedback_data = load_json(FEEDBACK_FILE)
+            feedback_data = list(get_all_feedback())
             self.assertEqual(len(feedback_data), 1)
             self.assertEqual(feedback_data[0]["query"], query)
             self.assertEqual(feedback_data[0]["helpful"], False)
@@ -155,6 +156,4 @@ class TestApp(unittest.TestCase):
 
 
 if __name__ == '__main__':
-    # To run these tests, you might need to install 'mock' if on Python < 3.3
-    # pip install mock (if needed)
     unittest.main()
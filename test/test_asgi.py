@@ -0,0 +1,180 @@
+import unittest
+import os
+import json
+import shutil
+import asyncio
+import tempfile
+import threading
+from unittest import mock
+import asgi
+from metrics import REQUEST_PHASE_SECONDS
+from feedback import FEEDBACK_FILE, get_all_feedback
+from utils import ensure_directory_exists
+
+class TestAsyncApp(unittest.IsolatedAsyncioTestCase):
+    """
+    Unit tests for the async (ASGI) application in asgi.py.
+    """
+
+    def setUp(self):
+        """
+        Set up for each test: create a test client and clear the cache and feedback log.
+        """
+        asgi.app.testing = True
+        self.client = asgi.app.test_client()
+        asgi.response_cache.clear()
+        ensure_directory_exists(os.path.dirname(FEEDBACK_FILE))
+        open(FEEDBACK_FILE, 'w').close()
+
+    def tearDown(self):
+        """
+        Clean up after each test: clear the feedback log.
+        """
+        open(FEEDBACK_FILE, 'w').close()
+
+    async def test_index_page(self):
+        """
+        Tests that the main index page loads successfully.
+        """
+        response = await self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"Choose a Function:", await response.get_data())
+        print("test_index_page passed: Async index page loads.")
+
+    async def test_generate(self):
+        """
+        Tests that /generate awaits the async model call and renders its Markdown.
+        """
+        with mock.patch('asgi.get_gemini_response_async', mock.AsyncMock(return_value="**Paris**")) as gemini:
+            response = await self.client.post('/generate', form={
+                'function_choice': 'answer_question',
+                'prompt_style': 'general',
+                'user_input': 'What is the capital of France?'
+            })
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b"<strong>Paris</strong>", await response.get_data())
+            gemini.assert_awaited_once()
+        print("test_generate passed: Async generate works with mock.")
+
+    async def test_generate_stream_shares_cache_and_metrics(self):
+        """
+        Tests that a streamed response is cached under the same key as /generate and that its
+        upstream call is timed for /metrics.
+        """
+        async def stream(*_args, **_kwargs):
+            for chunk in ["Paris", " is the capital."]:
+                yield chunk
+        form = {'function_choice': 'answer_question', 'prompt_style': 'general', 'user_input': 'Capital of France, streamed?'}
+        upstream_before = REQUEST_PHASE_SECONDS.count(route='generate_stream', phase='upstream')
+        with mock.patch('asgi.stream_gemini_response_async', stream):
+            response = await self.client.post('/generate/stream', form=form)
+            self.assertIn(b"event: done", await response.get_data())
+        self.assertEqual(REQUEST_PHASE_SECONDS.count(route='generate_stream', phase='upstream'), upstream_before + 1)
+        with mock.patch('asgi.get_gemini_response_async', mock.AsyncMock()) as gemini:
+            response = await self.client.post('/generate', form=form)
+            self.assertIn(b"Paris is the capital.", await response.get_data())
+            gemini.assert_not_awaited()
+        print("test_generate_stream_shares_cache_and_metrics passed: Stream and /generate share the cache.")
+
+    async def test_batch_endpoints(self):
+        """
+        Tests submitting a batch to the async app, polling it to completion and fetching its results.
+        """
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir, ignore_errors=True)
+        body = json.dumps({"function_choice": "answer_question", "prompt_style": "general", "user_input": "Q"}) + "\n"
+        with mock.patch("batch.BATCH_DIR", work_dir), mock.patch("batch.generate_response", return_value="Answer"):
+            response = await self.client.post('/batch', data=body)
+            self.assertEqual(response.status_code, 202)
+            job_id = (await response.get_json())["job_id"]
+            for _ in range(200):
+                status = await (await self.client.get(f'/batch/{job_id}')).get_json()
+                if status["status"] == "completed":
+                    break
+                await asyncio.sleep(0.01)
+            results = await self.client.get(f'/batch/{job_id}/results')
+            self.assertEqual(json.loads(await results.get_data(as_text=True))["response"], "Answer")
+            self.assertEqual((await self.client.post(f'/batch/{job_id}/resume')).status_code, 202)
+        self.assertEqual(status["succeeded"], 1)
+        self.assertEqual((await self.client.get('/batch/unknown')).status_code, 404)
+        self.assertEqual((await self.client.post('/batch?rate=fast', data=body)).status_code, 400)
+        print("test_batch_endpoints passed: Async batch job polled to completion.")
+
+    async def test_upstream_concurrency_limit(self):
+        """
+        Tests that no more than UPSTREAM_CONCURRENCY model calls are in flight at once.
+        """
+        in_flight = 0
+        peak = 0
+
+        async def slow_response(prompt, max_output_tokens=None, history=None):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return f"Answer to {prompt}"
+
+        with mock.patch('asgi.upstream_semaphore', asyncio.Semaphore(2)), \
+             mock.patch('asgi.get_gemini_response_async', slow_response):
+            responses = await asyncio.gather(*[
+                self.client.post('/generate', form={
+                    'function_choice': 'answer_question',
+                    'prompt_style': 'concise',
+                    'user_input': f'Question {index}'
+                }) for index in range(6)
+            ])
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertEqual(peak, 2)
+        print("test_upstream_concurrency_limit passed: Upstream calls are capped.")
+
+    async def test_blocking_work_off_event_loop(self):
+        """
+        Tests that the caches and the response store are used from worker threads, not the event loop.
+        """
+        loop_thread = threading.get_ident()
+        threads = {}
+
+        def recording(name, function):
+            def call(*args):
+                threads[name] = threading.get_ident()
+                return function(*args)
+            return call
+
+        with mock.patch('asgi.get_gemini_response_async', mock.AsyncMock(return_value="An answer")), \
+             mock.patch.object(asgi.response_cache, 'get', recording('cache', asgi.response_cache.get)), \
+             mock.patch.object(asgi.semantic_cache, 'lookup', recording('semantic', asgi.semantic_cache.lookup)), \
+             mock.patch.object(asgi.response_store, 'save', recording('store', asgi.response_store.save)):
+            response = await self.client.post('/generate', form={
+                'function_choice': 'answer_question',
+                'prompt_style': 'detailed',
+                'user_input': 'Which thread runs this?'
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(threads), {'cache', 'semantic', 'store'})
+        self.assertNotIn(loop_thread, threads.values())
+        print("test_blocking_work_off_event_loop passed: Blocking calls run in worker threads.")
+
+    async def test_feedback(self):
+        """
+        Tests that feedback posted to the async app is saved.
+        """
+        response_id = asgi.response_store.save('Async query', 'Async response', 'answer_question', 'general')
+        response = await self.client.post('/feedback', form={
+            'response_id': response_id,
+            'helpful': 'yes'
+        })
+        self.assertEqual(response.status_code, 302)
+        feedback_data = list(get_all_feedback())
+        self.assertEqual(len(feedback_data), 1)
+        self.assertEqual(feedback_data[0]["query"], "Async query")
+        self.assertEqual(feedback_data[0]["response"], "Async response")
+
+        response = await self.client.post('/feedback', form={'response_id': 'expired-or-fake', 'helpful': 'no'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(len(list(get_all_feedback())), 1)
+        print("test_feedback passed: Async feedback saved.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+import os
+import json
+import time
+import shutil
+import tempfile
+from unittest import mock
+import batch
+from batch import BatchJob, BatchRegistry, load_checkpoint
+from gemini_api import GeminiUnavailableError
+
+def write_jsonl(path, records):
+    with open(path, "w") as f:
+        for record in records:
+            f.write((record if isinstance(record, str) else json.dumps(record)) + "\n")
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+class TestBatch(unittest.TestCase):
+    """
+    Unit tests for the batch runner in batch.py.
+    """
+
+    def setUp(self):
+        """
+        Set up for each test: create temporary input and output paths.
+        """
+        self.work_dir = tempfile.mkdtemp()
+        self.input_path = os.path.join(self.work_dir, "input.jsonl")
+        self.output_path = os.path.join(self.work_dir, "output.jsonl")
+
+    def tearDown(self):
+        """
+        Clean up after each test: remove the temporary files.
+        """
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_batch_run_writes_results_and_reports_invalid_lines(self):
+        """
+        Tests that each record is dispatched and written with its index, and bad lines are reported.
+        """
+        write_jsonl(self.input_path, [
+            {"function_choice": "answer_question", "prompt_style": "general", "user_input": "Q1"},
+            "not json",
+            {"function_choice": "summarize_text", "prompt_style": "standard"},
+            {"function_choice": "answer_question", "prompt_style": "concise", "user_input": "Q2"},
+        ])
+        with mock.patch("batch.generate_response", side_effect=lambda fc, ps, ui: f"Answer to {ui}") as generate:
+            progress = BatchJob(self.input_path, self.output_path, concurrency=2, rate_per_minute=6000).run()
+
+        results = {result["index"]: result for result in read_jsonl(self.output_path)}
+        self.assertEqual(results[0]["response"], "Answer to Q1")
+        self.assertEqual(results[3]["response"], "Answer to Q2")
+        self.assertTrue(results[1]["error"].startswith("Invalid JSON"))
+        self.assertEqual(results[2]["error"], "Missing fields: user_input")
+        self.assertEqual(generate.call_count, 2)
+        self.assertEqual((progress["status"], progress["total"], progress["succeeded"], progress["failed"]), ("completed", 4, 2, 2))
+        print("test_batch_run_writes_results_and_reports_invalid_lines passed: Batch results written.")
+
+    def test_batch_failures_recorded_once(self):
+        """
+        Tests that a failed call is recorded without a second retry layer on top of the Gemini client's,
+        and that an unexpected error in a worker becomes a failed record instead of stalling the job.
+        """
+        write_jsonl(self.input_path, [
+            {"function_choice": "answer_question", "prompt_style": "general", "user_input": "Busy"},
+            {"function_choice": "answer_question", "prompt_style": "general", "user_input": "Crash"},
+        ] + [{"function_choice": "answer_question", "prompt_style": "general", "user_input": f"Q{index}"} for index in range(4)])
+
+        def fake_generate(function_choice, prompt_style, user_input):
+            if user_input == "Busy":
+                raise GeminiUnavailableError("busy")
+            if user_input == "Crash":
+                raise ZeroDivisionError("division by zero")
+            return f"Answer to {user_input}"
+
+        with mock.patch("batch.generate_response", side_effect=fake_generate) as generate:
+            progress = BatchJob(self.input_path, self.output_path, concurrency=1, rate_per_minute=6000).run()
+
+        results = {result["index"]: result for result in read_jsonl(self.output_path)}
+        self.assertEqual(generate.call_count, 6)
+        self.assertEqual(results[0]["error"], "busy")
+        self.assertEqual((results[1]["user_input"], results[1]["error"]), ("Crash", "Unexpected error: division by zero"))
+        self.assertEqual((progress["status"], progress["succeeded"], progress["failed"]), ("completed", 4, 2))
+        print("test_batch_failures_recorded_once passed: Failures recorded, job finished.")
+
+    def test_batch_resumes_from_checkpoint(self):
+        """
+        Tests that a rerun skips records that already succeeded and retries failed ones.
+        """
+        write_jsonl(self.input_path, [
+            {"function_choice": "answer_question", "prompt_style": "general", "user_input": f"Q{index}"} for index in range(3)
+        ])
+        write_jsonl(self.output_path, [
+            {"index": 0, "response": "done", "error": None},
+            {"index": 1, "response": None, "error": "quota"},
+        ])
+        with mock.patch("batch.generate_response", return_value="fresh") as generate:
+            progress = BatchJob(self.input_path, self.output_path, rate_per_minute=6000).run()
+
+        self.assertEqual(generate.call_count, 2)
+        self.assertEqual(progress["skipped"], 1)
+        self.assertEqual(load_checkpoint(self.output_path), {0, 1, 2})
+        print("test_batch_resumes_from_checkpoint passed: Completed records skipped.")
+
+    def test_batch_progress_shared_between_processes(self):
+        """
+        Tests that a job's progress is visible through another process's registry, and that a job
+        whose run stopped saving progress is reported as interrupted and may be resumed.
+        """
+        path = os.path.join(self.work_dir, "batch.sqlite3")
+        registry, other_process = BatchRegistry(path), BatchRegistry(path, stale_seconds=30)
+        write_jsonl(self.input_path, [{"function_choice": "answer_question", "prompt_style": "general", "user_input": "Q"}])
+        job = BatchJob(self.input_path, self.output_path, rate_per_minute=6000, job_id="0123456789ab", registry=registry)
+        self.assertTrue(registry.claim(job.job_id, job.run_id))
+        self.assertFalse(other_process.claim(job.job_id, "second-run")) # Pending in a live process
+        with mock.patch("batch.generate_response", return_value="Answer"):
+            job.run()
+        progress = other_process.get(job.job_id)
+        self.assertEqual((progress["status"], progress["succeeded"], progress["percent"]), ("completed", 1, 100.0))
+        self.assertIsNone(other_process.get("../../etc"))
+
+        self.assertTrue(other_process.claim(job.job_id, "second-run"))
+        with mock.patch("batch.time.time", return_value=time.time() + 60):
+            self.assertEqual(registry.get(job.job_id)["status"], "interrupted")
+            self.assertTrue(registry.claim(job.job_id, "third-run"))
+        print("test_batch_progress_shared_between_processes passed: Progress shared, dead runs resumable.")
+
+    def test_batch_endpoint(self):
+        """
+        Tests submitting a batch over HTTP and polling it until it completes.
+        """
+        from app import app
+        client = app.test_client()
+        body = json.dumps({"function_choice": "answer_question", "prompt_style": "general", "user_input": "Q"}) + "\n"
+        with mock.patch("batch.BATCH_DIR", self.work_dir), \
+             mock.patch("batch.generate_response", return_value="Answer"):
+            response = client.post('/batch', data=body)
+            self.assertEqual(response.status_code, 202)
+            job_id = response.get_json()["job_id"]
+            for _ in range(200):
+                status = client.get(f'/batch/{job_id}').get_json()
+                if status["status"] == "completed":
+                    break
+                time.sleep(0.01)
+            results = client.get(f'/batch/{job_id}/results')
+        self.assertEqual(status["succeeded"], 1)
+        self.assertEqual(json.loads(results.get_data(as_text=True))["response"], "Answer")
+        results.close()
+        self.assertEqual(client.get('/batch/unknown').status_code, 404)
+        for options in ("rate=0", "rate=-5", "concurrency=0", "rate=fast"):
+            self.assertEqual(client.post(f'/batch?{options}', data=body).status_code, 400)
+        self.assertEqual(os.listdir(self.work_dir), [job_id]) # Rejected batches store nothing
+        print("test_batch_endpoint passed: Batch job polled to completion.")
+
+
+if __name__ == '__main__':
+    unittest.main()
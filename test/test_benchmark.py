@@ -0,0 +1,124 @@
+import unittest
+import os
+import json
+import urllib.error
+import urllib.request
+from unittest import mock
+import gemini_api
+from benchmark import percentile, summarize_latencies, compare_results, run_load
+from mock_gemini import MockGeminiConfig, MockGeminiServer
+from ratelimit import AdaptiveRateLimiter, CircuitBreaker
+
+def post_json(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, dict(response.headers), json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), json.loads(e.read())
+
+GENERATE_PATH = "/v1beta/models/gemini-2.0-flash:generateContent"
+PROMPT = {"contents": [{"parts": [{"text": "How do caches work?"}], "role": "user"}]}
+
+class TestMockGemini(unittest.TestCase):
+    """
+    Unit tests for the stand-in Gemini server in mock_gemini.py.
+    """
+
+    def start_server(self, **options):
+        server = MockGeminiServer(MockGeminiConfig(latency_ms=0, jitter_ms=0, seed=1, **options)).start()
+        self.addCleanup(server.stop)
+        return server
+
+    def test_generate_content_response(self):
+        """
+        Tests that a call is answered with a Markdown candidate and usage metadata.
+        """
+        server = self.start_server()
+        status, _headers, body = post_json(server.url + GENERATE_PATH, PROMPT)
+        self.assertEqual(status, 200)
+        self.assertTrue(body["candidates"][0]["content"]["parts"][0]["text"].startswith("## Answer"))
+        self.assertGreater(body["usageMetadata"]["candidatesTokenCount"], 0)
+        self.assertEqual(server.stats(), {"calls": 1, "by_status": {200: 1}})
+        print("test_generate_content_response passed: Mock answer served.")
+
+    def test_rate_limits_and_errors(self):
+        """
+        Tests that random 429s carry Retry-After, the rpm quota is enforced, and errors are injected.
+        """
+        status, headers, body = post_json(self.start_server(rate_limit_rate=1.0, retry_after=3).url + GENERATE_PATH, PROMPT)
+        self.assertEqual((status, headers["Retry-After"], body["error"]["status"]), (429, "3.0", "RESOURCE_EXHAUSTED"))
+
+        quota_server = self.start_server(rpm=2)
+        statuses = [post_json(quota_server.url + GENERATE_PATH, PROMPT)[0] for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+        self.assertEqual(post_json(self.start_server(error_rate=1.0).url + GENERATE_PATH, PROMPT)[0], 500)
+        print("test_rate_limits_and_errors passed: Failures injected as configured.")
+
+    def test_sdk_calls_through_endpoint_override(self):
+        """
+        Tests that gemini_api reaches the mock through GEMINI_API_ENDPOINT and classifies its 429s.
+        """
+        server = self.start_server()
+        with mock.patch.dict(os.environ, {"GEMINI_API_ENDPOINT": server.url}), \
+             mock.patch.object(gemini_api, "client_manager", gemini_api.ClientManager()), \
+             mock.patch.object(gemini_api, "rate_limiter", AdaptiveRateLimiter(6000)), \
+             mock.patch.object(gemini_api, "circuit_breaker", CircuitBreaker()), \
+             mock.patch.object(gemini_api, "GEMINI_MAX_RETRIES", 0):
+            self.assertTrue(gemini_api.get_gemini_response("How do caches work?").startswith("## Answer"))
+            server.config.rate_limit_rate = 1.0
+            with self.assertRaises(gemini_api.GeminiRateLimitError) as raised:
+                gemini_api.get_gemini_response("How do caches work?")
+        self.assertEqual(raised.exception.retry_after, 1.0)
+        print("test_sdk_calls_through_endpoint_override passed: Real SDK path exercised.")
+
+class TestLoadReport(unittest.TestCase):
+    """
+    Unit tests for the load driver and report helpers in benchmark.py.
+    """
+
+    def test_percentiles_and_summary(self):
+        """
+        Tests nearest-rank percentiles and the per-route summary.
+        """
+        latencies = [i / 1000 for i in range(1, 101)]
+        self.assertEqual(percentile(latencies, 50), 0.05)
+        self.assertEqual(percentile(latencies, 99), 0.099)
+        self.assertIsNone(percentile([], 95))
+        summary = summarize_latencies(latencies, 2.0)
+        self.assertEqual((summary["requests_per_second"], summary["p95_ms"], summary["max_ms"]), (50.0, 95.0, 100.0))
+        print("test_percentiles_and_summary passed: Percentiles correct.")
+
+    def test_run_load_posts_generate_and_feedback(self):
+        """
+        Tests that every request posts /generate and the requested share of them posts /feedback.
+        """
+        posted = []
+
+        class FakeClient:
+            def post(self, path, data):
+                posted.append((path, data))
+                if path == "/generate":
+                    return 200, '<input type="hidden" name="response_id" value="abcdefghijklmnop">'
+                return 302, ""
+
+        report = run_load(FakeClient(), requests=10, concurrency=3, feedback_ratio=0.5, distinct=4)
+        self.assertEqual(report["generate"]["requests"], 10)
+        self.assertEqual(report["feedback"]["statuses"], {302: 5})
+        questions = {data["user_input"] for path, data in posted if path == "/generate"}
+        self.assertEqual(len(questions), 4)
+        print("test_run_load_posts_generate_and_feedback passed: Load driver posts as configured.")
+
+    def test_compare_flags_regressions(self):
+        """
+        Tests that only results slower than the baseline by more than the tolerance are flagged.
+        """
+        baseline = {"build_prompt": 1e-6, "log_event": 1e-5}
+        results = {"build_prompt": 1.2e-6, "log_event": 2e-5, "new_benchmark": 1.0}
+        self.assertEqual(compare_results(results, baseline, tolerance=0.25), [("log_event", 1e-5, 2e-5)])
+        print("test_compare_flags_regressions passed: Regressions flagged.")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from unittest import mock
+from budget import fit_input, compress_whitespace, truncate_to_tokens, parse_budgets, output_budget, TRUNCATION_NOTE
+from gemini_api import estimate_tokens, get_gemini_response
+from metrics import INPUT_BUDGET_DECISIONS
+
+class TestInputBudget(unittest.TestCase):
+    """
+    Unit tests for token budgeting of request inputs in budget.py.
+    """
+
+    def test_small_input_passes_through(self):
+        """
+        Tests that input within its budget is left exactly as typed.
+        """
+        text, decision = fit_input("answer_question", "What  is\n\n\n\nPython?", {"answer_question": 100})
+        self.assertEqual(text, "What  is\n\n\n\nPython?")
+        self.assertEqual(decision["action"], "none")
+        print("test_small_input_passes_through passed: Input unchanged.")
+
+    def test_whitespace_compressed_before_truncating(self):
+        """
+        Tests that padding is collapsed first, so text that fits once compressed is not cut.
+        """
+        padded = "word" + " " * 400 + "\n\n\n\n\nnext\t\tparagraph"
+        self.assertEqual(compress_whitespace(padded), "word\n\nnext paragraph")
+        text, decision = fit_input("answer_question", padded, {"answer_question": 20})
+        self.assertEqual((text, decision["action"]), ("word\n\nnext paragraph", "compress"))
+        print("test_whitespace_compressed_before_truncating passed: Whitespace compressed.")
+
+    def test_truncates_at_a_boundary_and_counts(self):
+        """
+        Tests that oversized input is cut on a sentence boundary, marked, kept in budget and counted.
+        """
+        long_input = "This is a sentence about budgets. " * 200
+        before = INPUT_BUDGET_DECISIONS.value(function="generate_creative_content", action="truncate")
+        with mock.patch("budget.log_event") as log:
+            text, decision = fit_input("generate_creative_content", long_input, {"generate_creative_content": 300})
+        self.assertEqual(decision["action"], "truncate")
+        self.assertTrue(text.endswith("budgets." + TRUNCATION_NOTE))
+        self.assertLessEqual(estimate_tokens(text), 300)
+        self.assertEqual(INPUT_BUDGET_DECISIONS.value(function="generate_creative_content", action="truncate"), before + 1)
+        self.assertIn("truncate", log.call_args[0][0])
+        self.assertEqual(truncate_to_tokens("x" * 100, 10), "x" * 36) # No boundary: cut mid-word
+        print("test_truncates_at_a_boundary_and_counts passed: Input truncated within budget.")
+
+    def test_long_summary_routed_to_chunking(self):
+        """
+        Tests that a long document under the summarize budget goes to the chunked path uncut.
+        """
+        document = "\n\n".join(f"Paragraph {index} " + "text " * 100 for index in range(100))
+        text, decision = fit_input("summarize_text", document, {"summarize_text": 100000})
+        self.assertEqual(text, document)
+        self.assertEqual((decision["action"], decision["chunked"]), ("chunk", True))
+        print("test_long_summary_routed_to_chunking passed: Long document chunked.")
+
+    def test_output_budget_sent_to_gemini(self):
+        """
+        Tests that the function's output budget reaches generate_content as max_output_tokens.
+        """
+        self.assertEqual(parse_budgets("answer_question=512, summarize_text=64"), {"answer_question": 512, "summarize_text": 64})
+        model = mock.Mock()
+        model.generate_content.return_value = mock.Mock(candidates=[mock.Mock(content=mock.Mock(parts=[mock.Mock(text="Hi")]))])
+        with mock.patch("gemini_api.client_manager.get_model", return_value=model):
+            self.assertEqual(get_gemini_response("prompt", max_output_tokens=output_budget("summarize_text")), "Hi")
+        model.generate_content.assert_called_once_with("prompt", generation_config={"max_output_tokens": output_budget("summarize_text")})
+        print("test_output_budget_sent_to_gemini passed: max_output_tokens applied.")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import os
+import time
+import tempfile
+import shutil
+from unittest import mock
+from cache import MemoryCache, DiskCache, ResponseCache, make_cache_key, create_response_cache
+
+class TestCache(unittest.TestCase):
+    """
+    Unit tests for the response cache in cache.py.
+    """
+
+    def setUp(self):
+        """
+        Set up for each test: create a temporary directory for the disk tier.
+        """
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """
+        Clean up after each test: remove the temporary disk tier.
+        """
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_cache_key_normalization(self):
+        """
+        Tests that whitespace differences share a key but model names do not.
+        """
+        self.assertEqual(make_cache_key("Write  a poem\n", "m"), make_cache_key("Write a poem", "m"))
+        self.assertNotEqual(make_cache_key("Write a poem", "m1"), make_cache_key("Write a poem", "m2"))
+        print("test_cache_key_normalization passed: Keys are normalized per model.")
+
+    def test_memory_cache_lru_eviction(self):
+        """
+        Tests that the least recently used entry is evicted once the size bound is reached.
+        """
+        memory = MemoryCache(max_entries=2, ttl_seconds=60)
+        memory.set("a", "A")
+        memory.set("b", "B")
+        memory.get("a")
+        memory.set("c", "C")
+        self.assertEqual(memory.get("a"), "A")
+        self.assertIsNone(memory.get("b"))
+        self.assertEqual(len(memory), 2)
+        print("test_memory_cache_lru_eviction passed: LRU entry evicted.")
+
+    def test_memory_cache_ttl_expiry(self):
+        """
+        Tests that entries expire after their TTL.
+        """
+        memory = MemoryCache(max_entries=2, ttl_seconds=10)
+        with mock.patch("cache.time.time", return_value=1000.0):
+            memory.set("a", "A")
+        with mock.patch("cache.time.time", return_value=1011.0):
+            self.assertIsNone(memory.get("a"))
+        print("test_memory_cache_ttl_expiry passed: Expired entry dropped.")
+
+    def test_disk_tier_survives_restart_and_promotes(self):
+        """
+        Tests that a new cache over the same directory serves entries from disk and counts the hit.
+        """
+        first = create_response_cache(use_disk=True, directory=self.cache_dir)
+        first.set("prompt", "model", "response")
+
+        second = ResponseCache([MemoryCache(), DiskCache(directory=self.cache_dir)])
+        self.assertEqual(second.get("prompt", "model"), "response")
+        self.assertEqual(second.get("prompt", "model"), "response")
+        stats = second.stats()
+        self.assertEqual(stats["tier_hits"], {"memory": 1, "disk": 1})
+        self.assertEqual(stats["misses"], 0)
+        print("test_disk_tier_survives_restart_and_promotes passed: Disk entries reused.")
+
+    def test_disk_tier_sweeps_expired_and_bounds_size(self):
+        """
+        Tests that the disk tier removes expired files and keeps at most max_entries files.
+        """
+        disk = DiskCache(directory=self.cache_dir, ttl_seconds=10, max_entries=3)
+        with mock.patch("cache.time.time", return_value=1000.0):
+            disk.set("aa-expired", "old")
+        os.utime(disk._path("aa-expired"), (1000.0, 1000.0))
+        for index in range(5):
+            disk.set(f"key{index}", index)
+            os.utime(disk._path(f"key{index}"), (time.time() - 5 + index, time.time() - 5 + index))
+        self.assertEqual(len(disk), 3) # Swept on every write when max_entries < 10
+        self.assertEqual([disk.get(f"key{index}") for index in range(5)], [None, None, 2, 3, 4])
+        self.assertIsNone(disk.get("aa-expired"))
+        print("test_disk_tier_sweeps_expired_and_bounds_size passed: Disk tier bounded.")
+
+    def test_get_or_generate_counts_and_skips_uncacheable(self):
+        """
+        Tests that generate is only called on a miss and rejected responses are not stored.
+        """
+        response_cache = create_response_cache()
+        generate = mock.Mock(return_value="answer")
+        self.assertEqual(response_cache.get_or_generate("q", "m", generate), "answer")
+        self.assertEqual(response_cache.get_or_generate("q", "m", generate), "answer")
+        self.assertEqual(generate.call_count, 1)
+
+        failing = mock.Mock(return_value="error")
+        response_cache.get_or_generate("other", "m", failing, should_cache=lambda text: text != "error")
+        response_cache.get_or_generate("other", "m", failing, should_cache=lambda text: text != "error")
+        self.assertEqual(failing.call_count, 2)
+
+        stats = response_cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 3)
+        print("test_get_or_generate_counts_and_skips_uncacheable passed: Counters and filter work.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+import os
+import sys
+import subprocess
+from unittest import mock
+from config import load_config
+import app as app_module
+from metrics import STARTUP_SECONDS
+
+class TestStartup(unittest.TestCase):
+    """
+    Tests for environment configuration, the application factory and lazy SDK loading.
+    """
+
+    def test_load_config_from_environment(self):
+        """
+        Tests that settings come from the environment and overrides take precedence.
+        """
+        with mock.patch.dict(os.environ, {"PORT": "8080", "WEB_CONCURRENCY": "3", "FLASK_DEBUG": "1"}):
+            config = load_config({"PORT": 9000})
+        self.assertEqual((config["PORT"], config["WORKERS"], config["DEBUG"]), (9000, 3, True))
+        with mock.patch.dict(os.environ, {}, clear=True):
+            self.assertFalse(load_config()["DEBUG"])
+        print("test_load_config_from_environment passed: Settings read from the environment.")
+
+    def test_create_app(self):
+        """
+        Tests that the factory applies settings, keeps the routes working and records startup time.
+        """
+        with mock.patch("app.client_manager.prewarm") as prewarm:
+            flask_app = app_module.create_app({"TESTING": True, "GEMINI_PREWARM": False})
+        prewarm.assert_not_called()
+        self.assertTrue(flask_app.config["TESTING"])
+        self.assertEqual(flask_app.test_client().get('/').status_code, 200)
+        self.assertGreater(STARTUP_SECONDS.value(phase="import"), 0)
+        self.assertIs(app_module.app, app_module.app) # The default app is built once
+        print("test_create_app passed: Application built by the factory.")
+
+    def test_sdk_imported_lazily(self):
+        """
+        Tests that importing the web app does not import the Gemini SDK until a model is needed.
+        """
+        code = ("import sys, app, gemini_api; assert 'google.generativeai' not in sys.modules; "
+                "gemini_api.load_sdk(); assert 'google.generativeai' in sys.modules")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, GEMINI_PREWARM="0")
+        result = subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        print("test_sdk_imported_lazily passed: Gemini SDK loaded on demand.")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import unittest
+import os
+import json
+import asyncio
+import shutil
+import tempfile
+from unittest import mock
+import gemini_api
+from context_cache import ContextCache
+from prompts import load_prompt_registry, prompt_prefixes
+from mock_gemini import MockGeminiConfig, MockGeminiServer
+from ratelimit import AdaptiveRateLimiter, CircuitBreaker
+
+INSTRUCTIONS = "Answer in the house style. Example: {\"q\": \"Why?\", \"a\": \"Because.\"}\n" * 20
+
+class FakeBackend:
+    """
+    Context cache backend recording its calls; raises on create while `fail` is set.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+
+    def create(self, prefix, ttl_seconds):
+        self.calls.append("create")
+        if self.fail:
+            raise RuntimeError("caching unavailable")
+        return f"cache-{len(self.calls)}"
+
+    def refresh(self, handle, ttl_seconds):
+        self.calls.append(f"refresh {handle}")
+
+    def model(self, handle):
+        return handle
+
+    def is_cache_error(self, e):
+        return isinstance(e, LookupError)
+
+def _chunk(text):
+    return mock.Mock(candidates=[mock.Mock(content=mock.Mock(parts=[mock.Mock(text=text)]))], usage_metadata=None)
+
+class StreamingModel:
+    """
+    Model stub whose streams yield the given texts, or raise `error` when read.
+    """
+
+    def __init__(self, texts=(), error=None):
+        self.texts = texts
+        self.error = error
+        self.prompts = []
+
+    def _chunks(self, prompt):
+        self.prompts.append(prompt)
+        if self.error is not None:
+            raise self.error
+        for text in self.texts:
+            yield _chunk(text)
+
+    def generate_content(self, prompt, **options):
+        return self._chunks(prompt)
+
+    async def generate_content_async(self, prompt, **options):
+        async def chunks():
+            for chunk in self._chunks(prompt):
+                yield chunk
+        return chunks()
+
+class TestContextCache(unittest.TestCase):
+    """
+    Unit tests for prompt-prefix context caching in context_cache.py.
+    """
+
+    def setUp(self):
+        """
+        Set up for each test: a fake backend and a clock the test advances.
+        """
+        self.now = 0.0
+        self.backend = FakeBackend()
+        self.cache = ContextCache(self.backend, [INSTRUCTIONS, "Short prefix: "], min_tokens=100, ttl_seconds=100,
+                                  refresh_seconds=10, retry_seconds=50, clock=lambda: self.now)
+
+    def test_prefixes_from_template_instructions(self):
+        """
+        Tests that instructions start every prompt of a function and are reported as its static prefix.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, "templates.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"answer_question": {"fallback": "{input}", "instructions": INSTRUCTIONS,
+                                           "styles": {"general": {"template": "Answer: {input}"}}}}, f)
+        registry, fallbacks, _options = load_prompt_registry(path)
+        self.assertEqual(registry[("answer_question", "general")](input="Why {x}?"), INSTRUCTIONS + "\n\nAnswer: Why {x}?")
+        self.assertEqual(prompt_prefixes(registry, fallbacks), [INSTRUCTIONS + "\n\n", INSTRUCTIONS + "\n\nAnswer: "])
+        print("test_prefixes_from_template_instructions passed: Instructions prefixed.")
+
+    def test_lookup_creates_refreshes_and_expires(self):
+        """
+        Tests that a prefix is cached on first use, reused, extended near expiry, and that short
+        prefixes and other prompts are sent in full.
+        """
+        self.assertEqual(self.cache.prefixes, [INSTRUCTIONS])
+        self.assertEqual(self.cache.lookup(INSTRUCTIONS + "Q1")[1], "Q1")
+        self.now = 50
+        entry, rest = self.cache.lookup(INSTRUCTIONS + "Q2")
+        self.assertEqual((entry.model, rest), ("cache-1", "Q2"))
+        self.now = 95 # Within refresh_seconds of expiring
+        self.cache.lookup(INSTRUCTIONS + "Q3")
+        self.assertEqual(self.backend.calls, ["create", "refresh cache-1"])
+        self.assertIsNone(self.cache.lookup("Short prefix: Q4"))
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["created"], stats["refreshed"]), (3, 1, 1))
+        self.assertEqual(stats["tokens_saved"], 3 * entry.tokens)
+        print("test_lookup_creates_refreshes_and_expires passed: Prefix cached and refreshed.")
+
+    def test_falls_back_when_caching_fails(self):
+        """
+        Tests that a failed creation sends full prompts until the retry delay passes, and that a cache
+        rejected by the provider is dropped.
+        """
+        self.backend.fail = True
+        self.assertIsNone(self.cache.lookup(INSTRUCTIONS + "Q1"))
+        self.assertIsNone(self.cache.lookup(INSTRUCTIONS + "Q2"))
+        self.assertEqual(self.backend.calls, ["create"]) # Not retried before retry_seconds
+        self.backend.fail = False
+        self.now = 60
+        entry, _rest = self.cache.lookup(INSTRUCTIONS + "Q3")
+        self.assertFalse(self.cache.discard(entry, RuntimeError("503")))
+        self.assertTrue(self.cache.discard(entry, LookupError("cache not found")))
+        self.assertIsNone(self.cache.lookup(INSTRUCTIONS + "Q4"))
+        self.assertEqual(self.cache.stats()["fallbacks"], 4)
+        print("test_falls_back_when_caching_fails passed: Full prompts sent on failure.")
+
+    def test_stream_falls_back_when_cache_rejected(self):
+        """
+        Tests that a cache error raised while reading a stream, before its first chunk, drops the cache
+        and streams the full prompt instead, in the sync and async paths.
+        """
+        rejected = StreamingModel(error=LookupError("cache not found"))
+        full = StreamingModel(["Full ", "answer."])
+        self.backend.model = lambda handle: rejected
+        client_manager = mock.Mock(get_model=mock.Mock(return_value=full))
+
+        async def stream_async():
+            return [text async for text in gemini_api.stream_gemini_response_async(INSTRUCTIONS + "Q2")]
+
+        with mock.patch.object(gemini_api, "context_cache", self.cache), \
+             mock.patch.object(gemini_api, "client_manager", client_manager), \
+             mock.patch.object(gemini_api, "rate_limiter", AdaptiveRateLimiter(6000)), \
+             mock.patch.object(gemini_api, "circuit_breaker", CircuitBreaker()):
+            self.assertEqual("".join(gemini_api.stream_gemini_response(INSTRUCTIONS + "Q1")), "Full answer.")
+            self.now = 60 # Past the retry delay, so the prefix is cached again
+            self.assertEqual("".join(asyncio.run(stream_async())), "Full answer.")
+        self.assertEqual(rejected.prompts, ["Q1", "Q2"])
+        self.assertEqual(full.prompts, [INSTRUCTIONS + "Q1", INSTRUCTIONS + "Q2"])
+        self.assertEqual(self.cache.stats()["fallbacks"], 2)
+        print("test_stream_falls_back_when_cache_rejected passed: Streams fall back to the full prompt.")
+
+    def test_cached_calls_through_mock_server(self):
+        """
+        Tests that the real SDK sends the rest of the prompt with the cache id, that the mock counts
+        the cached tokens, and that a cache deleted upstream falls back to the full prompt.
+        """
+        server = MockGeminiServer(MockGeminiConfig(latency_ms=0, jitter_ms=0)).start()
+        self.addCleanup(server.stop)
+        context_cache = ContextCache(gemini_api.GeminiContextBackend(), [INSTRUCTIONS], min_tokens=100)
+        with mock.patch.dict(os.environ, {"GEMINI_API_ENDPOINT": server.url}), \
+             mock.patch.object(gemini_api, "client_manager", gemini_api.ClientManager()), \
+             mock.patch.object(gemini_api, "rate_limiter", AdaptiveRateLimiter(6000)), \
+             mock.patch.object(gemini_api, "circuit_breaker", CircuitBreaker()), \
+             mock.patch.object(gemini_api, "context_cache", context_cache):
+            cached_response = gemini_api.get_gemini_response(INSTRUCTIONS + "How do caches work?")
+            usage = server.token_usage()
+            self.assertEqual(usage["cached_contents"], 1)
+            self.assertGreater(usage["cached_tokens"], usage["prompt_tokens"] * 0.9)
+
+            server.delete_cached_content(context_cache._entries[INSTRUCTIONS].handle.name)
+            self.assertEqual(gemini_api.get_gemini_response(INSTRUCTIONS + "How do caches work?"), cached_response)
+        self.assertEqual(server.token_usage()["cached_tokens"], usage["cached_tokens"]) # Sent in full
+        self.assertEqual((context_cache.stats()["fallbacks"], server.stats()["by_status"]), (1, {200: 2}))
+        print("test_cached_calls_through_mock_server passed: Cached context used and dropped.")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,14 @@
 import unittest
 import os
 import json
+import threading
 from datetime import datetime
-from feedback import save_feedback, get_all_feedback, FEEDBACK_FILE
-from utils import ensure_directory_exists, save_json, load_json
+import shutil
+import tempfile
+from unittest import mock
+import feedback
+from feedback import save_feedback, get_all_feedback, migrate_legacy_feedback, FEEDBACK_FILE
+from utils import ensure_directory_exists, save_json
 
 class TestFeedback(unittest.TestCase):
     """
@@ -16,8 +21,7 @@ class TestFeedback(unittest.TestCase):
         """
         ensure_directory_exists(os.path.dirname(FEEDBACK_FILE))
         # Clear the feedback file before each test to ensure a clean state
-        with open(FEEDBACK_FILE, 'w') as f:
-            json.dump([], f)
+        open(FEEDBACK_FILE, 'w').close()
         print(f"Cleared {FEEDBACK_FILE} before test.")
 
     def tearDown(self):
@@ -26,13 +30,12 @@ class TestFeedback(unittest.TestCase):
         """
         ensure_directory_exists(os.path.dirname(FEEDBACK_FILE))
         # Clear the feedback file after each test
-        with open(FEEDBACK_FILE, 'w') as f:
-            json.dump([], f)
+        open(FEEDBACK_FILE, 'w').close()
         print(f"Cleared {FEEDBACK_FILE} after test.")
 
     def test_save_feedback(self):
         """
-        Tests that feedback is correctly saved to the JSON file.
+        Tests that feedback is correctly appended to the JSON Lines file.
         """
         query = "Test query for saving."
         response = "Test response."
@@ -42,9 +45,9 @@ class TestFeedback(unittest.TestCase):
         save_feedback(query, response, helpful, timestamp)
 
         # Verify the content of the feedback file
-        feedback_data = load_json(FEEDBACK_FILE)
+        with open(FEEDBACK_FILE) as f:
+            feedback_data = [json.loads(line) for line in f]
 
-        self.assertIsInstance(feedback_data, list)
         self.assertEqual(len(feedback_data), 1)
 
         saved_entry = feedback_data[0]
@@ -58,10 +61,9 @@ class TestFeedback(unittest.TestCase):
         """
         Tests retrieving feedback when the file is empty.
         """
-        feedback_data = get_all_feedback()
-        self.assertIsInstance(feedback_data, list)
+        feedback_data = list(get_all_feedback())
         self.assertEqual(len(feedback_data), 0)
-        print("test_get_all_feedback_empty passed: Returns empty list for empty file.")
+        print("test_get_all_feedback_empty passed: Yields nothing for empty file.")
 
     def test_get_all_feedback_with_data(self):
         """
@@ -82,10 +84,11 @@ class TestFeedback(unittest.TestCase):
                 "timestamp": datetime.now().isoformat()
             }
         ]
-        save_json(FEEDBACK_FILE, initial_data)
+        with open(FEEDBACK_FILE, 'w') as f:
+            for entry in initial_data:
+                f.write(json.dumps(entry) + "\n")
 
-        feedback_data = get_all_feedback()
-        self.assertIsInstance(feedback_data, list)
+        feedback_data = list(get_all_feedback())
         self.assertEqual(len(feedback_data), 2)
         self.assertEqual(feedback_data[0]["query"], "Q1")
         self.assertEqual(feedback_data[1]["response"], "R2")
@@ -98,12 +101,52 @@ class TestFeedback(unittest.TestCase):
         save_feedback("Query A", "Response A", True, datetime.now().isoformat())
         save_feedback("Query B", "Response B", False, datetime.now().isoformat())
 
-        feedback_data = get_all_feedback()
+        feedback_data = list(get_all_feedback())
         self.assertEqual(len(feedback_data), 2)
         self.assertEqual(feedback_data[0]["query"], "Query A")
         self.assertEqual(feedback_data[1]["query"], "Query B")
         self.assertEqual(feedback_data[1]["helpful"], False)
         print("test_save_multiple_feedbacks passed: Multiple feedbacks saved correctly.")
 
+    def test_concurrent_saves_are_not_lost(self):
+        """
+        Tests that feedback saved from many threads at once is all kept.
+        """
+        threads = [
+            threading.Thread(target=save_feedback, args=(f"Query {index}", "Response", True, datetime.now().isoformat()))
+            for index in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        queries = sorted(entry["query"] for entry in get_all_feedback())
+        self.assertEqual(queries, sorted(f"Query {index}" for index in range(20)))
+        print("test_concurrent_saves_are_not_lost passed: No lost writes.")
+
+    def test_migrate_legacy_feedback(self):
+        """
+        Tests the one-time migration from the legacy JSON array file.
+        """
+        data_dir = tempfile.mkdtemp()
+        try:
+            legacy_file = os.path.join(data_dir, "feedback_log.json")
+            feedback_file = os.path.join(data_dir, "feedback_log.jsonl")
+            save_json(legacy_file, [{"query": "Q1", "response": "R1", "helpful": True, "timestamp": "t1"},
+                                    {"query": "Q2", "response": "R2", "helpful": False, "timestamp": "t2"}])
+
+            self.assertEqual(migrate_legacy_feedback(legacy_file, feedback_file), 2)
+            self.assertEqual(migrate_legacy_feedback(legacy_file, feedback_file), 0)
+            self.assertFalse(os.path.exists(legacy_file))
+            self.assertTrue(os.path.exists(legacy_file + ".migrated"))
+
+            with mock.patch.object(feedback, "FEEDBACK_FILE", feedback_file):
+                self.assertEqual([entry["query"] for entry in get_all_feedback()], ["Q1", "Q2"])
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+        print("test_migrate_legacy_feedback passed: Legacy feedback migrated once.")
+
+
 if __name__ == '__main__':
     unittest.main()
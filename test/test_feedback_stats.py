@@ -0,0 +1,102 @@
+import unittest
+import os
+import json
+import tempfile
+from datetime import date
+from unittest import mock
+from feedback_stats import FeedbackStats
+
+class TestFeedbackStats(unittest.TestCase):
+    """
+    Unit tests for the incremental feedback counters in feedback_stats.py.
+    """
+
+    def setUp(self):
+        """
+        Set up for each test: a feedback log and stats snapshot in a temporary directory.
+        """
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.feedback_file = os.path.join(self.tmpdir.name, "feedback_log.jsonl")
+        self.stats_file = os.path.join(self.tmpdir.name, "feedback_stats.json")
+        self.stats = FeedbackStats(self.feedback_file, self.stats_file)
+
+    def append(self, helpful, day, function_choice="answer_question", prompt_style="general"):
+        entry = {"query": "q", "response": "r", "helpful": helpful, "timestamp": f"{day}T12:00:00",
+                 "function_choice": function_choice, "prompt_style": prompt_style}
+        with open(self.feedback_file, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        self.stats.catch_up()
+
+    def test_report_by_function_style_and_window(self):
+        """
+        Tests helpful-rates per function and style, over windows and all time.
+        """
+        self.append(True, "2026-10-18")
+        self.append(False, "2026-10-18", prompt_style="concise")
+        self.append(True, "2026-10-15", "summarize_text", "key_points")
+        self.append(True, "2026-09-01")
+        with open(self.feedback_file, "a") as f:
+            f.write(json.dumps({"query": "old", "response": "r", "helpful": False, "timestamp": "2026-10-18T09:00:00"}) + "\n")
+
+        report = self.stats.report(windows=[1, 7], today=date(2026, 10, 18))
+        self.assertEqual((report["1d"]["total"], report["1d"]["helpful"]), (3, 1))
+        self.assertEqual(report["1d"]["by_style"]["answer_question/concise"]["helpful_rate"], 0.0)
+        self.assertEqual(report["1d"]["by_function"]["unknown"]["total"], 1)
+        self.assertEqual(report["7d"]["by_function"]["summarize_text"]["helpful_rate"], 1.0)
+        self.assertEqual(report["all"]["by_function"]["answer_question"], {"total": 3, "helpful": 2, "helpful_rate": 0.6667})
+        print("test_report_by_function_style_and_window passed: Rates broken down correctly.")
+
+    def test_counters_are_incremental_and_snapshotted(self):
+        """
+        Tests that only new lines are read, and that a new process resumes from the snapshot.
+        """
+        self.append(True, "2026-10-18")
+        self.append(False, "2026-10-18")
+        with mock.patch.object(FeedbackStats, "_record", autospec=True, side_effect=FeedbackStats._record) as record:
+            self.stats.report()
+            self.assertEqual(record.call_count, 0)
+            restarted = FeedbackStats(self.feedback_file, self.stats_file)
+            self.assertEqual(restarted.report()["all"]["total"], 2)
+            self.assertEqual(record.call_count, 0)
+            self.append(True, "2026-10-18")
+            self.assertEqual(record.call_count, 1)
+        print("test_counters_are_incremental_and_snapshotted passed: No rescans of the log.")
+
+    def test_truncated_log_is_recounted(self):
+        """
+        Tests that counters are rebuilt when the feedback log is truncated or replaced.
+        """
+        self.append(True, "2026-10-18")
+        self.append(True, "2026-10-18")
+        open(self.feedback_file, "w").close()
+        self.append(False, "2026-10-17", "generate_creative_content", "poem_standard")
+        report = self.stats.report()
+        self.assertEqual((report["all"]["total"], report["all"]["helpful"]), (1, 0))
+        print("test_truncated_log_is_recounted passed: Counters follow a reset log.")
+
+    def test_stats_endpoint_and_feedback_fields(self):
+        """
+        Tests that /feedback records the function and style and /stats reports them.
+        """
+        import app as app_module
+        stats = FeedbackStats(self.feedback_file, self.stats_file)
+        with mock.patch("feedback.FEEDBACK_FILE", self.feedback_file), \
+             mock.patch("feedback.feedback_stats", stats), \
+             mock.patch.object(app_module, "feedback_stats", stats):
+            client = app_module.app.test_client()
+            response_id = app_module.response_store.save('Why?', 'Because.', 'answer_question', 'detailed')
+            client.post('/feedback', data={'response_id': response_id, 'helpful': 'yes'})
+            with open(self.feedback_file) as f:
+                entry = json.loads(f.readline())
+            self.assertEqual((entry["function_choice"], entry["prompt_style"]), ("answer_question", "detailed"))
+
+            report = client.get('/stats?windows=1,30').get_json()
+            self.assertEqual(set(report), {"1d", "30d", "all"})
+            self.assertEqual(report["1d"]["by_style"]["answer_question/detailed"]["helpful_rate"], 1.0)
+            self.assertEqual(client.get('/stats?windows=week').status_code, 400)
+        print("test_stats_endpoint_and_feedback_fields passed: /stats reports saved feedback.")
+
+
+if __name__ == '__main__':
+    unittest.main()
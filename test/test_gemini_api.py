@@ -0,0 +1,142 @@
+import unittest
+import os
+import threading
+from unittest import mock
+from google.api_core import exceptions as google_exceptions
+import gemini_api
+from gemini_api import ClientManager, GeminiRateLimitError, GeminiCircuitOpenError, GeminiBlockedError, GeminiEmptyResponseError
+from ratelimit import AdaptiveRateLimiter, CircuitBreaker
+
+def text_response(text):
+    part = mock.Mock(text=text)
+    return mock.Mock(candidates=[mock.Mock(content=mock.Mock(parts=[part]))])
+
+class TestClientManager(unittest.TestCase):
+    """
+    Unit tests for the shared Gemini client manager in gemini_api.py.
+    """
+
+    def test_model_reused_and_configured_once(self):
+        """
+        Tests that concurrent callers share one model per name and configure the SDK once.
+        """
+        manager = ClientManager()
+        with mock.patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key"}), \
+             mock.patch("gemini_api.genai.configure") as configure, \
+             mock.patch("gemini_api.genai.GenerativeModel", side_effect=lambda name: object()) as model_cls:
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(manager.get_model("m1"))) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            other = manager.get_model("m2")
+
+        self.assertEqual(len(set(map(id, results))), 1)
+        self.assertIsNot(other, results[0])
+        configure.assert_called_once_with(api_key="test-key")
+        self.assertEqual(model_cls.call_count, 2)
+        print("test_model_reused_and_configured_once passed: Models are pooled per name.")
+
+    def test_prewarm_skipped_without_key(self):
+        """
+        Tests that pre-warming is a no-op when no API key is configured.
+        """
+        manager = ClientManager()
+        with mock.patch.dict(os.environ, {}, clear=True), \
+             mock.patch("gemini_api.genai.GenerativeModel") as model_cls:
+            self.assertFalse(manager.prewarm())
+        model_cls.assert_not_called()
+        print("test_prewarm_skipped_without_key passed: Pre-warm skipped.")
+
+    def test_get_gemini_response_uses_shared_model(self):
+        """
+        Tests that get_gemini_response asks the client manager for the model.
+        """
+        model = mock.Mock()
+        model.generate_content.return_value = text_response("Hello")
+        with mock.patch.object(gemini_api.client_manager, "get_model", return_value=model) as get_model:
+            self.assertEqual(gemini_api.get_gemini_response("Say hello"), "Hello")
+        get_model.assert_called_once_with(gemini_api.MODEL_NAME)
+        print("test_get_gemini_response_uses_shared_model passed: Shared model used.")
+
+
+class TestResilientCalls(unittest.TestCase):
+    """
+    Unit tests for retries, rate limiting and the circuit breaker around the Gemini call.
+    """
+
+    def setUp(self):
+        """
+        Set up for each test: use a fresh limiter and breaker, a mock model and no real sleeping.
+        """
+        self.model = mock.Mock()
+        self.limiter = AdaptiveRateLimiter(6000)
+        self.breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=30)
+        self.sleep = mock.Mock()
+        for patcher in (mock.patch.object(gemini_api.client_manager, "get_model", return_value=self.model),
+                        mock.patch.object(gemini_api, "rate_limiter", self.limiter),
+                        mock.patch.object(gemini_api, "circuit_breaker", self.breaker),
+                        mock.patch("gemini_api.time.sleep", self.sleep)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_rate_limit_retried_with_retry_after(self):
+        """
+        Tests that a 429 is retried after at least the upstream's retry-after and slows the limiter.
+        """
+        self.model.generate_content.side_effect = [
+            google_exceptions.ResourceExhausted("Quota exceeded. Please retry in 7s."),
+            text_response("Recovered"),
+        ]
+        self.assertEqual(gemini_api.get_gemini_response("prompt"), "Recovered")
+        self.assertGreaterEqual(max(call.args[0] for call in self.sleep.call_args_list), 7)
+        self.assertEqual(self.limiter.stats()["rate_limited"], 1)
+        print("test_rate_limit_retried_with_retry_after passed: 429 retried.")
+
+    def test_long_retry_after_not_waited_out(self):
+        """
+        Tests that a 429 asking for a wait longer than the backoff cap is raised at once.
+        """
+        self.model.generate_content.side_effect = [google_exceptions.ResourceExhausted("Quota exceeded. Please retry in 60s.")]
+        with self.assertRaises(gemini_api.GeminiRateLimitError) as raised:
+            gemini_api.get_gemini_response("prompt")
+        self.assertEqual(raised.exception.retry_after, 60)
+        self.assertEqual(self.model.generate_content.call_count, 1)
+        self.sleep.assert_not_called()
+        print("test_long_retry_after_not_waited_out passed: Long retry-after raised at once.")
+
+    def test_typed_errors_and_circuit_breaker(self):
+        """
+        Tests that exhausted retries raise a typed error, and the open circuit then fails fast.
+        """
+        self.model.generate_content.side_effect = google_exceptions.ResourceExhausted("quota")
+        with mock.patch.object(gemini_api, "GEMINI_MAX_RETRIES", 1):
+            with self.assertRaises(GeminiRateLimitError) as raised:
+                gemini_api.get_gemini_response("prompt")
+            self.assertEqual(raised.exception.status_code, 503)
+            calls = self.model.generate_content.call_count
+
+            with self.assertRaises(GeminiCircuitOpenError):
+                gemini_api.get_gemini_response("prompt")
+        self.assertEqual(self.model.generate_content.call_count, calls)
+        print("test_typed_errors_and_circuit_breaker passed: Circuit fails fast.")
+
+    def test_blocked_and_empty_responses_not_retried(self):
+        """
+        Tests that blocked prompts and empty answers raise immediately without tripping the breaker.
+        """
+        self.model.generate_content.side_effect = gemini_api.genai.types.BlockedPromptException("unsafe")
+        with self.assertRaises(GeminiBlockedError):
+            gemini_api.get_gemini_response("prompt")
+        self.model.generate_content.side_effect = None
+        self.model.generate_content.return_value = mock.Mock(candidates=[])
+        with self.assertRaises(GeminiEmptyResponseError):
+            gemini_api.get_gemini_response("prompt")
+        self.assertEqual(self.model.generate_content.call_count, 2)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        print("test_blocked_and_empty_responses_not_retried passed: No retries for permanent errors.")
+
+
+if __name__ == '__main__':
+    unittest.main()
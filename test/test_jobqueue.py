@@ -0,0 +1,180 @@
+import unittest
+import os
+import shutil
+import signal
+import sqlite3
+import time
+import tempfile
+from unittest import mock
+import app as app_module
+import jobqueue
+from jobqueue import JobQueue, run_job, work
+from gemini_api import GeminiRateLimitError
+
+class TestJobQueue(unittest.TestCase):
+    """
+    Unit tests for the SQLite-backed background job queue in jobqueue.py.
+    """
+
+    def setUp(self):
+        """
+        Set up for each test: a queue in a temporary directory.
+        """
+        self.directory = tempfile.mkdtemp()
+        self.queue = JobQueue(os.path.join(self.directory, "jobs.sqlite3"), caps={"generate_creative_content": 1})
+
+    def tearDown(self):
+        """
+        Clean up after each test: remove the temporary directory.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_priorities_and_concurrency_caps(self):
+        """
+        Tests that higher priorities run first, that a function at its cap is skipped,
+        and that queued jobs report their place in the queue.
+        """
+        story = self.queue.enqueue("generate_creative_content", "story_structured", "A dragon")
+        essay = self.queue.enqueue("generate_creative_content", "essay_idea_structured", "Cities")
+        question = self.queue.enqueue("answer_question", "general", "What is SQLite?")
+        self.assertEqual(self.queue.get(essay)["position"], 3)
+
+        self.assertEqual(self.queue.claim("w1")["id"], question)
+        self.assertEqual(self.queue.claim("w2")["id"], story)
+        self.assertIsNone(self.queue.claim("w3")) # The essay waits for the story to finish
+        self.assertTrue(self.queue.complete(story, "w2", "Once upon a time"))
+        self.assertEqual(self.queue.claim("w3")["id"], essay)
+        stats = self.queue.stats()
+        self.assertEqual((stats["running"], stats["done"], stats["running_by_function"]),
+                         (2, 1, {"answer_question": 1, "generate_creative_content": 1}))
+        self.assertIsNone(self.queue.get("not-a-job-id"))
+        print("test_priorities_and_concurrency_caps passed: Jobs claimed in order within caps.")
+
+    def test_expired_lease_requeued(self):
+        """
+        Tests that a job whose worker stopped renewing is queued again, the stale worker's result is
+        ignored, and the job fails once it runs out of attempts.
+        """
+        queue = JobQueue(self.queue.path, lease_seconds=-1, max_attempts=2)
+        job_id = queue.enqueue("answer_question", "general", "What is a lease?")
+        queue.claim("crashed")
+        self.assertEqual(queue.claim("w2")["attempts"], 2)
+        self.assertFalse(queue.complete(job_id, "crashed", "Stale answer"))
+        self.assertIsNone(queue.claim("w3"))
+        job = queue.get(job_id)
+        self.assertEqual((job["status"], job["error_status"]), ("failed", 500))
+        print("test_expired_lease_requeued passed: Lost jobs retried, then failed.")
+
+    def test_lease_renewed_while_running(self):
+        """
+        Tests that a job running longer than its lease keeps it, so it is not claimed and run again.
+        """
+        queue = JobQueue(self.queue.path, lease_seconds=0.3)
+        job_id = queue.enqueue("answer_question", "general", "A slow question?")
+        claims = []
+
+        def slow_generate(*_):
+            time.sleep(1)
+            claims.append(queue.claim("w2"))
+            return "A slow answer."
+        with mock.patch("assistant.generate_response", side_effect=slow_generate):
+            run_job(queue, queue.claim("w1"), "w1")
+        self.assertEqual(claims, [None])
+        job = queue.get(job_id)
+        self.assertEqual((job["status"], job["attempts"], job["response"]), ("done", 1, "A slow answer."))
+        print("test_lease_renewed_while_running passed: Long job kept its lease.")
+
+    def test_worker_heartbeats(self):
+        """
+        Tests that workers count as alive while their heartbeat is recent, and not once they stop.
+        """
+        self.assertEqual(self.queue.workers_alive(), 0)
+        self.queue.heartbeat("w1")
+        self.queue.heartbeat("w2")
+        self.assertEqual(self.queue.stats()["workers"], 2)
+        work(self.queue, "w1", should_stop=lambda: True)
+        self.assertEqual(self.queue.workers_alive(), 1)
+        with mock.patch("jobqueue.time.time", return_value=time.time() + 60):
+            self.assertEqual(self.queue.workers_alive(), 0)
+        print("test_worker_heartbeats passed: Live workers counted.")
+
+    def test_worker_survives_database_errors(self):
+        """
+        Tests that a locked database is logged and retried instead of ending the worker.
+        """
+        job_id = self.queue.enqueue("answer_question", "general", "Still there?")
+        claim = self.queue.claim
+        with mock.patch.object(self.queue, "claim", side_effect=[sqlite3.OperationalError("database is locked"), claim("w1")]), \
+             mock.patch("jobqueue.log_event") as logged, \
+             mock.patch("assistant.generate_response", return_value="Yes."):
+            work(self.queue, "w1", should_stop=lambda: self.queue.claim.call_count == 2, poll_seconds=0)
+        self.assertIn("database is locked", logged.call_args_list[0].args[0])
+        self.assertEqual(self.queue.get(job_id)["response"], "Yes.")
+        self.assertEqual(self.queue.workers_alive(), 0)
+        print("test_worker_survives_database_errors passed: Worker carried on.")
+
+    def test_dead_workers_restarted(self):
+        """
+        Tests that run_workers restarts a worker process that exits, until it is stopped with SIGTERM.
+        """
+        starts = os.path.join(self.directory, "starts")
+
+        def crashing_worker(index):
+            with open(starts, "a") as f:
+                f.write(f"{index}\n")
+            with open(starts) as f:
+                if len(f.readlines()) < 3:
+                    os._exit(1)
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            os.kill(os.getppid(), signal.SIGTERM) # Stop the supervisor once the worker ran three times
+        self.addCleanup(signal.signal, signal.SIGTERM, signal.getsignal(signal.SIGTERM))
+        with mock.patch("jobqueue._worker_process", crashing_worker), mock.patch("jobqueue.log_event") as logged:
+            jobqueue.run_workers(1, restart_delay=0)
+        with open(starts) as f:
+            self.assertEqual(f.read().split(), ["0", "0", "0"])
+        self.assertEqual([call.kwargs["event"] for call in logged.call_args_list], ["job_worker_restart"] * 2)
+        print("test_dead_workers_restarted passed: Crashed workers restarted.")
+
+    def test_run_job_records_outcome(self):
+        """
+        Tests that a worker stores the response, or the user-facing message of a failed model call.
+        """
+        answered = self.queue.enqueue("answer_question", "general", "What is Python?")
+        failed = self.queue.enqueue("answer_question", "general", "Too busy?")
+        with mock.patch("assistant.generate_response", side_effect=["A language.", GeminiRateLimitError("429")]):
+            work(self.queue, "w1", should_stop=lambda: self.queue.stats()["queued"] == 0 and self.queue.stats()["running"] == 0,
+                 poll_seconds=0)
+        self.assertEqual(self.queue.get(answered)["response"], "A language.")
+        job = self.queue.get(failed)
+        self.assertEqual((job["status"], job["error_message"], job["error_status"]),
+                         ("failed", GeminiRateLimitError.user_message, 503))
+        print("test_run_job_records_outcome passed: Outcomes stored.")
+
+    def test_generate_in_background(self):
+        """
+        Tests that /generate queues a job and redirects to its page, which shows the result once done.
+        """
+        client = app_module.app.test_client()
+        with mock.patch("app.job_queue", self.queue), mock.patch("jobqueue.log_event") as logged:
+            page = client.post('/generate', data={'function_choice': 'generate_creative_content', 'prompt_style': 'story_structured',
+                                                  'user_input': 'A lighthouse', 'background': 'on'})
+            self.assertEqual(page.status_code, 303)
+            job_id = page.headers['Location'].rsplit('/', 1)[1]
+            self.assertIn("job_no_workers", [call.kwargs.get("event") for call in logged.call_args_list])
+            self.assertIn(b"queued (position 1)", client.get(f'/jobs/{job_id}').data)
+            self.assertIn(b"No background worker is running", client.get(f'/jobs/{job_id}').data)
+            self.assertEqual(client.get(f'/jobs/{job_id}/status').get_json()["status"], "queued")
+            self.queue.heartbeat("w1")
+            self.assertEqual(client.get(f'/jobs/{job_id}/status').get_json()["workers"], 1)
+
+            with mock.patch("assistant.generate_response", return_value="**The keeper** lit the lamp."):
+                run_job(self.queue, self.queue.claim("w1"), "w1")
+            result = client.get(f'/jobs/{job_id}')
+            self.assertIn(b"<strong>The keeper</strong>", result.data)
+            self.assertIn(b'name="response_id"', result.data)
+            self.assertEqual(client.get('/jobs/stats').get_json()["done"], 1)
+            self.assertEqual(client.get('/jobs/AAAAAAAAAAAAAAAA').status_code, 404)
+        print("test_generate_in_background passed: Job page polls, then shows the result.")
+
+if __name__ == '__main__':
+    unittest.main()
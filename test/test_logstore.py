@@ -0,0 +1,90 @@
+import unittest
+import os
+import shutil
+import tempfile
+from logstore import SegmentWriter, query_logs, read_index, export_text_log, build_record, parse_time, main
+from utils import BackgroundLogWriter
+
+class TestLogStore(unittest.TestCase):
+    """
+    Unit tests for the compressed, indexed log segments in logstore.py.
+    """
+
+    def setUp(self):
+        """
+        Set up for each test: create a temporary log directory.
+        """
+        self.log_dir = tempfile.mkdtemp()
+        self.stream_dir = os.path.join(self.log_dir, "logstore", "errors")
+
+    def tearDown(self):
+        """
+        Clean up after each test: remove the temporary log directory.
+        """
+        shutil.rmtree(self.log_dir, ignore_errors=True)
+
+    def test_log_writer_stores_structured_records(self):
+        """
+        Tests that logged lines become structured records with derived and explicit fields.
+        """
+        writer = BackgroundLogWriter(flush_interval=60, echo=False, log_format="structured")
+        error_file = os.path.join(self.log_dir, "errors.log")
+        writer.enqueue(error_file, "line\n", {"ts": 100.0, "message": "Gemini API call failed (attempt 1) for prompt: 'x...'. "
+                                                                   "GeminiRateLimitError: quota", "latency_ms": 12.5})
+        writer.shutdown()
+        self.assertFalse(os.path.exists(error_file)) # Structured only
+        [record] = query_logs(self.stream_dir)
+        self.assertEqual((record["level"], record["event"], record["error_code"], record["latency_ms"]),
+                         ("error", "upstream_error", "GeminiRateLimitError", 12.5))
+        self.assertEqual(read_index(self.stream_dir)[0]["codes"], ["GeminiRateLimitError"]) # Sealed at shutdown
+        print("test_log_writer_stores_structured_records passed: Structured records written.")
+
+    def test_index_skips_segments(self):
+        """
+        Tests that filters are applied and sealed segments the index rules out are not read.
+        """
+        writer = SegmentWriter(self.stream_dir)
+        for hour, code in enumerate(["GeminiRateLimitError", "GeminiUnavailableError", "GeminiRateLimitError"]):
+            writer.append([build_record("errors.log", {"ts": hour * 3600 + minute, "message": f"failure {minute}",
+                                                       "event": "upstream_error", "error_code": code})
+                           for minute in range(3)])
+            writer.seal()
+        stats = {}
+        records = list(query_logs(self.stream_dir, codes=["GeminiUnavailableError"], stats=stats))
+        self.assertEqual([record["ts"] for record in records], [3600, 3601, 3602])
+        self.assertEqual(stats, {"scanned": 1, "skipped": 2})
+        records = list(query_logs(self.stream_dir, since=7200, contains="failure 2", stats=stats))
+        self.assertEqual([record["ts"] for record in records], [7202])
+        self.assertEqual(stats["scanned"], 1)
+        print("test_index_skips_segments passed: Index prunes segments.")
+
+    def test_retention(self):
+        """
+        Tests that only the newest sealed segments are kept.
+        """
+        writer = SegmentWriter(self.stream_dir, retain_segments=2)
+        for index in range(4):
+            writer.append([build_record("errors.log", {"ts": float(index), "message": f"record {index}"})])
+            writer.seal()
+        self.assertEqual([record["message"] for record in query_logs(self.stream_dir)], ["record 2", "record 3"])
+        self.assertEqual(len(read_index(self.stream_dir)), 2)
+        print("test_retention passed: Old segments removed.")
+
+    def test_export_text_log_and_query_cli(self):
+        """
+        Tests converting a text log, including multi-line messages, and querying it from the CLI.
+        """
+        text_log = os.path.join(self.log_dir, "errors.log")
+        with open(text_log, "w") as f:
+            f.write("[2025-06-23 10:39:58] OpenAI API key is not set.\n"
+                    "[2025-06-23 10:48:06] Error calling OpenAI API: Error code: 429 - {'error':\n"
+                    "  'insufficient_quota'}\n")
+        self.assertEqual(export_text_log(text_log), 2)
+        [record] = query_logs(self.stream_dir, codes=["429"], since=parse_time("2025-06-23 10:40"))
+        self.assertTrue(record["message"].endswith("'insufficient_quota'}"))
+        self.assertEqual(main(["--data-dir", self.log_dir, "query", "--stream", "errors", "--event", "upstream_error"]), 0)
+        self.assertAlmostEqual(parse_time("2h", now=10000.0), 2800.0)
+        print("test_export_text_log_and_query_cli passed: Text logs exported.")
+
+if __name__ == '__main__':
+    unittest.main()
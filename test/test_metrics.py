@@ -0,0 +1,137 @@
+import unittest
+import os
+import time
+import tempfile
+from unittest import mock
+import metrics
+import gemini_api
+from metrics import Counter, Histogram, Registry, SamplingProfiler, RequestTimer, phase
+from ratelimit import AdaptiveRateLimiter, CircuitBreaker
+
+class TestMetricTypes(unittest.TestCase):
+    """
+    Unit tests for the counters, histograms and Prometheus rendering in metrics.py.
+    """
+
+    def test_render_counter_and_histogram(self):
+        """
+        Tests that labelled counters and cumulative histogram buckets render in the text format.
+        """
+        registry = Registry()
+        calls = registry.register(Counter("calls_total", "Calls.", ["kind"]))
+        latency = registry.register(Histogram("latency_seconds", "Latency.", ["route"], buckets=(0.1, 1.0)))
+        registry.register_collector(lambda: [("entries", "gauge", "Entries.", [({"cache": "memory"}, 3)])])
+        calls.inc(kind="a")
+        calls.inc(2, kind="a")
+        for value in (0.05, 0.5, 5.0):
+            latency.observe(value, route="generate")
+
+        text = registry.render()
+        self.assertIn("# TYPE calls_total counter", text)
+        self.assertIn('calls_total{kind="a"} 3', text)
+        self.assertIn('latency_seconds_bucket{route="generate",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{route="generate",le="1.0"} 2', text)
+        self.assertIn('latency_seconds_bucket{route="generate",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_count{route="generate"} 3', text)
+        self.assertIn('entries{cache="memory"} 3', text)
+        print("test_render_counter_and_histogram passed: Metrics rendered in Prometheus format.")
+
+    def test_phase_outside_request_is_noop(self):
+        """
+        Tests that phase() can be used outside an instrumented request.
+        """
+        with phase("log"):
+            pass
+        print("test_phase_outside_request_is_noop passed: No timer, no error.")
+
+class TestRequestInstrumentation(unittest.TestCase):
+    """
+    Tests for route timing, the /metrics endpoint and slow request profiles.
+    """
+
+    def setUp(self):
+        """
+        Set up for each test: a Flask test client and an empty response cache.
+        """
+        import app as app_module
+        self.app_module = app_module
+        app_module.response_cache.clear()
+        self.client = app_module.app.test_client()
+
+    def test_generate_phases_and_metrics_endpoint(self):
+        """
+        Tests that /generate records its phases and that /metrics exposes them.
+        """
+        before = metrics.REQUEST_PHASE_SECONDS.count(route="generate", phase="upstream")
+        with mock.patch('assistant.get_gemini_response', return_value="Timed **answer**."):
+            response = self.client.post('/generate', data={'function_choice': 'answer_question', 'prompt_style': 'general',
+                                                           'user_input': 'How long does this take?'})
+        self.assertEqual(response.status_code, 200)
+        for name in ("build_prompt", "upstream", "render_markdown", "render_template"):
+            self.assertGreaterEqual(metrics.REQUEST_PHASE_SECONDS.count(route="generate", phase=name), 1, name)
+        self.assertEqual(metrics.REQUEST_PHASE_SECONDS.count(route="generate", phase="upstream"), before + 1)
+
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('assistant_request_seconds_count{route="generate"}', text)
+        self.assertIn('assistant_request_phase_seconds_bucket{route="generate",phase="upstream",le="+Inf"}', text)
+        self.assertIn("assistant_cache_lookups_total", text)
+        self.assertIn("assistant_circuit_breaker_state", text)
+        print("test_generate_phases_and_metrics_endpoint passed: Phases timed and exported.")
+
+    def test_slow_request_writes_profile(self):
+        """
+        Tests that a request slower than PROFILE_SLOW_REQUEST_MS leaves a folded stack profile.
+        """
+        with tempfile.TemporaryDirectory() as directory, \
+             mock.patch.object(metrics, "profiler", SamplingProfiler(0.001)), \
+             mock.patch.object(metrics, "PROFILE_SLOW_REQUEST_MS", 10), \
+             mock.patch.object(metrics, "PROFILE_DIR", directory):
+            timer = RequestTimer("slow_route")
+            time.sleep(0.05)
+            timer.finish()
+            profiles = os.listdir(directory)
+            self.assertEqual(len(profiles), 1)
+            with open(os.path.join(directory, profiles[0]), encoding="utf-8") as f:
+                self.assertIn("test_slow_request_writes_profile", f.read())
+        self.assertEqual(metrics.PROFILES_WRITTEN.value(route="slow_route"), 1)
+        print("test_slow_request_writes_profile passed: Slow request profiled.")
+
+    def test_fast_request_writes_no_profile(self):
+        """
+        Tests that requests under the threshold are sampled but not written.
+        """
+        with mock.patch.object(metrics, "profiler", SamplingProfiler(0.001)), \
+             mock.patch.object(metrics, "PROFILE_SLOW_REQUEST_MS", 60000), \
+             mock.patch("metrics.write_profile") as mock_write:
+            RequestTimer("fast_route").finish()
+        mock_write.assert_not_called()
+        print("test_fast_request_writes_no_profile passed: Fast request not written.")
+
+class TestUpstreamMetrics(unittest.TestCase):
+    """
+    Tests for the upstream call latency, token and retry counters recorded in gemini_api.py.
+    """
+
+    def test_tokens_and_outcomes_counted(self):
+        """
+        Tests that usage metadata is counted and each attempt is timed by outcome.
+        """
+        model = mock.Mock()
+        part = mock.Mock(text="Counted")
+        model.generate_content.return_value = mock.Mock(
+            candidates=[mock.Mock(content=mock.Mock(parts=[part]))],
+            usage_metadata=mock.Mock(prompt_token_count=12, candidates_token_count=30))
+        prompt_tokens = metrics.UPSTREAM_TOKENS.value(kind="prompt")
+        response_tokens = metrics.UPSTREAM_TOKENS.value(kind="response")
+        calls = metrics.UPSTREAM_SECONDS.count(mode="generate", outcome="ok")
+        with mock.patch.object(gemini_api.client_manager, "get_model", return_value=model), \
+             mock.patch.object(gemini_api, "rate_limiter", AdaptiveRateLimiter(6000)), \
+             mock.patch.object(gemini_api, "circuit_breaker", CircuitBreaker()):
+            self.assertEqual(gemini_api.get_gemini_response("prompt"), "Counted")
+        self.assertEqual(metrics.UPSTREAM_TOKENS.value(kind="prompt"), prompt_tokens + 12)
+        self.assertEqual(metrics.UPSTREAM_TOKENS.value(kind="response"), response_tokens + 30)
+        self.assertEqual(metrics.UPSTREAM_SECONDS.count(mode="generate", outcome="ok"), calls + 1)
+        print("test_tokens_and_outcomes_counted passed: Upstream usage recorded.")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
 import unittest
-from prompts import get_question_answering_prompt, get_summarization_prompt, get_creative_content_prompt
+import os
+import json
+import tempfile
+from prompts import get_question_answering_prompt, get_summarization_prompt, get_creative_content_prompt, build_prompt
+from prompts import load_prompt_registry, PromptTemplateError, PROMPT_OPTIONS
 
 class TestPrompts(unittest.TestCase):
     """
@@ -124,6 +128,56 @@ class TestPrompts(unittest.TestCase):
         default_creative_prompt = get_creative_content_prompt(topic)
         self.assertIn(f"Write a short story about: {topic}", default_creative_prompt)
 
+    def test_build_prompt(self):
+        """
+        Tests that build_prompt dispatches on the function choice and splits creative styles.
+        """
+        self.assertEqual(build_prompt("answer_question", "concise", "Why?"), get_question_answering_prompt("Why?", "concise"))
+        self.assertEqual(build_prompt("summarize_text", "key_points", "Text"), get_summarization_prompt("Text", "key_points"))
+        self.assertEqual(build_prompt("generate_creative_content", "essay_idea_structured", "AI"),
+                         get_creative_content_prompt("AI", content_type="essay_idea", prompt_type="structured"))
+        self.assertEqual(build_prompt("unknown", "general", "Why?"), "")
+        self.assertEqual(build_prompt("answer_question", "unknown", "Why?"), "")
+        self.assertEqual(build_prompt("answer_question", "general", "What is {x}?"),
+                         "Answer the following question clearly and concisely: What is {x}?")
+
+    def test_prompt_options(self):
+        """
+        Tests that the input page options list every registered function and style.
+        """
+        functions = [function["value"] for function in PROMPT_OPTIONS]
+        self.assertEqual(functions, ["answer_question", "summarize_text", "generate_creative_content"])
+        for function in PROMPT_OPTIONS:
+            for style in function["styles"]:
+                self.assertTrue(build_prompt(function["value"], style["value"], "input"))
+        print("test_prompt_options passed: Options match the registry.")
+
+    def test_load_prompt_registry_validation(self):
+        """
+        Tests that a new style needs only a file entry, and that malformed templates are rejected at load.
+        """
+        def write(definitions):
+            path = os.path.join(self.tmpdir.name, "templates.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(definitions, f)
+            return path
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        function = {"label": "Answer", "fallback": "Answer: {input}",
+                    "styles": {"pirate": {"label": "Pirate", "template": "Answer like a pirate: {input}"}}}
+        registry, fallbacks, options = load_prompt_registry(write({"answer_question": function}))
+        self.assertEqual(registry[("answer_question", "pirate")](input="Why?"), "Answer like a pirate: Why?")
+        self.assertEqual(options[0]["styles"], [{"value": "pirate", "label": "Pirate"}])
+
+        for bad_template in ("No placeholder", "Uses {other}", "Unbalanced {input"):
+            function["styles"]["pirate"]["template"] = bad_template
+            with self.assertRaises(PromptTemplateError):
+                load_prompt_registry(write({"answer_question": function}))
+        with self.assertRaises(PromptTemplateError):
+            load_prompt_registry(write({"answer_question": {"fallback": "{input}", "styles": {}}}))
+        print("test_load_prompt_registry_validation passed: Registry validated at load.")
+
 
 if __name__ == '__main__':
     unittest.main()
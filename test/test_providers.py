@@ -0,0 +1,202 @@
+import unittest
+import os
+import json
+import time
+import asyncio
+import threading
+import importlib.util
+from unittest import mock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from providers import ModelRouter, Provider, StubProvider, OpenAICompatibleProvider, create_router_from_env
+from gemini_api import GeminiBlockedError, GeminiRateLimitError, GeminiCircuitOpenError
+from metrics import HEDGED_CALLS
+from cache import create_response_cache
+
+class FailingProvider(Provider):
+    def __init__(self, name, error):
+        self.name = name
+        self.error = error
+        self.calls = 0
+
+    def generate(self, prompt, max_output_tokens=None, history=None):
+        self.calls += 1
+        raise self.error
+
+class AnsweringProvider(Provider):
+    def __init__(self, name, text):
+        self.name = name
+        self.model = f"{name}-model"
+        self.text = text
+
+    def generate(self, prompt, max_output_tokens=None, history=None):
+        return self.text
+
+class TestModelRouter(unittest.TestCase):
+    """
+    Unit tests for provider ranking, failover and hedging in providers.py.
+    """
+
+    def test_prefers_the_fastest_provider(self):
+        """
+        Tests that once latencies are measured, calls go to the faster provider.
+        """
+        slow = StubProvider("slow", "slow answer", latency_seconds=0.03)
+        fast = StubProvider("fast", "fast answer")
+        router = ModelRouter([slow, fast], explore_rate=0)
+        first_answers = [router.generate("prompt") for _ in range(2)]
+        self.assertEqual(first_answers[0], "slow answer") # Unmeasured providers keep their configured order
+        self.assertEqual([router.generate("prompt") for _ in range(3)], ["fast answer"] * 3)
+        self.assertEqual([provider.name for provider in router.candidates()], ["fast", "slow"])
+        print("test_prefers_the_fastest_provider passed: Fastest provider chosen.")
+
+    def test_fails_over_on_rate_limit_and_cools_down(self):
+        """
+        Tests that a 429 fails over to the next provider and takes the failing one out of rotation.
+        """
+        limited = FailingProvider("limited", GeminiRateLimitError("429", retry_after=60))
+        backup = StubProvider("backup", "backup answer")
+        router = ModelRouter([limited, backup], failure_threshold=1, explore_rate=0)
+        self.assertEqual(router.generate("prompt"), "backup answer")
+        self.assertEqual(router.generate("prompt"), "backup answer")
+        self.assertEqual(limited.calls, 1)
+        self.assertEqual(router.stats()["providers"]["limited"]["circuit_breaker"]["state"], "open")
+        print("test_fails_over_on_rate_limit_and_cools_down passed: Failover and cooldown work.")
+
+    def test_blocked_prompt_is_not_failed_over(self):
+        """
+        Tests that a safety block is raised rather than sent to another provider.
+        """
+        router = ModelRouter([FailingProvider("strict", GeminiBlockedError("blocked")), StubProvider("lenient")], explore_rate=0)
+        with self.assertRaises(GeminiBlockedError):
+            router.generate("prompt")
+        print("test_blocked_prompt_is_not_failed_over passed: Blocked prompts not rerouted.")
+
+    def test_every_provider_cooling_down(self):
+        """
+        Tests that the router refuses calls while every provider is out of rotation.
+        """
+        router = ModelRouter([FailingProvider("a", GeminiRateLimitError("429")),
+                              FailingProvider("b", GeminiRateLimitError("429"))], failure_threshold=1, explore_rate=0)
+        with self.assertRaises(GeminiRateLimitError):
+            router.generate("prompt")
+        with self.assertRaises(GeminiCircuitOpenError) as raised:
+            router.generate("prompt")
+        self.assertGreater(raised.exception.retry_after, 0)
+        print("test_every_provider_cooling_down passed: Calls refused while all providers cool down.")
+
+    def test_hedges_slow_calls(self):
+        """
+        Tests that a call slower than the hedge delay is raced against the next provider.
+        """
+        router = ModelRouter([StubProvider("slow", "slow answer", latency_seconds=0.5),
+                              StubProvider("fast", "fast answer")], hedge_after=0.02, explore_rate=0)
+        hedges = HEDGED_CALLS.value(provider="fast")
+        started = time.perf_counter()
+        self.assertEqual(router.generate("prompt"), "fast answer")
+        self.assertLess(time.perf_counter() - started, 0.4)
+        self.assertEqual(HEDGED_CALLS.value(provider="fast"), hedges + 1)
+        print("test_hedges_slow_calls passed: Slow call hedged.")
+
+    def test_async_failover_and_hedge(self):
+        """
+        Tests the async path: failover on a 429, and a hedge winning over a slow provider.
+        """
+        async def run():
+            failover = ModelRouter([FailingProvider("limited", GeminiRateLimitError("429")),
+                                    StubProvider("backup", "backup answer")], explore_rate=0)
+            hedged = ModelRouter([StubProvider("slow", "slow answer", latency_seconds=5),
+                                  StubProvider("fast", "fast answer")], hedge_after=0.02, explore_rate=0)
+            started = time.perf_counter()
+            results = (await failover.generate_async("prompt"), await hedged.generate_async("prompt"))
+            return results, time.perf_counter() - started
+
+        (failover_answer, hedged_answer), elapsed = asyncio.run(run())
+        self.assertEqual((failover_answer, hedged_answer), ("backup answer", "fast answer"))
+        self.assertLess(elapsed, 1)
+        print("test_async_failover_and_hedge passed: Async routing works.")
+
+    def test_only_first_choice_answers_are_cached(self):
+        """
+        Tests that failover and stand-in answers are marked uncacheable, so the pipeline neither caches
+        them nor serves them later under the router's cache key.
+        """
+        import assistant
+        primary = AnsweringProvider("primary", "primary answer")
+        backup = AnsweringProvider("backup", "backup answer")
+        limited = FailingProvider("limited", GeminiRateLimitError("429"))
+        self.assertTrue(ModelRouter([primary, backup], explore_rate=0).generate("prompt").cacheable)
+        answer = ModelRouter([limited, backup], explore_rate=0).generate("prompt")
+        self.assertEqual((answer, answer.provider, answer.cacheable), ("backup answer", "backup", False))
+        self.assertFalse(ModelRouter([StubProvider("stub")], explore_rate=0).generate("prompt").cacheable)
+
+        router = ModelRouter([limited, backup], explore_rate=0)
+        self.assertEqual(router.cache_name, "router:limited/,backup/backup-model")
+        with mock.patch.object(assistant, "model_router", router), \
+             mock.patch.object(assistant, "response_cache", create_response_cache()), \
+             mock.patch.object(assistant, "semantic_cache", mock.Mock(lookup=mock.Mock(return_value=None))) as semantic:
+            self.assertEqual(assistant.generate_response("answer_question", "general", "What is 2 + 2?"), "backup answer")
+            self.assertEqual(assistant.response_cache.stats()["tier_sizes"]["memory"], 0)
+            semantic.add.assert_not_called()
+        print("test_only_first_choice_answers_are_cached passed: Failover answers not cached.")
+
+    def test_router_from_env(self):
+        """
+        Tests that Gemini alone needs no router, and that listed providers are built in order.
+        """
+        with mock.patch.dict(os.environ, {"MODEL_PROVIDERS": "gemini"}):
+            self.assertIsNone(create_router_from_env())
+        with mock.patch.dict(os.environ, {"MODEL_PROVIDERS": "gemini,stub", "MODEL_HEDGE_MS": "250"}):
+            router = create_router_from_env()
+        self.assertEqual([provider.name for provider in router.providers], ["gemini", "stub"])
+        self.assertEqual(router.hedge_after, 0.25)
+        with mock.patch.dict(os.environ, {"MODEL_PROVIDERS": "gemini,llama"}):
+            self.assertRaises(ValueError, create_router_from_env)
+        print("test_router_from_env passed: Router configured from the environment.")
+
+class _ChatCompletionsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if request["messages"][0]["content"] == "rate limit me":
+            status, body, headers = 429, {"error": {"message": "Too many requests", "type": "rate_limit"}}, {"Retry-After": "4"}
+        else:
+            status, headers = 200, {}
+            body = {"id": "1", "object": "chat.completion", "created": 0, "model": request["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": f"Echo: {request['messages'][0]['content']}"}}]}
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+@unittest.skipIf(importlib.util.find_spec("openai") is None, "the openai package is not installed")
+class TestOpenAICompatibleProvider(unittest.TestCase):
+    """
+    Tests for the OpenAI-compatible provider against a local chat completions endpoint.
+    """
+
+    def test_completion_and_rate_limit(self):
+        """
+        Tests that completions are returned and 429s are raised as GeminiRateLimitError with retry-after.
+        """
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _ChatCompletionsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        provider = OpenAICompatibleProvider(name="local", model="local-model",
+                                            base_url=f"http://127.0.0.1:{server.server_address[1]}/v1")
+        self.assertEqual(provider.generate("hello"), "Echo: hello")
+        self.assertEqual(asyncio.run(provider.generate_async("hi")), "Echo: hi")
+        with self.assertRaises(GeminiRateLimitError) as raised:
+            provider.generate("rate limit me")
+        self.assertEqual(raised.exception.retry_after, 4.0)
+        print("test_completion_and_rate_limit passed: OpenAI-compatible provider works.")
+
+if __name__ == '__main__':
+    unittest.main()
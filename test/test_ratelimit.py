@@ -0,0 +1,128 @@
+import unittest
+from unittest import mock
+from ratelimit import TokenBucket, AdaptiveRateLimiter, CircuitBreaker, backoff_delay
+
+class FakeClock:
+    """
+    Stand-in for time.monotonic that only moves when told to.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestRateLimit(unittest.TestCase):
+    """
+    Unit tests for the rate limiting helpers in ratelimit.py.
+    """
+
+    def setUp(self):
+        """
+        Set up for each test: freeze the monotonic clock.
+        """
+        self.clock = FakeClock()
+        patcher = mock.patch("ratelimit.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_token_bucket_refill(self):
+        """
+        Tests that tokens are consumed and refilled at the configured rate.
+        """
+        bucket = TokenBucket(rate_per_minute=60, capacity=2)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertAlmostEqual(bucket.try_acquire(), 1.0)
+        self.clock.now += 1.0
+        self.assertEqual(bucket.try_acquire(), 0)
+        self.assertFalse(bucket.acquire(1, timeout=0.5))
+        print("test_token_bucket_refill passed: Bucket refills at its rate.")
+
+    def test_adaptive_limiter_backs_off_and_recovers(self):
+        """
+        Tests that a 429 halves the request rate and honours retry-after, and successes restore it.
+        """
+        limiter = AdaptiveRateLimiter(requests_per_minute=100)
+        limiter.on_rate_limited(retry_after=10)
+        self.assertEqual(limiter.stats()["requests_per_minute"], 50)
+        self.assertFalse(limiter.acquire(timeout=5))
+        for _ in range(20):
+            limiter.on_success()
+        self.assertEqual(limiter.stats()["requests_per_minute"], 100)
+
+        for _ in range(10):
+            limiter.on_rate_limited()
+        self.assertEqual(limiter.stats()["requests_per_minute"], 10)
+        print("test_adaptive_limiter_backs_off_and_recovers passed: Rate adapts to 429s.")
+
+    def test_failed_token_acquire_refunds_request(self):
+        """
+        Tests that a call refused for lack of tokens does not use up a request slot.
+        """
+        limiter = AdaptiveRateLimiter(requests_per_minute=60, tokens_per_minute=600)
+        self.assertTrue(limiter.acquire(tokens=100, timeout=0))
+        self.clock.now += 1.0
+        self.assertFalse(limiter.acquire(tokens=100, timeout=0))
+        self.assertTrue(limiter.acquire(tokens=5, timeout=0.5))
+        print("test_failed_token_acquire_refunds_request passed: Request slot refunded.")
+
+    def test_circuit_breaker(self):
+        """
+        Tests that the circuit opens after consecutive failures, half-opens after the cooldown, and closes on success.
+        """
+        breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=30)
+        breaker.record_failure()
+        self.assertEqual(breaker.allow(), (True, 0.0))
+        breaker.record_failure()
+        allowed, retry_after = breaker.allow()
+        self.assertFalse(allowed)
+        self.assertEqual(retry_after, 30)
+
+        self.clock.now += 30
+        self.assertTrue(breaker.allow()[0])
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        breaker.record_failure(retry_after=60)
+        self.assertEqual(breaker.allow(), (False, 60))
+
+        self.clock.now += 60
+        breaker.allow()
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.stats()["rejected"], 2)
+        print("test_circuit_breaker passed: Breaker opens, half-opens and closes.")
+
+    def test_half_open_allows_one_probe(self):
+        """
+        Tests that a half-open circuit lets a single probe through until its outcome is known, and
+        replaces a probe that was released or never reported.
+        """
+        breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=30)
+        breaker.record_failure()
+        self.clock.now += 30
+        self.assertEqual(breaker.allow(), (True, 0.0))
+        self.assertEqual([breaker.allow()[0] for _ in range(3)], [False, False, False])
+        breaker.release_probe()
+        self.assertTrue(breaker.allow()[0])
+        self.assertFalse(breaker.allow()[0])
+
+        self.clock.now += 30
+        self.assertTrue(breaker.allow()[0])
+        breaker.record_success()
+        self.assertEqual([breaker.allow()[0] for _ in range(3)], [True, True, True])
+        print("test_half_open_allows_one_probe passed: One probe at a time.")
+
+    def test_backoff_delay(self):
+        """
+        Tests that backoff is jittered within the exponential bound and honours retry-after.
+        """
+        for attempt in range(6):
+            self.assertLessEqual(backoff_delay(attempt, base_seconds=1, max_seconds=10), min(10, 2 ** attempt))
+        self.assertGreaterEqual(backoff_delay(0, base_seconds=1, retry_after=7), 7)
+        self.assertLessEqual(backoff_delay(0, base_seconds=1, max_seconds=10, retry_after=60), 10)
+        print("test_backoff_delay passed: Backoff bounded and jittered.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from unittest import mock
+import rendering
+from rendering import sanitize_html, markdown_to_html, MarkdownRenderCache
+from streaming import IncrementalMarkdownRenderer
+
+class TestSanitizer(unittest.TestCase):
+    """
+    Unit tests for the HTML allowlist sanitizer in rendering.py.
+    """
+
+    def test_strips_scripts_handlers_and_unsafe_urls(self):
+        """
+        Tests that scripts, event handlers, unknown tags and javascript: links are removed.
+        """
+        dirty = ('<p onclick="steal()">Hi<script>alert(1)</script></p><img src=x onerror=alert(1)>'
+                 '<a href="java\tscript:alert(1)">x</a><a href="https://example.com" style="color:red">ok</a>'
+                 '<iframe src="https://evil.example"></iframe><div>kept text</div>')
+        clean = sanitize_html(dirty)
+        for fragment in ("script", "alert", "onclick", "onerror", "<img", "iframe", "style=", "<div"):
+            self.assertNotIn(fragment, clean)
+        self.assertIn('<a href="https://example.com" rel="nofollow noopener noreferrer">ok</a>', clean)
+        self.assertIn("kept text", clean)
+        print("test_strips_scripts_handlers_and_unsafe_urls passed: Unsafe HTML removed.")
+
+    def test_output_is_escaped_and_balanced(self):
+        """
+        Tests that text is re-escaped and unclosed tags are closed.
+        """
+        self.assertEqual(sanitize_html("<p><strong>1 &lt; 2 &amp; 3"), "<p><strong>1 &lt; 2 &amp; 3</strong></p>")
+        self.assertEqual(sanitize_html("<em>a</p>b</em>"), "<em>ab</em>")
+        print("test_output_is_escaped_and_balanced passed: Output well-formed.")
+
+class TestMarkdownRendering(unittest.TestCase):
+    """
+    Unit tests for Markdown conversion and the rendered HTML cache.
+    """
+
+    def test_markdown_features_and_raw_html(self):
+        """
+        Tests fenced code, tables and lists, and that raw HTML in a response is sanitized.
+        """
+        text = ("# Title\n\n```python\nprint('<b>')\n```\n\n| a | b |\n|:--|--:|\n| 1 | 2 |\n\n"
+                "1. one\n2. two\n\n<script>alert(1)</script>")
+        rendered = markdown_to_html(text)
+        self.assertIn("<h1>Title</h1>", rendered)
+        self.assertIn('<code class="language-python">print(\'&lt;b&gt;\')', rendered)
+        self.assertIn('<th align="left">a</th>', rendered)
+        self.assertIn("<li>two</li>", rendered)
+        self.assertNotIn("<script", rendered)
+        self.assertEqual(markdown_to_html("*again*"), "<p><em>again</em></p>") # The reused instance was reset
+        print("test_markdown_features_and_raw_html passed: Markdown rendered safely.")
+
+    def test_render_cache_converts_once(self):
+        """
+        Tests that the same response text is converted only once.
+        """
+        cache = MarkdownRenderCache(max_entries=10)
+        with mock.patch("rendering.markdown_to_html", wraps=rendering.markdown_to_html) as convert:
+            first = cache.render("**Cached** answer")
+            second = cache.render("**Cached** answer")
+            cache.render("Another answer")
+        self.assertEqual(first, second)
+        self.assertEqual(convert.call_count, 2)
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (1, 2))
+        print("test_render_cache_converts_once passed: Rendered HTML memoized.")
+
+    def test_streaming_renderer_sanitizes(self):
+        """
+        Tests that the incremental renderer sanitizes both completed blocks and the tail.
+        """
+        renderer = IncrementalMarkdownRenderer()
+        block_html, tail_html = renderer.feed('Intro <a href="javascript:alert(1)">link</a>\n\nTail <script>x()</script>')
+        self.assertEqual(block_html, '<p>Intro <a rel="nofollow noopener noreferrer">link</a></p>')
+        self.assertNotIn("script", tail_html + renderer.finish())
+        print("test_streaming_renderer_sanitizes passed: Streamed HTML sanitized.")
+
+if __name__ == '__main__':
+    unittest.main()
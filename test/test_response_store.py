@@ -0,0 +1,67 @@
+import unittest
+import re
+import tempfile
+from unittest import mock
+from response_store import create_response_store
+
+class TestResponseStore(unittest.TestCase):
+    """
+    Unit tests for the server-side response store in response_store.py.
+    """
+
+    def test_save_and_get(self):
+        """
+        Tests that a saved response is found by its id, and malformed or unknown ids are not.
+        """
+        store = create_response_store()
+        response_id = store.save("Why?", "Because.", "answer_question", "general")
+        self.assertRegex(response_id, r"^[A-Za-z0-9_-]{16}$")
+        record = store.get(response_id)
+        self.assertEqual((record["query"], record["response"], record["prompt_style"]), ("Why?", "Because.", "general"))
+        self.assertIsNone(store.get("A" * 16))
+        self.assertIsNone(store.get("../../etc/passwd"))
+        self.assertIsNone(store.get(None))
+        print("test_save_and_get passed: Responses resolved by id.")
+
+    def test_expiry_and_disk_tier(self):
+        """
+        Tests that records expire after the TTL, and that a disk tier shares ids between stores.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            writer = create_response_store(ttl_seconds=60, use_disk=True, directory=directory)
+            reader = create_response_store(ttl_seconds=60, use_disk=True, directory=directory)
+            response_id = writer.save("Why?", "Because.")
+            self.assertEqual(reader.get(response_id)["response"], "Because.")
+            with mock.patch("cache.time.time", return_value=writer.get(response_id)["created_at"] + 61):
+                self.assertIsNone(writer.get(response_id))
+        print("test_expiry_and_disk_tier passed: TTL and disk sharing work.")
+
+    def test_feedback_form_posts_only_the_id(self):
+        """
+        Tests that the result page posts just the response id, and feedback logs the stored text.
+        """
+        import app as app_module
+        app_module.response_cache.clear()
+        client = app_module.app.test_client()
+        with mock.patch('assistant.get_gemini_response', return_value="A long **creative** answer."), \
+             mock.patch('app.save_feedback_for_response', wraps=app_module.save_feedback_for_response), \
+             mock.patch('feedback.save_feedback') as mock_save:
+            page = client.post('/generate', data={'function_choice': 'answer_question', 'prompt_style': 'general',
+                                                  'user_input': 'Why?'}).get_data(as_text=True)
+            self.assertNotIn("A long **creative** answer.", page)
+            response_id = re.search(r'name="response_id" value="([^"]+)"', page).group(1)
+
+            response = client.post('/feedback', data={'response_id': response_id, 'helpful': 'yes',
+                                                      'response': 'Tampered text'})
+            self.assertEqual(response.status_code, 302)
+            args, kwargs = mock_save.call_args
+            self.assertEqual(args[:3], ("Why?", "A long **creative** answer.", True))
+            self.assertEqual(kwargs["response_id"], response_id)
+
+            self.assertEqual(client.post('/feedback', data={'response_id': 'unknown', 'helpful': 'yes'}).status_code, 404)
+        app_module.response_cache.clear()
+        print("test_feedback_form_posts_only_the_id passed: Feedback resolved server-side.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import unittest
+import os
+import tempfile
+from unittest import mock
+import semantic_cache as semantic_cache_module
+from semantic_cache import SemanticCache, VectorIndex, HashingEmbedder, parse_thresholds, calibrate, guard_terms
+
+# Labelled query pairs the hashing embedder's default threshold was measured on: one answer fits
+# both queries of a same pair and not the queries of a different pair.
+SAME_PAIRS = [
+    ("What is the capital of France?", "Tell me the capital of France, please"),
+    ("What is the capital of France?", "Capital of France?"),
+    ("Who wrote Hamlet?", "who wrote hamlet"),
+    ("How do I reverse a list in Python?", "how to reverse a list in python"),
+    ("Why is the sky blue?", "why is the sky blue?"),
+    ("Explain photosynthesis", "Please explain photosynthesis to me"),
+    ("What is the capital of France?", "what's the capital city of france"),
+    ("How far away is the Moon?", "How far is the moon away"),
+    ("What are the benefits of exercise?", "What is the benefit of exercise"),
+    ("What causes earthquakes?", "What causes an earthquake"),
+    ("How tall is Mount Everest", "height of Mount Everest"),
+]
+DIFFERENT_PAIRS = [
+    ("When did World War 2 end", "When did World War 1 end"),
+    ("sort dictionary by value", "sort dictionary by key"),
+    ("Is it safe to eat raw eggs", "Is it not safe to eat raw eggs"),
+    ("safe", "not safe"),
+    ("What is the capital of France?", "What is the capital of Germany?"),
+    ("How do I reverse a list in Python?", "How do I reverse a string in Python?"),
+    ("convert celsius to fahrenheit", "convert fahrenheit to celsius"),
+    ("Python 2 print syntax", "Python 3 print syntax"),
+    ("What is the population of Texas in 2020", "What is the population of Texas in 2010"),
+    ("How to install numpy on windows", "How to install numpy on mac"),
+    ("Who was the first president of the USA", "Who was the second president of the USA"),
+    ("benefits of coffee", "risks of coffee"),
+    ("Can dogs eat grapes", "Can cats eat grapes"),
+    ("largest planet in the solar system", "smallest planet in the solar system"),
+    ("Can I use a for loop here", "Can't I use a for loop here"),
+]
+
+class TestSemanticCache(unittest.TestCase):
+    """
+    Unit tests for the semantic response cache in semantic_cache.py.
+    """
+
+    def setUp(self):
+        """
+        Set up for each test: a cache persisted to a temporary directory.
+        """
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "semantic_cache.jsonl")
+        self.cache = SemanticCache(path=self.path)
+
+    def test_rephrased_question_hits(self):
+        """
+        Tests that a rephrased question is answered from the cache and a different one is not.
+        """
+        self.cache.add("answer_question", "general", "What is the capital of France?", "Paris.")
+        self.assertEqual(self.cache.lookup("answer_question", "general", "Tell me the capital of France, please"), "Paris.")
+        self.assertEqual(self.cache.lookup("answer_question", "general", "capital of france"), "Paris.")
+        self.assertIsNone(self.cache.lookup("answer_question", "general", "What is the capital of Germany?"))
+        self.assertIsNone(self.cache.lookup("answer_question", "detailed", "What is the capital of France?"))
+        self.assertEqual(self.cache.stats()["hits"], 2)
+        print("test_rephrased_question_hits passed: Rephrasings hit, other questions miss.")
+
+    def test_default_threshold_measured_on_pairs(self):
+        """
+        Tests that no different pair clears the default threshold, and that the near-duplicates do.
+        """
+        pairs = [(query, other, True) for query, other in SAME_PAIRS] + \
+                [(query, other, False) for query, other in DIFFERENT_PAIRS]
+        measured = calibrate(HashingEmbedder(), pairs)
+        self.assertLessEqual(measured["threshold"], SemanticCache(path=None).threshold_for("answer_question", "general"))
+        self.assertGreaterEqual(measured["recall"], 0.5)
+        print("test_default_threshold_measured_on_pairs passed: Threshold separates the labelled pairs.")
+
+    def test_numbers_and_negations_never_match(self):
+        """
+        Tests that queries differing in a number or a negation miss even when their embeddings are close.
+        """
+        self.assertEqual(guard_terms("Why don't cats eat 2 grapes?"), frozenset({"not", "2"}))
+        cache = SemanticCache(path=None, thresholds={"answer_question": 0.5})
+        cache.add("answer_question", "general", "When did World War 2 end", "1945.")
+        cache.add("answer_question", "general", "Is it safe to eat raw eggs", "Mostly.")
+        self.assertIsNone(cache.lookup("answer_question", "general", "When did World War 1 end"))
+        self.assertIsNone(cache.lookup("answer_question", "general", "Is it not safe to eat raw eggs"))
+        self.assertIsNone(cache.lookup("answer_question", "general", "Isn't it safe to eat raw eggs"))
+        self.assertEqual(cache.lookup("answer_question", "general", "when did world war 2 end?"), "1945.")
+        print("test_numbers_and_negations_never_match passed: Changed numbers and negations miss.")
+
+    def test_unavailable_model_keeps_cache_off(self):
+        """
+        Tests that a configured model that cannot be loaded, or has no measured thresholds, leaves the cache disabled.
+        """
+        environ = {"SEMANTIC_CACHE": "1", "SEMANTIC_CACHE_MODEL": "all-MiniLM-L6-v2",
+                   "SEMANTIC_CACHE_THRESHOLDS": "answer_question=0.85"}
+        with mock.patch.dict(os.environ, environ), \
+             mock.patch("semantic_cache.importlib.import_module", side_effect=ImportError("no module")):
+            self.assertFalse(semantic_cache_module.create_semantic_cache_from_env().enabled)
+        with mock.patch.dict(os.environ, dict(environ, SEMANTIC_CACHE_THRESHOLDS="")):
+            self.assertFalse(semantic_cache_module.create_semantic_cache_from_env().enabled)
+        with mock.patch.dict(os.environ, {"SEMANTIC_CACHE": "1", "SEMANTIC_CACHE_MODEL": "hashing"}):
+            self.assertTrue(semantic_cache_module.create_semantic_cache_from_env().enabled)
+        print("test_unavailable_model_keeps_cache_off passed: Cache off without a usable model.")
+
+    def test_thresholds_per_function_and_style(self):
+        """
+        Tests that style thresholds override function thresholds and unlisted functions are not cached.
+        """
+        cache = SemanticCache(path=None, thresholds=parse_thresholds("answer_question=0.8, answer_question:concise=1.01"))
+        self.assertEqual(cache.threshold_for("answer_question", "general"), 0.8)
+        cache.add("answer_question", "concise", "Capital of France?", "Paris.")
+        self.assertIsNone(cache.lookup("answer_question", "concise", "Capital of France?"))
+        cache.add("generate_creative_content", "poem_standard", "the sea", "A poem.")
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertIsNone(cache.lookup("generate_creative_content", "poem_standard", "the sea"))
+        print("test_thresholds_per_function_and_style passed: Thresholds resolved per style.")
+
+    def test_persistence_and_expiry(self):
+        """
+        Tests that entries survive a reload and expired entries are dropped.
+        """
+        self.cache.add("answer_question", "general", "How far away is the Moon?", "About 384,400 km.")
+        reloaded = SemanticCache(path=self.path)
+        self.assertEqual(reloaded.lookup("answer_question", "general", "how far away is the moon"), "About 384,400 km.")
+
+        with mock.patch("semantic_cache.time.time", return_value=os.path.getmtime(self.path) + 8 * 24 * 3600):
+            expired = SemanticCache(path=self.path)
+        self.assertEqual(expired.stats()["entries"], 0)
+        print("test_persistence_and_expiry passed: Cache reloads from data file.")
+
+    def test_lru_eviction_and_compaction(self):
+        """
+        Tests that the least recently used entry is evicted and the file is compacted to live entries.
+        """
+        cache = SemanticCache(path=self.path, max_entries=2)
+        cache.add("answer_question", "general", "Who wrote Hamlet?", "Shakespeare.")
+        cache.add("answer_question", "general", "How tall is Everest?", "8,849 m.")
+        cache.lookup("answer_question", "general", "Who wrote Hamlet?")
+        cache.add("answer_question", "general", "Why is the sky blue?", "Rayleigh scattering.")
+        self.assertIsNone(cache.lookup("answer_question", "general", "How tall is Everest?"))
+        self.assertEqual(cache.lookup("answer_question", "general", "Who wrote Hamlet?"), "Shakespeare.")
+
+        for index in range(4):
+            cache.add("answer_question", "general", f"Question number {index} about volcanoes", "Answer.")
+        with open(self.path, encoding="utf-8") as f:
+            self.assertLessEqual(sum(1 for _ in f), 5)
+        self.assertEqual(SemanticCache(path=self.path, max_entries=2).stats()["entries"], 2)
+        print("test_lru_eviction_and_compaction passed: Eviction and compaction work.")
+
+    def test_workers_share_the_file(self):
+        """
+        Tests that compacting in one process keeps the entries another process appended to the same file.
+        """
+        first = SemanticCache(path=self.path, max_entries=3)
+        second = SemanticCache(path=self.path, max_entries=3)
+        first.add("answer_question", "general", "Who painted the Mona Lisa?", "Leonardo da Vinci.")
+        for _ in range(7): # The seventh line the second cache appends compacts the file
+            second.add("answer_question", "general", "How do glaciers move?", "Under their own weight.")
+        with open(self.path, encoding="utf-8") as f:
+            self.assertEqual(sum(1 for _ in f), 3)
+        self.assertEqual(second.lookup("answer_question", "general", "Who painted the Mona Lisa?"), "Leonardo da Vinci.")
+        reloaded = SemanticCache(path=self.path, max_entries=3)
+        self.assertEqual(reloaded.lookup("answer_question", "general", "who painted the mona lisa"), "Leonardo da Vinci.")
+        self.assertEqual(reloaded.stats()["entries"], 2)
+        self.assertFalse([name for name in os.listdir(os.path.dirname(self.path)) if name.endswith(".tmp")])
+        print("test_workers_share_the_file passed: Compaction kept other processes' entries.")
+
+    def test_index_without_numpy(self):
+        """
+        Tests that the pure Python index returns the same nearest neighbour as the NumPy one.
+        """
+        embedder = HashingEmbedder()
+        queries = ["capital of France", "boiling point of water", "speed of light"]
+        probe = embedder.embed("what is the speed of light in vacuum")
+        results = []
+        for backend in (semantic_cache_module.np, None):
+            with mock.patch.object(semantic_cache_module, "np", backend):
+                index = VectorIndex(embedder.dimensions)
+                for query in queries:
+                    index.add(query, embedder.embed(query))
+                index.remove("capital of France")
+                results.append(index.search(probe))
+        self.assertEqual(results[0][0], "speed of light")
+        self.assertEqual(results[1][0], "speed of light")
+        self.assertAlmostEqual(results[0][1], results[1][1], places=5)
+        print("test_index_without_numpy passed: Both index backends agree.")
+
+    def test_generate_response_uses_semantic_cache(self):
+        """
+        Tests that a rephrased question skips the model call in the shared response pipeline.
+        """
+        import assistant
+        assistant.response_cache.clear()
+        with mock.patch.object(assistant, "semantic_cache", SemanticCache(path=None)), \
+             mock.patch.object(assistant, "get_gemini_response", return_value="Paris.") as mock_gemini:
+            self.assertEqual(assistant.generate_response("answer_question", "general", "What is the capital of France?"), "Paris.")
+            self.assertEqual(assistant.generate_response("answer_question", "general", "Capital of France?"), "Paris.")
+        mock_gemini.assert_called_once()
+        assistant.response_cache.clear()
+        print("test_generate_response_uses_semantic_cache passed: Rephrased query served from cache.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import shutil
+import tempfile
+from unittest import mock
+import app as app_module
+from sessions import create_conversation_store, SUMMARY_ACKNOWLEDGEMENT
+from response_store import response_store
+from gemini_api import _contents
+
+class TestConversationStore(unittest.TestCase):
+    """
+    Unit tests for multi-turn sessions and history compaction in sessions.py.
+    """
+
+    def setUp(self):
+        """
+        Set up for each test: record the model calls made by the store.
+        """
+        self.calls = []
+
+    def generate(self, prompt, history):
+        self.calls.append((prompt, history))
+        return "Summary of old turns." if history is None else f"Answer {len(self.calls)}"
+
+    def test_history_sent_and_compacted(self):
+        """
+        Tests that each turn is sent with the earlier ones, and that old turns are summarized once
+        the history outgrows its budget while the recent turns are kept verbatim.
+        """
+        store = create_conversation_store(max_history_tokens=60, keep_turns=2)
+        session = store.start()
+        store.reply(session, "First question", self.generate)
+        store.reply(session, "Second question", self.generate)
+        self.assertEqual(self.calls[1][1], [{"role": "user", "text": "First question"},
+                                            {"role": "model", "text": "Answer 1"}])
+
+        store.reply(session, "A much longer third question " * 10, self.generate)
+        compaction_prompt, compaction_history = self.calls[2]
+        self.assertIsNone(compaction_history)
+        self.assertIn("User: First question", compaction_prompt)
+        _prompt, history = self.calls[3]
+        self.assertEqual([turn["text"] for turn in history[1:]], [SUMMARY_ACKNOWLEDGEMENT, "Second question", "Answer 2"])
+        self.assertIn("Summary of old turns.", history[0]["text"])
+        self.assertEqual(len(store.get(session["id"])["turns"]), 4)
+        self.assertEqual(store.stats()["compactions"], 1)
+        print("test_history_sent_and_compacted passed: History bounded by compaction.")
+
+    def test_lru_eviction_and_disk_tier(self):
+        """
+        Tests that the least recently used session is evicted from memory, and that with the disk tier
+        another process's store sees every turn added since it last read the session.
+        """
+        store = create_conversation_store(max_sessions=2)
+        first, _second, _third = store.start(), store.start(), store.start()
+        self.assertIsNone(store.get(first["id"]))
+        self.assertIsNone(store.get("not-a-session-id"))
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        worker_a, worker_b = (create_conversation_store(use_disk=True, directory=directory) for _ in range(2))
+        session = worker_a.start()
+        worker_b.reply(worker_b.get(session["id"]), "First question", lambda prompt, history: "Answer 1")
+        worker_a.reply(worker_a.get(session["id"]), "Second question", lambda prompt, history: "Answer 2")
+        self.assertEqual([turn["text"] for turn in worker_b.get(session["id"])["turns"]],
+                         ["First question", "Answer 1", "Second question", "Answer 2"])
+        print("test_lru_eviction_and_disk_tier passed: Sessions evicted and shared on disk.")
+
+    def test_gemini_contents_for_history(self):
+        """
+        Tests that a conversation is sent to Gemini as alternating role turns ending with the prompt.
+        """
+        self.assertEqual(_contents("Hi", None), "Hi")
+        self.assertEqual(_contents("Next", [{"role": "user", "text": "Q"}, {"role": "model", "text": "A"}]),
+                         [{"role": "user", "parts": ["Q"]}, {"role": "model", "parts": ["A"]}, {"role": "user", "parts": ["Next"]}])
+        print("test_gemini_contents_for_history passed: History converted.")
+
+    def test_follow_up_route(self):
+        """
+        Tests that a follow-up to a stored response starts a session seeded with that exchange,
+        and that the next follow-up continues it.
+        """
+        client = app_module.app.test_client()
+        response_id = response_store.save("What is Python?", "A programming language.", "answer_question", "concise")
+        with mock.patch("assistant.get_gemini_response", return_value="It was created by Guido van Rossum.") as gemini:
+            page = client.post('/follow_up', data={'response_id': response_id, 'user_input': 'Who created it?'})
+            self.assertEqual(page.status_code, 200)
+            self.assertIn(b"Guido van Rossum", page.data)
+            session_id = page.data.decode().split('name="session_id" value="')[1].split('"')[0]
+            history = gemini.call_args.kwargs["history"]
+            self.assertIn("What is Python?", history[0]["text"])
+            self.assertEqual(history[1]["text"], "A programming language.")
+
+            client.post('/follow_up', data={'session_id': session_id, 'user_input': 'When?'})
+            self.assertEqual(len(gemini.call_args.kwargs["history"]), 4)
+        self.assertEqual(client.post('/follow_up', data={'user_input': 'Hello?'}).status_code, 404)
+        print("test_follow_up_route passed: Follow-ups continue the conversation.")
+
+if __name__ == '__main__':
+    unittest.main()
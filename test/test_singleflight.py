@@ -0,0 +1,103 @@
+import unittest
+import time
+import asyncio
+import threading
+from unittest import mock
+from singleflight import SingleFlight
+
+class TestSingleFlight(unittest.TestCase):
+    """
+    Unit tests for request coalescing in singleflight.py.
+    """
+
+    def test_identical_concurrent_calls_coalesced(self):
+        """
+        Tests that threads calling with the same key share one execution and its result.
+        """
+        single_flight = SingleFlight()
+        release = threading.Event()
+        upstream = mock.Mock(side_effect=lambda: release.wait() and "answer")
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(single_flight.do("key", upstream))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while single_flight.stats()["coalesced"] < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["answer"] * 5)
+        self.assertEqual(upstream.call_count, 1)
+        self.assertEqual(single_flight.stats(), {"executed": 1, "coalesced": 4, "coalesced_rate": 0.8, "in_flight": 0})
+        print("test_identical_concurrent_calls_coalesced passed: One upstream call for five requests.")
+
+    def test_sequential_and_distinct_calls_not_coalesced(self):
+        """
+        Tests that completed calls are forgotten and different keys run separately.
+        """
+        single_flight = SingleFlight()
+        self.assertEqual(single_flight.do("a", lambda: 1), 1)
+        self.assertEqual(single_flight.do("a", lambda: 2), 2)
+        self.assertEqual(single_flight.do("b", lambda: 3), 3)
+        self.assertEqual(single_flight.stats()["executed"], 3)
+        self.assertEqual(single_flight.stats()["coalesced"], 0)
+        print("test_sequential_and_distinct_calls_not_coalesced passed: Keys are independent.")
+
+    def test_async_calls_coalesced_and_errors_shared(self):
+        """
+        Tests that concurrent coroutines share one call, including its exception.
+        """
+        single_flight = SingleFlight()
+        calls = 0
+
+        async def upstream():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("quota")
+
+        async def run():
+            results = await asyncio.gather(*[single_flight.do_async("key", upstream) for _ in range(4)])
+            errors = await asyncio.gather(*[single_flight.do_async("bad", failing) for _ in range(3)], return_exceptions=True)
+            return results, errors
+
+        results, errors = asyncio.run(run())
+        self.assertEqual(results, ["answer"] * 4)
+        self.assertEqual(calls, 1)
+        self.assertTrue(all(isinstance(error, ValueError) for error in errors))
+        self.assertEqual(single_flight.stats()["coalesced"], 5)
+        print("test_async_calls_coalesced_and_errors_shared passed: Async calls coalesced.")
+
+    def test_cancelled_leader_handed_over(self):
+        """
+        Tests that when the leader is cancelled, a waiter runs the call again and all waiters get its result.
+        """
+        single_flight = SingleFlight()
+        calls = 0
+
+        async def upstream():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return f"answer {calls}"
+
+        async def run():
+            leader = asyncio.create_task(single_flight.do_async("key", upstream))
+            await asyncio.sleep(0)
+            waiters = [asyncio.create_task(single_flight.do_async("key", upstream)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await asyncio.gather(*waiters)
+
+        self.assertEqual(asyncio.run(run()), ["answer 2"] * 3)
+        self.assertEqual(single_flight.stats(), {"executed": 2, "coalesced": 2, "coalesced_rate": 0.5, "in_flight": 0})
+        print("test_cancelled_leader_handed_over passed: Waiter took over the cancelled call.")
+
+
+if __name__ == '__main__':
+    unittest.main()
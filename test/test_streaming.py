@@ -0,0 +1,88 @@
+import unittest
+import json
+from unittest import mock
+import app as app_module
+from assistant import CACHE_MODEL_NAME
+from metrics import REQUEST_PHASE_SECONDS
+from streaming import IncrementalMarkdownRenderer, sse_event
+
+def parse_events(body):
+    """
+    Splits a Server-Sent Events body into (event, data) tuples.
+    """
+    events = []
+    for message in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in message.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+class TestStreaming(unittest.TestCase):
+    """
+    Unit tests for incremental rendering and the /generate/stream endpoint.
+    """
+
+    def test_renderer_commits_completed_blocks_once(self):
+        """
+        Tests that completed paragraphs are emitted as blocks and the tail is provisional.
+        """
+        renderer = IncrementalMarkdownRenderer()
+        block, tail = renderer.feed("# Title\n\nFirst para")
+        self.assertEqual(block, "<h1>Title</h1>")
+        self.assertEqual(tail, "<p>First para</p>")
+        block, tail = renderer.feed("graph.\n\n")
+        self.assertEqual(block, "")
+        self.assertEqual(tail, "<p>First paragraph.</p>")
+        self.assertEqual(renderer.feed("Second")[0], "<p>First paragraph.</p>")
+        self.assertEqual(renderer.finish(), "<p>Second</p>")
+        print("test_renderer_commits_completed_blocks_once passed: Blocks committed incrementally.")
+
+    def test_renderer_keeps_code_fences_and_lists_together(self):
+        """
+        Tests that blank lines inside code fences or loose lists do not split the block.
+        """
+        renderer = IncrementalMarkdownRenderer()
+        self.assertEqual(renderer.feed("```\na = 1\n\nb = 2\n")[0], "")
+        block, _tail = renderer.feed("```\n\n- one\n\n- two\n\nDone")
+        self.assertIn("a = 1", block)
+        self.assertIn("b = 2", block)
+        self.assertEqual(block.count("<ul>"), 1)
+        self.assertEqual(renderer.finish(), "<p>Done</p>")
+        print("test_renderer_keeps_code_fences_and_lists_together passed: Fences kept whole.")
+
+    def test_generate_stream_endpoint(self):
+        """
+        Tests that the stream endpoint emits rendered blocks and, at the end, the id of the stored raw text.
+        """
+        app_module.app.testing = True
+        app_module.response_cache.clear()
+        client = app_module.app.test_client()
+        upstream_before = REQUEST_PHASE_SECONDS.count(route='generate_stream', phase='upstream')
+        with mock.patch('app.stream_gemini_response', return_value=iter(["Once upon", " a time.\n\nThe end."])):
+            response = client.post('/generate/stream', data={
+                'function_choice': 'generate_creative_content',
+                'prompt_style': 'story_structured',
+                'user_input': 'a brave knight'
+            })
+            self.assertEqual(response.mimetype, 'text/event-stream')
+            events = parse_events(response.get_data(as_text=True))
+
+        blocks = "".join(data['html'] for event, data in events if event == 'block')
+        self.assertEqual(blocks, "<p>Once upon a time.</p><p>The end.</p>")
+        event, data = events[-1]
+        self.assertEqual(event, 'done')
+        self.assertEqual(app_module.response_store.get(data['response_id'])['response'], "Once upon a time.\n\nThe end.")
+        self.assertEqual(REQUEST_PHASE_SECONDS.count(route='generate_stream', phase='upstream'), upstream_before + 1)
+        prompt = app_module.build_request_prompt('generate_creative_content', 'story_structured', 'a brave knight')
+        self.assertEqual(app_module.response_cache.get(prompt, CACHE_MODEL_NAME), "Once upon a time.\n\nThe end.")
+        print("test_generate_stream_endpoint passed: Stream endpoint works with mock.")
+
+    def test_sse_event_format(self):
+        """
+        Tests the Server-Sent Event wire format.
+        """
+        self.assertEqual(sse_event("done", {"a": 1}), 'event: done\ndata: {"a": 1}\n\n')
+        print("test_sse_event_format passed: SSE formatted.")
+
+
+if __name__ == '__main__':
+    unittest.main()
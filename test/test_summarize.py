@@ -0,0 +1,105 @@
+import unittest
+import asyncio
+import threading
+from cache import create_response_cache
+from prompts import build_prompt
+from gemini_api import estimate_tokens
+from summarize import split_into_chunks, needs_chunking, chunk_summary_prompt, build_long_summary_prompt, build_long_summary_prompt_async
+
+def make_document(paragraphs=40, edited=None):
+    """
+    Builds a document of distinct paragraphs, optionally rewording one of them.
+    """
+    document = []
+    for index in range(paragraphs):
+        text = f"Paragraph {index} discusses topic {index} at some length. " * 8
+        if index == edited:
+            text = "This paragraph was rewritten by the author. " * 8
+        document.append(text.strip())
+    return "\n\n".join(document)
+
+class TestSummarize(unittest.TestCase):
+    """
+    Unit tests for the map-reduce summarization pipeline in summarize.py.
+    """
+
+    def setUp(self):
+        """
+        Set up for each test: a fresh response cache in front of a fake model that records its prompts.
+        """
+        self.cache = create_response_cache()
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def fake_model(self, prompt):
+        with self.lock:
+            self.prompts.append(prompt)
+        return f"summary {len(self.prompts)}"
+
+    def generate(self, prompt):
+        return self.cache.get_or_generate(prompt, "test-model", self.fake_model)
+
+    def test_split_into_chunks(self):
+        """
+        Tests that chunks respect the token bound and keep every paragraph in order.
+        """
+        document = make_document()
+        chunks = split_into_chunks(document, max_chunk_tokens=300)
+        self.assertGreater(len(chunks), 5)
+        self.assertTrue(all(estimate_tokens(chunk) <= 300 for chunk in chunks))
+        self.assertEqual("\n\n".join(chunks), document)
+
+        oversized = "One long sentence without paragraphs. " * 200
+        self.assertTrue(all(estimate_tokens(chunk) <= 300 for chunk in split_into_chunks(oversized, max_chunk_tokens=300)))
+        print("test_split_into_chunks passed: Chunks are bounded and ordered.")
+
+    def test_short_text_uses_single_prompt(self):
+        """
+        Tests that a document under the bound gets the normal prompt and no map calls.
+        """
+        self.assertFalse(needs_chunking("Short text", max_chunk_tokens=300))
+        prompt = build_long_summary_prompt("Short text", "key_points", self.generate, max_chunk_tokens=300)
+        self.assertEqual(prompt, build_prompt("summarize_text", "key_points", "Short text"))
+        self.assertEqual(self.prompts, [])
+        self.assertEqual(build_long_summary_prompt("Short text", "unknown", self.generate), "")
+        print("test_short_text_uses_single_prompt passed: Short input is not chunked.")
+
+    def test_map_reduce_reuses_unchanged_chunks(self):
+        """
+        Tests that chunks are summarized into a styled reduce prompt, and that an edit only re-summarizes changed chunks.
+        """
+        document = make_document()
+        chunks = split_into_chunks(document, max_chunk_tokens=300)
+        prompt = build_long_summary_prompt(document, "very_short", self.generate, max_chunk_tokens=300)
+        self.assertEqual(len(self.prompts), len(chunks))
+        self.assertTrue(prompt.startswith("Provide a very brief, one-paragraph summary"))
+        self.assertIn("summary 1", prompt)
+
+        self.prompts.clear()
+        edited = make_document(edited=20)
+        edited_chunks = split_into_chunks(edited, max_chunk_tokens=300)
+        build_long_summary_prompt(edited, "very_short", self.generate, max_chunk_tokens=300)
+        changed = [chunk for chunk in edited_chunks if chunk not in chunks]
+        self.assertEqual(sorted(self.prompts), sorted(chunk_summary_prompt(chunk) for chunk in changed))
+        self.assertLessEqual(len(changed), 2)
+        print("test_map_reduce_reuses_unchanged_chunks passed: Only edited chunks are recomputed.")
+
+    def test_async_map_reduce(self):
+        """
+        Tests that the async pipeline builds the same reduce prompt as the threaded one.
+        """
+        async def generate_async(prompt):
+            return f"summary of {len(prompt)} chars"
+
+        def generate(prompt):
+            return f"summary of {len(prompt)} chars"
+
+        document = make_document()
+        expected = build_long_summary_prompt(document, "standard", generate, max_chunk_tokens=300)
+        result = asyncio.run(build_long_summary_prompt_async(document, "standard", generate_async, max_chunk_tokens=300))
+        self.assertEqual(result, expected)
+        print("test_async_map_reduce passed: Async and threaded pipelines agree.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+from utils import BackgroundLogWriter, log_event, flush_logs
+
+class TestBackgroundLogWriter(unittest.TestCase):
+    """
+    Unit tests for the background log writer in utils.py.
+    """
+
+    def setUp(self):
+        """
+        Set up for each test: create a temporary log directory.
+        """
+        self.log_dir = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.log_dir, "logs.txt")
+        self.error_file = os.path.join(self.log_dir, "errors.log")
+
+    def tearDown(self):
+        """
+        Clean up after each test: remove the temporary log directory.
+        """
+        shutil.rmtree(self.log_dir, ignore_errors=True)
+
+    def test_records_written_in_order_per_file(self):
+        """
+        Tests that queued records reach their own files, in order, after a flush.
+        """
+        writer = BackgroundLogWriter(flush_interval=60, echo=False)
+        for index in range(5):
+            writer.enqueue(self.log_file, f"line {index}\n")
+        writer.enqueue(self.error_file, "error\n")
+        writer.flush()
+
+        with open(self.log_file) as f:
+            self.assertEqual(f.read(), "".join(f"line {index}\n" for index in range(5)))
+        with open(self.error_file) as f:
+            self.assertEqual(f.read(), "error\n")
+        writer.shutdown()
+        print("test_records_written_in_order_per_file passed: Records flushed per file.")
+
+    def test_batch_written_with_single_write(self):
+        """
+        Tests that a batch of records for one file is written with one file open.
+        """
+        writer = BackgroundLogWriter(flush_interval=60, echo=False)
+        real_open = open
+        with mock.patch("builtins.open", side_effect=real_open) as open_mock:
+            for index in range(20):
+                writer.enqueue(self.log_file, f"line {index}\n")
+            writer.flush()
+        opens = [call for call in open_mock.call_args_list if call.args and call.args[0] == self.log_file]
+        self.assertEqual(len(opens), 1)
+        writer.shutdown()
+        print("test_batch_written_with_single_write passed: Batch coalesced.")
+
+    def test_rotation(self):
+        """
+        Tests that a file past max_bytes is rotated and old backups are shifted.
+        """
+        writer = BackgroundLogWriter(flush_interval=60, max_bytes=10, backup_count=2, echo=False)
+        for batch in ("first batch\n", "second batch\n", "third batch\n"):
+            writer.enqueue(self.log_file, batch)
+            writer.flush()
+        writer.shutdown()
+
+        with open(self.log_file) as f:
+            self.assertEqual(f.read(), "third batch\n")
+        with open(f"{self.log_file}.1") as f:
+            self.assertEqual(f.read(), "second batch\n")
+        with open(f"{self.log_file}.2") as f:
+            self.assertEqual(f.read(), "first batch\n")
+        print("test_rotation passed: Log rotated.")
+
+    def test_shutdown_drains_pending_records(self):
+        """
+        Tests that shutdown writes records that were still queued.
+        """
+        writer = BackgroundLogWriter(flush_interval=60, echo=False)
+        writer.enqueue(self.log_file, "pending\n")
+        writer.shutdown()
+        with open(self.log_file) as f:
+            self.assertEqual(f.read(), "pending\n")
+        print("test_shutdown_drains_pending_records passed: Pending records drained.")
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        """
+        Tests that enqueueing behind a stalled writer returns at once and counts the dropped records.
+        """
+        writer = BackgroundLogWriter(flush_interval=60, echo=False, queue_size=2)
+        stalled = threading.Event()
+        with mock.patch.object(writer, "_write", side_effect=lambda records: stalled.wait(5)):
+            writer.enqueue(self.log_file, "first\n")
+            writer.flush(timeout=0.2) # The writer is now stuck writing
+            for index in range(5):
+                writer.enqueue(self.log_file, f"line {index}\n")
+            self.assertEqual(writer.dropped, 3)
+            stalled.set()
+        writer.shutdown()
+        print("test_full_queue_drops_instead_of_blocking passed: Records dropped, callers not blocked.")
+
+    def test_writer_survives_bad_record(self):
+        """
+        Tests that a record the writer cannot store is reported, and later records are still written.
+        """
+        writer = BackgroundLogWriter(flush_interval=60, echo=False, log_format="both")
+        with mock.patch("utils.build_record", side_effect=[ValueError("bad record"), {"ok": True}]), \
+             mock.patch.object(writer, "_segment_writer"), mock.patch("sys.stderr") as stderr:
+            writer.enqueue(self.log_file, "bad\n")
+            writer.flush()
+            writer.enqueue(self.log_file, "good\n")
+            writer.flush()
+        self.assertTrue(writer._thread.is_alive())
+        self.assertIn("bad record", "".join(call.args[0] for call in stderr.write.call_args_list))
+        writer.shutdown()
+        with open(self.log_file) as f:
+            self.assertEqual(f.read(), "bad\ngood\n")
+        print("test_writer_survives_bad_record passed: Writer kept running.")
+
+    def test_log_event_signature(self):
+        """
+        Tests that log_event(message, log_file) still writes a timestamped line.
+        """
+        log_event("Hello log", self.log_file)
+        flush_logs()
+        with open(self.log_file) as f:
+            content = f.read()
+        self.assertRegex(content, r"^\[\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\] Hello log\n$")
+        print("test_log_event_signature passed: log_event still works.")
+
+
+if __name__ == '__main__':
+    unittest.main()
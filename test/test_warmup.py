@@ -0,0 +1,97 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from unittest import mock
+import assistant
+import warmup
+from cache import create_response_cache
+from semantic_cache import SemanticCache
+from gemini_api import GeminiRateLimitError
+
+QUOTA_ERROR = "An error occurred while generating response from OpenAI: Error code: 429. Please check the logs."
+
+def _feedback(query, response, helpful, function_choice="answer_question", prompt_style="general"):
+    return {"query": query, "response": response, "helpful": helpful, "timestamp": "2025-06-23T10:53:14",
+            "function_choice": function_choice, "prompt_style": prompt_style}
+
+class TestWarmup(unittest.TestCase):
+    """
+    Unit tests for the response cache warm-up in warmup.py.
+    """
+
+    def setUp(self):
+        """
+        Set up for each test: feedback history covering helpful, unhelpful, error and legacy entries.
+        """
+        self.feedback = [
+            _feedback("What is Python?", "A programming language.", True),
+            _feedback("What is  Python? ", "A snake.", True),
+            _feedback("What is Python?", "A snake.", False),
+            _feedback("What is Rust?", "A systems language.", True),
+            _feedback("Why is the sky blue?", QUOTA_ERROR, True),
+            _feedback("Why is the sky blue?", "Rayleigh scattering.", False),
+            {"query": "global warming", "response": "Legacy answer.", "helpful": True, "timestamp": "2025-06-23"},
+        ]
+
+    def test_mines_helpful_queries(self):
+        """
+        Tests that queries are ranked by helpful votes plus requests, per function and style, and
+        that unhelpful responses, error messages and legacy entries are never used.
+        """
+        requests = [{"function_choice": "answer_question", "prompt_style": "general", "user_input": "Why is the sky blue?"}] * 3
+        candidates = warmup.mine_queries(self.feedback, requests)
+        self.assertEqual(len(candidates), 3) # The legacy entry has no function or style
+        selected = warmup.select_top(candidates, top=2)
+        self.assertEqual([(candidate["query"], candidate["count"], candidate["response"]) for candidate in selected],
+                         [("Why is the sky blue?", 4, None), ("What is Python?", 2, "A programming language.")])
+        print("test_mines_helpful_queries passed: Popular helpful queries selected.")
+
+    def test_warm_cache_serves_without_model_calls(self):
+        """
+        Tests that stored responses are served from the warmed cache, that missing ones are generated
+        only when asked, and that a failed generation is counted and skipped.
+        """
+        selected = warmup.select_top(warmup.mine_queries(self.feedback, [
+            {"function_choice": "answer_question", "prompt_style": "concise", "user_input": "What is Go?"},
+            {"function_choice": "answer_question", "prompt_style": "concise", "user_input": "What is Zig?"}]))
+        responses = ["Rayleigh scattering of sunlight.", "A language from Google.", GeminiRateLimitError("429")]
+        with mock.patch.object(assistant, "response_cache", create_response_cache()), \
+             mock.patch.object(assistant, "semantic_cache", SemanticCache(path=None, enabled=False)), \
+             mock.patch.object(assistant, "call_model", side_effect=responses) as call:
+            self.assertEqual(warmup.warm_cache(selected), {"stored": 2, "generated": 0, "skipped": 3, "failed": 0})
+            self.assertEqual(call.call_count, 0)
+            self.assertEqual(assistant.generate_response("answer_question", "general", "What is Rust?"), "A systems language.")
+            self.assertEqual(assistant.generate_response("answer_question", "general", "What is Python?"), "A programming language.")
+            self.assertEqual(call.call_count, 0)
+
+            summary = warmup.warm_cache(selected, generate=True, rate_per_minute=6000)
+            self.assertEqual(summary, {"stored": 2, "generated": 2, "skipped": 0, "failed": 1})
+            self.assertEqual(assistant.generate_response("answer_question", "concise", "What is Go?"), "A language from Google.")
+            self.assertEqual(call.call_count, 3)
+        print("test_warm_cache_serves_without_model_calls passed: Cache warmed from feedback.")
+
+    def test_cli_reads_request_files(self):
+        """
+        Tests that a dry run lists the queries from request files, and that warming refuses to run
+        without the disk tier, which would lose the entries on exit.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, "requests.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"function_choice": "summarize_text", "prompt_style": "standard", "user_input": "Long text"}) + "\n")
+            f.write("not json\n")
+        with mock.patch.object(warmup, "get_all_feedback", return_value=iter(self.feedback)), \
+             mock.patch("builtins.print") as printed:
+            self.assertEqual(warmup.main(["--requests", path, "--dry-run"]), 0)
+        lines = [json.loads(call.args[0]) for call in printed.call_args_list]
+        self.assertIn({"function_choice": "summarize_text", "prompt_style": "standard", "count": 1,
+                       "query": "Long text", "stored_response": False}, lines)
+        with mock.patch.dict(os.environ, {"RESPONSE_CACHE_DISK": "0"}), mock.patch("builtins.print"):
+            self.assertEqual(warmup.main([]), 1)
+        print("test_cli_reads_request_files passed: Requests counted, disk tier required.")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,22 @@
 import os
+import sys
 import json
+import time
+import queue
+import atexit
+import threading
 from datetime import datetime
+from metrics import phase, LOG_RECORDS_DROPPED
+from logstore import SegmentWriter, build_record, stream_directory
+
+LOG_FLUSH_INTERVAL = float(os.environ.get("LOG_FLUSH_INTERVAL", 0.5)) # Seconds between flushes
+LOG_BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", 200)) # Records that force an early flush
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 5 * 1024 * 1024)) # Rotate a log file past this size
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", 3)) # Rotated files kept per log
+LOG_ECHO = os.environ.get("LOG_ECHO", "1") == "1" # Also echo records to stdout
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000)) # Records waiting beyond this are dropped
+# "text" for the plain log files, "structured" for the compressed segments in logstore.py, or "both"
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "both")
 
 def ensure_directory_exists(path):
     """
@@ -10,15 +26,201 @@ def ensure_directory_exists(path):
         os.makedirs(path)
         print(f"Created directory: {path}")
 
-def log_event(message, log_file="data/logs.txt"):
+class BackgroundLogWriter:
+    """
+    Writes log records from a background thread so request threads never touch the log files.
+    Callers enqueue formatted lines; the writer batches them and flushes each file with a
+    single write once LOG_BATCH_SIZE records are waiting or LOG_FLUSH_INTERVAL has passed.
+    Files are rotated past LOG_MAX_BYTES, and pending records are drained at interpreter exit.
+    Enqueueing never blocks: when LOG_QUEUE_SIZE records are already waiting, the record is
+    dropped and counted instead, and a failed write is reported on stderr without stopping the
+    writer. With LOG_FORMAT "structured" or "both", each batch is also stored as a compressed segment
+    of the file's stream (see logstore.py).
+    """
+
+    _FLUSH = object()
+    _STOP = object()
+
+    def __init__(self, flush_interval=LOG_FLUSH_INTERVAL, batch_size=LOG_BATCH_SIZE,
+                 max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, echo=LOG_ECHO, log_format=LOG_FORMAT,
+                 queue_size=LOG_QUEUE_SIZE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.echo = echo
+        self.log_format = log_format
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._segments = {}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def enqueue(self, log_file, line, record=None):
+        """
+        Queues a formatted line for log_file, starting the writer thread if needed.
+        The line is dropped (and counted in dropped) if the writer has fallen queue_size records behind.
+        :param record: The structured record's fields (at least ts and message); by default
+                       the line itself, timestamped now.
+        """
+        self._ensure_started()
+        if record is None:
+            record = {"ts": time.time(), "message": line.rstrip("\n")}
+        try:
+            self._queue.put_nowait((log_file, line, record))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            LOG_RECORDS_DROPPED.inc()
+
+    def flush(self, timeout=5.0):
+        """
+        Blocks until every record queued before this call has been written.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        try:
+            self._queue.put((self._FLUSH, done, None), timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def shutdown(self, timeout=5.0):
+        """
+        Drains pending records and stops the writer thread.
+        """
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put((self._STOP, None, None), timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _ensure_started(self):
+        # A forked worker inherits the queue but not the thread, so start a fresh writer per process.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._segments = {} # A parent's active segments are not this process's to append to
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        pending = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                item = None
+
+            try:
+                if item is not None and item[0] is self._STOP:
+                    self._write(pending)
+                    self._seal_segments()
+                    return
+                if item is not None and item[0] is self._FLUSH:
+                    self._write(pending)
+                    pending = []
+                    item[1].set()
+                    continue
+                if item is not None:
+                    pending.append(item)
+
+                if len(pending) >= self.batch_size or time.monotonic() >= deadline:
+                    self._write(pending)
+                    pending = []
+                    deadline = time.monotonic() + self.flush_interval
+            except Exception as e:
+                # One bad record must not stop the writer, or the queue would fill and drop everything
+                sys.stderr.write(f"Log writer dropped {len(pending)} records: {e!r}\n")
+                pending = []
+                deadline = time.monotonic() + self.flush_interval
+                if item is not None and item[0] is self._FLUSH:
+                    item[1].set()
+                if item is not None and item[0] is self._STOP:
+                    return
+
+    def _write(self, records):
+        if not records:
+            return
+        records_by_file = {}
+        for log_file, line, record in records:
+            records_by_file.setdefault(log_file, []).append((line, record))
+        for log_file, batch in records_by_file.items():
+            try:
+                if self.log_format in ("text", "both"):
+                    ensure_directory_exists(os.path.dirname(log_file))
+                    self._rotate_if_needed(log_file)
+                    with open(log_file, "a") as f:
+                        f.write("".join(line for line, _record in batch))
+                if self.log_format in ("structured", "both"):
+                    self._segment_writer(log_file).append([build_record(log_file, record) for _line, record in batch])
+            except Exception as e:
+                sys.stderr.write(f"Could not write {len(batch)} records to {log_file}: {e!r}\n")
+        if self.echo:
+            sys.stdout.write("".join(f"Logged: {line}" for _log_file, line, _record in records))
+            sys.stdout.flush()
+
+    def _segment_writer(self, log_file):
+        writer = self._segments.get(log_file)
+        if writer is None:
+            writer = self._segments[log_file] = SegmentWriter(stream_directory(log_file))
+        return writer
+
+    def _seal_segments(self):
+        for log_file, writer in self._segments.items():
+            try:
+                writer.seal()
+            except Exception as e:
+                sys.stderr.write(f"Could not index the log segment for {log_file}: {e!r}\n")
+
+    def _rotate_if_needed(self, log_file):
+        if self.max_bytes <= 0 or not os.path.exists(log_file) or os.path.getsize(log_file) < self.max_bytes:
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            older = f"{log_file}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{log_file}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(log_file, f"{log_file}.1")
+        else:
+            os.remove(log_file)
+
+_log_writer = BackgroundLogWriter()
+atexit.register(_log_writer.shutdown)
+
+def log_event(message, log_file="data/logs.txt", **fields):
     """
     Logs an event with a timestamp to a specified log file.
+    The record is queued and written by the background log writer, so this never blocks on file I/O.
+    :param fields: Structured fields stored with the record, e.g. event, function, latency_ms or
+                   error_code. The event type and level are otherwise derived from the message and file.
+    """
+    with phase("log"):
+        now = time.time()
+        timestamp = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+        _log_writer.enqueue(log_file, f"[{timestamp}] {message}\n", dict(fields, ts=now, message=message))
+
+def estimate_tokens(text):
+    """
+    Rough token count for rate limiting and budgets: about four characters per token.
+    """
+    return len(text) // 4 + 1
+
+def flush_logs(timeout=5.0):
+    """
+    Waits until all queued log records have been written to their files.
     """
-    ensure_directory_exists(os.path.dirname(log_file))
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(log_file, "a") as f:
-        f.write(f"[{timestamp}] {message}\n")
-    print(f"Logged: {message}")
+    _log_writer.flush(timeout)
 
 def load_json(filepath, default_value=None):
     """
@@ -0,0 +1,179 @@
+"""
+This module pre-populates the response cache from usage history, so a restart does not send every
+popular query to Gemini at once while the cache is cold.
+
+The queries users marked helpful in the feedback log, plus the queries in batch request files
+(JSONL with function_choice, prompt_style and user_input, see batch.py), are counted per function
+and style, and the most frequent ones are warmed. A query warms with the latest response users
+marked helpful for it; responses anyone rated unhelpful and stored error messages (e.g. the 429
+quota errors older versions saved as responses) are never used. Queries without a usable response
+are generated through the normal pipeline, under a rate limit, only when asked to (--generate).
+
+Usage:
+    python warmup.py [--requests requests.jsonl ...] [--top 20] [--generate] [--rate 30] [--dry-run]
+
+The offline job needs the disk tier (RESPONSE_CACHE_DISK=1), which the app's processes read after it
+exits. Under gunicorn, WARMUP=1 also warms the master's cache from stored responses before the
+workers are forked, so every worker starts with it (see gunicorn.conf.py).
+"""
+import os
+import sys
+import json
+import argparse
+from utils import log_event
+from cache import normalize_prompt
+from batch import read_records
+from budget import fit_input
+from feedback import get_all_feedback
+from gemini_api import GeminiError, is_error_response
+from prompts import build_prompt
+from ratelimit import TokenBucket
+from summarize import needs_chunking
+
+WARMUP_TOP = int(os.environ.get("WARMUP_TOP", 20)) # Queries warmed per function and style
+# Batch request files counted along with the feedback log, comma-separated
+WARMUP_REQUESTS = [path.strip() for path in os.environ.get("WARMUP_REQUESTS", "").split(",") if path.strip()]
+DEFAULT_RATE_PER_MINUTE = 30
+
+def mine_queries(feedback_entries, request_records=()):
+    """
+    Counts how often each query was marked helpful or requested, per function and style.
+    Queries are grouped after normalization (see cache.normalize_prompt); feedback saved before the
+    function and style were recorded is skipped, since its prompt cannot be rebuilt.
+    :param feedback_entries: Feedback log entries, as returned by feedback.get_all_feedback().
+    :param request_records: Batch request records with function_choice, prompt_style and user_input.
+    :return: Dict of (function_choice, prompt_style, normalized query) -> candidate dict with the
+    function_choice, prompt_style, query, count and the response to warm with (None if there is none).
+    """
+    candidates = {}
+    helpful_responses = {}
+    rejected = set()
+
+    def candidate_for(function_choice, prompt_style, query):
+        if not (function_choice and prompt_style and isinstance(query, str) and query.strip()):
+            return None, None
+        key = (function_choice, prompt_style, normalize_prompt(query))
+        if key not in candidates:
+            candidates[key] = {"function_choice": function_choice, "prompt_style": prompt_style,
+                               "query": query, "count": 0, "response": None}
+        return key, candidates[key]
+
+    for entry in feedback_entries:
+        response = entry.get("response")
+        if not entry.get("helpful"):
+            if entry.get("function_choice") and isinstance(entry.get("query"), str):
+                rejected.add((entry["function_choice"], entry.get("prompt_style"),
+                              normalize_prompt(entry["query"]), response))
+            continue
+        key, candidate = candidate_for(entry.get("function_choice"), entry.get("prompt_style"), entry.get("query"))
+        if candidate is None:
+            continue
+        candidate["count"] += 1
+        if isinstance(response, str) and response.strip() and not is_error_response(response):
+            helpful_responses.setdefault(key, []).append(response)
+
+    for record in request_records:
+        _key, candidate = candidate_for(record.get("function_choice"), record.get("prompt_style"), record.get("user_input"))
+        if candidate is not None:
+            candidate["count"] += 1
+
+    for key, responses in helpful_responses.items():
+        usable = [response for response in responses if key + (response,) not in rejected]
+        if usable:
+            candidates[key]["response"] = usable[-1]
+    return candidates
+
+def select_top(candidates, top=WARMUP_TOP):
+    """
+    Returns the top most frequent candidates of each function and style, most frequent first.
+    Ties go to the query seen first.
+    """
+    ranked = sorted(candidates.values(), key=lambda candidate: -candidate["count"])
+    selected = []
+    per_style = {}
+    for candidate in ranked:
+        style = (candidate["function_choice"], candidate["prompt_style"])
+        if per_style.get(style, 0) < top:
+            per_style[style] = per_style.get(style, 0) + 1
+            selected.append(candidate)
+    return selected
+
+def stored_prompt(function_choice, prompt_style, query):
+    """
+    Returns the prompt /generate would send for a query, or None if building it needs model calls
+    (a document long enough to be summarized in chunks) or the function or style is unknown.
+    """
+    user_input, _decision = fit_input(function_choice, query)
+    if function_choice == "summarize_text" and needs_chunking(user_input):
+        return None
+    return build_prompt(function_choice, prompt_style, user_input) or None
+
+def warm_cache(selected, generate=False, rate_per_minute=DEFAULT_RATE_PER_MINUTE):
+    """
+    Stores the selected candidates' responses in the response cache (and the semantic cache), and
+    generates the missing ones through assistant.generate_response when generate is set.
+    :return: Counts of stored, generated, skipped and failed candidates.
+    """
+    import assistant # Imported here so that mining the history does not build the pipeline
+    summary = {"stored": 0, "generated": 0, "skipped": 0, "failed": 0}
+    limiter = TokenBucket(rate_per_minute)
+    for candidate in selected:
+        function_choice, prompt_style, query = candidate["function_choice"], candidate["prompt_style"], candidate["query"]
+        prompt = stored_prompt(function_choice, prompt_style, query) if candidate["response"] else None
+        if prompt is not None:
+            assistant.response_cache.set(prompt, assistant.CACHE_MODEL_NAME, candidate["response"])
+            assistant.semantic_cache.add(function_choice, prompt_style, query, candidate["response"])
+            summary["stored"] += 1
+            continue
+        if not generate:
+            summary["skipped"] += 1
+            continue
+        limiter.acquire()
+        try:
+            response = assistant.generate_response(function_choice, prompt_style, query)
+        except GeminiError as e:
+            log_event(f"Warm-up generation failed for {function_choice}/{prompt_style} '{query[:50]}...': {e}",
+                      "data/errors.log", event="warmup_error")
+            summary["failed"] += 1
+            continue
+        summary["generated" if response is not None else "skipped"] += 1
+    return summary
+
+def _request_records(paths):
+    return (record for path in paths for _index, record, error in read_records(path) if error is None)
+
+def warm_up(request_files=(), top=WARMUP_TOP, generate=False, rate_per_minute=DEFAULT_RATE_PER_MINUTE):
+    """
+    Mines the feedback log and the request files, then warms the response cache with the top queries.
+    :return: The warm_cache() counts, plus the number of queries selected.
+    """
+    selected = select_top(mine_queries(get_all_feedback(), _request_records(request_files)), top)
+    summary = {"selected": len(selected), **warm_cache(selected, generate, rate_per_minute)}
+    log_event(f"Response cache warm-up: {summary}", event="warmup")
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-populate the response cache from feedback and request history.")
+    parser.add_argument("--requests", nargs="*", default=WARMUP_REQUESTS,
+                        help="Batch request JSONL files whose queries count towards popularity")
+    parser.add_argument("--top", type=int, default=WARMUP_TOP, help="Queries warmed per function and style")
+    parser.add_argument("--generate", action="store_true",
+                        help="Call the model for popular queries without a helpful stored response")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE_PER_MINUTE, help="Maximum generations per minute")
+    parser.add_argument("--dry-run", action="store_true", help="Print the selected queries without warming the cache")
+    args = parser.parse_args(argv)
+
+    if args.dry_run:
+        for candidate in select_top(mine_queries(get_all_feedback(), _request_records(args.requests)), args.top):
+            print(json.dumps({**{field: candidate[field] for field in ("function_choice", "prompt_style", "count", "query")},
+                              "stored_response": candidate["response"] is not None}))
+        return 0
+    if os.environ.get("RESPONSE_CACHE_DISK", "0") != "1":
+        print("The response cache has no disk tier, so warmed entries would be lost when this process exits. "
+              "Set RESPONSE_CACHE_DISK=1 here and in the app.", file=sys.stderr)
+        return 1
+    print(json.dumps(warm_up(args.requests, args.top, args.generate, args.rate), indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())